@@ -0,0 +1,224 @@
+"""Shared AIND MCP server — one long-lived process for every CLI client.
+
+Each `claude` CLI used to launch its own `python -m
+aind_data_mcp.data_access_server` over stdio, so every pool worker, hot
+spare and one-shot query() paid the server's import + spawn time and
+kept its own copy resident (aind-data-access-api, pymongo, fastmcp). The
+pool watchdog also spawned one more every HEALTH_CHECK_INTERVAL_S just to
+list tools.
+
+With AIND_MCP_SHARED=1 (the default), the backend instead runs the server
+once as a local streamable-HTTP service on 127.0.0.1:AIND_MCP_PORT
+(default 8765), and _build_options() registers it with the CLI as an
+"http" MCP server once it's up (clients built before then, or while it's
+down, get stdio). The CLI connects per session, so all clients share the
+one process. check() runs the health check against that process (the
+same initialize + list_tools the CLI does) and restarts it if it died or
+stopped answering. AIND_MCP_SHARED=0 restores the per-client stdio
+subprocess.
+
+If a healthy server is already listening on the port (another backend
+worker process started it), start() uses it rather than spawning a
+second one.
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+AIND_MCP_SHARED = os.environ.get("AIND_MCP_SHARED", "1") == "1"
+AIND_MCP_PORT = int(os.environ.get("AIND_MCP_PORT", "8765"))
+AIND_MCP_STARTUP_TIMEOUT_S = float(os.environ.get("AIND_MCP_STARTUP_TIMEOUT_S", "120"))
+
+MCP_SERVER_DIR = Path(os.environ.get(
+    "MCP_SERVER_DIR",
+    str(Path(__file__).resolve().parent.parent / "aind-data-mcp"),
+))
+
+
+def is_enabled() -> bool:
+    """Whether the AIND MCP server is registered with the CLI at all."""
+    return (MCP_SERVER_DIR / "src").is_dir() and os.environ.get("SKIP_AIND_MCP") != "1"
+
+
+def server_command() -> tuple[list[str], dict[str, str]]:
+    """argv and environment that run the vendored server (stdio transport).
+
+    AIND_MCP_PYTHON: path to a Python that has aind-data-access-api +
+    fastmcp installed. Defaults to the backend's own interpreter.
+    """
+    mcp_src = MCP_SERVER_DIR / "src"
+    mcp_python = os.environ.get("AIND_MCP_PYTHON", sys.executable)
+    existing_pypath = os.environ.get("PYTHONPATH", "")
+    new_pypath = f"{mcp_src}:{existing_pypath}" if existing_pypath else str(mcp_src)
+    env = {**os.environ, "PYTHONPATH": new_pypath, "PYTHONUNBUFFERED": "1"}
+    return [mcp_python, "-m", "aind_data_mcp.data_access_server"], env
+
+
+def server_url(port: int = AIND_MCP_PORT) -> str:
+    return f"http://127.0.0.1:{port}/mcp"
+
+
+def cli_config() -> dict[str, Any]:
+    """The CLI's mcp_servers entry for the AIND server.
+
+    The shared HTTP server only when it's running and passed its last
+    health check; before it's up, or if it failed to start, each client
+    gets its own stdio subprocess rather than a dead URL.
+    """
+    server = get_mcp_server()
+    if AIND_MCP_SHARED and server is not None and server.healthy:
+        return {"type": "http", "url": server.url}
+    command, env = server_command()
+    return {"type": "stdio", "command": command[0], "args": command[1:], "env": env}
+
+
+async def list_tools(url: str, timeout: float = 30.0) -> list[str]:
+    """Connect to the HTTP server at ``url`` over MCP, initialize, and
+    return its tool names. Raises on connection failure or timeout."""
+    from mcp import ClientSession
+    from mcp.client.streamable_http import streamable_http_client
+
+    async with streamable_http_client(url) as (read_stream, write_stream, _):
+        async with ClientSession(read_stream, write_stream) as session:
+            await asyncio.wait_for(session.initialize(), timeout=timeout)
+            result = await asyncio.wait_for(session.list_tools(), timeout=10.0)
+            return [t.name for t in result.tools or []]
+
+
+class SharedMcpServer:
+    """Owns the single HTTP AIND MCP server process."""
+
+    def __init__(self, port: int = AIND_MCP_PORT, command: list[str] | None = None,
+                 env: dict[str, str] | None = None):
+        if command is None:
+            command, env = server_command()
+            command = command + ["--transport", "streamable-http", "--port", str(port)]
+        self.port = port
+        self.url = server_url(port)
+        self._command = command
+        self._env = env
+        self._proc: asyncio.subprocess.Process | None = None
+        self._lock = asyncio.Lock()
+        self._ready = asyncio.Event()
+        self.started_at: float | None = None
+        self.restarts = 0
+        self.healthy = False
+        self.tools: list[str] = []
+        self.probe_ms: float | None = None  # last successful initialize + list_tools
+
+    @property
+    def pid(self) -> int | None:
+        return self._proc.pid if self._proc is not None and self._proc.returncode is None else None
+
+    async def start(self, timeout: float = AIND_MCP_STARTUP_TIMEOUT_S) -> bool:
+        """Spawn the server (or adopt one already on the port) and wait
+        until it lists tools. Returns whether it came up in time."""
+        async with self._lock:
+            return await self._start(timeout)
+
+    async def _start(self, timeout: float) -> bool:
+        self._ready.clear()
+        if await self._probe():
+            logger.info("AIND MCP: using the server already running at %s", self.url)
+        else:
+            logger.info("AIND MCP: starting shared server at %s", self.url)
+            self._proc = await asyncio.create_subprocess_exec(*self._command, env=self._env)
+            deadline = time.monotonic() + timeout
+            while not await self._probe():
+                if self._proc.returncode is not None:
+                    logger.error("AIND MCP: server exited with code %s during startup", self._proc.returncode)
+                    return False
+                if time.monotonic() > deadline:
+                    logger.error("AIND MCP: server not ready after %.0fs", timeout)
+                    return False
+                await asyncio.sleep(0.5)
+        self.started_at = time.monotonic()
+        self._ready.set()
+        logger.info("AIND MCP: %d tools registered: %s", len(self.tools), self.tools)
+        return True
+
+    async def wait_ready(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def check(self) -> bool:
+        """Health check against the running instance.
+
+        Returns True if it answers with at least one tool. Otherwise the
+        process is restarted (waiting until it's up again, so clients
+        started afterwards can connect) and False is returned: clients
+        connected to the old instance should be replaced.
+        """
+        async with self._lock:
+            if await self._probe():
+                return True
+            logger.warning("AIND MCP: health check failed at %s — restarting the server", self.url)
+            await self._stop()
+            self.restarts += 1
+            await self._start(AIND_MCP_STARTUP_TIMEOUT_S)
+            return False
+
+    async def stop(self) -> None:
+        async with self._lock:
+            await self._stop()
+
+    async def _stop(self) -> None:
+        self._ready.clear()
+        self.healthy = False
+        self.tools = []
+        proc, self._proc = self._proc, None
+        if proc is None or proc.returncode is not None:
+            return
+        proc.terminate()
+        try:
+            await asyncio.wait_for(proc.wait(), timeout=5)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+
+    async def _probe(self) -> bool:
+        t0 = time.perf_counter()
+        try:
+            self.tools = await list_tools(self.url, timeout=10.0)
+        except Exception:
+            self.tools = []
+        self.healthy = bool(self.tools)
+        if self.healthy:
+            self.probe_ms = (time.perf_counter() - t0) * 1000
+        return self.healthy
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "url": self.url,
+            "pid": self.pid,
+            "healthy": self.healthy,
+            "tools": len(self.tools),
+            "restarts": self.restarts,
+            "probe_ms": round(self.probe_ms, 1) if self.probe_ms is not None else None,
+            "uptime_s": round(time.monotonic() - self.started_at, 1) if self.started_at is not None else None,
+        }
+
+
+# Module-level singleton, set up in server.py's lifespan when
+# AIND_MCP_SHARED=1 and the server is enabled.
+_server: SharedMcpServer | None = None
+
+
+def get_mcp_server() -> SharedMcpServer | None:
+    return _server
+
+
+def init_mcp_server() -> SharedMcpServer:
+    global _server
+    _server = SharedMcpServer()
+    return _server
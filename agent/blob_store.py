@@ -0,0 +1,345 @@
+"""Content-addressed storage for upload bytes and video keyframes.
+
+Blobs are keyed by the SHA-256 hex digest of their content, so the same
+file uploaded twice is stored once and the database only keeps the digest
+(uploads.blob_digest, upload_keyframes.frame_digest). Keeping the bytes
+out of the DB keeps the SQLite file/WAL small and means no row read ever
+drags a 100 MB payload along with it.
+
+Three drivers, picked by BLOB_STORE:
+  - "local": files under BLOB_DIR (default UPLOADS_DIR/blobs), fanned out
+    as ab/cd/<digest>. Uploads already on disk are hard-linked in rather
+    than copied when they're on the same filesystem.
+  - "s3": any S3-compatible bucket (BLOB_S3_BUCKET, optional
+    BLOB_S3_PREFIX / BLOB_S3_ENDPOINT_URL). Needs boto3, imported lazily;
+    tests pass a client object instead. Use this where the local disk is
+    ephemeral (autoscale deployments).
+  - "db": a blobs table in the metadata database. Survives an ephemeral
+    disk without extra infrastructure, at the cost of the bytes living
+    in the database again, so only blobs up to BLOB_DB_MAX_BYTES (default
+    100 MB, the non-video upload cap) are accepted; larger uploads keep
+    only their local copy. Opt-in only.
+
+Left unset, BLOB_STORE is "s3" when BLOB_S3_BUCKET is set, else "local".
+
+All driver I/O runs in a worker thread so the event loop never blocks on
+disk or network.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import shutil
+import tempfile
+import uuid
+from abc import ABC, abstractmethod
+from collections.abc import AsyncIterator
+from pathlib import Path
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+BLOB_DB_MAX_BYTES = int(os.environ.get("BLOB_DB_MAX_BYTES", str(100 * 1024 * 1024)))
+
+_DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def sha256_file(path: str | Path) -> str:
+    """Hex SHA-256 of a file, read in chunks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _check_digest(digest: str) -> str:
+    # Digests become file paths / object keys; refuse anything else.
+    if not _DIGEST_RE.match(digest):
+        raise ValueError(f"Not a SHA-256 hex digest: {digest!r}")
+    return digest
+
+
+class BlobStore(ABC):
+    """Async content-addressed blob store interface."""
+
+    #: Largest blob the driver accepts, or None for no limit. Callers check
+    #: it before handing over a file; put_file/put_bytes raise ValueError
+    #: above it.
+    max_blob_bytes: int | None = None
+
+    @abstractmethod
+    async def put_file(self, path: str | Path, digest: str | None = None) -> str:
+        """Store a file's contents; returns its digest.
+
+        Pass ``digest`` when it was already computed (e.g. while streaming
+        the upload to disk) to skip re-hashing a large file.
+        """
+
+    @abstractmethod
+    async def put_bytes(self, data: bytes) -> str:
+        """Store ``data``; returns its digest."""
+
+    @abstractmethod
+    async def exists(self, digest: str) -> bool:
+        """Whether a blob with this digest is stored."""
+
+    @abstractmethod
+    def stream(self, digest: str, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+        """Yield the blob's bytes in chunks. Raises FileNotFoundError if absent."""
+
+    async def read(self, digest: str) -> bytes:
+        """The whole blob in memory. Prefer stream() for anything large."""
+        return b"".join([chunk async for chunk in self.stream(digest)])
+
+    async def download(self, digest: str, dest: str | Path) -> None:
+        """Write the blob to ``dest`` (e.g. to restore an upload's file_path)."""
+        dest = Path(dest)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        with dest.open("wb") as out:
+            async for chunk in self.stream(digest):
+                await asyncio.to_thread(out.write, chunk)
+
+
+class LocalBlobStore(BlobStore):
+    """Blobs as files under a root directory."""
+
+    def __init__(self, root: str | Path) -> None:
+        self.root = Path(root)
+
+    def path(self, digest: str) -> Path:
+        """Filesystem location of a blob (whether or not it exists)."""
+        _check_digest(digest)
+        return self.root / digest[:2] / digest[2:4] / digest
+
+    def _put_file_sync(self, src: Path, digest: str | None) -> str:
+        digest = digest or sha256_file(src)
+        dest = self.path(digest)
+        if dest.exists():
+            return digest  # already stored — dedupe
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(f".{digest}.{uuid.uuid4().hex}.tmp")
+        try:
+            try:
+                os.link(src, tmp)
+            except OSError:
+                shutil.copyfile(src, tmp)
+            os.replace(tmp, dest)
+        finally:
+            tmp.unlink(missing_ok=True)
+        return digest
+
+    def _put_bytes_sync(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        dest = self.path(digest)
+        if dest.exists():
+            return digest
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=dest.parent, prefix=f".{digest}.")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, dest)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        return digest
+
+    async def put_file(self, path: str | Path, digest: str | None = None) -> str:
+        return await asyncio.to_thread(self._put_file_sync, Path(path), digest)
+
+    async def put_bytes(self, data: bytes) -> str:
+        return await asyncio.to_thread(self._put_bytes_sync, data)
+
+    async def exists(self, digest: str) -> bool:
+        return await asyncio.to_thread(self.path(digest).exists)
+
+    async def stream(self, digest: str, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+        f = await asyncio.to_thread(open, self.path(digest), "rb")
+        try:
+            while chunk := await asyncio.to_thread(f.read, chunk_size):
+                yield chunk
+        finally:
+            f.close()
+
+
+class S3BlobStore(BlobStore):
+    """Blobs as objects in an S3-compatible bucket.
+
+    ``client`` is anything with boto3's S3 client methods (put_object,
+    upload_file, head_object, get_object); by default a boto3 client is
+    created from the environment on first use.
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        client: Any = None,
+        endpoint_url: str | None = None,
+    ) -> None:
+        self.bucket = bucket
+        self.prefix = prefix
+        self._client = client
+        self._endpoint_url = endpoint_url
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            import boto3
+            self._client = boto3.client("s3", endpoint_url=self._endpoint_url)
+        return self._client
+
+    def key(self, digest: str) -> str:
+        return f"{self.prefix}{_check_digest(digest)}"
+
+    @staticmethod
+    def _is_not_found(exc: Exception) -> bool:
+        code = str(getattr(exc, "response", {}).get("Error", {}).get("Code", ""))
+        return code in ("404", "NoSuchKey", "NotFound")
+
+    def _exists_sync(self, digest: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.key(digest))
+            return True
+        except Exception as exc:
+            if self._is_not_found(exc):
+                return False
+            raise
+
+    def _put_file_sync(self, src: Path, digest: str | None) -> str:
+        digest = digest or sha256_file(src)
+        if not self._exists_sync(digest):
+            # upload_file does multipart for large files.
+            self.client.upload_file(str(src), self.bucket, self.key(digest))
+        return digest
+
+    def _put_bytes_sync(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        if not self._exists_sync(digest):
+            self.client.put_object(Bucket=self.bucket, Key=self.key(digest), Body=data)
+        return digest
+
+    def _open_sync(self, digest: str) -> Any:
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self.key(digest))["Body"]
+        except Exception as exc:
+            if self._is_not_found(exc):
+                raise FileNotFoundError(digest) from exc
+            raise
+
+    async def put_file(self, path: str | Path, digest: str | None = None) -> str:
+        return await asyncio.to_thread(self._put_file_sync, Path(path), digest)
+
+    async def put_bytes(self, data: bytes) -> str:
+        return await asyncio.to_thread(self._put_bytes_sync, data)
+
+    async def exists(self, digest: str) -> bool:
+        return await asyncio.to_thread(self._exists_sync, digest)
+
+    async def stream(self, digest: str, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+        body = await asyncio.to_thread(self._open_sync, digest)
+        try:
+            while chunk := await asyncio.to_thread(body.read, chunk_size):
+                yield chunk
+        finally:
+            body.close()
+
+
+class DatabaseBlobStore(BlobStore):
+    """Blobs as rows of the metadata database's blobs table.
+
+    ``db`` is an agent.db Database; by default the shared one. A blob is
+    read and written whole (BYTEA/BLOB columns can't be streamed), so
+    anything over ``max_bytes`` is refused rather than loaded into memory.
+    """
+
+    def __init__(self, db: Any = None, max_bytes: int = BLOB_DB_MAX_BYTES) -> None:
+        self._db = db
+        self.max_blob_bytes = max_bytes
+
+    def _check_size(self, size: int) -> None:
+        if size > self.max_blob_bytes:
+            raise ValueError(
+                f"{size} bytes is over the database blob store's {self.max_blob_bytes}-byte limit")
+
+    async def _get_db(self) -> Any:
+        if self._db is None:
+            from .db.database import get_db
+            self._db = await get_db()
+        return self._db
+
+    async def _put(self, digest: str, data: bytes) -> str:
+        db = await self._get_db()
+        await db.execute(
+            "INSERT INTO blobs (digest, data) VALUES (?, ?) ON CONFLICT (digest) DO NOTHING",
+            (_check_digest(digest), data),
+        )
+        return digest
+
+    async def put_file(self, path: str | Path, digest: str | None = None) -> str:
+        if digest is not None and await self.exists(digest):
+            return digest
+        self._check_size((await asyncio.to_thread(os.stat, path)).st_size)
+        data = await asyncio.to_thread(Path(path).read_bytes)
+        return await self._put(digest or hashlib.sha256(data).hexdigest(), data)
+
+    async def put_bytes(self, data: bytes) -> str:
+        self._check_size(len(data))
+        return await self._put(hashlib.sha256(data).hexdigest(), data)
+
+    async def exists(self, digest: str) -> bool:
+        db = await self._get_db()
+        row = await db.fetchrow("SELECT 1 AS found FROM blobs WHERE digest = ?", (_check_digest(digest),))
+        return row is not None
+
+    async def stream(self, digest: str, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+        db = await self._get_db()
+        row = await db.fetchrow("SELECT data FROM blobs WHERE digest = ?", (_check_digest(digest),))
+        if row is None:
+            raise FileNotFoundError(digest)
+        data = bytes(row["data"])
+        for start in range(0, len(data), chunk_size):
+            yield data[start:start + chunk_size]
+
+
+_store: BlobStore | None = None
+
+
+def _create_store() -> BlobStore:
+    """Select the driver based on environment."""
+    kind = os.environ.get("BLOB_STORE", "").lower()
+    if not kind:
+        kind = "s3" if os.environ.get("BLOB_S3_BUCKET") else "local"
+    if kind == "s3":
+        bucket = os.environ["BLOB_S3_BUCKET"]
+        logger.info("Using S3 blob store: bucket=%s", bucket)
+        return S3BlobStore(
+            bucket,
+            prefix=os.environ.get("BLOB_S3_PREFIX", ""),
+            endpoint_url=os.environ.get("BLOB_S3_ENDPOINT_URL") or None,
+        )
+    if kind == "db":
+        logger.info("Using database blob store")
+        return DatabaseBlobStore()
+    uploads_dir = Path(os.environ.get("UPLOADS_DIR", Path(__file__).resolve().parent.parent / "uploads"))
+    root = Path(os.environ.get("BLOB_DIR", uploads_dir / "blobs"))
+    logger.info("Using local blob store: %s", root)
+    if os.environ.get("DATABASE_URL"):
+        logger.warning("Local blob store with DATABASE_URL set: blobs won't survive an ephemeral disk; "
+                       "set BLOB_STORE=s3 (or BLOB_STORE=db for small files)")
+    return LocalBlobStore(root)
+
+
+def get_blob_store() -> BlobStore:
+    """Return the shared blob store, creating it if needed."""
+    global _store
+    if _store is None:
+        _store = _create_store()
+    return _store
@@ -0,0 +1,190 @@
+"""Chat runs: agent turns that outlive the request that started them.
+
+POST /chat starts a run: a task that drives chat() to completion and
+appends every event it yields to the run's log under an increasing seq.
+The response just follows that log, so a client that drops (a phone
+changing networks, a closed laptop) doesn't cancel the agent; it
+reattaches with GET /chat/{run_id}/stream and Last-Event-ID and gets the
+events it missed, then the rest live. Only POST /chat/{run_id}/cancel
+stops a run.
+
+The log is a ring buffer of the last CHAT_RUN_BUFFER_EVENTS events
+(default 5000), kept in memory and written to the chat_run_events table
+in batches every 250 ms. Memory serves the live run and, for
+CHAT_RUN_MEMORY_TTL seconds (default 300) after it ends, replays; after
+that, or after a restart, replays come from the DB. A run the DB still
+has as running after a restart was cut off; its replay ends with an
+error. Runs untouched for CHAT_RUN_RETENTION_HOURS (default 24) are
+pruned when the next one starts.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+import os
+import uuid
+from collections import deque
+from collections.abc import AsyncIterator
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from .sse import DONE, Event, SeqEvent, decode_data, encode_data
+from .tools.metadata_store import (
+    append_chat_run_events,
+    create_chat_run,
+    get_chat_run,
+    get_chat_run_events,
+    prune_chat_runs,
+)
+
+logger = logging.getLogger(__name__)
+
+CHAT_RUN_BUFFER_EVENTS = max(1, int(os.environ.get("CHAT_RUN_BUFFER_EVENTS", "5000")))
+_MEMORY_TTL = float(os.environ.get("CHAT_RUN_MEMORY_TTL", "300"))
+_RETENTION = timedelta(hours=float(os.environ.get("CHAT_RUN_RETENTION_HOURS", "24")))
+_PERSIST_INTERVAL = 0.25
+
+_INTERRUPTED = {"error": "This response was interrupted by a server restart. Please send your message again."}
+
+
+class ChatRun:
+    """One agent turn's event log, followed by any number of clients."""
+
+    def __init__(self, run_id: str, session_id: str, buffer_size: int = CHAT_RUN_BUFFER_EVENTS) -> None:
+        self.run_id = run_id
+        self.session_id = session_id
+        self.status = "running"
+        self.last_seq = 0
+        self.events: deque[tuple[int, Event]] = deque(maxlen=buffer_size)
+        self.task: asyncio.Task | None = None
+        self._unpersisted: list[tuple[int, str]] = []
+        self._wakeup = asyncio.Event()
+
+    def append(self, event: Event) -> int:
+        self.last_seq += 1
+        self.events.append((self.last_seq, event))
+        self._unpersisted.append((self.last_seq, encode_data(event).decode()))
+        self._notify()
+        return self.last_seq
+
+    def _notify(self) -> None:
+        self._wakeup.set()
+        self._wakeup = asyncio.Event()
+
+    async def persist(self, status: str | None = None) -> None:
+        """Write the events logged since the last call (and ``status``)."""
+        batch, self._unpersisted = self._unpersisted, []
+        if batch or status:
+            await append_chat_run_events(self.run_id, batch, keep=self.events.maxlen, status=status)
+
+    async def follow(self, after: int = 0) -> AsyncIterator[SeqEvent]:
+        """Events with seq > ``after``, then new ones as they're logged,
+        until the run ends."""
+        while True:
+            wakeup = self._wakeup
+            if self.events and after < self.last_seq:
+                first = self.events[0][0]
+                if after < first - 1:
+                    logger.warning("Run %s: events %d-%d left the buffer before the client resumed",
+                                   self.run_id, after + 1, first - 1)
+                for item in list(itertools.islice(self.events, max(0, after - first + 1), None)):
+                    yield item
+                    after = item[0]
+                continue
+            if self.status != "running":
+                return
+            await wakeup.wait()
+
+
+_runs: dict[str, ChatRun] = {}
+
+
+async def _drive(run: ChatRun, events: AsyncIterator[dict[str, Any]]) -> None:
+    """Run the agent to the end, logging its events; persist in batches."""
+
+    async def _persist_loop():
+        while True:
+            await asyncio.sleep(_PERSIST_INTERVAL)
+            try:
+                await run.persist()
+            except Exception:
+                logger.exception("Run %s: could not persist events", run.run_id)
+
+    persister = asyncio.create_task(_persist_loop())
+    status = "done"
+    try:
+        async for event in events:
+            run.append(event)
+        run.append(DONE)
+    except asyncio.CancelledError:
+        status = "cancelled"
+        run.append(DONE)
+    except Exception as exc:
+        logger.exception("Run %s failed after %d events: %s", run.run_id, run.last_seq, exc)
+        status = "error"
+        run.append({"error": str(exc)})
+    finally:
+        persister.cancel()
+        try:
+            await run.persist(status)
+        except Exception:
+            logger.exception("Run %s: could not persist final events", run.run_id)
+        # Followers stop only after the log is durable, so a client that
+        # saw the end can always replay it.
+        run.status = status
+        run._notify()
+        asyncio.get_running_loop().call_later(_MEMORY_TTL, _runs.pop, run.run_id, None)
+        logger.info("Run %s %s after %d events", run.run_id, status, run.last_seq)
+
+
+async def start_run(session_id: str, events: AsyncIterator[dict[str, Any]]) -> ChatRun:
+    """Start driving ``events`` (a chat() iterator) as a new run. The run's
+    first event is {"run_id": ...}."""
+    run = ChatRun(str(uuid.uuid4()), session_id)
+    try:
+        await prune_chat_runs((datetime.now(timezone.utc) - _RETENTION).isoformat())
+    except Exception:
+        logger.exception("Could not prune old chat runs")
+    await create_chat_run(run.run_id, session_id)
+    run.append({"run_id": run.run_id})
+    _runs[run.run_id] = run
+    run.task = asyncio.create_task(_drive(run, events))
+    return run
+
+
+async def _replay_from_db(run_id: str, status: str, after: int) -> AsyncIterator[SeqEvent]:
+    for row in await get_chat_run_events(run_id, after):
+        yield row["seq"], decode_data(row["data"])
+    if status == "running":
+        yield None, _INTERRUPTED
+
+
+async def follow_run(run_id: str, after: int = 0) -> AsyncIterator[SeqEvent] | None:
+    """The events of run ``run_id`` after seq ``after`` (live if it's still
+    running here), or None if there's no such run."""
+    run = _runs.get(run_id)
+    if run is not None:
+        return run.follow(after)
+    row = await get_chat_run(run_id)
+    if row is None:
+        return None
+    return _replay_from_db(run_id, row["status"], after)
+
+
+def cancel_run(run_id: str) -> bool:
+    """Stop a live run. False if it isn't running in this process."""
+    run = _runs.get(run_id)
+    if run is None or run.task is None or run.task.done():
+        return False
+    run.task.cancel()
+    return True
+
+
+async def shutdown_runs() -> None:
+    """Cancel live runs and wait for their final events to be written."""
+    tasks = [run.task for run in _runs.values() if run.task is not None and not run.task.done()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
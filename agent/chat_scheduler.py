@@ -0,0 +1,181 @@
+"""Admission control for chat runs.
+
+Each chat turn spawns (or borrows) a `claude` CLI process — seconds of
+startup and hundreds of MB — and two turns in one session would race on
+its history. So every run takes a ticket here before chat() starts:
+
+  - at most one run per session at a time; a second message waits for
+    the first to finish
+  - at most CHAT_MAX_CONCURRENT runs at a time overall (default 4)
+  - the rest wait in one FIFO queue. A ticket whose session is busy
+    doesn't hold up the tickets behind it
+  - once CHAT_MAX_QUEUE tickets are waiting (default 32), admit() raises
+    ChatQueueFull and /chat answers 503 with a Retry-After estimated from
+    recent run times
+
+While a run waits, its stream gets {"queue_position": n} events (n = 1
+is next), then {"queue_position": 0} when it starts. Queue depth, wait
+times and rejections are in GET /metrics under "chat_scheduler".
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+from collections.abc import AsyncIterator
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+CHAT_MAX_CONCURRENT = max(1, int(os.environ.get("CHAT_MAX_CONCURRENT", "4")))
+CHAT_MAX_QUEUE = max(0, int(os.environ.get("CHAT_MAX_QUEUE", "32")))
+
+# Retry-After until a run has finished to estimate from, and its bounds.
+_DEFAULT_RUN_SECONDS = 30.0
+_RETRY_AFTER_MAX = 300
+
+
+class ChatQueueFull(Exception):
+    """Too many chat runs waiting; retry after ``retry_after`` seconds."""
+
+    def __init__(self, retry_after: int) -> None:
+        super().__init__(f"Chat queue is full; retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """One chat run's place in the scheduler."""
+
+    __slots__ = ("session_id", "enqueued_at", "started_at", "released", "_wakeup")
+
+    def __init__(self, session_id: str) -> None:
+        self.session_id = session_id
+        self.enqueued_at = time.monotonic()
+        self.started_at: float | None = None
+        self.released = False
+        self._wakeup = asyncio.Event()
+
+
+class ChatScheduler:
+    def __init__(self, max_concurrent: int = CHAT_MAX_CONCURRENT, max_queue: int = CHAT_MAX_QUEUE,
+                 recent: int = 200) -> None:
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self._waiting: list[Ticket] = []
+        self._busy_sessions: set[str] = set()
+        self._running = 0
+        self._waits: deque[float] = deque(maxlen=recent)
+        self._durations: deque[float] = deque(maxlen=recent)
+        self.admitted = 0
+        self.rejected = 0
+
+    def admit(self, session_id: str) -> Ticket:
+        """Queue a run for ``session_id`` (starting it now if it can).
+        Raises ChatQueueFull when the queue is at CHAT_MAX_QUEUE."""
+        can_start = self._running < self.max_concurrent and session_id not in self._busy_sessions
+        if not can_start and len(self._waiting) >= self.max_queue:
+            self.rejected += 1
+            retry_after = self.retry_after()
+            logger.warning("Chat queue full (%d waiting, %d running); rejecting with Retry-After %ds",
+                           len(self._waiting), self._running, retry_after)
+            raise ChatQueueFull(retry_after)
+        ticket = Ticket(session_id)
+        self._waiting.append(ticket)
+        self.admitted += 1
+        self._dispatch()
+        return ticket
+
+    def retry_after(self) -> int:
+        """Seconds until a place in the queue is likely to free up."""
+        per_run = sum(self._durations) / len(self._durations) if self._durations else _DEFAULT_RUN_SECONDS
+        rounds = (len(self._waiting) + 1) / self.max_concurrent
+        return max(1, min(_RETRY_AFTER_MAX, math.ceil(per_run * rounds)))
+
+    def position(self, ticket: Ticket) -> int:
+        """1-based place among waiting runs; 0 once the run has started."""
+        return 0 if ticket.started_at is not None else self._waiting.index(ticket) + 1
+
+    def _dispatch(self) -> None:
+        started = False
+        for ticket in list(self._waiting):
+            if self._running >= self.max_concurrent:
+                break
+            if ticket.session_id in self._busy_sessions:
+                continue
+            self._waiting.remove(ticket)
+            self._busy_sessions.add(ticket.session_id)
+            self._running += 1
+            ticket.started_at = time.monotonic()
+            self._waits.append(ticket.started_at - ticket.enqueued_at)
+            ticket._wakeup.set()
+            started = True
+        if started:
+            # Everyone's position may have moved.
+            for ticket in self._waiting:
+                ticket._wakeup.set()
+
+    def release(self, ticket: Ticket) -> None:
+        """Finish (or abandon, if still waiting) ``ticket``'s run. Safe to
+        call more than once."""
+        if ticket.released:
+            return
+        ticket.released = True
+        if ticket.started_at is None:
+            if ticket in self._waiting:
+                self._waiting.remove(ticket)
+                for other in self._waiting:
+                    other._wakeup.set()
+        else:
+            self._running -= 1
+            self._busy_sessions.discard(ticket.session_id)
+            self._durations.append(time.monotonic() - ticket.started_at)
+        self._dispatch()
+
+    async def run(self, ticket: Ticket, events: AsyncIterator[dict[str, Any]]) -> AsyncIterator[dict[str, Any]]:
+        """``events`` (a chat() iterator), once ``ticket`` gets its turn,
+        preceded by queue position updates if it has to wait."""
+        try:
+            if ticket.started_at is None:
+                position = None
+                while ticket.started_at is None:
+                    if self.position(ticket) != position:
+                        position = self.position(ticket)
+                        yield {"queue_position": position}
+                    await ticket._wakeup.wait()
+                    ticket._wakeup.clear()
+                logger.info("Chat run for session %s started after %.1fs in queue",
+                            ticket.session_id, ticket.started_at - ticket.enqueued_at)
+                yield {"queue_position": 0}
+            async for event in events:
+                yield event
+        finally:
+            self.release(ticket)
+            await events.aclose()
+
+    def stats(self) -> dict[str, Any]:
+        waits = sorted(self._waits)
+
+        def pct(p: float) -> float:
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))], 3) if waits else 0.0
+
+        return {
+            "running": self._running,
+            "queue_depth": len(self._waiting),
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "wait_seconds": {
+                "p50": pct(0.5),
+                "p95": pct(0.95),
+                "max": round(waits[-1], 3) if waits else 0.0,
+                "samples": len(waits),
+            },
+        }
+
+
+chat_scheduler = ChatScheduler()
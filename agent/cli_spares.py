@@ -0,0 +1,171 @@
+"""Hot-spare CLI processes for chat()'s one-shot query() path.
+
+When the SDK client pool is off (USE_SDK_POOL=0), cold, or has no warm
+client for the requested model, chat() falls back to query(), which
+spawns the `claude` CLI and its MCP stdio servers (~4s) before the first
+token. This keeps CLI_HOT_SPARES (default 0 = off) clients per model
+already spawned and connected, each handed out for exactly one query
+and then disconnected, so the fallback answers as fast as the pool:
+
+  - take() hands the oldest ready spare to a request and starts a
+    replacement in the background right away
+  - a spare nobody takes within CLI_SPARE_MAX_AGE seconds (default 300)
+    is disconnected and replaced, so the CLI's MCP connections are never
+    older than that when used
+  - the default model always has spares; other models get them once
+    requested, for as long as they're requested at least once per
+    CLI_SPARE_MAX_AGE
+
+Single use keeps query()'s semantics: every request starts a fresh
+conversation. Spares are pool workers (agent/sdk_client_pool._Worker)
+that retire after their first query; this class stands in for the pool
+in their callbacks.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections.abc import AsyncIterator, Callable
+from typing import Any
+
+from claude_agent_sdk import ClaudeSDKClient
+
+from .sdk_client_pool import CONNECT_RETRY_DELAY_S, _Worker
+
+logger = logging.getLogger(__name__)
+
+CLI_HOT_SPARES = max(0, int(os.environ.get("CLI_HOT_SPARES", "0")))
+CLI_SPARE_MAX_AGE = float(os.environ.get("CLI_SPARE_MAX_AGE", "300"))
+
+
+class HotSpares:
+    """K connected, never-used CLI clients per model, handed out once each."""
+
+    def __init__(
+        self,
+        options_factory,
+        default_model: str,
+        spares: int = CLI_HOT_SPARES,
+        max_age: float = CLI_SPARE_MAX_AGE,
+        client_factory: Callable[..., Any] = ClaudeSDKClient,
+    ):
+        self._options_factory = options_factory
+        self._client_factory = client_factory
+        self.default_model = default_model
+        self.spares = spares
+        self.max_age = max_age
+        self._workers: dict[str, list[_Worker]] = {}
+        self._last_used: dict[str, float] = {}
+        self._not_before: dict[str, float] = {}
+        self._timers: set[asyncio.TimerHandle] = set()
+        self._retry_pending: set[str] = set()
+        self._started = False
+        self._closing = False
+        self.taken = 0
+        self.missed = 0
+
+    def start(self) -> None:
+        """Begin spawning the default model's spares in the background."""
+        self._started = True
+        self._rebalance(self.default_model)
+
+    async def shutdown(self) -> None:
+        self._closing = True
+        for timer in self._timers:
+            timer.cancel()
+        workers = [w for ws in self._workers.values() for w in ws]
+        await asyncio.gather(*(w.stop() for w in workers), return_exceptions=True)
+        self._workers.clear()
+
+    def take(self, prompt, model: str | None) -> AsyncIterator[Any] | None:
+        """Run ``prompt`` on a ready spare for ``model``: the same raw
+        message + tool event stream as SDKClientPool.dispatch(). None when
+        no spare is ready (the caller spawns its own with query())."""
+        model = model or self.default_model
+        self._last_used[model] = time.monotonic()
+        ready = [w for w in self._workers.get(model, ()) if w.is_warm and not w.retiring]
+        if not ready:
+            self.missed += 1
+            self._rebalance(model)
+            return None
+        spare = min(ready, key=lambda w: w.connected_at)
+        spare.load += 1
+        spare.served += 1
+        results = spare.submit(prompt)
+        spare.retire()  # exits after this one query
+        self.taken += 1
+        self._rebalance(model)
+        return results
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "taken": self.taken,
+            "missed": self.missed,
+            "ready": {m: sum(w.is_warm and not w.retiring for w in ws) for m, ws in self._workers.items()},
+        }
+
+    def _wanted(self, model: str) -> int:
+        if model == self.default_model:
+            return self.spares
+        recent = time.monotonic() - self._last_used.get(model, float("-inf")) < self.max_age
+        return self.spares if recent else 0
+
+    def _rebalance(self, model: str) -> None:
+        """Start spares until ``model`` has as many unused ones as it should."""
+        if self._closing or not self._started:
+            return
+        workers = self._workers.setdefault(model, [])
+        unused = [w for w in workers if not w.retiring]
+        missing = self._wanted(model) - len(unused)
+        delay = self._not_before.get(model, 0.0) - time.monotonic()
+        if missing > 0 and delay > 0:
+            if model not in self._retry_pending:
+                self._retry_pending.add(model)
+                self._call_later(delay, self._retry, model)
+            return
+        for _ in range(missing):
+            worker = _Worker(self, model)
+            workers.append(worker)
+            worker.start()
+
+    def _retry(self, model: str) -> None:
+        self._retry_pending.discard(model)
+        self._rebalance(model)
+
+    def _call_later(self, delay: float, fn, *args) -> None:
+        timer = asyncio.get_running_loop().call_later(delay, lambda: (self._timers.discard(timer), fn(*args)))
+        self._timers.add(timer)
+
+    def _expire(self, worker: _Worker) -> None:
+        if worker.served == 0 and not worker.retiring:
+            logger.info("CLI spare (%s) unused for %.0fs — replacing", worker.model, worker.age)
+            worker.retire()
+
+    # Callbacks from _Worker.
+
+    def _on_worker_ready(self, worker: _Worker) -> None:
+        self._call_later(self.max_age, self._expire, worker)
+
+    def _on_worker_exit(self, worker: _Worker) -> None:
+        workers = self._workers.get(worker.model, [])
+        if worker in workers:
+            workers.remove(worker)
+        if worker.failure == "connect":
+            self._not_before[worker.model] = time.monotonic() + CONNECT_RETRY_DELAY_S
+        self._rebalance(worker.model)
+
+
+# Module-level singleton, set up in server.py's lifespan when
+# CLI_HOT_SPARES > 0.
+_spares: HotSpares | None = None
+
+
+def get_spares() -> HotSpares | None:
+    return _spares
+
+
+def init_spares(options_factory, default_model: str) -> HotSpares:
+    global _spares
+    _spares = HotSpares(options_factory, default_model)
+    return _spares
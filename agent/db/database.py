@@ -6,15 +6,27 @@ otherwise falls back to SQLite (via aiosqlite) for local development.
 
 from __future__ import annotations
 
+import asyncio
 import logging
 import os
 import re
 from abc import ABC, abstractmethod
+from collections.abc import AsyncIterator, Iterable
+from contextlib import AbstractAsyncContextManager, asynccontextmanager
+from contextvars import ContextVar
 from pathlib import Path
 from typing import Any
+from urllib.parse import quote
 
 logger = logging.getLogger(__name__)
 
+# (database, connection) of the transaction open in the current task, if any.
+# A ContextVar rather than an attribute so concurrent requests each see only
+# their own transaction; child tasks created inside the block inherit it.
+_current_txn: ContextVar[tuple[Database, Any] | None] = ContextVar(
+    "current_txn", default=None
+)
+
 
 def _sqlite_to_pg(sql: str) -> str:
     """Convert ``?`` placeholders to ``$1, $2, ...`` for PostgreSQL."""
@@ -28,13 +40,46 @@ def _sqlite_to_pg(sql: str) -> str:
     return re.sub(r"\?", _replacer, sql)
 
 
+# SQLite has no ADD COLUMN IF NOT EXISTS; _migrate drops these statements
+# itself when the column is already there.
+_ADD_COLUMN_RE = re.compile(r"ALTER TABLE (\w+) ADD COLUMN (\w+)[^;]*;", re.IGNORECASE)
+
+
 class Database(ABC):
     """Unified async database interface."""
 
+    #: SQL dialect name ("sqlite" or "postgres"), for the few statements
+    #: whose syntax differs between backends (JSON functions mostly).
+    dialect: str
+
     @abstractmethod
     async def execute(self, sql: str, params: tuple | list = ()) -> str:
         """Execute a statement. Returns a status string (e.g. 'DELETE 1')."""
 
+    @abstractmethod
+    async def execute_returning(
+        self, sql: str, params: tuple | list = ()
+    ) -> dict[str, Any] | None:
+        """Execute an INSERT/UPDATE/DELETE ... RETURNING statement.
+
+        Runs on the write path (and commits, outside a transaction) and
+        returns the first returned row as a dict, or None if no row matched.
+        """
+
+    @abstractmethod
+    async def executemany(self, sql: str, rows: Iterable[tuple | list]) -> None:
+        """Execute a statement once per parameter row, as a single batch."""
+
+    @abstractmethod
+    def transaction(self) -> AbstractAsyncContextManager[None]:
+        """Group statements into one transaction (one commit).
+
+        Usage: ``async with db.transaction(): ...``. Every statement the
+        current task issues inside the block — reads included — runs on the
+        same connection and is committed on exit, or rolled back if the
+        block raises. Nested blocks join the outer transaction.
+        """
+
     @abstractmethod
     async def fetch(self, sql: str, params: tuple | list = ()) -> list[dict[str, Any]]:
         """Execute a query and return all rows as dicts."""
@@ -51,10 +96,17 @@ class Database(ABC):
     async def init_tables(self) -> None:
         """Create tables and indexes, run backend-specific migrations."""
 
+    def _txn_conn(self) -> Any | None:
+        """Connection of this database's transaction in the current task."""
+        txn = _current_txn.get()
+        return txn[1] if txn is not None and txn[0] is self else None
+
 
 class PostgresDatabase(Database):
     """PostgreSQL backend using asyncpg."""
 
+    dialect = "postgres"
+
     def __init__(self) -> None:
         self._pool = None
 
@@ -66,19 +118,50 @@ class PostgresDatabase(Database):
             logger.info("PostgreSQL connection pool created")
         return self._pool
 
+    async def _target(self):
+        """The open transaction's connection, else the pool."""
+        return self._txn_conn() or await self._get_pool()
+
     async def execute(self, sql: str, params: tuple | list = ()) -> str:
-        pool = await self._get_pool()
-        result = await pool.execute(_sqlite_to_pg(sql), *params)
+        target = await self._target()
+        result = await target.execute(_sqlite_to_pg(sql), *params)
         return result or ""
 
-    async def fetch(self, sql: str, params: tuple | list = ()) -> list[dict[str, Any]]:
+    async def execute_returning(
+        self, sql: str, params: tuple | list = ()
+    ) -> dict[str, Any] | None:
+        target = await self._target()
+        row = await target.fetchrow(_sqlite_to_pg(sql), *params)
+        return dict(row) if row else None
+
+    async def executemany(self, sql: str, rows: Iterable[tuple | list]) -> None:
+        # asyncpg pipelines executemany into one round trip per batch
+        # rather than one per row.
+        target = await self._target()
+        await target.executemany(_sqlite_to_pg(sql), [tuple(r) for r in rows])
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[None]:
+        if self._txn_conn() is not None:
+            yield
+            return
         pool = await self._get_pool()
-        rows = await pool.fetch(_sqlite_to_pg(sql), *params)
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                token = _current_txn.set((self, conn))
+                try:
+                    yield
+                finally:
+                    _current_txn.reset(token)
+
+    async def fetch(self, sql: str, params: tuple | list = ()) -> list[dict[str, Any]]:
+        target = await self._target()
+        rows = await target.fetch(_sqlite_to_pg(sql), *params)
         return [dict(r) for r in rows]
 
     async def fetchrow(self, sql: str, params: tuple | list = ()) -> dict[str, Any] | None:
-        pool = await self._get_pool()
-        row = await pool.fetchrow(_sqlite_to_pg(sql), *params)
+        target = await self._target()
+        row = await target.fetchrow(_sqlite_to_pg(sql), *params)
         return dict(row) if row else None
 
     async def close(self) -> None:
@@ -88,21 +171,56 @@ class PostgresDatabase(Database):
             logger.info("PostgreSQL connection pool closed")
 
     async def init_tables(self) -> None:
-        from .models import PG_TABLES, CREATE_INDEXES
+        from .models import PG_TABLES, PG_MIGRATIONS, CREATE_INDEXES, PG_KEY_INDEXES
         pool = await self._get_pool()
         async with pool.acquire() as conn:
             for ddl in PG_TABLES:
                 await conn.execute(ddl)
-            for idx in CREATE_INDEXES:
+            for migration in PG_MIGRATIONS:
+                await conn.execute(migration)
+            for idx in CREATE_INDEXES + PG_KEY_INDEXES:
                 await conn.execute(idx)
 
 
 class SQLiteDatabase(Database):
-    """SQLite backend using aiosqlite."""
+    """SQLite backend using aiosqlite.
+
+    One writer connection serialises everything that mutates the file;
+    ``fetch``/``fetchrow`` go to a small pool of read-only connections.
+    aiosqlite runs each connection on its own thread, so with a single
+    connection a dashboard ``GET /records`` queued behind whatever the chat
+    path was writing (conversation turns, keyframe BLOBs). WAL mode lets
+    readers see the last committed snapshot without blocking the writer.
 
-    def __init__(self, db_path: str | Path) -> None:
+    ``read_pool_size=0`` (``SQLITE_READ_POOL_SIZE=0``) routes reads through
+    the writer connection again — the old single-connection behaviour.
+    In-memory databases (``":memory:"``, ``""``) always do: another
+    connection can't open them, it would get a new empty database.
+
+    Writes hold ``_write_lock`` for the statement + commit, and
+    ``transaction()`` holds it for the whole block, so another task's
+    autocommit write can never land inside someone else's transaction.
+    """
+
+    dialect = "sqlite"
+
+    DEFAULT_READ_POOL_SIZE = 4
+
+    def __init__(self, db_path: str | Path, read_pool_size: int | None = None) -> None:
         self._db_path = str(db_path)
         self._conn = None
+        if read_pool_size is None:
+            read_pool_size = int(os.environ.get(
+                "SQLITE_READ_POOL_SIZE", self.DEFAULT_READ_POOL_SIZE))
+        if self._db_path in ("", ":memory:"):
+            read_pool_size = 0
+        self._read_pool_size = max(0, read_pool_size)
+        # Idle read-only connections. Readers are opened lazily, up to
+        # _read_pool_size, the first time concurrent reads need them.
+        self._idle_readers: asyncio.Queue | None = None
+        self._readers: list = []
+        self._readers_opening = 0
+        self._write_lock = asyncio.Lock()
 
     async def _get_conn(self):
         if self._conn is None:
@@ -115,38 +233,168 @@ class SQLiteDatabase(Database):
             logger.info("SQLite connection opened: %s", self._db_path)
         return self._conn
 
+    async def _open_reader(self):
+        import aiosqlite
+        # The writer creates the file and switches it to WAL; a read-only
+        # connection can't do either.
+        await self._get_conn()
+        uri = f"file:{quote(self._db_path)}?mode=ro"
+        conn = await aiosqlite.connect(uri, uri=True)
+        conn.row_factory = aiosqlite.Row
+        self._readers.append(conn)
+        logger.debug("SQLite reader %d opened", len(self._readers))
+        return conn
+
+    @asynccontextmanager
+    async def _reader(self):
+        """Borrow a read-only connection (or the writer when pooling is off).
+
+        Inside a transaction reads go to the transaction's connection so
+        they see its uncommitted writes.
+        """
+        txn_conn = self._txn_conn()
+        if txn_conn is not None:
+            yield txn_conn
+            return
+        if self._read_pool_size == 0:
+            yield await self._get_conn()
+            return
+        if self._idle_readers is None:
+            self._idle_readers = asyncio.Queue()
+        opened = len(self._readers) + self._readers_opening
+        if self._idle_readers.empty() and opened < self._read_pool_size:
+            # Reserve the slot before awaiting so concurrent callers don't
+            # all decide to open one.
+            self._readers_opening += 1
+            try:
+                conn = await self._open_reader()
+            finally:
+                self._readers_opening -= 1
+        else:
+            conn = await self._idle_readers.get()
+        try:
+            yield conn
+        finally:
+            self._idle_readers.put_nowait(conn)
+
     async def execute(self, sql: str, params: tuple | list = ()) -> str:
-        conn = await self._get_conn()
-        cursor = await conn.execute(sql, tuple(params))
-        await conn.commit()
+        conn = self._txn_conn()
+        if conn is not None:
+            cursor = await conn.execute(sql, tuple(params))
+            return f"OK {cursor.rowcount}"
+        async with self._write_lock:
+            conn = await self._get_conn()
+            cursor = await conn.execute(sql, tuple(params))
+            await conn.commit()
         return f"OK {cursor.rowcount}"
 
+    async def execute_returning(
+        self, sql: str, params: tuple | list = ()
+    ) -> dict[str, Any] | None:
+        # fetchall, not fetchone: the statement has to run to completion
+        # before COMMIT, or SQLite refuses with "SQL statements in progress".
+        conn = self._txn_conn()
+        if conn is not None:
+            cursor = await conn.execute(sql, tuple(params))
+            rows = await cursor.fetchall()
+        else:
+            async with self._write_lock:
+                conn = await self._get_conn()
+                cursor = await conn.execute(sql, tuple(params))
+                rows = await cursor.fetchall()
+                await conn.commit()
+        return dict(rows[0]) if rows else None
+
+    async def executemany(self, sql: str, rows: Iterable[tuple | list]) -> None:
+        rows = [tuple(r) for r in rows]
+        conn = self._txn_conn()
+        if conn is not None:
+            await conn.executemany(sql, rows)
+            return
+        async with self._write_lock:
+            conn = await self._get_conn()
+            await conn.executemany(sql, rows)
+            await conn.commit()
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[None]:
+        if self._txn_conn() is not None:
+            yield
+            return
+        async with self._write_lock:
+            conn = await self._get_conn()
+            # IMMEDIATE takes the write lock up front instead of upgrading
+            # from a read lock mid-transaction.
+            await conn.execute("BEGIN IMMEDIATE")
+            token = _current_txn.set((self, conn))
+            try:
+                yield
+            except BaseException:
+                await conn.rollback()
+                raise
+            else:
+                await conn.commit()
+            finally:
+                _current_txn.reset(token)
+
     async def fetch(self, sql: str, params: tuple | list = ()) -> list[dict[str, Any]]:
-        conn = await self._get_conn()
-        cursor = await conn.execute(sql, tuple(params))
-        rows = await cursor.fetchall()
+        async with self._reader() as conn:
+            cursor = await conn.execute(sql, tuple(params))
+            rows = await cursor.fetchall()
         return [dict(r) for r in rows]
 
     async def fetchrow(self, sql: str, params: tuple | list = ()) -> dict[str, Any] | None:
-        conn = await self._get_conn()
-        cursor = await conn.execute(sql, tuple(params))
-        row = await cursor.fetchone()
+        async with self._reader() as conn:
+            cursor = await conn.execute(sql, tuple(params))
+            row = await cursor.fetchone()
         return dict(row) if row else None
 
     async def close(self) -> None:
+        for reader in self._readers:
+            await reader.close()
+        self._readers.clear()
+        self._idle_readers = None
         if self._conn is not None:
             await self._conn.close()
             self._conn = None
             logger.info("SQLite connection closed")
 
     async def init_tables(self) -> None:
-        from .models import SQLITE_TABLES, CREATE_INDEXES
-        conn = await self._get_conn()
-        for ddl in SQLITE_TABLES:
-            await conn.executescript(ddl)
-        for idx in CREATE_INDEXES:
-            await conn.execute(idx)
-        await conn.commit()
+        from .models import SQLITE_TABLES, SQLITE_MIGRATIONS, CREATE_INDEXES, SQLITE_KEY_INDEXES
+        async with self._write_lock:
+            conn = await self._get_conn()
+            cursor = await conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'metadata_records'")
+            fresh = await cursor.fetchone() is None
+            for ddl in SQLITE_TABLES:
+                await conn.executescript(ddl)
+            await self._migrate(conn, SQLITE_MIGRATIONS, fresh)
+            for idx in CREATE_INDEXES + SQLITE_KEY_INDEXES:
+                await conn.execute(idx)
+            await conn.commit()
+
+    @staticmethod
+    async def _migrate(conn, migrations: list[str], fresh: bool) -> None:
+        """Apply the migrations this file hasn't seen yet (PRAGMA user_version).
+
+        A fresh file already has the latest schema, so it's just stamped.
+        An older file can still have tables that SQLITE_TABLES just created
+        with their current columns (e.g. sessions), so ADD COLUMN statements
+        for columns that already exist are skipped.
+        """
+        cursor = await conn.execute("PRAGMA user_version")
+        version = (await cursor.fetchone())[0]
+        if fresh:
+            version = len(migrations)
+        for i, script in enumerate(migrations[version:], start=version + 1):
+            logger.info("Applying SQLite migration %d", i)
+            for match in list(_ADD_COLUMN_RE.finditer(script)):
+                cursor = await conn.execute(f"PRAGMA table_info({match.group(1)})")
+                if match.group(2) in {row[1] for row in await cursor.fetchall()}:
+                    script = script.replace(match.group(0), "", 1)
+            await conn.executescript(script)
+        # PRAGMA doesn't take bound parameters.
+        await conn.execute(f"PRAGMA user_version = {len(migrations)}")
 
 
 _db: Database | None = None
@@ -3,10 +3,66 @@
 Provides both SQLite and PostgreSQL DDL variants.
 """
 
+# ---------------------------------------------------------------------------
+# Full-text search over metadata_records
+# ---------------------------------------------------------------------------
+
+# Identifier fields that get their own search column, weighted above the
+# rest of the document, so "4528" ranks the subject whose subject_id is 4528
+# above a record that merely mentions it.
+SEARCH_KEY_FIELDS = ("subject_id", "genotype", "instrument_id", "rig_id", "project_name")
+
+
+def _sqlite_search_values(doc: str) -> str:
+    """(name, keys, body) values for a records_fts row built from ``doc``."""
+    keys = " || ' ' || ".join(
+        f"COALESCE(json_extract({doc}.data_json, '$.{f}'), '')" for f in SEARCH_KEY_FIELDS
+    )
+    body = (
+        f"(SELECT group_concat(value, ' ') FROM json_tree({doc}.data_json) "
+        f"WHERE type NOT IN ('object', 'array'))"
+    )
+    return f"{doc}.name, {keys}, {body}"
+
+
+# Search document for Postgres: the same three parts as the SQLite FTS
+# columns, as weights A/B/C. Indexed with GIN as an expression (not a
+# stored column) so SELECT * stays unchanged; queries must repeat it
+# verbatim for the planner to use the index.
+PG_SEARCH_VECTOR = (
+    "(setweight(to_tsvector('simple'::regconfig, coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple'::regconfig, "
+    + " || ' ' || ".join(f"coalesce(data_json->>'{f}', '')" for f in SEARCH_KEY_FIELDS)
+    + "), 'B') || "
+    "setweight(jsonb_to_tsvector('simple'::regconfig, data_json, '[\"string\", \"numeric\"]'), 'C'))"
+)
+
 # ---------------------------------------------------------------------------
 # SQLite DDL
 # ---------------------------------------------------------------------------
 
+# Keep records_fts in step with metadata_records, through records_fts_ids.
+_FTS_ROWID = "(SELECT fts_rowid FROM records_fts_ids WHERE record_id = {}.id)"
+_RECORDS_FTS_TRIGGERS = f"""
+CREATE TRIGGER IF NOT EXISTS records_fts_insert AFTER INSERT ON metadata_records BEGIN
+    INSERT OR IGNORE INTO records_fts_ids (record_id) VALUES (new.id);
+    DELETE FROM records_fts WHERE rowid = {_FTS_ROWID.format('new')};
+    INSERT INTO records_fts (rowid, name, keys, body)
+        SELECT fts_rowid, {_sqlite_search_values('new')}
+        FROM records_fts_ids WHERE record_id = new.id;
+END;
+CREATE TRIGGER IF NOT EXISTS records_fts_update AFTER UPDATE OF name, data_json ON metadata_records BEGIN
+    DELETE FROM records_fts WHERE rowid = {_FTS_ROWID.format('old')};
+    INSERT INTO records_fts (rowid, name, keys, body)
+        SELECT fts_rowid, {_sqlite_search_values('new')}
+        FROM records_fts_ids WHERE record_id = new.id;
+END;
+CREATE TRIGGER IF NOT EXISTS records_fts_delete AFTER DELETE ON metadata_records BEGIN
+    DELETE FROM records_fts WHERE rowid = {_FTS_ROWID.format('old')};
+    DELETE FROM records_fts_ids WHERE record_id = old.id;
+END;
+"""
+
 SQLITE_TABLES = [
     """
 CREATE TABLE IF NOT EXISTS metadata_records (
@@ -45,8 +101,28 @@ CREATE TABLE IF NOT EXISTS conversations (
     role TEXT NOT NULL CHECK (role IN ('user', 'assistant')),
     content TEXT NOT NULL,
     attachments_json TEXT,
+    token_estimate INTEGER,
     created_at TEXT NOT NULL DEFAULT (datetime('now'))
 );
+""",
+    # One row per chat session, maintained by save_conversation_turn /
+    # create_record / delete_*, so the sidebar's /sessions is an indexed
+    # read instead of an aggregate over every conversation turn.
+    # history_start_id / history_summary hold the chat history window
+    # (agent/history.py): the first conversations.id shown in full, and the
+    # rolling summary of the turns before it.
+    """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    last_active TEXT NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    first_message TEXT,
+    record_count INTEGER NOT NULL DEFAULT 0,
+    model TEXT,
+    history_start_id INTEGER,
+    history_summary TEXT
+);
 """,
     """
 CREATE TABLE IF NOT EXISTS uploads (
@@ -55,13 +131,17 @@ CREATE TABLE IF NOT EXISTS uploads (
     content_type TEXT NOT NULL,
     file_path TEXT NOT NULL,
     size_bytes INTEGER NOT NULL,  -- SQLite INTEGER is 64-bit, fine for large files
-    file_data BLOB,
+    blob_digest TEXT,
     session_id TEXT,
     extracted_text TEXT,
     extracted_meta_json TEXT,
     extraction_status TEXT DEFAULT 'pending',
     extraction_error TEXT,
-    created_at TEXT NOT NULL DEFAULT (datetime('now'))
+    created_at TEXT NOT NULL DEFAULT (datetime('now')),
+    -- Legacy; new uploads live in the blob store (blob_digest). Kept last:
+    -- SQLite walks a large value's overflow pages to reach any column
+    -- stored after it.
+    file_data BLOB
 );
 """,
     """
@@ -81,11 +161,57 @@ CREATE TABLE IF NOT EXISTS upload_keyframes (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     upload_id TEXT NOT NULL,
     frame_idx INTEGER NOT NULL,
-    frame_data BLOB NOT NULL,
+    frame_data BLOB,  -- legacy; new frames live in the blob store (frame_digest)
+    frame_digest TEXT,
     caption TEXT NOT NULL,
     created_at TEXT NOT NULL DEFAULT (datetime('now'))
 );
 """,
+    # Blob store contents for BLOB_STORE=db (agent/blob_store.py).
+    """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    created_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
+""",
+    # Resumable chat runs (agent/chat_runs.py): one row per agent turn, plus
+    # the tail of its SSE event log (the last CHAT_RUN_BUFFER_EVENTS
+    # events; ``data`` is the frame's data: payload).
+    """
+CREATE TABLE IF NOT EXISTS chat_runs (
+    run_id TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'running'
+        CHECK (status IN ('running', 'done', 'error', 'cancelled')),
+    last_seq INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+""",
+    """
+CREATE TABLE IF NOT EXISTS chat_run_events (
+    run_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (run_id, seq)
+);
+""",
+    # Full-text index over records. `keys` holds SEARCH_KEY_FIELDS, `body`
+    # every scalar value in data_json. metadata_records has a TEXT primary
+    # key, so its implicit rowid can be renumbered by VACUUM; the index is
+    # keyed on records_fts_ids.fts_rowid (an INTEGER PRIMARY KEY, which
+    # VACUUM keeps) instead, and the triggers keep both in sync.
+    """
+CREATE TABLE IF NOT EXISTS records_fts_ids (
+    fts_rowid INTEGER PRIMARY KEY,
+    record_id TEXT NOT NULL UNIQUE
+);
+""",
+    """
+CREATE VIRTUAL TABLE IF NOT EXISTS records_fts USING fts5(name, keys, body, prefix='2 3');
+""",
+    _RECORDS_FTS_TRIGGERS,
 ]
 
 # ---------------------------------------------------------------------------
@@ -106,10 +232,10 @@ CREATE TABLE IF NOT EXISTS metadata_records (
     category TEXT NOT NULL
         CHECK (category IN ('shared', 'asset')),
     name TEXT,
-    data_json TEXT NOT NULL DEFAULT '{}',
+    data_json JSONB NOT NULL DEFAULT '{}'::jsonb,
     status TEXT NOT NULL DEFAULT 'draft'
         CHECK (status IN ('draft', 'validated', 'confirmed', 'error')),
-    validation_json TEXT,
+    validation_json JSONB,
     created_at TEXT NOT NULL DEFAULT (NOW() AT TIME ZONE 'UTC')::TEXT,
     updated_at TEXT NOT NULL DEFAULT (NOW() AT TIME ZONE 'UTC')::TEXT
 );
@@ -130,8 +256,22 @@ CREATE TABLE IF NOT EXISTS conversations (
     role TEXT NOT NULL CHECK (role IN ('user', 'assistant')),
     content TEXT NOT NULL,
     attachments_json TEXT,
+    token_estimate INTEGER,
     created_at TEXT NOT NULL DEFAULT (NOW() AT TIME ZONE 'UTC')::TEXT
 );
+""",
+    """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    last_active TEXT NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    first_message TEXT,
+    record_count INTEGER NOT NULL DEFAULT 0,
+    model TEXT,
+    history_start_id INTEGER,
+    history_summary TEXT
+);
 """,
     """
 CREATE TABLE IF NOT EXISTS uploads (
@@ -140,7 +280,8 @@ CREATE TABLE IF NOT EXISTS uploads (
     content_type TEXT NOT NULL,
     file_path TEXT NOT NULL,
     size_bytes BIGINT NOT NULL,
-    file_data BYTEA,
+    file_data BYTEA,  -- legacy; new uploads live in the blob store (blob_digest)
+    blob_digest TEXT,
     session_id TEXT,
     extracted_text TEXT,
     extracted_meta_json TEXT,
@@ -166,10 +307,37 @@ CREATE TABLE IF NOT EXISTS upload_keyframes (
     id SERIAL PRIMARY KEY,
     upload_id TEXT NOT NULL,
     frame_idx INTEGER NOT NULL,
-    frame_data BYTEA NOT NULL,
+    frame_data BYTEA,  -- legacy; new frames live in the blob store (frame_digest)
+    frame_digest TEXT,
     caption TEXT NOT NULL,
     created_at TEXT NOT NULL DEFAULT (NOW() AT TIME ZONE 'UTC')::TEXT
 );
+""",
+    """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    data BYTEA NOT NULL,
+    created_at TEXT NOT NULL DEFAULT (NOW() AT TIME ZONE 'UTC')::TEXT
+);
+""",
+    """
+CREATE TABLE IF NOT EXISTS chat_runs (
+    run_id TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'running'
+        CHECK (status IN ('running', 'done', 'error', 'cancelled')),
+    last_seq INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+""",
+    """
+CREATE TABLE IF NOT EXISTS chat_run_events (
+    run_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (run_id, seq)
+);
 """,
 ]
 
@@ -182,14 +350,257 @@ CREATE_INDEXES = [
     "CREATE INDEX IF NOT EXISTS idx_records_type ON metadata_records(record_type)",
     "CREATE INDEX IF NOT EXISTS idx_records_category ON metadata_records(category)",
     "CREATE INDEX IF NOT EXISTS idx_records_status ON metadata_records(status)",
+    # Keyset pagination order for list_records (newest first).
+    "CREATE INDEX IF NOT EXISTS idx_records_created ON metadata_records(created_at, id)",
+    "CREATE INDEX IF NOT EXISTS idx_sessions_last_active ON sessions(last_active, session_id)",
     "CREATE INDEX IF NOT EXISTS idx_links_source ON record_links(source_id)",
     "CREATE INDEX IF NOT EXISTS idx_links_target ON record_links(target_id)",
     "CREATE INDEX IF NOT EXISTS idx_conv_session ON conversations(session_id)",
+    "CREATE INDEX IF NOT EXISTS idx_conv_session_id ON conversations(session_id, id)",
     "CREATE INDEX IF NOT EXISTS idx_uploads_session ON uploads(session_id)",
     "CREATE INDEX IF NOT EXISTS idx_artifacts_session ON artifacts(session_id)",
     "CREATE INDEX IF NOT EXISTS idx_keyframes_upload ON upload_keyframes(upload_id)",
+    "CREATE INDEX IF NOT EXISTS idx_chat_runs_session ON chat_runs(session_id)",
+    "CREATE INDEX IF NOT EXISTS idx_chat_runs_updated ON chat_runs(updated_at)",
+]
+
+# ---------------------------------------------------------------------------
+# Migrations
+# ---------------------------------------------------------------------------
+
+# Rebuild the sessions summary from conversations + metadata_records, for
+# databases that predate the table. Valid on both backends. ("WHERE true"
+# keeps SQLite from reading ON CONFLICT as part of the SELECT.) Record-only
+# sessions get metadata_records' ISO timestamps here; a later migration
+# rewrites them in the format the rest of the table uses.
+_SESSIONS_BACKFILL = """
+INSERT INTO sessions (session_id, created_at, last_active, message_count, first_message, record_count)
+    SELECT c.session_id, MIN(c.created_at), MAX(c.created_at), COUNT(*),
+           (SELECT c2.content FROM conversations c2
+            WHERE c2.session_id = c.session_id AND c2.role = 'user'
+            ORDER BY c2.created_at, c2.id LIMIT 1),
+           (SELECT COUNT(*) FROM metadata_records m WHERE m.session_id = c.session_id)
+    FROM conversations c WHERE true GROUP BY c.session_id
+    ON CONFLICT (session_id) DO NOTHING;
+INSERT INTO sessions (session_id, created_at, last_active, message_count, record_count)
+    SELECT session_id, MIN(created_at), MIN(created_at), 0, COUNT(*)
+    FROM metadata_records WHERE true GROUP BY session_id
+    ON CONFLICT (session_id) DO NOTHING;
+"""
+
+# SQLite: each entry is a script applied once, in order, tracked with
+# PRAGMA user_version. A fresh database is created from SQLITE_TABLES at the
+# latest version and skips them all, so only ever append to this list.
+SQLITE_MIGRATIONS = [
+    # 1: make every data_json / validation_json a valid, singly-encoded JSON
+    # document so updates can use the JSON1 functions on it. Unparseable
+    # text is kept as a JSON string; a JSON string that itself holds a JSON
+    # document (double-encoded) is unwrapped.
+    """
+UPDATE metadata_records SET data_json = json_quote(data_json)
+    WHERE NOT json_valid(data_json);
+UPDATE metadata_records SET data_json = json(json_extract(data_json, '$'))
+    WHERE json_type(data_json) = 'text' AND json_valid(json_extract(data_json, '$'));
+UPDATE metadata_records SET validation_json = json_quote(validation_json)
+    WHERE validation_json IS NOT NULL AND NOT json_valid(validation_json);
+UPDATE metadata_records SET validation_json = json(json_extract(validation_json, '$'))
+    WHERE json_type(validation_json) = 'text' AND json_valid(json_extract(validation_json, '$'));
+""",
+    # 2: index records that predate records_fts.
+    f"""
+DELETE FROM records_fts;
+INSERT INTO records_fts (rowid, name, keys, body)
+    SELECT m.rowid, {_sqlite_search_values('m')} FROM metadata_records AS m;
+""",
+    # 3: fill the sessions summary table.
+    _SESSIONS_BACKFILL,
+    # 4: upload bytes move to the blob store. upload_keyframes is rebuilt
+    # because SQLite can't drop the NOT NULL on frame_data in place.
+    """
+BEGIN;
+ALTER TABLE uploads ADD COLUMN blob_digest TEXT;
+CREATE TABLE upload_keyframes_new (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    upload_id TEXT NOT NULL,
+    frame_idx INTEGER NOT NULL,
+    frame_data BLOB,
+    frame_digest TEXT,
+    caption TEXT NOT NULL,
+    created_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
+INSERT INTO upload_keyframes_new (id, upload_id, frame_idx, frame_data, caption, created_at)
+    SELECT id, upload_id, frame_idx, frame_data, caption, created_at FROM upload_keyframes;
+DROP TABLE upload_keyframes;
+ALTER TABLE upload_keyframes_new RENAME TO upload_keyframes;
+COMMIT;
+""",
+    # 5: rebuild uploads with file_data as the last column, so reading the
+    # metadata of a legacy row no longer walks its blob's overflow pages.
+    """
+BEGIN;
+CREATE TABLE uploads_new (
+    id TEXT PRIMARY KEY,
+    original_filename TEXT NOT NULL,
+    content_type TEXT NOT NULL,
+    file_path TEXT NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    blob_digest TEXT,
+    session_id TEXT,
+    extracted_text TEXT,
+    extracted_meta_json TEXT,
+    extraction_status TEXT DEFAULT 'pending',
+    extraction_error TEXT,
+    created_at TEXT NOT NULL DEFAULT (datetime('now')),
+    file_data BLOB
+);
+INSERT INTO uploads_new
+    SELECT id, original_filename, content_type, file_path, size_bytes, blob_digest,
+           session_id, extracted_text, extracted_meta_json, extraction_status,
+           extraction_error, created_at, file_data
+    FROM uploads;
+DROP TABLE uploads;
+ALTER TABLE uploads_new RENAME TO uploads;
+COMMIT;
+""",
+    # 6: token-budgeted history. Older turns have no token_estimate; readers
+    # fall back to estimating from the content length.
+    """
+ALTER TABLE conversations ADD COLUMN token_estimate INTEGER;
+ALTER TABLE sessions ADD COLUMN history_start_id INTEGER;
+ALTER TABLE sessions ADD COLUMN history_summary TEXT;
+""",
+    # 7: sessions started by create_record had ISO-8601 timestamps
+    # ("…T…+00:00"); everything else writes datetime('now')'s format.
+    """
+UPDATE sessions SET created_at = datetime(created_at) WHERE created_at LIKE '%T%';
+UPDATE sessions SET last_active = datetime(last_active) WHERE last_active LIKE '%T%';
+""",
+    # 8: key records_fts on records_fts_ids instead of metadata_records'
+    # rowid, which VACUUM may renumber, and re-index every record.
+    f"""
+BEGIN;
+DROP TRIGGER IF EXISTS records_fts_insert;
+DROP TRIGGER IF EXISTS records_fts_update;
+DROP TRIGGER IF EXISTS records_fts_delete;
+{_RECORDS_FTS_TRIGGERS}
+DELETE FROM records_fts_ids;
+DELETE FROM records_fts;
+INSERT INTO records_fts_ids (record_id) SELECT id FROM metadata_records;
+INSERT INTO records_fts (rowid, name, keys, body)
+    SELECT k.fts_rowid, {_sqlite_search_values('m')}
+    FROM metadata_records AS m JOIN records_fts_ids AS k ON k.record_id = m.id;
+COMMIT;
+""",
+]
+
+# PostgreSQL: idempotent statements run on every startup.
+PG_MIGRATIONS = [
+    # data_json / validation_json were TEXT before they were JSONB.
+    # Unparseable text is kept as a JSON string rather than failing the
+    # ALTER; double-encoded documents are unwrapped.
+    """
+DO $$
+BEGIN
+    IF (SELECT data_type FROM information_schema.columns
+        WHERE table_name = 'metadata_records' AND column_name = 'data_json') = 'text' THEN
+        CREATE OR REPLACE FUNCTION pg_temp.to_jsonb_lenient(t TEXT) RETURNS JSONB AS $f$
+        DECLARE
+            j JSONB;
+        BEGIN
+            IF t IS NULL THEN
+                RETURN NULL;
+            END IF;
+            BEGIN
+                j := t::jsonb;
+            EXCEPTION WHEN others THEN
+                RETURN to_jsonb(t);
+            END;
+            IF jsonb_typeof(j) = 'string' THEN
+                BEGIN
+                    RETURN (j #>> '{}')::jsonb;
+                EXCEPTION WHEN others THEN
+                    RETURN j;
+                END;
+            END IF;
+            RETURN j;
+        END
+        $f$ LANGUAGE plpgsql;
+
+        ALTER TABLE metadata_records ALTER COLUMN data_json DROP DEFAULT;
+        ALTER TABLE metadata_records
+            ALTER COLUMN data_json TYPE JSONB USING pg_temp.to_jsonb_lenient(data_json),
+            ALTER COLUMN validation_json TYPE JSONB USING pg_temp.to_jsonb_lenient(validation_json);
+        ALTER TABLE metadata_records ALTER COLUMN data_json SET DEFAULT '{}'::jsonb;
+    END IF;
+END
+$$;
+""",
+    f"CREATE INDEX IF NOT EXISTS idx_records_search ON metadata_records USING GIN ({PG_SEARCH_VECTOR})",
+    "ALTER TABLE uploads ADD COLUMN IF NOT EXISTS blob_digest TEXT",
+    "ALTER TABLE upload_keyframes ADD COLUMN IF NOT EXISTS frame_digest TEXT",
+    "ALTER TABLE upload_keyframes ALTER COLUMN frame_data DROP NOT NULL",
+    "ALTER TABLE conversations ADD COLUMN IF NOT EXISTS token_estimate INTEGER",
+    "ALTER TABLE sessions ADD COLUMN IF NOT EXISTS history_start_id INTEGER",
+    "ALTER TABLE sessions ADD COLUMN IF NOT EXISTS history_summary TEXT",
+    # Fill the sessions summary table the first time it exists.
+    f"""
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM sessions) THEN
+        {_SESSIONS_BACKFILL}
+    END IF;
+END
+$$;
+""",
+    # Sessions started by create_record had ISO-8601 timestamps; use the
+    # column default's format, as every other write does.
+    """
+UPDATE sessions SET created_at = (created_at::timestamptz AT TIME ZONE 'UTC')::TEXT
+    WHERE created_at LIKE '%T%';
+UPDATE sessions SET last_active = (last_active::timestamptz AT TIME ZONE 'UTC')::TEXT
+    WHERE last_active LIKE '%T%';
+""",
 ]
 
+# ---------------------------------------------------------------------------
+# Natural-key indexes (backend-specific expression syntax)
+# ---------------------------------------------------------------------------
+
+# Shared record types and the data_json field that identifies them. Dedupe
+# and linking look records up by these, so each gets a partial expression
+# index; find_record_by_key must use the exact same expression.
+RECORD_KEY_FIELDS = {
+    "subject": "subject_id",
+    "instrument": "instrument_id",
+    "rig": "rig_id",
+    "data_description": "project_name",
+}
+
+
+def record_key_expr(dialect: str, field: str) -> str:
+    """Indexed SQL expression for ``data_json.<field>`` as text.
+
+    SQLite's json_extract keeps JSON numbers numeric, so it's cast to TEXT
+    to make subject_id 4528 and "4528" the same key (Postgres ->> already
+    returns text).
+    """
+    if dialect == "postgres":
+        return f"(data_json->>'{field}')"
+    return f"CAST(json_extract(data_json, '$.{field}') AS TEXT)"
+
+
+def _key_indexes(dialect: str) -> list[str]:
+    return [
+        f"CREATE INDEX IF NOT EXISTS idx_records_key_{record_type} "
+        f"ON metadata_records(({record_key_expr(dialect, field)})) "
+        f"WHERE record_type = '{record_type}'"
+        for record_type, field in RECORD_KEY_FIELDS.items()
+    ]
+
+
+SQLITE_KEY_INDEXES = _key_indexes("sqlite")
+PG_KEY_INDEXES = _key_indexes("postgres")
+
 # ---------------------------------------------------------------------------
 # Category mapping
 # ---------------------------------------------------------------------------
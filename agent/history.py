@@ -0,0 +1,132 @@
+"""Token-budgeted conversation history for the chat prompt.
+
+Instead of a fixed last-N turns, the agent sees the longest run of recent
+turns that fits HISTORY_TOKEN_BUDGET, plus a rolling summary of the turns
+before it. Both are kept on the session's row in the sessions table:
+
+  - history_start_id: the first conversations.id shown in full
+  - history_summary:  one line per older turn, capped at
+    HISTORY_SUMMARY_TOKENS (oldest lines drop off first)
+
+Each turn's token estimate is stored when it's saved, so picking the
+window is arithmetic over the turns since history_start_id. The
+rest of the history is never read.
+
+The window start only moves when the turns shown overflow the budget, and
+then it jumps far enough that they fit in HISTORY_LOW_WATER of it. Between
+moves the history is append-only, which keeps the prompt prefix cacheable
+(see _build_prompt_blocks in service.py), and the summary is only
+rewritten on a move rather than recomputed per request.
+
+The summary is extractive (the start of each turn), not model-written.
+That keeps it free and deterministic; the agent still has find_records
+and the session's records for anything the summary drops.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Any
+
+from .tools.metadata_store import advance_history, estimate_tokens, get_history_state, get_history_turns
+
+HISTORY_TOKEN_BUDGET = int(os.environ.get("HISTORY_TOKEN_BUDGET", "8000"))
+HISTORY_SUMMARY_TOKENS = int(os.environ.get("HISTORY_SUMMARY_TOKENS", "1000"))
+HISTORY_LOW_WATER = 0.6
+
+_SUMMARY_LINE_CHARS = 200
+_OMITTED_LINE = "- (earlier turns omitted)"
+
+
+@dataclass
+class HistoryWindow:
+    """What the prompt shows of a session's history."""
+
+    turns: list[dict[str, Any]] = field(default_factory=list)
+    summary: str | None = None
+
+
+def window_start(token_counts: list[int], budget: int, low_water: float = HISTORY_LOW_WATER) -> int:
+    """Index of the first turn to keep in full.
+
+    0 while everything fits ``budget``; on overflow, the start of the
+    longest suffix that fits ``budget * low_water``. The last turn is
+    always kept (clipped later if it alone is over budget).
+    """
+    total = sum(token_counts)
+    if total <= budget:
+        return 0
+    target = budget * low_water
+    start = 0
+    while start < len(token_counts) - 1 and total > target:
+        total -= token_counts[start]
+        start += 1
+    return start
+
+
+def summary_line(turn: dict[str, Any]) -> str:
+    """One-line extract of a turn for the rolling summary."""
+    text = re.sub(r"\s+", " ", turn["content"]).strip()
+    if len(text) > _SUMMARY_LINE_CHARS:
+        text = text[:_SUMMARY_LINE_CHARS].rstrip() + "…"
+    attachments = turn.get("attachments_json")
+    if attachments and isinstance(attachments, list):
+        names = ", ".join(att.get("filename", "file") for att in attachments)
+        text += f" [attached: {names}]"
+    return f"- {turn['role'].upper()}: {text}"
+
+
+def fold_summary(summary: str | None, turns: list[dict[str, Any]], max_tokens: int) -> str:
+    """Append ``turns`` to the rolling summary, dropping the oldest lines
+    past ``max_tokens``."""
+    lines = [line for line in (summary or "").splitlines() if line and line != _OMITTED_LINE]
+    lines += [summary_line(t) for t in turns]
+    dropped = False
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+        dropped = True
+    if dropped or (summary or "").startswith(_OMITTED_LINE):
+        lines.insert(0, _OMITTED_LINE)
+    return "\n".join(lines)
+
+
+def _clip(turn: dict[str, Any], max_tokens: int) -> dict[str, Any]:
+    max_chars = max_tokens * 4
+    if len(turn["content"]) <= max_chars:
+        return turn
+    return {**turn, "content": turn["content"][:max_chars] + "\n[… truncated to fit the history budget]"}
+
+
+async def load_history_window(
+    session_id: str,
+    exclude_latest: bool = True,
+    budget: int | None = None,
+    summary_tokens: int | None = None,
+) -> HistoryWindow:
+    """The history to show for the next turn of ``session_id``.
+
+    ``exclude_latest`` drops the newest saved turn (chat() saves the user's
+    message before building the prompt, which then adds it separately).
+    Advances and persists the window when it overflows.
+    """
+    budget = HISTORY_TOKEN_BUDGET if budget is None else budget
+    summary_tokens = HISTORY_SUMMARY_TOKENS if summary_tokens is None else summary_tokens
+
+    state = await get_history_state(session_id)
+    turns = await get_history_turns(session_id, state["start_id"])
+    if exclude_latest and turns:
+        turns = turns[:-1]
+    summary = state["summary"]
+
+    start = window_start([t["token_estimate"] for t in turns], budget)
+    if start:
+        new_summary = fold_summary(summary, turns[:start], summary_tokens)
+        # Lost the race to a concurrent turn: show this turn's view anyway,
+        # the next request picks up whatever was persisted.
+        await advance_history(session_id, state["start_id"], turns[start]["id"], new_summary)
+        summary = new_summary
+        turns = turns[start:]
+
+    return HistoryWindow(turns=[_clip(t, budget) for t in turns], summary=summary)
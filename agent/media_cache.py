@@ -0,0 +1,200 @@
+"""Cache of API-ready image/PDF payloads for chat attachments.
+
+Sending an image or PDF to the model means reading the file, downscaling
+oversized images (PIL) and base64-encoding the result. Attachments stay in
+the conversation, so without a cache that work repeats for every follow-up
+message that re-sends them, and for every video keyframe.
+
+Payloads are (media_type, base64 data) pairs keyed by the upload's content
+hash (uploads.blob_digest / upload_keyframes.frame_digest; the upload id
+when there's no digest). A cache hit never touches the original bytes.
+
+Two tiers:
+  - memory: LRU bounded by MEDIA_CACHE_MEMORY_MB (default 64)
+  - disk:   one file per key under MEDIA_CACHE_DIR (default
+    UPLOADS_DIR/media_cache), bounded by MEDIA_CACHE_DISK_MB (default
+    1024; 0 disables it). On overflow the least recently used files are
+    deleted until usage is under 90% of the cap.
+
+Uploads populate it eagerly (see prepare_upload_media in service.py), so
+the first chat turn that uses an attachment is usually a hit too.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import re
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+MediaPayload = tuple[str, str]  # (media_type, base64 data)
+
+_KEY_RE = re.compile(r"^[A-Za-z0-9_-]{1,128}$")
+_DISK_LOW_WATER = 0.9
+
+
+def _payload_size(payload: MediaPayload) -> int:
+    return len(payload[0]) + len(payload[1])
+
+
+class MediaCache:
+    """Two-tier (memory LRU + disk) cache of prepared media payloads."""
+
+    def __init__(self, directory: str | Path | None, memory_bytes: int, disk_bytes: int) -> None:
+        self.directory = Path(directory) if directory and disk_bytes > 0 else None
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._memory: OrderedDict[str, MediaPayload] = OrderedDict()
+        self._memory_used = 0
+        self._disk_used: int | None = None  # scanned on first write
+        self._disk_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _check_key(key: str) -> str:
+        # Keys become file names; refuse anything that could escape the dir.
+        if not _KEY_RE.match(key):
+            raise ValueError(f"Invalid media cache key: {key!r}")
+        return key
+
+    # -- memory tier ---------------------------------------------------------
+
+    def _remember(self, key: str, payload: MediaPayload) -> None:
+        size = _payload_size(payload)
+        if size > self.memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_used -= _payload_size(old)
+        self._memory[key] = payload
+        self._memory_used += size
+        while self._memory_used > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_used -= _payload_size(evicted)
+
+    # -- disk tier -----------------------------------------------------------
+
+    def _read_file(self, key: str) -> MediaPayload | None:
+        assert self.directory is not None
+        path = self.directory / key
+        try:
+            with open(path, encoding="ascii") as f:
+                media_type = f.readline().rstrip("\n")
+                data = f.read()
+            os.utime(path)  # mtime doubles as last-access time for eviction
+        except (FileNotFoundError, UnicodeDecodeError):
+            return None
+        return media_type, data
+
+    def _write_file(self, key: str, payload: MediaPayload) -> int:
+        assert self.directory is not None
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / key
+        tmp = self.directory / f".{key}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "w", encoding="ascii") as f:
+            f.write(f"{payload[0]}\n{payload[1]}")
+        os.replace(tmp, path)
+        return path.stat().st_size
+
+    def _store_file(self, key: str, payload: MediaPayload) -> None:
+        written = self._write_file(key, payload)
+        with self._disk_lock:
+            if self._disk_used is None:
+                self._disk_used = self._scan_disk()
+            else:
+                self._disk_used += written
+            if self._disk_used > self.disk_bytes:
+                self._disk_used = self._evict_disk()
+
+    def _scan_disk(self) -> int:
+        assert self.directory is not None
+        if not self.directory.is_dir():
+            return 0
+        return sum(p.stat().st_size for p in self.directory.iterdir() if not p.name.startswith("."))
+
+    def _evict_disk(self) -> int:
+        """Delete least recently used files until under the low-water mark;
+        returns the remaining usage."""
+        assert self.directory is not None
+        entries = []
+        for p in self.directory.iterdir():
+            if p.name.startswith("."):
+                continue  # another writer's temp file
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+        used = sum(size for _, size, _ in entries)
+        target = self.disk_bytes * _DISK_LOW_WATER
+        for _, size, p in sorted(entries):
+            if used <= target:
+                break
+            p.unlink(missing_ok=True)
+            used -= size
+        return used
+
+    # -- public API ----------------------------------------------------------
+
+    async def get(self, key: str) -> MediaPayload | None:
+        """The cached payload for ``key``, or None."""
+        self._check_key(key)
+        payload = self._memory.get(key)
+        if payload is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return payload
+        if self.directory is not None:
+            payload = await asyncio.to_thread(self._read_file, key)
+            if payload is not None:
+                self._remember(key, payload)
+                self.hits += 1
+                return payload
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, payload: MediaPayload) -> None:
+        """Store ``payload`` in both tiers. Disk errors are logged, not raised."""
+        self._check_key(key)
+        self._remember(key, payload)
+        if self.directory is None:
+            return
+        try:
+            await asyncio.to_thread(self._store_file, key, payload)
+        except OSError:
+            logger.warning("Could not write media cache entry %s", key, exc_info=True)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_used,
+        }
+
+
+_cache: MediaCache | None = None
+
+
+def _create_cache() -> MediaCache:
+    uploads_dir = Path(os.environ.get("UPLOADS_DIR", Path(__file__).resolve().parent.parent / "uploads"))
+    return MediaCache(
+        Path(os.environ.get("MEDIA_CACHE_DIR", uploads_dir / "media_cache")),
+        memory_bytes=int(os.environ.get("MEDIA_CACHE_MEMORY_MB", "64")) * 1024 * 1024,
+        disk_bytes=int(os.environ.get("MEDIA_CACHE_DISK_MB", "1024")) * 1024 * 1024,
+    )
+
+
+def get_media_cache() -> MediaCache:
+    """Return the shared media cache, creating it if needed."""
+    global _cache
+    if _cache is None:
+        _cache = _create_cache()
+    return _cache
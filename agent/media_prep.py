@@ -0,0 +1,235 @@
+"""CPU-bound preparation of image/PDF attachments for the model.
+
+Sending an image means decoding it (Pillow), downscaling anything over the
+CLI's size limit, re-encoding it as JPEG and base64-encoding the result.
+For a large microscopy frame that is hundreds of ms of CPU; done inside the
+async chat handler it froze every other SSE stream and the /health poll on
+the single-worker server for that long.
+
+run_media_prep does the work in a bounded worker pool instead:
+  - MEDIA_PREP_POOL=process (default): a spawned process pool. Pillow and
+    base64 hold the GIL for much of the work, so with threads the event
+    loop still stalled (see scripts/bench_media_prep.py); processes cost a
+    pickle of the bytes each way but keep the loop responsive.
+  - MEDIA_PREP_POOL=thread: a thread pool, for hosts where spawning worker
+    processes isn't allowed.
+MEDIA_PREP_WORKERS (default min(4, CPUs)) caps the pool size, and callers
+use it to bound how many attachments they prepare at once.
+
+This module is what the worker processes import, so it stays light: no
+SDK, DB or FastAPI imports.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import io
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+MediaPayload = tuple[str, str]  # (media_type, base64 data)
+
+# The Claude Code CLI's validateImagesForAPI rejects any image whose base64
+# string length exceeds ~5MB. Base64 inflates bytes by 4/3, so raw bytes must
+# stay under 5 * 3/4 = 3.75MB. We aim lower (3.5MB) for headroom. Claude's
+# vision model downscales to 1568px internally anyway, so pre-resizing to
+# that dimension loses no model-visible detail.
+_IMAGE_MAX_RAW_BYTES = 3_500_000
+_IMAGE_MAX_DIMENSION = 1568
+
+
+# Re-encoding. At 1568px nearly everything fits at q85, so the first pass
+# is usually the only one; the quality search is for noise-heavy inputs.
+_QUALITY_MAX = 85
+_QUALITY_MIN = 20
+_ENCODE_PASSES = 3
+# JPEG/WebP size falls roughly as quality**1.2 over q20–85 (measured on the
+# scripts/bench_image_encode.py corpus); used to guess the second pass.
+_SIZE_QUALITY_EXPONENT = 1.2
+# Content classification, on a 256x256 nearest-neighbour sample.
+_SAMPLE_SIZE = 256
+_FLAT_MAX_COLOURS = 64    # diagrams, plain UI: palette PNG
+_TEXT_TOP_COLOURS = 16    # screenshots, scanned pages: a few colours cover
+_TEXT_MIN_COVERAGE = 0.5  # most of the image (background, ink, chrome)
+
+
+def _classify_image(img: Image.Image) -> str:
+    """Content class of an RGB image: "flat", "text" or "photo"."""
+    from PIL import Image
+
+    sample = img.resize((_SAMPLE_SIZE, _SAMPLE_SIZE), Image.Resampling.NEAREST)
+    if sample.getcolors(_FLAT_MAX_COLOURS) is not None and img.getcolors(256) is not None:
+        return "flat"
+    counts = sorted((n for n, _ in sample.getcolors(_SAMPLE_SIZE * _SAMPLE_SIZE)), reverse=True)
+    if sum(counts[:_TEXT_TOP_COLOURS]) >= _TEXT_MIN_COVERAGE * _SAMPLE_SIZE ** 2:
+        return "text"
+    return "photo"
+
+
+def _encode(img: Image.Image, fmt: str, quality: int | None = None) -> bytes:
+    buf = io.BytesIO()
+    if fmt == "PNG":
+        img.save(buf, format="PNG")
+    elif fmt == "WEBP":
+        # method 2: within ~3% of the default (4) on screenshots, half the time.
+        img.save(buf, format="WEBP", quality=quality, method=2)
+    else:
+        img.save(buf, format="JPEG", quality=quality)
+    return buf.getvalue()
+
+
+def _encode_to_fit(img: Image.Image, fmt: str, limit: int) -> tuple[bytes, int]:
+    """(bytes, quality) at the highest quality up to _QUALITY_MAX that fits
+    ``limit``, in at most _ENCODE_PASSES encodes.
+
+    The first pass is at _QUALITY_MAX. If that's too big the second is
+    estimated from its size. If the second fits, the third bisects between
+    it and the first; if not, the third is at _QUALITY_MIN (text-heavy
+    images shrink much less with quality than the estimate assumes). If
+    nothing fits, the smallest output.
+    """
+    lo, hi = _QUALITY_MIN, _QUALITY_MAX
+    quality = _QUALITY_MAX
+    best: tuple[bytes, int] | None = None
+    smallest: tuple[bytes, int] | None = None
+    for _ in range(_ENCODE_PASSES):
+        out = _encode(img, fmt, quality)
+        if smallest is None or len(out) < len(smallest[0]):
+            smallest = (out, quality)
+        if len(out) <= limit:
+            best, lo = (out, quality), quality + 1
+        else:
+            hi = quality - 1
+        if lo > hi:
+            break
+        if best is None and quality == _QUALITY_MAX:
+            # Aim 5% under the limit so the estimate's error rarely costs a pass.
+            guess = quality * (0.95 * limit / len(out)) ** (1 / _SIZE_QUALITY_EXPONENT)
+            quality = min(max(int(guess), lo), hi)
+        elif best is None:
+            quality = lo
+        else:
+            quality = (lo + hi + 1) // 2
+    if best is None:
+        assert smallest is not None
+        logger.warning("Image still %d bytes at q=%d; sending it anyway", len(smallest[0]), smallest[1])
+        return smallest
+    return best
+
+
+def _resize_image_for_api(raw: bytes, content_type: str) -> tuple[bytes, str]:
+    """Shrink an image to fit the API's 5MB base64 limit.
+
+    Returns (bytes, media_type). If the input is already small enough it's
+    returned unchanged. Otherwise the image is downscaled to 1568px max
+    dimension and re-encoded in a format picked from its content:
+      - flat (diagrams, plain UI; at most 256 colours): palette PNG
+      - text (screenshots, scanned pages): WebP, which keeps text edges
+        sharper than JPEG and is ~25% smaller
+      - photo (microscopy frames, camera images): JPEG
+    Lossy formats start at q85 and only search lower if that doesn't fit.
+    """
+    if len(raw) <= _IMAGE_MAX_RAW_BYTES:
+        return raw, content_type
+
+    from PIL import Image
+
+    try:
+        img = Image.open(io.BytesIO(raw))
+        img.load()
+    except Exception as exc:
+        logger.warning("Pillow failed to open image (%s); sending original bytes", exc)
+        return raw, content_type
+
+    # Only JPEG is strictly RGB-only, but flattening alpha/palette modes onto
+    # white keeps classification and every encoder on one code path.
+    if img.mode != "RGB":
+        bg = Image.new("RGB", img.size, (255, 255, 255))
+        if img.mode in ("RGBA", "LA"):
+            bg.paste(img, mask=img.split()[-1])
+        else:
+            bg.paste(img.convert("RGB"))
+        img = bg
+
+    # Classify before resizing: LANCZOS blends edges into new colours.
+    kind = _classify_image(img)
+    img.thumbnail((_IMAGE_MAX_DIMENSION, _IMAGE_MAX_DIMENSION), Image.Resampling.LANCZOS)
+
+    if kind == "flat":
+        # Back to the original's colour count; only resampled edge pixels move.
+        palette = img.quantize(256, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+        out = _encode(palette, "PNG")
+        if len(out) <= _IMAGE_MAX_RAW_BYTES:
+            logger.info("Resized image %d → %d bytes (png, %dx%d)", len(raw), len(out), *img.size)
+            return out, "image/png"
+        kind = "text"
+
+    fmt, media_type = ("WEBP", "image/webp") if kind == "text" else ("JPEG", "image/jpeg")
+    out, quality = _encode_to_fit(img, fmt, _IMAGE_MAX_RAW_BYTES)
+    logger.info(
+        "Resized image %d → %d bytes (%s q=%d, %dx%d)",
+        len(raw), len(out), fmt.lower(), quality, *img.size,
+    )
+    return out, media_type
+
+
+def prepare_media(raw: bytes, content_type: str) -> MediaPayload:
+    """(media_type, base64 data) ready for an image/document block. CPU
+    bound — async callers go through run_media_prep."""
+    if content_type.startswith("image/"):
+        raw, content_type = _resize_image_for_api(raw, content_type)
+    return content_type, base64.standard_b64encode(raw).decode("ascii")
+
+
+MEDIA_PREP_POOL = os.environ.get("MEDIA_PREP_POOL", "process").lower()
+MEDIA_PREP_WORKERS = max(1, int(os.environ.get("MEDIA_PREP_WORKERS", str(min(4, os.cpu_count() or 1)))))
+
+_pool: Executor | None = None
+
+
+def _create_pool() -> Executor:
+    if MEDIA_PREP_POOL == "thread":
+        return ThreadPoolExecutor(MEDIA_PREP_WORKERS, thread_name_prefix="media-prep")
+    # spawn, not fork: the server process has the event loop, aiosqlite and
+    # SDK subprocess threads running, none of which survive a fork.
+    return ProcessPoolExecutor(MEDIA_PREP_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+
+def _get_pool() -> Executor:
+    global _pool
+    if _pool is None:
+        _pool = _create_pool()
+    return _pool
+
+
+async def run_media_prep(raw: bytes, content_type: str) -> MediaPayload:
+    """prepare_media in the media-prep pool."""
+    global _pool
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_get_pool(), prepare_media, raw, content_type)
+    except BrokenProcessPool:
+        # A worker died (OOM on a huge image, killed by the host). Drop the
+        # pool so the next call starts a fresh one, and finish this
+        # attachment in a thread rather than failing the chat turn.
+        logger.warning("Media prep worker pool broke; recreating it", exc_info=True)
+        _pool = None
+        return await asyncio.to_thread(prepare_media, raw, content_type)
+
+
+def shutdown_media_prep() -> None:
+    """Stop the worker pool (server shutdown)."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -0,0 +1,143 @@
+"""In-process metrics, served as JSON by GET /metrics.
+
+Per-turn token usage comes from the SDK's ResultMessage.usage, which
+reports the Messages API counters summed over every model call in the
+turn:
+
+  - input_tokens:                 uncached input
+  - cache_creation_input_tokens:  input written to the prompt cache
+  - cache_read_input_tokens:      input served from the prompt cache
+  - output_tokens
+
+"Cached" below means cache_read_input_tokens; everything else on the
+input side was processed fresh. Counters are per process and reset on
+restart — good enough for spotting a cache regression, not for billing.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import deque
+from dataclasses import asdict, dataclass
+from typing import Any
+
+
+@dataclass
+class TurnUsage:
+    """Token counts for one chat turn."""
+
+    session_id: str
+    input_tokens: int = 0
+    cache_creation_input_tokens: int = 0
+    cache_read_input_tokens: int = 0
+    output_tokens: int = 0
+
+    @classmethod
+    def from_usage(cls, session_id: str, usage: dict[str, Any] | None) -> TurnUsage:
+        usage = usage or {}
+        return cls(
+            session_id=session_id,
+            input_tokens=int(usage.get("input_tokens") or 0),
+            cache_creation_input_tokens=int(usage.get("cache_creation_input_tokens") or 0),
+            cache_read_input_tokens=int(usage.get("cache_read_input_tokens") or 0),
+            output_tokens=int(usage.get("output_tokens") or 0),
+        )
+
+    @property
+    def cached_input_tokens(self) -> int:
+        return self.cache_read_input_tokens
+
+    @property
+    def uncached_input_tokens(self) -> int:
+        return self.input_tokens + self.cache_creation_input_tokens
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            **asdict(self),
+            "cached_input_tokens": self.cached_input_tokens,
+            "uncached_input_tokens": self.uncached_input_tokens,
+        }
+
+
+class UsageMetrics:
+    """Running totals plus the most recent turns."""
+
+    def __init__(self, recent: int = 50) -> None:
+        self._lock = threading.Lock()
+        self._recent: deque[TurnUsage] = deque(maxlen=recent)
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.turns = 0
+            self.cached_input_tokens = 0
+            self.uncached_input_tokens = 0
+            self.output_tokens = 0
+            self._recent.clear()
+
+    def record(self, session_id: str, usage: dict[str, Any] | None) -> TurnUsage:
+        """Add one turn's ResultMessage.usage; returns the parsed counts."""
+        turn = TurnUsage.from_usage(session_id, usage)
+        with self._lock:
+            self.turns += 1
+            self.cached_input_tokens += turn.cached_input_tokens
+            self.uncached_input_tokens += turn.uncached_input_tokens
+            self.output_tokens += turn.output_tokens
+            self._recent.append(turn)
+        return turn
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            total_input = self.cached_input_tokens + self.uncached_input_tokens
+            return {
+                "turns": self.turns,
+                "cached_input_tokens": self.cached_input_tokens,
+                "uncached_input_tokens": self.uncached_input_tokens,
+                "output_tokens": self.output_tokens,
+                "cache_hit_ratio": self.cached_input_tokens / total_input if total_input else 0.0,
+                "recent_turns": [t.as_dict() for t in self._recent],
+            }
+
+
+usage_metrics = UsageMetrics()
+
+
+class LatencyHistogram:
+    """Counts of latencies (ms) in fixed buckets, plus the most recent
+    samples for percentiles."""
+
+    BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+    def __init__(self, recent: int = 100) -> None:
+        self.counts = [0] * (len(self.BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self._recent: deque[float] = deque(maxlen=recent)
+
+    def record(self, ms: float) -> None:
+        i = next((i for i, bound in enumerate(self.BUCKETS_MS) if ms <= bound), len(self.BUCKETS_MS))
+        self.counts[i] += 1
+        self.count += 1
+        self.total_ms += ms
+        self._recent.append(ms)
+
+    def percentile(self, p: float) -> float | None:
+        """The ``p`` (0–1) percentile of the recent samples; None if empty."""
+        if not self._recent:
+            return None
+        ordered = sorted(self._recent)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+    def snapshot(self) -> dict[str, Any]:
+        labels = [f"<={bound}" for bound in self.BUCKETS_MS] + ["+inf"]
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ms / self.count, 1) if self.count else None,
+            "p50_ms": _round(self.percentile(0.5)),
+            "p99_ms": _round(self.percentile(0.99)),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+def _round(ms: float | None) -> float | None:
+    return round(ms, 1) if ms is not None else None
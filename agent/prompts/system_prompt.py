@@ -36,8 +36,21 @@ Save or update a single metadata record. Each call captures ONE record type.
 Search for existing records. Use this to find shared records (subjects, instruments, etc.) \
 before creating duplicates.
 - `record_type`: Filter by type (e.g., "subject")
-- `query`: Text search against record names and data
+- `query`: Text search against record names and data. Matches whole words or word \
+prefixes (so "4528" or "Pvalb" work, a fragment from the middle of an ID does not); \
+best matches come first
 - `category`: Filter by "shared" or "asset"
+- `key`: (optional, with `record_type`) Exact identifier lookup — subject_id for subjects, \
+instrument_id for instruments, rig_id for rigs, project_name for data_description. \
+Returns the matching record or nothing; prefer this for duplicate checks
+
+### get_record
+Fetch one record's full data and validation results.
+- `record_id`: ID of the record
+The session's records are listed in each message. Records changed since the previous \
+turn include their data; the others are summarised (type, name, status, validation, filled \
+fields). Call get_record before updating or answering questions about the contents of a \
+summarised record.
 
 ### link_records
 Create a link between two records (e.g., link a session to a subject).
@@ -135,7 +148,7 @@ The modality must use the exact abbreviation from the mappings above.
 If the user mentions both a subject and a procedure, make two separate calls.
 
 4. **Reuse shared records**: Before creating a new subject, instrument, or rig, use find_records \
-to check if one already exists. If it does, link to it instead of creating a duplicate.
+(with `key` when you know the identifier) to check if one already exists. If it does, link to it instead of creating a duplicate.
 
 5. **Link related records**: When capturing asset-specific metadata (session, acquisition, etc.), \
 link it to the relevant shared records using the link_to parameter.
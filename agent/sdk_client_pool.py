@@ -1,7 +1,7 @@
 """Persistent ClaudeSDKClient pool — eliminates the ~4s subprocess spawn per chat.
 
 The SDK's ClaudeSDKClient keeps a single `claude` CLI subprocess (and its
-MCP stdio subprocesses) alive across queries. This is what we want: a
+MCP connections) alive across queries. This is what we want: a
 warm client so requests 2+ skip the 4s spawn entirely.
 
 The catch (SDK client.py:55-62): the client's internal anyio.TaskGroup is
@@ -11,14 +11,47 @@ contexts. So we run each client inside a dedicated asyncio task (its own
 context) and exchange messages with it via asyncio.Queues.
 
 Flow:
-  - warmup(): starts a background task that owns a ClaudeSDKClient,
-    connects it, then waits on an input queue
-  - chat handler puts (prompt, model, out_queue, sentinel_ctx) on the
-    input queue
+  - start(): brings each configured model up to its minimum number of
+    workers. A worker is a background task that owns one ClaudeSDKClient
+    for one model, connects it, then waits on its input queue
+  - chat handler calls dispatch(), which puts (prompt, out_queue) on the
+    least-loaded warm worker for the requested model
   - worker task runs client.query(), reads responses, puts them on
     out_queue, puts a DONE sentinel when ResultMessage arrives
   - chat handler drains out_queue, translates to SSE events
 
+Clients are bound to a model for life, so switching between Opus, Sonnet
+and Haiku never calls set_model() — each model has its own workers:
+
+  - SDK_POOL_MODELS: models warmed at startup, each with an optional
+    minimum, e.g. "claude-sonnet-4-6:2,claude-haiku-4-5-20251001" (default:
+    the default model, 1 worker). Other models get workers on first use
+    (that first request falls back to query()) and lose them once idle
+  - SDK_POOL_MAX_WORKERS: workers per model (default 4)
+  - SDK_POOL_WARM_SPARES: idle warm workers kept per model in use, on top
+    of the busy ones (default 1), so a new request rarely queues behind
+    another or waits for a connect
+  - SDK_POOL_IDLE_SECONDS: how long a surplus worker may sit idle before
+    it's retired (default 600)
+
+With SESSION_AFFINITY=1 (service.py), a chat session can also take a
+worker for itself: pin() hands it a warm client that has never served a
+query, and from then on that client holds the session's real multi-turn
+conversation, so chat() sends it only the new turn instead of replaying
+history. Pinned workers are outside the shared rotation and sizing. At
+most SDK_POOL_PINNED_MAX are kept (default 8); the least recently used
+idle one is evicted to make room, and any idle for
+SDK_POOL_PINNED_IDLE_SECONDS (default 900) is retired. An evicted
+session's next turn rebuilds its context from the DB as usual.
+
+Workers are replaced, never reconnected in place: when one goes stale
+(its CLI ping fails or keeps coming back slow, see _watchdog) a fresh
+worker is started, and the stale one keeps serving until the fresh one
+is warm. Only one worker per model connects at a time, and only one
+stale worker is retired per step while a fresh sibling is warm, so
+reconnects are staggered and a model that had a warm client never goes
+without one.
+
 The stream_events contextvar (used by capture_metadata to push validation
 results) is a problem: the tool handler runs inside the worker task's
 context, not the HTTP handler's. We bridge this by having the worker set
@@ -28,19 +61,33 @@ its own queue and forward drained events into out_queue with a marker.
 import asyncio
 import logging
 import os
-import sys
 import time
-from collections.abc import AsyncIterator
-from pathlib import Path
+from collections import deque
+from collections.abc import AsyncIterator, Callable
 from typing import Any
 
 from claude_agent_sdk import ClaudeSDKClient
 from claude_agent_sdk.types import ResultMessage
 
+from . import aind_mcp
+from .metrics import LatencyHistogram
 from .shared import stream_events
 
 logger = logging.getLogger(__name__)
 
+SDK_POOL_MAX_WORKERS = max(1, int(os.environ.get("SDK_POOL_MAX_WORKERS", "4")))
+SDK_POOL_WARM_SPARES = max(0, int(os.environ.get("SDK_POOL_WARM_SPARES", "1")))
+SDK_POOL_IDLE_SECONDS = float(os.environ.get("SDK_POOL_IDLE_SECONDS", "600"))
+SDK_POOL_PINNED_MAX = max(0, int(os.environ.get("SDK_POOL_PINNED_MAX", "8")))
+SDK_POOL_PINNED_IDLE_SECONDS = float(os.environ.get("SDK_POOL_PINNED_IDLE_SECONDS", "900"))
+
+RECONNECT_DELAY_S = 5         # pause before replacing a worker whose query failed
+CONNECT_RETRY_DELAY_S = 60    # pause before retrying a failed connect()
+PING_TIMEOUT_S = 10           # a ping slower than this counts as a failure
+PING_SLOW_STREAK = 3          # consecutive slow pings before a worker is replaced
+# A ping is slow above this, or above 5x the model's recent median if higher.
+SDK_POOL_PING_SLOW_MS = float(os.environ.get("SDK_POOL_PING_SLOW_MS", "1000"))
+
 # Sentinels for the output queue — class-as-sentinel pattern so they're
 # unambiguously not SDK message objects.
 class _Done: ...
@@ -49,329 +96,219 @@ class _Error:
 _DONE = _Done()
 
 
+def parse_pool_models(spec: str, default_model: str) -> dict[str, int]:
+    """SDK_POOL_MODELS ("model[:min],...") -> {model: min workers}."""
+    models: dict[str, int] = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, minimum = item.partition(":")
+        models[name.strip()] = max(0, int(minimum)) if minimum.strip() else 1
+    return models or {default_model: 1}
+
+
 class _Work:
     """A single chat request routed to a pooled client."""
-    __slots__ = ("prompt", "model", "out_q")
+    __slots__ = ("prompt", "out_q")
 
-    def __init__(self, prompt: str | list[dict[str, Any]], model: str | None,
-                 out_q: asyncio.Queue):
+    def __init__(self, prompt: str | list[dict[str, Any]], out_q: asyncio.Queue):
         self.prompt = prompt
-        self.model = model
         self.out_q = out_q
 
 
-class SDKClientPool:
-    """Owns one warm ClaudeSDKClient in a background task.
+class _Ping:
+    """A liveness probe routed through a worker's queue, between queries."""
+    __slots__ = ("fut",)
 
-    Size=1 is fine for our single-worker uvicorn — FastAPI serialises
-    requests on the event loop anyway, and ClaudeSDKClient cannot
-    interleave queries on the same stdin stream. If we ever go
-    multi-worker, this becomes one pool per worker (process-local).
-    """
+    def __init__(self, fut: asyncio.Future):
+        self.fut = fut
 
-    HEALTH_CHECK_INTERVAL_S = 120   # check every 2 min
-    MAX_POOL_AGE_S = 300            # force reconnect after 5 min
 
-    def __init__(self, options_factory):
-        """options_factory(model) -> ClaudeAgentOptions (or cached)."""
-        self._options_factory = options_factory
-        self._in_q: asyncio.Queue[_Work | None] = asyncio.Queue(maxsize=1)
-        self._worker: asyncio.Task | None = None
-        self._watchdog_task: asyncio.Task | None = None
-        self._ready = asyncio.Event()
-        self._needs_reconnect = False
-        self._connect_monotonic: float = 0.0
-        self._connect_ms: float = 0.0
+class _Worker:
+    """One ClaudeSDKClient for one model, owned by a background task.
 
-    def start(self) -> None:
-        """Start the pool worker and MCP watchdog in the background.
-
-        Returns immediately — the worker task runs concurrently and sets
-        _ready when connect() finishes. Use await_warm() to wait for it.
-        """
-        if self._worker is None:
-            self._worker = asyncio.create_task(self._run(), name="sdk-client-pool")
-        if self._watchdog_task is None or self._watchdog_task.done():
-            self._watchdog_task = asyncio.create_task(self._watchdog(), name="mcp-watchdog")
-
-    async def await_warm(self, timeout: float) -> bool:
-        """Wait up to `timeout` seconds for the pool to become warm.
+    A worker connects once and serves queries until it's retired or a
+    query fails; the pool starts a replacement rather than reconnecting
+    it.
+    """
 
-        Returns True if the pool is warm, False if the timeout elapsed.
-        Safe to call even before start() — returns False immediately.
-        """
-        if self.is_warm:
-            return True
-        if self._worker is None:
-            return False
-        try:
-            await asyncio.wait_for(asyncio.shield(self._ready.wait()), timeout=timeout)
-            return self.is_warm
-        except asyncio.TimeoutError:
-            return False
+    def __init__(self, pool: "SDKClientPool", model: str):
+        self.pool = pool
+        self.model = model
+        self.load = 0                 # queries queued or running
+        self.stale = False            # due for replacement
+        self.retiring = False         # takes no new queries; exits when drained
+        self.connected_at = 0.0       # time.monotonic() when warm
+        self.connect_ms = 0.0
+        self.idle_since = time.monotonic()
+        self.last_done = 0.0
+        self.failure: str | None = None   # "connect" / "query" / "ping" if it exited on an error
+        self.served = 0               # queries dispatched to it, ever
+        self.session_id: str | None = None    # the session it's pinned to
+        self.last_turn_id: int | None = None  # that session's last turn this client saw
+        self.pings: deque[float] = deque(maxlen=PING_SLOW_STREAK)  # recent ping latencies, ms
+        self._in_q: asyncio.Queue[_Work | _Ping | None] = asyncio.Queue()
+        self._ready = asyncio.Event()
+        self._task: asyncio.Task | None = None
 
-    async def warmup(self):
-        """Start the worker task and wait for it to connect.
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run(), name=f"sdk-client-pool:{self.model}")
+        self._task.add_done_callback(lambda _: self.pool._on_worker_exit(self))
 
-        Legacy blocking API kept for compatibility. Prefer start() +
-        await_warm() so callers can control the timeout independently.
-        """
-        if self._worker is not None:
-            return
-        self._worker = asyncio.create_task(self._run(), name="sdk-client-pool")
-        # Block until connect() completes (or the task crashes).
-        ready_wait = asyncio.create_task(self._ready.wait())
-        worker_wait = asyncio.ensure_future(self._worker)
-        _done, pending = await asyncio.wait(
-            {ready_wait, worker_wait}, return_when=asyncio.FIRST_COMPLETED)
-        for t in pending:
-            if t is ready_wait:  # only cancel the ready waiter, not the worker
-                t.cancel()
-        if self._worker.done():
-            exc = self._worker.exception()
-            if exc is not None:
-                raise exc  # connect failed
-        logger.info("SDK client pool warm: connect took %.0fms", self._connect_ms)
+    @property
+    def is_warm(self) -> bool:
+        return self._ready.is_set() and self._task is not None and not self._task.done()
 
-    async def shutdown(self):
-        if self._watchdog_task is not None:
-            self._watchdog_task.cancel()
-            self._watchdog_task = None
-        if self._worker is None:
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.connected_at if self.connected_at else 0.0
+
+    def retire(self) -> None:
+        """Stop taking queries; exit after the ones already queued."""
+        if not self.retiring:
+            self.retiring = True
+            self._in_q.put_nowait(None)
+
+    async def stop(self, timeout: float = 5) -> None:
+        self.retire()
+        if self._task is None:
             return
-        await self._in_q.put(None)  # signals worker to disconnect
         try:
-            await asyncio.wait_for(self._worker, timeout=5)
+            await asyncio.wait_for(asyncio.shield(self._task), timeout=timeout)
         except asyncio.TimeoutError:
-            self._worker.cancel()
-        self._worker = None
-
-    @property
-    def is_warm(self) -> bool:
-        return self._ready.is_set() and self._worker is not None and not self._worker.done()
+            self._task.cancel()
+        except Exception:
+            pass
 
-    async def submit(self, prompt, model: str | None) -> AsyncIterator[Any]:
-        """Run a query on the warm client and yield raw SDK messages + tool events.
+    def submit(self, prompt) -> AsyncIterator[Any]:
+        """Queue a query on this worker's client; returns an iterator of raw
+        SDK messages + tool events. The caller has already counted it in
+        ``load``.
 
         Yields:
           - SDK message objects (StreamEvent, AssistantMessage, ResultMessage)
           - dicts with key 'tool_event' for validation/artifact results
             pushed by capture_metadata via the stream_events contextvar
         """
-        if not self.is_warm:
-            raise RuntimeError("SDK client pool not warm — call warmup() first or fall back to query()")
-
         out_q: asyncio.Queue = asyncio.Queue()
-        await self._in_q.put(_Work(prompt, model, out_q))
-
-        while True:
-            item = await out_q.get()
-            if item is _DONE:
-                return
-            if isinstance(item, _Error):
-                raise item.exc
-            yield item
-
-    async def _check_mcp_health(self) -> bool:
-        """Start a fresh aind-data-mcp subprocess and verify it registers tools.
-
-        Uses the MCP protocol (JSON-RPC over stdio) to connect, initialize,
-        and list tools. Returns True if the server starts and exposes at
-        least one tool, False otherwise. The subprocess is always killed
-        after the check.
+        self._in_q.put_nowait(_Work(prompt, out_q))
+        return self._results(out_q)
+
+    async def ping(self) -> float:
+        """Round trip (ms) of an MCP status request over this worker's
+        existing CLI connection. Raises if the CLI doesn't answer within
+        PING_TIMEOUT_S or reports an MCP server as failed.
+
+        This measures the CLI, not the MCP server: the CLI answers from
+        the connection state it already holds, without a request to the
+        server. A hung-but-connected server passes; the shared server's
+        own round trip is checked by _check_mcp_health.
         """
-        # When MCP is intentionally disabled for perf isolation, the pool's
-        # client has no AIND MCP attached — probing here would just churn
-        # spurious reconnects (or fail outright if deps are missing, the
-        # usual reason to set the flag).
-        if os.environ.get("SKIP_AIND_MCP") == "1":
-            return True
+        fut = asyncio.get_running_loop().create_future()
+        self._in_q.put_nowait(_Ping(fut))
+        return await asyncio.wait_for(fut, PING_TIMEOUT_S)
 
-        from mcp import StdioServerParameters
-        from mcp.client.stdio import stdio_client
-        from mcp import ClientSession
-
-        mcp_server_dir = Path(os.environ.get(
-            "MCP_SERVER_DIR",
-            str(Path(__file__).resolve().parent.parent / "aind-data-mcp"),
-        ))
-        mcp_src = mcp_server_dir / "src"
-        if not mcp_src.is_dir():
-            logger.warning("MCP health check: src dir not found at %s", mcp_src)
-            return False
-
-        mcp_python = os.environ.get("AIND_MCP_PYTHON", sys.executable)
-        existing_pypath = os.environ.get("PYTHONPATH", "")
-        new_pypath = f"{mcp_src}:{existing_pypath}" if existing_pypath else str(mcp_src)
-        mcp_env = {**os.environ, "PYTHONPATH": new_pypath, "PYTHONUNBUFFERED": "1"}
+    async def _results(self, out_q: asyncio.Queue) -> AsyncIterator[Any]:
+        try:
+            while True:
+                item = await out_q.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, _Error):
+                    raise item.exc
+                yield item
+        finally:
+            self.load -= 1
+            self.last_done = time.monotonic()
+            if self.load == 0:
+                self.idle_since = self.last_done
+            self.pool._rebalance(self.model)
 
-        server_params = StdioServerParameters(
-            command=mcp_python,
-            args=["-m", "aind_data_mcp.data_access_server"],
-            env=mcp_env,
-        )
+    async def _run(self):
+        """Worker task — connect, then serve queries until retired."""
+        client = self.pool._client_factory(options=self.pool._options_factory(self.model))
 
+        # Set stream_events BEFORE connect(). connect() spawns the SDK's
+        # stdio reader task which inherits contextvar at spawn time.
+        self._tool_q = asyncio.Queue()
+        token = stream_events.set(self._tool_q)
         try:
-            async with stdio_client(server_params) as (read_stream, write_stream):
-                async with ClientSession(read_stream, write_stream) as session:
-                    await asyncio.wait_for(session.initialize(), timeout=30.0)
-                    result = await asyncio.wait_for(session.list_tools(), timeout=10.0)
-                    tool_count = len(result.tools) if result.tools else 0
-                    tool_names = [t.name for t in result.tools] if result.tools else []
-                    logger.info(
-                        "MCP health check: %d tools registered: %s",
-                        tool_count, tool_names,
-                    )
-                    return tool_count > 0
-        except asyncio.TimeoutError:
-            logger.warning("MCP health check: timed out connecting to aind-data-mcp")
-            return False
-        except Exception:
-            logger.exception("MCP health check: failed to connect to aind-data-mcp")
-            return False
-
-    async def _watchdog(self):
-        """Background task: periodically verify the local MCP server is
-        healthy and force a pool reconnect when it's stale.
-
-        Every HEALTH_CHECK_INTERVAL_S:
-        1. Start a fresh aind-data-mcp subprocess and check it registers
-           tools via MCP protocol — this verifies the server code, its
-           Python deps, and any external connections (MongoDB) all work.
-        2. If healthy AND pool connection is older than MAX_POOL_AGE_S,
-           set _needs_reconnect so _run() picks it up on the next poll.
-        3. If unhealthy, force immediate reconnect (the pool's MCP
-           subprocess may have died).
-        """
-        while True:
+            t0 = time.perf_counter()
             try:
-                await asyncio.sleep(self.HEALTH_CHECK_INTERVAL_S)
-
-                healthy = await self._check_mcp_health()
-
-                if not healthy:
-                    logger.warning(
-                        "MCP watchdog: aind-data-mcp health check FAILED — forcing reconnect"
-                    )
-                    self._needs_reconnect = True
-                    continue
-
-                if not self.is_warm:
-                    logger.info("MCP watchdog: pool not warm, skipping age check")
+                await client.connect()
+            except Exception:
+                logger.exception("Pool connect() failed (%s)", self.model)
+                self.failure = "connect"
+                return
+            self.connect_ms = (time.perf_counter() - t0) * 1000
+            self.connected_at = self.idle_since = time.monotonic()
+            self._ready.set()
+            logger.info("SDK client pool: %s worker ready (connect=%.0fms)", self.model, self.connect_ms)
+            self.pool._on_worker_ready(self)
+
+            while True:
+                work = await self._in_q.get()
+                if work is None:
+                    return  # retired
+                if isinstance(work, _Ping):
+                    await self._ping(client, work.fut)
+                    if not self._ready.is_set():
+                        self.failure = "ping"
+                        return
                     continue
-
-                age = time.monotonic() - self._connect_monotonic
-                if age > self.MAX_POOL_AGE_S:
-                    logger.info(
-                        "MCP watchdog: pool age %.0fs > %ds and MCP healthy — requesting reconnect",
-                        age, self.MAX_POOL_AGE_S,
-                    )
-                    self._needs_reconnect = True
-                else:
-                    logger.debug("MCP watchdog: pool age %.0fs OK, MCP healthy", age)
-
-            except asyncio.CancelledError:
-                raise
+                await self._handle(client, work)
+                if not self._ready.is_set():
+                    self.failure = "query"
+                    return
+        finally:
+            # Single cleanup path for all exit routes (retire, failure,
+            # CancelledError). Anything still queued here fails so its
+            # caller can fall back to query().
+            self._ready.clear()
+            while not self._in_q.empty():
+                work = self._in_q.get_nowait()
+                if isinstance(work, _Ping):
+                    if not work.fut.done():
+                        work.fut.set_exception(RuntimeError("SDK pool client exited"))
+                elif work is not None:
+                    work.out_q.put_nowait(_Error(RuntimeError("SDK pool client exited")))
+            stream_events.reset(token)
+            try:
+                await client.disconnect()
             except Exception:
-                logger.exception("MCP watchdog: unexpected error")
+                logger.exception("Error disconnecting pool client")
 
-    async def _run(self):
-        """Worker task — owns one ClaudeSDKClient and auto-reconnects on failure.
-
-        Two reconnect triggers:
-        1. Noisy failure: _handle() raises → _ready cleared → reconnect.
-        2. Watchdog/heuristic: _needs_reconnect flag set (by background
-           health check or by service.py's MCP-dead heuristic) → picked
-           up on the next POLL_TIMEOUT_S wake cycle.
-
-        Idle timeout alone does NOT reconnect — it exists only to wake
-        the worker so it can check the flag.
+    async def _ping(self, client: ClaudeSDKClient, fut: asyncio.Future):
+        """Ask the CLI for its MCP servers' status (a control request on the
+        already-open stdio channel; nothing is spawned) and time it. The
+        status is the CLI's record of each connection, not a fresh probe.
 
-        On each reconnect cycle, stream_events contextvar is re-set on
-        the fresh Queue so tool callbacks in the new client context land
-        in the right queue.
+        A CLI that doesn't answer within PING_TIMEOUT_S is treated as hung:
+        _ready is cleared so nothing more is dispatched here and the worker
+        exits (disconnecting it) instead of staying stuck on the request.
         """
-        RECONNECT_DELAY_S = 5         # pause between reconnect cycles after failure
-        CONNECT_RETRY_DELAY_S = 60    # pause before retrying a failed connect()
-        POLL_TIMEOUT_S = 30.0         # wake every 30s to check watchdog flag
-
-        while True:
-            opts = self._options_factory(None)
-            client = ClaudeSDKClient(options=opts)
-
-            # Set stream_events BEFORE connect(). connect() spawns the SDK's
-            # stdio reader task which inherits contextvar at spawn time.
-            # Reset and re-set on each cycle so the fresh client gets its
-            # own queue; stale references from old cycles are gone.
-            self._tool_q = asyncio.Queue()
-            token = stream_events.set(self._tool_q)
-
-            reconnect_reason: str = "idle"
-            connect_failed = False
+        t0 = time.perf_counter()
+        try:
             try:
-                t0 = time.perf_counter()
-                await client.connect()
-                self._connect_ms = (time.perf_counter() - t0) * 1000
-                self._connect_monotonic = time.monotonic()
-                self._needs_reconnect = False
-                self._ready.set()
-                logger.info("SDK client pool ready (connect=%.0fms)", self._connect_ms)
-
-                while True:
-                    # Poll with short timeout so we can check the watchdog
-                    # reconnect flag regularly (every 30s).
-                    try:
-                        work = await asyncio.wait_for(
-                            self._in_q.get(), timeout=POLL_TIMEOUT_S
-                        )
-                    except asyncio.TimeoutError:
-                        if self._needs_reconnect:
-                            self._needs_reconnect = False
-                            reconnect_reason = "watchdog"
-                            break
-                        continue  # keep polling
-
-                    if work is None:
-                        return  # shutdown signal
-
-                    await self._handle(client, work)
-                    if not self._ready.is_set():
-                        reconnect_reason = "handle-failure"
-                        break
-
-                    if self._needs_reconnect:
-                        self._needs_reconnect = False
-                        reconnect_reason = "watchdog"
-                        break
-
-            except asyncio.CancelledError:
-                raise
-            except Exception:
-                logger.exception("Pool connect() failed")
-                connect_failed = True
-            finally:
-                # Single cleanup path for all exit routes (normal break,
-                # exception, CancelledError). ready and token are always
-                # cleared here — no double-reset in the except block.
+                status = await asyncio.wait_for(client.get_mcp_status(), PING_TIMEOUT_S)
+            except asyncio.TimeoutError:
                 self._ready.clear()
-                stream_events.reset(token)
-                try:
-                    await client.disconnect()
-                except Exception:
-                    logger.exception("Error disconnecting pool client")
-
-            delay = CONNECT_RETRY_DELAY_S if connect_failed else RECONNECT_DELAY_S
-            logger.info("Pool reconnecting (%s) in %ds...", reconnect_reason, delay)
-            await asyncio.sleep(delay)
+                raise
+            failed = [s["name"] for s in status.get("mcpServers", []) if s.get("status") == "failed"]
+            if failed:
+                raise RuntimeError(f"MCP server(s) failed: {', '.join(failed)}")
+        except Exception as exc:
+            if not fut.done():
+                fut.set_exception(exc)
+            return
+        if not fut.done():
+            fut.set_result((time.perf_counter() - t0) * 1000)
 
     async def _handle(self, client: ClaudeSDKClient, work: _Work):
         """Run one query and stream results to work.out_q.
 
         If the client's subprocess died (BrokenPipeError on query() or
         no messages received), we propagate the error — the caller
-        should fall back to the one-shot query() path. A fancier pool
-        would reconnect here, but reconnect races with the caller
-        already having given up, so simpler is better.
+        should fall back to the one-shot query() path — and the worker
+        exits so the pool can start a fresh one.
         """
         # Flush any stale events from the last request — shouldn't happen
         # since _handle drains fully before returning, but defensive.
@@ -380,9 +317,6 @@ class SDKClientPool:
             tool_q.get_nowait()
 
         try:
-            if work.model:
-                await client.set_model(work.model)
-
             # ClaudeSDKClient.query() takes str or AsyncIterable[dict].
             # Our prompt is str or list[dict] (multimodal content blocks).
             # The list case needs wrapping in an async iterator.
@@ -409,14 +343,363 @@ class SDKClientPool:
             await work.out_q.put(_DONE)
 
         except Exception as exc:
-            logger.exception("Pool query failed")
+            logger.exception("Pool query failed (%s)", self.model)
             await work.out_q.put(_Error(exc))
-            # Subprocess may be dead. Clear ready flag so callers know
-            # to fall back; a future warmup() call will reconnect.
+            # Subprocess may be dead. Clearing ready ends this worker.
             self._ready.clear()
 
 
-# Module-level singleton — one pool per worker process. warmup() is
+class SDKClientPool:
+    """Warm ClaudeSDKClients per model, with least-loaded dispatch.
+
+    One pool per uvicorn worker process (clients are process-local).
+    """
+
+    HEALTH_CHECK_INTERVAL_S = 30    # ping idle workers every 30 s
+
+    def __init__(
+        self,
+        options_factory,
+        default_model: str,
+        models: dict[str, int] | None = None,
+        max_workers: int = SDK_POOL_MAX_WORKERS,
+        warm_spares: int = SDK_POOL_WARM_SPARES,
+        idle_seconds: float = SDK_POOL_IDLE_SECONDS,
+        pinned_max: int = SDK_POOL_PINNED_MAX,
+        pinned_idle_seconds: float = SDK_POOL_PINNED_IDLE_SECONDS,
+        client_factory: Callable[..., Any] = ClaudeSDKClient,
+    ):
+        """options_factory(model) -> ClaudeAgentOptions (or cached);
+        client_factory(options=...) -> a ClaudeSDKClient (or a stand-in)."""
+        self._options_factory = options_factory
+        self._client_factory = client_factory
+        self.default_model = default_model
+        self.min_workers = models if models is not None else parse_pool_models(
+            os.environ.get("SDK_POOL_MODELS", ""), default_model)
+        self.max_workers = max_workers
+        self.warm_spares = warm_spares
+        self.idle_seconds = idle_seconds
+        self.pinned_max = pinned_max
+        self.pinned_idle_seconds = pinned_idle_seconds
+        self._workers: dict[str, list[_Worker]] = {}
+        self._last_used: dict[str, float] = {}
+        self._not_before: dict[str, float] = {}   # connect backoff per model
+        self._retry_handles: dict[str, asyncio.TimerHandle] = {}
+        self._cli_ping_ms: dict[str, LatencyHistogram] = {}
+        self._warm = asyncio.Event()
+        self._started = False
+        self._closing = False
+        self._watchdog_task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        """Start each configured model's workers and the MCP watchdog in
+        the background.
+
+        Returns immediately — workers connect concurrently with serving
+        requests. Use await_warm() to wait for the first one.
+        """
+        self._started = True
+        for model in self.min_workers:
+            self._rebalance(model)
+        if self._watchdog_task is None or self._watchdog_task.done():
+            self._watchdog_task = asyncio.create_task(self._watchdog(), name="mcp-watchdog")
+
+    async def await_warm(self, timeout: float) -> bool:
+        """Wait up to `timeout` seconds for a client to become warm.
+
+        Returns True if the pool is warm, False if the timeout elapsed.
+        Safe to call even before start() — returns False immediately.
+        """
+        if self.is_warm:
+            return True
+        if not self._started:
+            return False
+        try:
+            await asyncio.wait_for(self._warm.wait(), timeout=timeout)
+            return self.is_warm
+        except asyncio.TimeoutError:
+            return False
+
+    async def warmup(self, timeout: float = 120):
+        """Start the pool and wait for a client to connect.
+
+        Legacy blocking API kept for compatibility. Prefer start() +
+        await_warm() so callers can control the timeout independently.
+        """
+        self.start()
+        if not await self.await_warm(timeout):
+            raise RuntimeError(f"SDK client pool did not warm up within {timeout:.0f}s")
+
+    async def shutdown(self):
+        self._closing = True
+        if self._watchdog_task is not None:
+            self._watchdog_task.cancel()
+            self._watchdog_task = None
+        for handle in self._retry_handles.values():
+            handle.cancel()
+        workers = [w for ws in self._workers.values() for w in ws]
+        await asyncio.gather(*(w.stop() for w in workers), return_exceptions=True)
+        self._workers.clear()
+
+    @property
+    def is_warm(self) -> bool:
+        return any(w.is_warm for ws in self._workers.values() for w in ws)
+
+    def is_warm_for(self, model: str | None) -> bool:
+        return bool(self._shared(model or self.default_model, warm=True))
+
+    def dispatch(self, prompt, model: str | None) -> AsyncIterator[Any] | None:
+        """Route a query to the least-loaded warm client for ``model``.
+
+        Returns the worker's submit() iterator, or None when ``model`` has
+        no warm client yet — one is started and the caller should fall back
+        to query() for this request.
+        """
+        model = model or self.default_model
+        self._last_used[model] = time.monotonic()
+        candidates = self._shared(model, warm=True)
+        if not candidates:
+            self._rebalance(model)
+            return None
+        return self.dispatch_to(min(candidates, key=lambda w: (w.load, w.stale, -w.connected_at)), prompt)
+
+    def dispatch_to(self, worker: _Worker, prompt) -> AsyncIterator[Any]:
+        """Queue a query on ``worker`` (one from dispatch(), or pinned)."""
+        worker.load += 1
+        worker.served += 1
+        self._rebalance(worker.model)
+        return worker.submit(prompt)
+
+    def _shared(self, model: str, warm: bool = False) -> list[_Worker]:
+        """``model``'s workers in the shared rotation (not pinned or retiring)."""
+        return [w for w in self._workers.get(model, ())
+                if w.session_id is None and not w.retiring and (w.is_warm or not warm)]
+
+    # -- session affinity --------------------------------------------------
+
+    def pinned(self, session_id: str, model: str | None) -> _Worker | None:
+        """The warm worker holding ``session_id``'s conversation with
+        ``model``, if there is one. A pin on another model, or on a worker
+        that died or went stale, is dropped."""
+        model = model or self.default_model
+        for workers in self._workers.values():
+            for w in workers:
+                if w.session_id != session_id or w.retiring:
+                    continue
+                if w.model == model and w.is_warm and not w.stale:
+                    return w
+                self.unpin(w)
+        return None
+
+    def pin(self, session_id: str, model: str | None) -> _Worker | None:
+        """Take a warm, never-used worker out of the shared rotation for
+        ``session_id``; None if there isn't one to spare (or pinning is off).
+        Evicts the least recently used idle pinned worker when at capacity."""
+        model = model or self.default_model
+        self._last_used[model] = time.monotonic()
+        unused = [w for w in self._shared(model, warm=True) if w.served == 0 and w.load == 0 and not w.stale]
+        if not unused or not self.pinned_max:
+            self._rebalance(model)
+            return None
+        pinned = [w for ws in self._workers.values() for w in ws if w.session_id is not None and not w.retiring]
+        if len(pinned) >= self.pinned_max:
+            idle = [w for w in pinned if w.load == 0]
+            if not idle:
+                return None
+            lru = min(idle, key=lambda w: w.idle_since)
+            logger.info("SDK client pool: evicting session %s (LRU) to pin %s", lru.session_id, session_id)
+            self.unpin(lru)
+        worker = unused[0]
+        worker.session_id = session_id
+        logger.info("SDK client pool: pinned session %s to a %s worker", session_id, model)
+        self._rebalance(model)  # the shared rotation just lost a spare
+        return worker
+
+    def unpin(self, worker: _Worker) -> None:
+        """Drop ``worker``'s session. Its conversation can't be reused for
+        anyone else, so the worker is retired."""
+        if worker.session_id is not None:
+            logger.info("SDK client pool: unpinned session %s", worker.session_id)
+        worker.retire()
+        self._rebalance(worker.model)
+
+    def request_reconnect(self, model: str | None) -> None:
+        """Replace the client that most recently answered for ``model``
+        (service.py calls this when a response says the MCP server is gone)."""
+        workers = [w for w in self._shared(model or self.default_model, warm=True) if not w.stale]
+        if workers:
+            max(workers, key=lambda w: w.last_done).stale = True
+            self._rebalance(model or self.default_model)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            model: {
+                "workers": len(workers),
+                "warm": sum(w.is_warm for w in workers),
+                "busy": sum(w.load > 0 for w in workers),
+                "queued": sum(max(0, w.load - 1) for w in workers),
+                "stale": sum(w.stale for w in workers),
+                "pinned": sum(w.session_id is not None for w in workers),
+                "cli_ping_ms": self._cli_ping_ms[model].snapshot() if model in self._cli_ping_ms else None,
+            }
+            for model, workers in self._workers.items()
+        }
+
+    # -- sizing ------------------------------------------------------------
+
+    def _target(self, model: str) -> int:
+        """How many fresh (non-stale) workers ``model`` should have."""
+        workers = self._shared(model)
+        in_use = model in self.min_workers or (
+            time.monotonic() - self._last_used.get(model, float("-inf")) < self.idle_seconds)
+        busy = sum(w.load > 0 for w in workers)
+        spares = self.warm_spares if in_use else 0
+        if in_use and not workers and not spares:
+            spares = 1  # a model just asked for gets one client even with no spares configured
+        return min(self.max_workers, max(self.min_workers.get(model, 0), busy + spares))
+
+    def _rebalance(self, model: str) -> None:
+        """Retire at most one stale or surplus worker, and start at most one
+        new one, for ``model``. Called whenever something changes."""
+        if self._closing or not self._started:
+            return
+        workers = self._workers.setdefault(model, [])
+        live = self._shared(model)
+        fresh = [w for w in live if not w.stale]
+        fresh_warm = [w for w in fresh if w.is_warm]
+        connecting = [w for w in live if not w.is_warm]
+        target = self._target(model)
+
+        # Replace stale workers once a fresh one can take over; oldest first.
+        stale_warm = sorted((w for w in live if w.stale and w.is_warm), key=lambda w: w.connected_at)
+        if stale_warm and fresh_warm:
+            stale_warm[0].retire()
+            logger.info("SDK client pool: retiring stale %s worker (age %.0fs)", model, stale_warm[0].age)
+        elif len(fresh) > target:
+            idle = [w for w in fresh_warm if w.load == 0
+                    and time.monotonic() - w.idle_since > self.idle_seconds]
+            if idle and len(fresh) - 1 >= self.min_workers.get(model, 0):
+                min(idle, key=lambda w: w.idle_since).retire()
+                logger.info("SDK client pool: retiring idle %s worker", model)
+
+        # Pinned workers: a stale one, or one idle too long, is let go (its
+        # session falls back to rebuilding context from the DB).
+        for w in workers:
+            if w.session_id is not None and not w.retiring and w.load == 0 and (
+                    w.stale or time.monotonic() - w.idle_since > self.pinned_idle_seconds):
+                logger.info("SDK client pool: releasing idle session %s", w.session_id)
+                w.retire()
+
+        if len(fresh) < target and not connecting:
+            delay = self._not_before.get(model, 0.0) - time.monotonic()
+            if delay > 0:
+                if model not in self._retry_handles:
+                    self._retry_handles[model] = asyncio.get_running_loop().call_later(
+                        delay, self._retry_rebalance, model)
+                return
+            worker = _Worker(self, model)
+            workers.append(worker)
+            worker.start()
+            logger.info("SDK client pool: starting %s worker (%d of target %d)", model, len(fresh) + 1, target)
+
+    def _retry_rebalance(self, model: str) -> None:
+        self._retry_handles.pop(model, None)
+        self._rebalance(model)
+
+    def _on_worker_ready(self, worker: _Worker) -> None:
+        self._warm.set()
+        self._rebalance(worker.model)
+
+    def _on_worker_exit(self, worker: _Worker) -> None:
+        workers = self._workers.get(worker.model, [])
+        if worker in workers:
+            workers.remove(worker)
+        if worker.failure == "connect":
+            self._not_before[worker.model] = time.monotonic() + CONNECT_RETRY_DELAY_S
+        elif worker.failure == "query":
+            self._not_before[worker.model] = time.monotonic() + RECONNECT_DELAY_S
+        if worker.failure:
+            logger.info("SDK client pool: %s worker exited (%s failure)", worker.model, worker.failure)
+        self._rebalance(worker.model)
+
+    async def _check_mcp_health(self) -> bool:
+        """Health check on the shared AIND MCP server (agent/aind_mcp.py),
+        if there is one: initialize + list tools against the running
+        instance, restarting it if it died or stopped answering. This is
+        the only real MCP round trip in a watchdog round. Without a shared
+        server (AIND_MCP_SHARED=0) each worker's own stdio server is only
+        covered by its ping, i.e. by what its CLI last saw."""
+        server = aind_mcp.get_mcp_server()
+        if server is None or not aind_mcp.is_enabled():
+            return True
+        return await server.check()
+
+    async def _ping_worker(self, worker: _Worker) -> None:
+        """Ping ``worker``'s CLI (_Worker.ping); mark it stale if the ping
+        fails or it has come back slow PING_SLOW_STREAK times in a row."""
+        try:
+            ms = await worker.ping()
+        except Exception as exc:
+            logger.warning("MCP watchdog: %s worker ping failed (%s) — replacing", worker.model, exc or type(exc).__name__)
+            worker.stale = True
+            return
+        hist = self._cli_ping_ms.setdefault(worker.model, LatencyHistogram())
+        hist.record(ms)
+        worker.pings.append(ms)
+        slow_ms = max(SDK_POOL_PING_SLOW_MS, 5 * (hist.percentile(0.5) or 0))
+        if len(worker.pings) == PING_SLOW_STREAK and min(worker.pings) > slow_ms:
+            logger.warning("MCP watchdog: %s worker pings %s ms (slow above %.0f) — replacing",
+                           worker.model, [round(p) for p in worker.pings], slow_ms)
+            worker.stale = True
+
+    async def _probe(self) -> None:
+        """One watchdog round; see _watchdog."""
+        healthy = await self._check_mcp_health()
+        if not healthy:
+            logger.warning("MCP watchdog: aind-data-mcp health check FAILED — replacing pool workers")
+        for model, workers in list(self._workers.items()):
+            live = [w for w in workers if w.is_warm and not w.stale and not w.retiring]
+            if not healthy:
+                for w in live:
+                    w.stale = True
+            else:
+                await asyncio.gather(*(self._ping_worker(w) for w in live if w.load == 0))
+            self._rebalance(model)
+
+    async def _watchdog(self):
+        """Background task: every HEALTH_CHECK_INTERVAL_S, check the MCP
+        connections the workers actually use and replace the broken ones.
+
+        1. Check the shared AIND MCP server, if any (_check_mcp_health).
+           If it failed, it has been restarted and every warm worker is
+           marked stale: their connections were to the old instance.
+        2. Otherwise ping each idle warm worker (_Worker.ping: an MCP
+           status request over its open CLI channel, so nothing is
+           spawned) and record the latency in the model's cli_ping_ms
+           histogram. The CLI answers from its cached connection state,
+           so this catches a wedged CLI or a server it already knows
+           failed, not a server that stopped answering; step 1 covers
+           that for the shared server. A
+           worker whose ping fails, or whose MCP server is reported failed,
+           is marked stale, as is one that was slow PING_SLOW_STREAK times
+           running. Busy workers are skipped; a failure there surfaces as
+           a failed query.
+        3. Rebalance every model: stale workers are replaced one at a time,
+           idle surplus workers are retired.
+
+        Workers aren't replaced on age alone.
+        """
+        while True:
+            try:
+                await asyncio.sleep(self.HEALTH_CHECK_INTERVAL_S)
+                await self._probe()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("MCP watchdog: unexpected error")
+
+
+# Module-level singleton — one pool per worker process. start() is
 # called from server.py lifespan; USE_SDK_POOL=0 disables it for
 # debugging or when something goes sideways.
 _pool: SDKClientPool | None = None
@@ -426,7 +709,7 @@ def get_pool() -> SDKClientPool | None:
     return _pool
 
 
-def init_pool(options_factory) -> SDKClientPool:
+def init_pool(options_factory, default_model: str) -> SDKClientPool:
     global _pool
-    _pool = SDKClientPool(options_factory)
+    _pool = SDKClientPool(options_factory, default_model)
     return _pool
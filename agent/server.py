@@ -1,6 +1,8 @@
 """FastAPI HTTP server wrapping the metadata capture agent service."""
 
 import asyncio
+import base64
+import hashlib
 import json
 import logging
 import os
@@ -18,14 +20,31 @@ from typing import Any
 os.environ.setdefault("CLAUDE_AGENT_SDK_SKIP_VERSION_CHECK", "1")
 
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, UploadFile
+from fastapi import FastAPI, Header, HTTPException, Query, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse, Response, StreamingResponse
 from pydantic import BaseModel
 
+from .aind_mcp import AIND_MCP_SHARED, get_mcp_server, init_mcp_server
+from .aind_mcp import is_enabled as aind_mcp_enabled
+from .blob_store import get_blob_store
+from .chat_runs import cancel_run, follow_run, shutdown_runs, start_run
+from .chat_scheduler import ChatQueueFull, chat_scheduler
+from .cli_spares import CLI_HOT_SPARES, get_spares, init_spares
 from .db.database import close_db, init_db
+from .media_prep import shutdown_media_prep
 from .sdk_client_pool import init_pool
-from .service import AVAILABLE_MODELS, DEFAULT_MODEL, _get_options, chat, get_session_messages, get_sessions
+from .sse import sse_body
+from .service import (
+    AVAILABLE_MODELS,
+    DEFAULT_MODEL,
+    _get_options,
+    chat,
+    get_session_messages,
+    get_sessions,
+    prepare_frame_media,
+    prepare_upload_media,
+)
 from .tools.extractors import EXTRACTORS, EXT_EXTRACTORS, NATIVE_TYPES
 from .tools.spreadsheet import SPREADSHEET_CONTENT_TYPES, parse_spreadsheet
 
@@ -81,20 +100,13 @@ async def lifespan(app: FastAPI):
     except Exception:
         logger.exception("Database initialization failed — continuing without DB")
 
-    if os.environ.get("USE_SDK_POOL", "0") == "1":
-        pool = init_pool(_get_options)
-        print("[lifespan] Starting SDK client pool warmup in background...", flush=True)
-        try:
-            pool.start()
-            print("[lifespan] SDK client pool warmup started (MCP+MongoDB may take ~90s)", flush=True)
-        except Exception:
-            logger.exception(
-                "SDK client pool warmup failed to start — chat() will fall back to "
-                "per-request query(). Set USE_SDK_POOL=0 to silence."
-            )
+    startup = asyncio.create_task(_start_cli_clients(), name="cli-client-startup")
 
     yield
+    startup.cancel()
+    await shutdown_runs()
     await close_db()
+    shutdown_media_prep()
     # Pool shutdown: disconnect() is best-effort — the subprocess dies
     # with the worker anyway on SIGTERM.
     from .sdk_client_pool import get_pool
@@ -104,6 +116,49 @@ async def lifespan(app: FastAPI):
             await p.shutdown()
         except Exception:
             pass
+    spares = get_spares()
+    if spares is not None:
+        try:
+            await spares.shutdown()
+        except Exception:
+            pass
+    mcp_server = get_mcp_server()
+    if mcp_server is not None:
+        await mcp_server.stop()
+
+
+async def _start_cli_clients() -> None:
+    """Start the shared AIND MCP server, then the CLI clients that use it.
+
+    Pool workers and hot spares connect to the MCP server when they
+    spawn, so they wait for it; a CLI that connects first would run
+    without the AIND tools for its whole life. If it doesn't come up,
+    they start anyway and the pool watchdog keeps retrying it.
+    """
+    if AIND_MCP_SHARED and aind_mcp_enabled():
+        mcp_server = init_mcp_server()
+        print(f"[lifespan] Starting shared AIND MCP server at {mcp_server.url}...", flush=True)
+        if await mcp_server.start():
+            print(f"[lifespan] AIND MCP server ready ({len(mcp_server.tools)} tools)", flush=True)
+        else:
+            logger.error("Shared AIND MCP server failed to start — CLI clients will lack AIND tools until it recovers")
+
+    if os.environ.get("USE_SDK_POOL", "0") == "1":
+        pool = init_pool(_get_options, DEFAULT_MODEL)
+        print("[lifespan] Starting SDK client pool warmup in background...", flush=True)
+        try:
+            pool.start()
+            print("[lifespan] SDK client pool warmup started", flush=True)
+        except Exception:
+            logger.exception(
+                "SDK client pool warmup failed to start — chat() will fall back to "
+                "per-request query(). Set USE_SDK_POOL=0 to silence."
+            )
+
+    if CLI_HOT_SPARES > 0:
+        spares = init_spares(_get_options, DEFAULT_MODEL)
+        spares.start()
+        print(f"[lifespan] Spawning {CLI_HOT_SPARES} hot-spare CLI process(es) per model in background", flush=True)
 
 
 app = FastAPI(title="AIND Metadata Capture Agent", lifespan=lifespan)
@@ -114,6 +169,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 
@@ -155,91 +211,145 @@ class PatchFieldRequest(BaseModel):
 # ---------------------------------------------------------------------------
 
 
-@app.post("/chat")
-async def chat_endpoint(req: ChatRequest):
-    """Stream a chat response using Server-Sent Events."""
-    session_id = req.session_id or str(uuid.uuid4())
-    attachments = [a.model_dump() for a in req.attachments] if req.attachments else None
-
-    async def event_stream():
-        queue: asyncio.Queue[str | None] = asyncio.Queue()
-        evt_count = 0
-
-        async def _produce():
-            nonlocal evt_count
-            try:
-                async for chunk in chat(session_id, req.message, model=req.model, attachments=attachments):
-                    evt_count += 1
-                    await queue.put(f"data: {json.dumps(chunk)}\n\n")
-                logger.info("SSE producer: chat() finished, %d events yielded, sending [DONE]", evt_count)
-                await queue.put("data: [DONE]\n\n")
-            except Exception as exc:
-                logger.exception("SSE producer error after %d events: %s", evt_count, exc)
-                await queue.put(f"data: {json.dumps({'error': str(exc)})}\n\n")
-            finally:
-                await queue.put(None)
-
-        producer = asyncio.create_task(_produce())
-        try:
-            while True:
-                try:
-                    item = await asyncio.wait_for(queue.get(), timeout=15)
-                except asyncio.TimeoutError:
-                    yield ": keepalive\n\n"
-                    continue
-                if item is None:
-                    break
-                yield item
-        except GeneratorExit:
-            logger.warning("SSE consumer: GeneratorExit after %d events (client disconnected mid-stream)", evt_count)
-            raise
-        finally:
-            producer.cancel()
-            try:
-                await producer
-            except (asyncio.CancelledError, Exception):
-                pass
-            logger.info("SSE consumer: stream ended, %d events total", evt_count)
-
+def _sse_response(events, run_id: str) -> StreamingResponse:
     return StreamingResponse(
-        event_stream(),
+        sse_body(events),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
             "X-Accel-Buffering": "no",
+            "X-Chat-Run-Id": run_id,
         },
     )
 
 
+@app.post("/chat")
+async def chat_endpoint(req: ChatRequest):
+    """Stream a chat response using Server-Sent Events.
+
+    The agent runs as a chat run (agent/chat_runs.py) that keeps going if
+    the client disconnects; the first event is {"run_id": ...}, and every
+    frame has an id: for resuming with GET /chat/{run_id}/stream.
+
+    Runs go through the chat scheduler (agent/chat_scheduler.py): one at a
+    time per session, a global cap, {"queue_position"} events while
+    waiting, and 503 + Retry-After when the queue is full.
+    """
+    session_id = req.session_id or str(uuid.uuid4())
+    attachments = [a.model_dump() for a in req.attachments] if req.attachments else None
+
+    try:
+        ticket = chat_scheduler.admit(session_id)
+    except ChatQueueFull as exc:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many chats in progress; please try again shortly",
+            headers={"Retry-After": str(exc.retry_after)},
+        )
+    events = chat(session_id, req.message, model=req.model, attachments=attachments)
+    try:
+        run = await start_run(session_id, chat_scheduler.run(ticket, events))
+    except BaseException:
+        chat_scheduler.release(ticket)
+        raise
+    # chat_scheduler.run() releases the ticket when it finishes, but not if
+    # the run is cancelled before it first iterates.
+    run.task.add_done_callback(lambda _: chat_scheduler.release(ticket))
+    return _sse_response(run.follow(), run.run_id)
+
+
+@app.get("/chat/{run_id}/stream")
+async def chat_stream_endpoint(
+    run_id: str,
+    last_event_id: str | None = Header(None),
+    after: int | None = Query(None, description="Resume after this event id (for clients that can't set Last-Event-ID)"),
+):
+    """Reattach to a chat run: replay the events after Last-Event-ID, then
+    follow it live until it ends."""
+    if after is None:
+        try:
+            after = int(last_event_id) if last_event_id else 0
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Last-Event-ID must be an event id")
+    events = await follow_run(run_id, after)
+    if events is None:
+        raise HTTPException(status_code=404, detail="Chat run not found")
+    return _sse_response(events, run_id)
+
+
+@app.post("/chat/{run_id}/cancel")
+async def chat_cancel_endpoint(run_id: str):
+    """Stop a running chat run (the client's Stop button)."""
+    if not cancel_run(run_id):
+        raise HTTPException(status_code=404, detail="No running chat run with that id")
+    return {"cancelled": run_id}
+
+
 
 # ---------------------------------------------------------------------------
 # Records endpoints
 # ---------------------------------------------------------------------------
 
 
+def _encode_cursor(*values: str) -> str:
+    """Opaque pagination cursor for a (sort key, id) position."""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[str, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key, ident = json.loads(base64.urlsafe_b64decode(padded))
+        return str(key), str(ident)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
 @app.get("/records")
 async def list_records_endpoint(
+    response: Response,
     type: str | None = None,
     category: str | None = None,
     session_id: str | None = None,
     status: str | None = None,
     ids: str | None = None,
+    limit: int | None = Query(None, ge=1, le=1000),
+    after: str | None = None,
+    fields: str | None = None,
 ) -> list[dict[str, Any]]:
     """List metadata records with optional filters.
 
     `ids` is a comma-separated list of record IDs — used by the spreadsheet
     overlay to batch-fetch live data for an artifact snapshot.
+
+    With `limit`, returns one page (newest first) and, if there are more,
+    an `X-Next-Cursor` header to pass back as `after`. `fields` is a
+    comma-separated column list (e.g. `name,record_type,status`) for list
+    views that don't need data_json.
     """
     from .tools.metadata_store import list_records
 
     id_list = [i for i in ids.split(",") if i] if ids else None
-    return await list_records(
-        record_type=type,
-        category=category,
-        session_id=session_id,
-        status=status,
-        ids=id_list,
-    )
+    field_list = [f for f in fields.split(",") if f] if fields else None
+    try:
+        records = await list_records(
+            record_type=type,
+            category=category,
+            session_id=session_id,
+            status=status,
+            ids=id_list,
+            # One extra row tells us whether another page exists.
+            limit=limit + 1 if limit else None,
+            after=_decode_cursor(after) if after else None,
+            fields=field_list,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if limit and len(records) > limit:
+        records = records[:limit]
+        last = records[-1]
+        response.headers["X-Next-Cursor"] = _encode_cursor(last["created_at"], last["id"])
+    return records
 
 
 @app.get("/schema/enums")
@@ -271,20 +381,23 @@ async def get_record_endpoint(record_id: str) -> dict[str, Any]:
 
 
 async def _apply_record_update(
-    record_id: str, record_type: str, data_patch: dict[str, Any], merge: bool = True
+    record_id: str, data_patch: dict[str, Any], merge: bool = True
 ) -> dict[str, Any]:
-    """Shared tail for PUT and PATCH: merge → validate → refetch."""
-    from .tools.metadata_store import get_record, update_record, update_record_validation
-    from .validation import validate_record
+    """Shared tail for PUT and PATCH: merge → validate, in one transaction.
 
-    result = await update_record(record_id, data=data_patch, merge=merge)
-    if result is None:
-        raise HTTPException(status_code=500, detail="Failed to update record")
+    Both writes return the updated row, so there's no refetch; a missing
+    record surfaces as 404 from the UPDATE itself.
+    """
+    from .tools.metadata_store import transaction, update_record, update_record_validation
+    from .validation import validate_record
 
-    validation = validate_record(record_type, result.get("data_json") or {})
-    await update_record_validation(record_id, validation.to_dict())
+    async with transaction():
+        result = await update_record(record_id, data=data_patch, merge=merge)
+        if result is None:
+            raise HTTPException(status_code=404, detail="Record not found")
 
-    updated = await get_record(record_id)
+        validation = validate_record(result["record_type"], result.get("data_json") or {})
+        updated = await update_record_validation(record_id, validation.to_dict())
     if updated is None:
         raise HTTPException(status_code=500, detail="Record not found after update")
     return updated
@@ -293,13 +406,7 @@ async def _apply_record_update(
 @app.put("/records/{record_id}")
 async def update_record_endpoint(record_id: str, req: UpdateRecordDataRequest) -> dict[str, Any]:
     """Update a record's data."""
-    from .tools.metadata_store import get_record
-
-    existing = await get_record(record_id)
-    if existing is None:
-        raise HTTPException(status_code=404, detail="Record not found")
-
-    return await _apply_record_update(record_id, existing["record_type"], req.data, merge=req.merge)
+    return await _apply_record_update(record_id, req.data, merge=req.merge)
 
 
 def _build_field_patch(field: str, value: str) -> dict[str, Any]:
@@ -340,9 +447,7 @@ async def patch_record_field(record_id: str, req: PatchFieldRequest) -> dict[str
             detail=f"Unknown field '{req.field}' for record type '{record_type}'",
         )
 
-    return await _apply_record_update(
-        record_id, record_type, _build_field_patch(req.field, req.value)
-    )
+    return await _apply_record_update(record_id, _build_field_patch(req.field, req.value))
 
 
 @app.post("/records/{record_id}/confirm")
@@ -397,9 +502,24 @@ async def delete_record_endpoint(record_id: str):
 
 
 @app.get("/sessions")
-async def list_sessions() -> list[dict[str, Any]]:
-    """List all chat sessions with message counts."""
-    return await get_sessions()
+async def list_sessions(
+    response: Response,
+    limit: int | None = Query(None, ge=1, le=1000),
+    after: str | None = None,
+) -> list[dict[str, Any]]:
+    """List chat sessions with message counts, most recently active first.
+
+    Paginated like GET /records: `limit`, `after`, `X-Next-Cursor`.
+    """
+    sessions = await get_sessions(
+        limit=limit + 1 if limit else None,
+        after=_decode_cursor(after) if after else None,
+    )
+    if limit and len(sessions) > limit:
+        sessions = sessions[:limit]
+        last = sessions[-1]
+        response.headers["X-Next-Cursor"] = _encode_cursor(last["last_active"], last["session_id"])
+    return sessions
 
 
 @app.get("/sessions/{session_id}/messages")
@@ -466,6 +586,7 @@ async def _extract_and_store(upload_id: str, path: Path, content_type: str) -> N
                 try:
                     async for frame_bytes, caption in extract_keyframes_gen(path):
                         await save_keyframe(upload_id, frame_idx, frame_bytes, caption)
+                        await prepare_frame_media(frame_bytes)
                         frame_idx += 1
                 except Exception as kf_exc:
                     err = f"Keyframe extraction failed: {kf_exc}"
@@ -492,6 +613,9 @@ async def _extract_and_store(upload_id: str, path: Path, content_type: str) -> N
                     meta=result.meta,
                     error=result.error,
                 )
+                # Resize/encode now rather than on the first chat turn.
+                for img_bytes, _caption in result.images:
+                    await prepare_frame_media(img_bytes)
         except Exception as exc:
             logger.exception("Background extraction failed for %s", upload_id)
             try:
@@ -529,6 +653,29 @@ async def _transcribe_and_append(upload_id: str, path: Path) -> None:
             logger.exception("Failed to persist transcript error for %s", upload_id)
 
 
+async def _store_upload_blob(dest: Path, digest: str, size_bytes: int) -> str | None:
+    """Copy an upload into the blob store for ephemeral-filesystem
+    environments (Replit autoscale). The digest was computed while the file
+    was written, so it isn't re-read just to hash it; identical files share
+    one blob. A store failure is logged, not fatal — the local copy still
+    serves until the filesystem goes away.
+
+    Skipped for files over the store's size limit (BLOB_STORE=db): a
+    multi-GB video won't fit in a BYTEA column; its durability comes from
+    the extraction columns (keyframes + transcript).
+    """
+    store = get_blob_store()
+    if store.max_blob_bytes is not None and size_bytes > store.max_blob_bytes:
+        logger.info("Upload too large for the blob store (%d bytes), keeping only the local copy: %s",
+                    size_bytes, dest)
+        return None
+    try:
+        return await store.put_file(dest, digest)
+    except Exception:
+        logger.warning("Could not copy upload to the blob store: %s", dest, exc_info=True)
+        return None
+
+
 @app.post("/upload")
 async def upload_file(file: UploadFile, session_id: str | None = None):
     """Upload a file for use in chat messages.
@@ -580,6 +727,7 @@ async def upload_file(file: UploadFile, session_id: str | None = None):
     dest = UPLOADS_DIR / f"{file_id}{dest_ext}"
 
     size_bytes = 0
+    digest = hashlib.sha256()
     try:
         UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
         with dest.open("wb") as out:
@@ -590,6 +738,7 @@ async def upload_file(file: UploadFile, session_id: str | None = None):
                         status_code=413,
                         detail=f"File too large. Maximum is {size_cap // (1024*1024)} MB.",
                     )
+                digest.update(chunk)
                 out.write(chunk)
     except HTTPException:
         dest.unlink(missing_ok=True)
@@ -602,16 +751,7 @@ async def upload_file(file: UploadFile, session_id: str | None = None):
         dest.unlink(missing_ok=True)
         raise HTTPException(status_code=500, detail=f"Upload write failed: {exc}")
 
-    # DB-stored copy for ephemeral-filesystem environments (Replit autoscale).
-    # Skipped for files above the non-video cap — a multi-GB video won't fit
-    # in a BLOB column; its durability comes from the extraction columns
-    # (keyframes + transcript) that _extract_and_store fills in.
-    file_data: bytes | None = None
-    if size_bytes <= MAX_UPLOAD_SIZE:
-        try:
-            file_data = dest.read_bytes()
-        except OSError:
-            logger.warning("Could not re-read upload for DB durability: %s", dest)
+    blob_digest = await _store_upload_blob(dest, digest.hexdigest(), size_bytes)
 
     # Native types (images, PDFs) go directly to Claude at chat time — no
     # extraction pipeline. Mark them 'done' at insert so the frontend's
@@ -624,15 +764,18 @@ async def upload_file(file: UploadFile, session_id: str | None = None):
         content_type=content_type,
         file_path=str(dest),
         size_bytes=size_bytes,
-        file_data=file_data,
+        blob_digest=blob_digest,
         session_id=session_id,
         initial_status="done" if is_native else "pending",
     )
 
-    # Schedule extraction for non-native types. The task runs after this
-    # response is returned; the DB row starts as 'pending' and flips to
-    # 'done'/'error' when the task finishes.
-    if not is_native:
+    # Native types get their API-ready payload cached in the background;
+    # non-native types are scheduled for extraction. Either task runs after
+    # this response is returned; for extraction the DB row starts as
+    # 'pending' and flips to 'done'/'error' when the task finishes.
+    if is_native:
+        asyncio.create_task(prepare_upload_media(file_id, dest, content_type, blob_digest))
+    else:
         asyncio.create_task(_extract_and_store(file_id, dest, content_type))
         # Video: transcript runs as a second, slower task. Keyframes (above)
         # finish in ~20s and flip status to 'done'; transcript lands minutes
@@ -735,6 +878,7 @@ async def upload_finalize_chunked(upload_id: str, total_chunks: int):
     dest = UPLOADS_DIR / f"{file_id}{dest_ext}"
     size_cap = MAX_VIDEO_UPLOAD_SIZE if is_video else MAX_UPLOAD_SIZE
     size_bytes = 0
+    digest = hashlib.sha256()
 
     try:
         UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
@@ -747,6 +891,7 @@ async def upload_finalize_chunked(upload_id: str, total_chunks: int):
                         status_code=413,
                         detail=f"File too large. Maximum is {size_cap // (1024 * 1024)} MB.",
                     )
+                digest.update(data)
                 out.write(data)
     except HTTPException:
         dest.unlink(missing_ok=True)
@@ -759,12 +904,7 @@ async def upload_finalize_chunked(upload_id: str, total_chunks: int):
 
     shutil.rmtree(chunk_dir, ignore_errors=True)
 
-    file_data: bytes | None = None
-    if size_bytes <= MAX_UPLOAD_SIZE:
-        try:
-            file_data = dest.read_bytes()
-        except OSError:
-            logger.warning("Could not re-read assembled upload for DB durability: %s", dest)
+    blob_digest = await _store_upload_blob(dest, digest.hexdigest(), size_bytes)
 
     is_native = content_type in NATIVE_TYPES or ext in _NATIVE_EXTS
 
@@ -774,12 +914,14 @@ async def upload_finalize_chunked(upload_id: str, total_chunks: int):
         content_type=content_type,
         file_path=str(dest),
         size_bytes=size_bytes,
-        file_data=file_data,
+        blob_digest=blob_digest,
         session_id=session_id,
         initial_status="done" if is_native else "pending",
     )
 
-    if not is_native:
+    if is_native:
+        asyncio.create_task(prepare_upload_media(file_id, dest, content_type, blob_digest))
+    else:
         asyncio.create_task(_extract_and_store(file_id, dest, content_type))
         if is_video:
             from .tools.transcribe import check_availability
@@ -819,9 +961,9 @@ async def get_upload_extraction_endpoint(file_id: str):
 @app.get("/uploads/{file_id}")
 async def get_uploaded_file(file_id: str):
     """Serve an uploaded file by ID."""
-    from .tools.metadata_store import get_upload
+    from .tools.metadata_store import UploadBlob, get_upload_meta
 
-    upload = await get_upload(file_id)
+    upload = await get_upload_meta(file_id)
     if upload is None:
         raise HTTPException(status_code=404, detail="Upload not found")
 
@@ -833,11 +975,15 @@ async def get_uploaded_file(file_id: str):
             filename=upload["original_filename"],
         )
 
-    if upload.get("file_data"):
-        return Response(
-            content=bytes(upload["file_data"]),
+    blob = UploadBlob(upload)
+    if await blob.exists():
+        return StreamingResponse(
+            blob.stream(),
             media_type=upload["content_type"],
-            headers={"Content-Disposition": f'inline; filename="{upload["original_filename"]}"'},
+            headers={
+                "Content-Disposition": f'inline; filename="{upload["original_filename"]}"',
+                "Content-Length": str(upload["size_bytes"]),
+            },
         )
 
     raise HTTPException(status_code=404, detail="File not found")
@@ -846,9 +992,9 @@ async def get_uploaded_file(file_id: str):
 @app.get("/uploads/{file_id}/table")
 async def get_upload_as_table(file_id: str) -> dict[str, Any]:
     """Parse a spreadsheet upload (CSV/XLSX) into columns + rows."""
-    from .tools.metadata_store import get_upload
+    from .tools.metadata_store import UploadBlob, get_upload_meta
 
-    upload = await get_upload(file_id)
+    upload = await get_upload_meta(file_id)
     if upload is None:
         raise HTTPException(status_code=404, detail="Upload not found")
 
@@ -858,12 +1004,10 @@ async def get_upload_as_table(file_id: str) -> dict[str, Any]:
 
     file_path = Path(upload["file_path"])
     if not file_path.exists():
-        if upload.get("file_data"):
-            UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
-            file_path.parent.mkdir(parents=True, exist_ok=True)
-            file_path.write_bytes(bytes(upload["file_data"]))
-        else:
+        blob = UploadBlob(upload)
+        if not await blob.exists():
             raise HTTPException(status_code=404, detail="File not found")
+        await blob.save_to(file_path)
 
     try:
         parsed = parse_spreadsheet(file_path, content_type)
@@ -911,6 +1055,29 @@ async def list_models():
     return {"models": AVAILABLE_MODELS, "default": DEFAULT_MODEL}
 
 
+@app.get("/metrics")
+async def metrics() -> dict[str, Any]:
+    """Per-process token usage (cached vs uncached input, recent turns),
+    media cache hit counts, chat queue depth / wait times, SDK pool
+    workers per model, hot-spare CLI hand-outs, and the shared AIND MCP
+    server's state."""
+    from .media_cache import get_media_cache
+    from .metrics import usage_metrics
+    from .sdk_client_pool import get_pool
+
+    pool = get_pool()
+    spares = get_spares()
+    mcp_server = get_mcp_server()
+    return {
+        "usage": usage_metrics.snapshot(),
+        "media_cache": get_media_cache().stats(),
+        "chat_scheduler": chat_scheduler.stats(),
+        "sdk_pool": pool.stats() if pool is not None else None,
+        "cli_spares": spares.stats() if spares is not None else None,
+        "aind_mcp": mcp_server.stats() if mcp_server is not None else None,
+    }
+
+
 @app.get("/health")
 async def health():
     """Health check endpoint."""
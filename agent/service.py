@@ -1,14 +1,13 @@
 """Core agent service that wraps the Claude Code SDK for metadata capture."""
 
 import asyncio
-import base64
-import io
+import hashlib
 import json
 import logging
 import os
-import sys
 import time
-from collections.abc import AsyncIterator
+from collections.abc import AsyncIterator, Awaitable, Callable
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any
 
@@ -20,15 +19,23 @@ from claude_agent_sdk.types import (
     TextBlock,
 )
 
+from . import aind_mcp
+from .history import load_history_window
+from .cli_spares import get_spares
+from .media_cache import MediaPayload, get_media_cache
+from .media_prep import MEDIA_PREP_WORKERS, run_media_prep
+from .metrics import usage_metrics
 from .prompts.system_prompt import SYSTEM_PROMPT
 from .sdk_client_pool import get_pool
 from .shared import stream_events
 from .tools.capture_mcp import capture_server
 from .tools.metadata_store import (
+    Keyframe,
     get_conversation_history,
     get_session_records,
-    get_upload,
     get_upload_extraction,
+    get_upload_meta,
+    open_upload_stream,
     save_conversation_turn,
 )
 
@@ -39,8 +46,25 @@ logger = logging.getLogger(__name__)
 # the extra log lines clutter output.
 _PROFILE = os.environ.get("CHAT_PROFILE") == "1"
 
+# Set PROMPT_CACHE=0 to send the old single-string prompt with no
+# cache_control markers (kill switch if the API or CLI rejects them).
+_PROMPT_CACHE = os.environ.get("PROMPT_CACHE", "1") != "0"
+
+# Set RECORDS_CONTEXT=full to put every record's full data in the prompt on
+# every turn. The default (compact) sends full data only for records that
+# changed since the previous turn and a one-line summary for the rest; the
+# agent fetches the others with get_record.
+_COMPACT_RECORDS = os.environ.get("RECORDS_CONTEXT", "compact") != "full"
+
+# Set SESSION_AFFINITY=1 (with USE_SDK_POOL=1) to pin each active session to
+# a pooled client that keeps the real conversation, so later turns send only
+# the new message and changed records instead of replaying history. A
+# session whose client was evicted, or that missed a turn, is rebuilt from
+# the DB as usual (see SDKClientPool.pin).
+_SESSION_AFFINITY = os.environ.get("SESSION_AFFINITY") == "1"
+
 # Path to the AIND MCP server for schema context
-MCP_SERVER_DIR = Path(__file__).resolve().parent.parent / "aind-data-mcp"
+MCP_SERVER_DIR = aind_mcp.MCP_SERVER_DIR
 
 
 DEFAULT_MODEL = "claude-sonnet-4-6"
@@ -76,10 +100,11 @@ def _build_options(model: str | None = None) -> ClaudeAgentOptions:
         "mcp__aind-data-mcp__get_additional_schema_help",
     ]
 
-    # Capture tools (capture_metadata, find_records, link_records, render_artifact)
+    # Capture tools (capture_metadata, find_records, get_record, link_records, render_artifact)
     capture_tools = [
         "mcp__capture__capture_metadata",
         "mcp__capture__find_records",
+        "mcp__capture__get_record",
         "mcp__capture__link_records",
         "mcp__capture__render_artifact",
     ]
@@ -90,7 +115,12 @@ def _build_options(model: str | None = None) -> ClaudeAgentOptions:
     }
 
     # Add AIND MCP server if available. SKIP_AIND_MCP=1 disables it for
-    # perf testing — the stdio subprocess spawn is the dominant TTFT cost.
+    # perf testing.
+    #
+    # By default every CLI connects to the one shared HTTP server the
+    # backend runs (agent/aind_mcp.py) instead of spawning its own stdio
+    # subprocess, which was the dominant TTFT cost and a few hundred MB of
+    # RSS per client. AIND_MCP_SHARED=0 goes back to stdio.
     #
     # Previously this called the `aind-metadata-mcp` CLI entrypoint. That
     # broke silently when the editable install's .pth file pointed at a
@@ -101,28 +131,12 @@ def _build_options(model: str | None = None) -> ClaudeAgentOptions:
     # lazy-import fix (~600ms off cold start), (c) makes the failure mode
     # obvious: if AIND_MCP_PYTHON doesn't have the deps, the backend
     # crashes at startup instead of every chat being mysteriously slow.
-    #
-    # AIND_MCP_PYTHON: path to a Python that has aind-data-access-api +
-    # fastmcp installed. Defaults to the system conda py311 env that was
-    # already hosting the editable install.
-    mcp_src = MCP_SERVER_DIR / "src"
-    print(f"[MCP] MCP_SERVER_DIR={MCP_SERVER_DIR}, src exists={mcp_src.is_dir()}, SKIP={os.environ.get('SKIP_AIND_MCP')}", flush=True)
-    if mcp_src.is_dir() and os.environ.get("SKIP_AIND_MCP") != "1":
-        mcp_python = os.environ.get(
-            "AIND_MCP_PYTHON",
-            sys.executable,
-        )
-        existing_pypath = os.environ.get("PYTHONPATH", "")
-        new_pypath = f"{mcp_src}:{existing_pypath}" if existing_pypath else str(mcp_src)
-        mcp_env = {**os.environ, "PYTHONPATH": new_pypath}
-        print(f"[MCP] Registering AIND MCP server via {mcp_python} (src={mcp_src})", flush=True)
-        logger.info("Registering AIND MCP server via %s (src=%s)", mcp_python, mcp_src)
-        mcp_servers["aind-data-mcp"] = {
-            "type": "stdio",
-            "command": mcp_python,
-            "args": ["-m", "aind_data_mcp.data_access_server"],
-            "env": mcp_env,
-        }
+    logger.debug("AIND MCP: MCP_SERVER_DIR=%s, enabled=%s, shared=%s",
+                 MCP_SERVER_DIR, aind_mcp.is_enabled(), aind_mcp.AIND_MCP_SHARED)
+    if aind_mcp.is_enabled():
+        config = aind_mcp.cli_config()
+        logger.debug("Registering AIND MCP server (%s): %s", config["type"], config.get("url") or config.get("command"))
+        mcp_servers["aind-data-mcp"] = config
 
     # Built-in tools (Bash/Read/Glob/Grep/WebFetch/WebSearch) dropped — the
     # capture workflow is purely MCP-driven (capture_metadata + AIND schema
@@ -162,52 +176,217 @@ def _get_options(model: str | None) -> ClaudeAgentOptions:
     return _OPTIONS_CACHE[key]
 
 
-def _format_conversation_context(history: list[dict[str, Any]], user_message: str) -> str:
-    """Format conversation history + new message into a prompt string."""
+def _format_turn(turn: dict[str, Any]) -> str:
+    """Format one history turn as "ROLE: content" plus attachment markers."""
+    role = turn["role"].upper()
+    content = turn["content"]
+    # Add markers for attachments in history so agent knows what was shared
+    attachments = turn.get("attachments_json")
+    if attachments and isinstance(attachments, list):
+        for att in attachments:
+            ct = att.get("content_type", "")
+            fname = att.get("filename", "file")
+            if ct.startswith("image/"):
+                content += f"\n[Attached image: {fname}]"
+            elif ct == "application/pdf":
+                content += f"\n[Attached PDF: {fname}]"
+            else:
+                # Generic fallback covers spreadsheets, text, docx,
+                # audio, video — anything the extraction pipeline
+                # handles. Include the MIME type so the agent can
+                # reason about what kind of file it was.
+                content += f"\n[Attached {ct or 'file'}: {fname}]"
+    return f"{role}: {content}"
+
+
+def _format_conversation_context(
+    history: list[dict[str, Any]], user_message: str, summary: str | None = None,
+) -> str:
+    """Format conversation history + new message into a prompt string.
+
+    ``history`` is already windowed (agent/history.py); ``summary`` covers
+    the turns before it.
+    """
     parts: list[str] = []
 
+    if summary:
+        parts.append(_format_summary(summary))
+        parts.append("")
     if history:
         parts.append("Previous conversation:")
-        for turn in history[-10:]:  # Keep last 10 turns for context
-            role = turn["role"].upper()
-            content = turn["content"]
-            # Add markers for attachments in history so agent knows what was shared
-            attachments = turn.get("attachments_json")
-            if attachments and isinstance(attachments, list):
-                for att in attachments:
-                    ct = att.get("content_type", "")
-                    fname = att.get("filename", "file")
-                    if ct.startswith("image/"):
-                        content += f"\n[Attached image: {fname}]"
-                    elif ct == "application/pdf":
-                        content += f"\n[Attached PDF: {fname}]"
-                    else:
-                        # Generic fallback covers spreadsheets, text, docx,
-                        # audio, video — anything the extraction pipeline
-                        # handles. Include the MIME type so the agent can
-                        # reason about what kind of file it was.
-                        content += f"\n[Attached {ct or 'file'}: {fname}]"
-            parts.append(f"{role}: {content}")
+        for turn in history:
+            parts.append(_format_turn(turn))
         parts.append("")
 
     parts.append(f"USER: {user_message}")
     return "\n".join(parts)
 
 
-def _format_records_context(records: list[dict[str, Any]]) -> str:
-    """Format existing records as context for the agent prompt."""
-    if not records:
-        return ""
+def _format_summary(summary: str) -> str:
+    return f"Summary of earlier conversation (no longer shown in full):\n{summary}"
+
+
+def _format_record(r: dict[str, Any]) -> str:
+    data = r.get("data_json", {})
+    name = r.get("name", "unnamed")
+    return f"- [{r['record_type']}] id={r['id']} name=\"{name}\" data={json.dumps(data, default=str)}"
+
+
+def _filled_fields(data: dict[str, Any]) -> list[str]:
+    """Top-level keys with a value; lists carry their length."""
+    fields = []
+    for key, value in data.items():
+        if value is None or value == "" or value == [] or value == {}:
+            continue
+        fields.append(f"{key}[{len(value)}]" if isinstance(value, list) else key)
+    return fields
+
+
+def _format_validation_brief(validation: dict[str, Any] | None) -> str:
+    if not validation:
+        return "not validated"
+    details = []
+    if validation.get("errors"):
+        details.append(f"{len(validation['errors'])} errors")
+    if validation.get("warnings"):
+        details.append(f"{len(validation['warnings'])} warnings")
+    if validation.get("missing_required"):
+        details.append(f"missing {', '.join(validation['missing_required'])}")
+    status = validation.get("status", "valid")
+    return f"{status} ({'; '.join(details)})" if details else status
+
+
+def _format_record_summary(r: dict[str, Any]) -> str:
+    """One line per record: identity, status and which fields are filled."""
+    data = r.get("data_json") or {}
+    name = r.get("name", "unnamed")
+    fields = ", ".join(_filled_fields(data)) if isinstance(data, dict) else "?"
+    return (
+        f"- [{r['record_type']}] id={r['id']} name=\"{name}\" status={r.get('status', 'draft')} "
+        f"validation={_format_validation_brief(r.get('validation_json'))} fields: {fields or 'none'}"
+    )
+
+
+def _parse_timestamp(value: Any) -> datetime | None:
+    # Python-written timestamps carry +00:00; the DB defaults are naive UTC.
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        try:
+            parsed = datetime.fromisoformat(str(value))
+        except ValueError:
+            return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
 
-    parts = ["\nExisting metadata records for this session:"]
+def _records_changed_since(records: list[dict[str, Any]], since: Any) -> set[str]:
+    """IDs of records written at or after ``since`` (all of them if None).
+
+    ``since`` is the previous user turn's created_at, so this covers what
+    the agent captured during that turn plus any edits made in the UI after
+    it. SQLite stamps turns to the second; the >= errs towards sending a
+    record in full.
+    """
+    cutoff = _parse_timestamp(since) if since else None
+    if cutoff is None:
+        return {r["id"] for r in records}
+    changed = set()
     for r in records:
-        data = r.get("data_json", {})
-        name = r.get("name", "unnamed")
-        parts.append(f"- [{r['record_type']}] id={r['id']} name=\"{name}\" data={json.dumps(data, default=str)}")
+        updated = _parse_timestamp(r.get("updated_at"))
+        if updated is None or updated >= cutoff:
+            changed.add(r["id"])
+    return changed
+
+
+def _previous_turn_start(history: list[dict[str, Any]]) -> Any:
+    """created_at of the last user turn shown in ``history``, if any."""
+    return next((t.get("created_at") for t in reversed(history) if t["role"] == "user"), None)
 
+
+def _format_records_context(records: list[dict[str, Any]], full_ids: set[str] | None = None) -> str:
+    """Format existing records as context for the agent prompt.
+
+    ``full_ids`` limits full data to those records and summarises the rest
+    (see _format_record_summary); None sends every record in full.
+    """
+    if not records:
+        return ""
+
+    if full_ids is None:
+        parts = ["\nExisting metadata records for this session:"]
+        parts.extend(_format_record(r) for r in records)
+    else:
+        parts = [
+            "\nExisting metadata records for this session. Records changed since the previous "
+            "turn include their data; for the others call get_record(record_id) when you need "
+            "their full data:"
+        ]
+        parts.extend(_format_record(r) if r["id"] in full_ids else _format_record_summary(r) for r in records)
     return "\n".join(parts)
 
 
+def _format_records_update(records: list[dict[str, Any]], changed_ids: set[str]) -> str:
+    """Records changed since the previous turn, for a client that already
+    has the earlier ones in its conversation."""
+    changed = [r for r in records if r["id"] in changed_ids]
+    if not changed:
+        return ""
+    return "\n".join(["Metadata records changed since the previous turn:", *map(_format_record, changed)])
+
+
+def _session_instructions(session_id: str) -> str:
+    # The agent doesn't know the session_id otherwise, and the capture tool
+    # handlers hard-require it.
+    return (
+        f"IMPORTANT: When calling capture_metadata, find_records, link_records, "
+        f"or render_artifact, always use session_id=\"{session_id}\""
+    )
+
+
+def _build_prompt_blocks(
+    session_id: str,
+    history: list[dict[str, Any]],
+    records: list[dict[str, Any]],
+    summary: str | None = None,
+    full_ids: set[str] | None = None,
+) -> list[dict[str, Any]]:
+    """Build the cacheable prefix of the user content, most stable first.
+
+    The system prompt (ClaudeAgentOptions.system_prompt) and tool schemas
+    precede all of this and never change, so every prefix below includes
+    them. Then:
+
+      1. session instructions — fixed for the session
+      2. summary of older turns — rewritten only when the history window
+         moves (agent/history.py)
+      3. history — one block per earlier turn, so turn N's prefix ends on
+         a block boundary turn N+1 still shares (cache breakpoint on the
+         last one). The window start only moves on budget overflow, so
+         between moves this part is append-only
+      4. records snapshot — rewritten whenever a record changes, which is
+         most turns, so it goes after history (cache breakpoint)
+
+    The new turn (attachments + user message) is appended by the caller and
+    never cached. That's two breakpoints; the API allows four per request
+    and the CLI uses the rest for its own system-prompt caching.
+    """
+    blocks: list[dict[str, Any]] = [{"type": "text", "text": _session_instructions(session_id)}]
+    if summary:
+        blocks.append({"type": "text", "text": _format_summary(summary)})
+    if history:
+        blocks.append({"type": "text", "text": "Previous conversation:"})
+        blocks.extend({"type": "text", "text": _format_turn(turn)} for turn in history)
+    blocks[-1]["cache_control"] = {"type": "ephemeral"}
+
+    if records:
+        blocks.append({
+            "type": "text",
+            "text": _format_records_context(records, full_ids).lstrip("\n"),
+            "cache_control": {"type": "ephemeral"},
+        })
+    return blocks
+
+
 async def _create_message_stream(prompt: str | list[dict[str, Any]]):
     """Create an async generator for streaming input to the SDK."""
     yield {
@@ -219,61 +398,176 @@ async def _create_message_stream(prompt: str | list[dict[str, Any]]):
     }
 
 
-# The Claude Code CLI's validateImagesForAPI rejects any image whose base64
-# string length exceeds ~5MB. Base64 inflates bytes by 4/3, so raw bytes must
-# stay under 5 * 3/4 = 3.75MB. We aim lower (3.5MB) for headroom. Claude's
-# vision model downscales to 1568px internally anyway, so pre-resizing to
-# that dimension loses no model-visible detail.
-_IMAGE_MAX_RAW_BYTES = 3_500_000
-_IMAGE_MAX_DIMENSION = 1568
-
-
-def _resize_image_for_api(raw: bytes, content_type: str) -> tuple[bytes, str]:
-    """Shrink an image to fit the API's 5MB base64 limit.
-
-    Returns (bytes, media_type). If the input is already small enough it's
-    returned unchanged. Otherwise the image is downscaled to 1568px max
-    dimension and re-encoded as JPEG (q85), which reliably lands under the
-    limit for photographic content like microscopy frames.
-    """
-    if len(raw) <= _IMAGE_MAX_RAW_BYTES:
-        return raw, content_type
+async def _media_payload(
+    key: str | None, load: Callable[[], Awaitable[bytes | None]], content_type: str,
+) -> MediaPayload | None:
+    """Prepared payload for ``key`` from the media cache, or load + prepare
+    + cache it on a miss. ``key`` None skips the cache; ``load`` returning
+    None (bytes gone) gives None."""
+    cache = get_media_cache()
+    if key:
+        cached = await cache.get(key)
+        if cached is not None:
+            return cached
+    raw = await load()
+    if raw is None:
+        return None
+    payload = await run_media_prep(raw, content_type)
+    if key:
+        await cache.put(key, payload)
+    return payload
+
+
+def _upload_media_key(upload_id: str | None, blob_digest: str | None) -> str | None:
+    # Content hash when the upload has one, so identical files share an entry.
+    return blob_digest or (f"upload-{upload_id}" if upload_id else None)
+
+
+async def _read_attachment(file_path: Path, file_id: str | None) -> bytes | None:
+    """An attachment's bytes: local file first, then the stored copy."""
+    if await asyncio.to_thread(file_path.is_file):
+        return await asyncio.to_thread(file_path.read_bytes)
+    if file_id:
+        blob = await open_upload_stream(file_id)
+        if blob is not None and await blob.exists():
+            return await blob.read()
+        logger.warning("Attachment file not found and no stored copy: %s", file_path)
+        return None
+    logger.warning("Attachment file not found: %s", file_path)
+    return None
+
+
+async def prepare_upload_media(
+    upload_id: str, file_path: Path, content_type: str, blob_digest: str | None,
+) -> None:
+    """Background: put a just-uploaded image/PDF into the media cache so
+    the first chat turn that sends it doesn't pay for the resize/encode."""
+    if not (content_type.startswith("image/") or content_type == "application/pdf"):
+        return
+    try:
+        await _media_payload(
+            _upload_media_key(upload_id, blob_digest),
+            lambda: _read_attachment(file_path, upload_id),
+            content_type,
+        )
+    except Exception:
+        logger.warning("Could not prepare media for upload %s", upload_id, exc_info=True)
 
-    from PIL import Image
 
+async def prepare_frame_media(frame: bytes) -> None:
+    """Background: media-cache an extracted image (video keyframe etc.)
+    while its bytes are still in hand. Keyed by SHA-256, which is the
+    frame_digest the blob store gives it."""
     try:
-        img = Image.open(io.BytesIO(raw))
-        img.load()
-    except Exception as exc:
-        logger.warning("Pillow failed to open image (%s); sending original bytes", exc)
-        return raw, content_type
-
-    # JPEG can't encode alpha or palette modes — flatten onto white.
-    if img.mode != "RGB":
-        bg = Image.new("RGB", img.size, (255, 255, 255))
-        if img.mode in ("RGBA", "LA"):
-            bg.paste(img, mask=img.split()[-1])
+        digest = await asyncio.to_thread(lambda: hashlib.sha256(frame).hexdigest())
+
+        async def load() -> bytes:
+            return frame
+
+        await _media_payload(digest, load, "image/png")
+    except Exception:
+        logger.warning("Could not prepare extracted media", exc_info=True)
+
+
+async def _attachment_blocks(att: dict[str, Any]) -> list[dict[str, Any]]:
+    """Content blocks for one attachment (see _build_multimodal_content)."""
+    blocks: list[dict[str, Any]] = []
+    file_path = Path(att.get("file_path", ""))
+    content_type = att.get("content_type", "")
+    filename = att.get("filename", file_path.name or "file")
+    file_id = att.get("file_id")
+
+    # --- Native types: send raw bytes to Claude ----------------------------
+    # Resized + base64-encoded once per file, then served from the
+    # media cache (agent/media_cache.py).
+    if content_type.startswith("image/") or content_type == "application/pdf":
+        payload = await _media_payload(
+            _upload_media_key(file_id, att.get("blob_digest")),
+            lambda: _read_attachment(file_path, file_id),
+            content_type,
+        )
+        if payload is None:
+            return blocks
+        media_type, b64_data = payload
+        if media_type.startswith("image/"):
+            blocks.append({
+                "type": "image",
+                "source": {"type": "base64", "media_type": media_type, "data": b64_data},
+            })
         else:
-            bg.paste(img.convert("RGB"))
-        img = bg
-
-    img.thumbnail((_IMAGE_MAX_DIMENSION, _IMAGE_MAX_DIMENSION), Image.Resampling.LANCZOS)
-
-    # Drop quality until the encoded result fits. q85 handles almost every
-    # real-world photo at 1568px; the loop is a safety net for pathological
-    # inputs (noise-heavy scans, etc.).
-    out, quality = b"", 0
-    for quality in (85, 75, 60, 45):
-        buf = io.BytesIO()
-        img.save(buf, format="JPEG", quality=quality, optimize=True)
-        out = buf.getvalue()
-        if len(out) <= _IMAGE_MAX_RAW_BYTES:
-            break
-    logger.info(
-        "Resized image %d → %d bytes (q=%d, %dx%d)",
-        len(raw), len(out), quality, *img.size,
-    )
-    return out, "image/jpeg"
+            blocks.append({
+                "type": "document",
+                "source": {"type": "base64", "media_type": "application/pdf", "data": b64_data},
+            })
+        return blocks
+
+    # --- Non-native: read cached extraction from DB ------------------------
+    if not file_id:
+        logger.warning("Non-native attachment %s has no file_id; skipping", filename)
+        return blocks
+
+    extraction = await get_upload_extraction(file_id, lazy_images=True)
+    if extraction is None:
+        # Upload row doesn't exist — shouldn't happen if get_upload_meta()
+        # succeeded upstream, but guard anyway.
+        logger.warning("No extraction row for upload %s", file_id)
+        return blocks
+
+    status = extraction["status"]
+
+    if status == "pending":
+        blocks.append({
+            "type": "text",
+            "text": (
+                f"[Attachment {filename} is still being processed — "
+                f"extraction not yet complete. Ask the user to wait a "
+                f"moment and resend their message.]"
+            ),
+        })
+        return blocks
+
+    if status == "error":
+        blocks.append({
+            "type": "text",
+            "text": f"[Attachment {filename}: extraction failed — {extraction['error']}]",
+        })
+        return blocks
+
+    # status == "done": inject extracted images then text
+    async def frame_payload(frame: Keyframe | bytes) -> MediaPayload | None:
+        if isinstance(frame, Keyframe):
+            return await _media_payload(frame.key, frame.read, "image/png")
+        return await run_media_prep(frame, "image/png")
+
+    payloads = await asyncio.gather(*(frame_payload(frame) for frame, _ in extraction["images"]))
+    for (_, caption), payload in zip(extraction["images"], payloads):
+        if payload is None:
+            # Stored bytes are gone; the turn goes on without the frame.
+            blocks.append({"type": "text", "text": f"[{caption}: frame unavailable]"})
+            continue
+        media_type, data = payload
+        blocks.append({
+            "type": "image",
+            "source": {"type": "base64", "media_type": media_type, "data": data},
+        })
+        blocks.append({"type": "text", "text": f"[{caption}]"})
+
+    text = extraction["text"] or ""
+    if text:
+        header = f"[Attachment: {filename}]\n"
+        # Partial-success case (e.g. video keyframes OK but transcription
+        # timed out) — surface the error alongside the content we do have.
+        if extraction["error"]:
+            header += f"[Note: partial extraction — {extraction['error']}]\n"
+        blocks.append({"type": "text", "text": header + text})
+    elif not extraction["images"]:
+        # Done but empty — rare, but tell the agent rather than silently
+        # dropping the attachment.
+        blocks.append({
+            "type": "text",
+            "text": f"[Attachment {filename}: extraction completed but produced no content]",
+        })
+    return blocks
 
 
 async def _build_multimodal_content(
@@ -281,108 +575,23 @@ async def _build_multimodal_content(
 ) -> list[dict[str, Any]]:
     """Build Claude API content blocks from text + file attachments.
 
-    Native types (images, PDF) are read from disk and base64-encoded inline.
+    Native types (images, PDF) are base64-encoded inline, via the media cache.
     Everything else is looked up in the uploads.extraction_* columns — the
     heavy work (spreadsheet parsing, docx, transcription, keyframes) already
     ran as a background task at upload time.
-    """
-    content_blocks: list[dict[str, Any]] = []
-
-    for att in attachments:
-        file_path = Path(att.get("file_path", ""))
-        content_type = att.get("content_type", "")
-        filename = att.get("filename", file_path.name or "file")
-        file_id = att.get("file_id")
-
-        # --- Native types: send raw bytes to Claude ------------------------
-        if content_type.startswith("image/") or content_type == "application/pdf":
-            if file_path.exists():
-                raw = file_path.read_bytes()
-            elif file_id:
-                upload = await get_upload(file_id)
-                if upload and upload.get("file_data"):
-                    raw = bytes(upload["file_data"])
-                else:
-                    logger.warning("Attachment file not found and no DB bytes: %s", file_path)
-                    continue
-            else:
-                logger.warning("Attachment file not found: %s", file_path)
-                continue
-            if content_type.startswith("image/"):
-                raw, content_type = _resize_image_for_api(raw, content_type)
-            b64_data = base64.standard_b64encode(raw).decode("ascii")
-            if content_type.startswith("image/"):
-                content_blocks.append({
-                    "type": "image",
-                    "source": {"type": "base64", "media_type": content_type, "data": b64_data},
-                })
-            else:
-                content_blocks.append({
-                    "type": "document",
-                    "source": {"type": "base64", "media_type": "application/pdf", "data": b64_data},
-                })
-            continue
 
-        # --- Non-native: read cached extraction from DB --------------------
-        if not file_id:
-            logger.warning("Non-native attachment %s has no file_id; skipping", filename)
-            continue
-
-        extraction = await get_upload_extraction(file_id)
-        if extraction is None:
-            # Upload row doesn't exist — shouldn't happen if get_upload()
-            # succeeded upstream, but guard anyway.
-            logger.warning("No extraction row for upload %s", file_id)
-            continue
-
-        status = extraction["status"]
-
-        if status == "pending":
-            content_blocks.append({
-                "type": "text",
-                "text": (
-                    f"[Attachment {filename} is still being processed — "
-                    f"extraction not yet complete. Ask the user to wait a "
-                    f"moment and resend their message.]"
-                ),
-            })
-            continue
+    Attachments are prepared concurrently (at most MEDIA_PREP_WORKERS at a
+    time, so a 20-image message doesn't hold 20 files in memory at once);
+    blocks keep the attachments' order.
+    """
+    limit = asyncio.Semaphore(MEDIA_PREP_WORKERS)
 
-        if status == "error":
-            content_blocks.append({
-                "type": "text",
-                "text": f"[Attachment {filename}: extraction failed — {extraction['error']}]",
-            })
-            continue
+    async def bounded(att: dict[str, Any]) -> list[dict[str, Any]]:
+        async with limit:
+            return await _attachment_blocks(att)
 
-        # status == "done": inject extracted images then text
-        for img_bytes, caption in extraction["images"]:
-            resized, media_type = _resize_image_for_api(img_bytes, "image/png")
-            content_blocks.append({
-                "type": "image",
-                "source": {
-                    "type": "base64",
-                    "media_type": media_type,
-                    "data": base64.standard_b64encode(resized).decode("ascii"),
-                },
-            })
-            content_blocks.append({"type": "text", "text": f"[{caption}]"})
-
-        text = extraction["text"] or ""
-        if text:
-            header = f"[Attachment: {filename}]\n"
-            # Partial-success case (e.g. video keyframes OK but transcription
-            # timed out) — surface the error alongside the content we do have.
-            if extraction["error"]:
-                header += f"[Note: partial extraction — {extraction['error']}]\n"
-            content_blocks.append({"type": "text", "text": header + text})
-        elif not extraction["images"]:
-            # Done but empty — rare, but tell the agent rather than silently
-            # dropping the attachment.
-            content_blocks.append({
-                "type": "text",
-                "text": f"[Attachment {filename}: extraction completed but produced no content]",
-            })
+    per_attachment = await asyncio.gather(*(bounded(att) for att in attachments))
+    content_blocks = [block for blocks in per_attachment for block in blocks]
 
     # Text prompt always comes last
     content_blocks.append({"type": "text", "text": text_prompt})
@@ -433,12 +642,14 @@ async def _translate_to_sse(
     raw_iter: AsyncIterator[Any],
     full_response: list[str],
     _t,  # profiler timestamp fn or None
+    session_id: str = "",
 ) -> AsyncIterator[dict[str, Any]]:
     """Translate SDK messages + tool events into SSE event dicts.
 
     `full_response` is mutated in place so the caller can persist the
     complete assistant text after the stream ends. `_t` is the
-    CHAT_PROFILE timestamp closure or None.
+    CHAT_PROFILE timestamp closure or None. The turn's token usage is
+    recorded in agent.metrics under `session_id`.
     """
     # Tracking state for matching tool_use IDs to their results and
     # backfilling text that didn't arrive via deltas.
@@ -536,6 +747,10 @@ async def _translate_to_sse(
             logger.info("Query complete: turns=%d, duration=%sms, is_error=%s, subtype=%s, result_len=%s",
                         message.num_turns, message.duration_ms, message.is_error,
                         message.subtype, len(message.result) if message.result else 0)
+            usage = usage_metrics.record(session_id, message.usage)
+            logger.info("Turn usage: cached_input=%d uncached_input=%d (cache_write=%d) output=%d session=%s",
+                        usage.cached_input_tokens, usage.uncached_input_tokens,
+                        usage.cache_creation_input_tokens, usage.output_tokens, session_id)
 
             if message.is_error:
                 error_detail = message.result or "The agent encountered an internal error."
@@ -592,7 +807,17 @@ async def chat(
             {"file_id": a["file_id"], "filename": a["filename"], "content_type": a["content_type"]}
             for a in attachments
         ]
-    await save_conversation_turn(session_id, "user", user_message, attachments=attachment_meta)
+    pool = get_pool()
+    use_sdk_pool = os.environ.get("USE_SDK_POOL", "0") == "1"
+    pool_model = model if model in AVAILABLE_MODELS else DEFAULT_MODEL
+    pinned = None
+    if _SESSION_AFFINITY and use_sdk_pool and pool is not None:
+        pinned = pool.pinned(session_id, pool_model)
+
+    await save_conversation_turn(
+        session_id, "user", user_message, attachments=attachment_meta,
+        model=model if model in AVAILABLE_MODELS else DEFAULT_MODEL,
+    )
 
     # Send session_id first so the frontend can set up its UI state while
     # we're still gathering context below.
@@ -600,7 +825,7 @@ async def chat(
     if _PROFILE:
         print(f"[profile] +{_t():.0f}ms: session_id yielded", flush=True)
 
-    # History + records + attachment lookups are independent reads — run them
+    # History window + records + attachment lookups are independent reads — run them
     # concurrently. TTFT is dominated by the MCP subprocess spawn inside
     # query(), but this shaves the serialized round-trips that came before it.
     # The attachment lookups are themselves a gather, so we end up with one
@@ -608,28 +833,47 @@ async def chat(
     async def _resolve_uploads() -> list[dict[str, Any] | None]:
         if not attachments:
             return []
-        return await asyncio.gather(*(get_upload(a["file_id"]) for a in attachments))
+        return await asyncio.gather(*(get_upload_meta(a["file_id"]) for a in attachments))
 
-    history, records, uploads = await asyncio.gather(
-        get_conversation_history(session_id),
+    window, records, uploads = await asyncio.gather(
+        load_history_window(session_id),
         get_session_records(session_id),
         _resolve_uploads(),
     )
     if _PROFILE:
-        print(f"[profile] +{_t():.0f}ms: context gathered (history={len(history)} records={len(records)} uploads={len(uploads)})", flush=True)
-
-    # Build conversation context
-    prior_history = history[:-1] if history else []
-    prompt = _format_conversation_context(prior_history, user_message)
-    if records:
-        prompt += _format_records_context(records)
-
-    # Add session_id context for the capture tools — the agent doesn't know the
-    # session_id otherwise, and the tool handlers hard-require it.
-    prompt += (
-        f"\n\nIMPORTANT: When calling capture_metadata, find_records, link_records, "
-        f"or render_artifact, always use session_id=\"{session_id}\""
-    )
+        print(f"[profile] +{_t():.0f}ms: context gathered (history={len(window.turns)} records={len(records)} uploads={len(uploads)})", flush=True)
+
+    full_ids = None
+    if (_COMPACT_RECORDS or pinned is not None) and records:
+        full_ids = _records_changed_since(records, _previous_turn_start(window.turns))
+
+    # A pinned client has the conversation up to its last reply. If the
+    # session has turns it didn't see (its reply wasn't saved, or another
+    # process answered), drop it and rebuild from the DB.
+    if pinned is not None and (not window.turns or window.turns[-1]["id"] != pinned.last_turn_id):
+        logger.info("Session %s: pinned client is behind the DB, rebuilding context", session_id)
+        pool.unpin(pinned)
+        pinned = None
+
+    # Build conversation context. A pinned client only needs the new turn
+    # (and any records that changed). Otherwise, with prompt caching on,
+    # the stable part (history, records) goes in separate cache-marked
+    # blocks and only the new turn is left as the trailing text.
+    if pinned is not None:
+        prefix_blocks = []
+        prompt = f"USER: {user_message}"
+        if records:
+            update = _format_records_update(records, full_ids or set())
+            prompt = f"{update}\n\n{prompt}" if update else prompt
+    elif _PROMPT_CACHE:
+        prefix_blocks = _build_prompt_blocks(session_id, window.turns, records, window.summary, full_ids)
+        prompt = f"USER: {user_message}"
+    else:
+        prefix_blocks = []
+        prompt = _format_conversation_context(window.turns, user_message, window.summary)
+        if records:
+            prompt += _format_records_context(records, full_ids)
+        prompt += "\n\n" + _session_instructions(session_id)
 
     # Build multimodal content if attachments are present. Upload rows were
     # already fetched concurrently above; zip them back onto the attachment
@@ -639,6 +883,7 @@ async def chat(
             {
                 "file_id": att["file_id"],
                 "file_path": up["file_path"],
+                "blob_digest": up.get("blob_digest"),
                 "content_type": att["content_type"],
                 "filename": att["filename"],
             }
@@ -651,6 +896,10 @@ async def chat(
             prompt_content = prompt
     else:
         prompt_content = prompt
+    if prefix_blocks:
+        if isinstance(prompt_content, str):
+            prompt_content = [{"type": "text", "text": prompt_content}]
+        prompt_content = prefix_blocks + prompt_content
 
     if _PROFILE:
         prompt_len = len(prompt_content) if isinstance(prompt_content, str) else sum(
@@ -660,19 +909,36 @@ async def chat(
 
     full_response: list[str] = []
 
-    pool = get_pool()
-    use_sdk_pool = os.environ.get("USE_SDK_POOL", "0") == "1"
-    use_pool = pool is not None and pool.is_warm and use_sdk_pool
-    path = "pool" if use_pool else "query()"
+    if _SESSION_AFFINITY and use_sdk_pool and pool is not None and pinned is None:
+        # This turn carries the full context, so a fresh client can take
+        # the session from here.
+        pinned = pool.pin(session_id, pool_model)
+    if pinned is not None:
+        pooled = pool.dispatch_to(pinned, prompt_content)
+    elif pool is not None and use_sdk_pool:
+        # dispatch() picks the least-loaded warm client for the model, or
+        # returns None (and starts one) if the model has none yet.
+        pooled = pool.dispatch(prompt_content, pool_model)
+    else:
+        pooled = None
+    use_pool = pooled is not None
+    # Without a pooled client, a pre-spawned CLI (agent/cli_spares.py) used
+    # once gives query()'s semantics without the spawn.
+    spares = get_spares()
+    spare = spares.take(prompt_content, pool_model) if pooled is None and spares is not None else None
+    path = ("pinned" if pinned is not None else "pool" if use_pool
+            else "spare" if spare is not None else "query()")
     logger.info("Chat path=%s for session %s", path, session_id)
 
     if _PROFILE:
         print(f"[profile] +{_t():.0f}ms: entering {path}", flush=True)
 
-    if use_pool:
+    if pooled is not None:
         # Pool path: tool events arrive interleaved as {"tool_event": ...}
         # dicts — the worker task owns the stream_events queue, not us.
-        raw_iter = pool.submit(prompt_content, model)
+        raw_iter = pooled
+    elif spare is not None:
+        raw_iter = spare
     else:
         # Fallback: spawn a fresh subprocess per request (~4s). We own
         # the stream_events queue here — tool handlers run in our
@@ -681,7 +947,7 @@ async def chat(
         raw_iter = _query_with_tool_events(prompt_content, options)
 
     try:
-        async for sse_evt in _translate_to_sse(raw_iter, full_response, _t if _PROFILE else None):
+        async for sse_evt in _translate_to_sse(raw_iter, full_response, _t if _PROFILE else None, session_id):
             yield sse_evt
     except Exception as exc:
         logger.exception("Agent query failed for session %s: %s", session_id, exc)
@@ -701,12 +967,18 @@ async def chat(
             or ("mcp server" in _lower and ("reconnect" in _lower or "not available" in _lower or "fresh session" in _lower))
         )
         if _mcp_dead:
-            logger.warning("Detected MCP unavailability in agent response — forcing pool reconnect")
-            pool._needs_reconnect = True
+            logger.warning("Detected MCP unavailability in agent response — replacing pool client")
+            if pinned is not None:
+                pool.unpin(pinned)
+                pinned = None
+            else:
+                pool.request_reconnect(pool_model)
 
     if assistant_text.strip():
         try:
-            await save_conversation_turn(session_id, "assistant", assistant_text)
+            turn_id = await save_conversation_turn(session_id, "assistant", assistant_text)
+            if pinned is not None:
+                pinned.last_turn_id = turn_id
             logger.info("chat() saved assistant turn (%d chars) for session %s", len(assistant_text), session_id)
         except Exception as save_exc:
             logger.exception("chat() FAILED to save assistant turn for session %s: %s", session_id, save_exc)
@@ -721,28 +993,34 @@ async def get_session_messages(session_id: str) -> list[dict[str, Any]]:
     return await get_conversation_history(session_id)
 
 
-async def get_sessions() -> list[dict[str, Any]]:
-    """Get all sessions with their message counts."""
+async def get_sessions(
+    limit: int | None = None,
+    after: tuple[str, str] | None = None,
+) -> list[dict[str, Any]]:
+    """Get sessions with their message counts, most recently active first.
+
+    Reads the sessions summary table (an index range scan on
+    last_active). Keyset-paginated on (last_active, session_id): ``after``
+    is the last row of the previous page.
+    """
     from .db.database import get_db
 
     db = await get_db()
+    clauses = ["message_count > 0"]  # sessions with only records aren't chats
+    params: list[Any] = []
+    if after:
+        clauses.append("(last_active, session_id) < (?, ?)")
+        params.extend(after)
+    page = ""
+    if limit is not None:
+        page = " LIMIT ?"
+        params.append(limit)
     rows = await db.fetch(
-        """
-        SELECT
-            session_id,
-            MIN(created_at) as created_at,
-            MAX(created_at) as last_active,
-            COUNT(*) as message_count,
-            (
-                SELECT content FROM conversations c2
-                WHERE c2.session_id = conversations.session_id
-                  AND c2.role = 'user'
-                ORDER BY c2.created_at ASC
-                LIMIT 1
-            ) as first_message
-        FROM conversations
-        GROUP BY session_id
-        ORDER BY MAX(created_at) DESC
-        """
+        f"""SELECT session_id, created_at, last_active, message_count, first_message,
+                   record_count, model
+            FROM sessions
+            WHERE {' AND '.join(clauses)}
+            ORDER BY last_active DESC, session_id DESC{page}""",
+        params,
     )
     return [dict(r) for r in rows]
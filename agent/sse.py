@@ -0,0 +1,167 @@
+"""Server-Sent Events body for the /chat stream.
+
+chat() yields one event dict per SDK stream event, which for text and tool
+input is a token or two. Framing each one separately meant a json.dumps,
+a queue hop and an ASGI write per token. Here adjacent deltas of the same
+kind ({"content"}, {"thinking"}, {"tool_use_input"}) are merged and every
+event that arrives within a flush window goes out in one write:
+
+  - leading edge: an event that arrives when nothing was flushed for a
+    whole window is written immediately, so the first token (and the
+    first after a pause) isn't delayed
+  - otherwise it waits until the window since the last flush ends,
+    collecting whatever arrives meanwhile
+
+The window is SSE_FLUSH_MS (default 16, about one display frame); 0 writes
+every event as its own frame. Events are serialized with orjson when it's
+installed.
+
+Events come in as (seq, event) pairs from a chat run's log (see
+agent/chat_runs.py); each frame carries the seq of its last event as its
+``id:``, which is what a client sends back as Last-Event-ID to resume.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+from collections.abc import AsyncIterator
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+SSE_FLUSH_INTERVAL = max(0.0, float(os.environ.get("SSE_FLUSH_MS", "16")) / 1000)
+_KEEPALIVE_SECONDS = 15
+
+_MERGEABLE = frozenset({"content", "thinking", "tool_use_input"})
+_KEEPALIVE = b": keepalive\n\n"
+
+# The end-of-stream event. Runs log it like any other event, so a client
+# that resumes after the last frame gets nothing more.
+DONE = "[DONE]"
+
+Event = dict[str, Any] | str  # an event dict, or DONE
+SeqEvent = tuple[int | None, Event]
+
+
+def encode_data(event: Event) -> bytes:
+    """The ``data:`` payload for an event: its JSON, or DONE as is."""
+    if isinstance(event, str):
+        return event.encode()
+    if orjson is not None:
+        try:
+            return orjson.dumps(event)
+        except TypeError:
+            pass  # e.g. an int orjson can't represent; json can
+    return json.dumps(event).encode()
+
+
+def decode_data(data: str) -> Event:
+    """Inverse of encode_data."""
+    return data if data == DONE else json.loads(data)
+
+
+def encode_frame(seq: int | None, event: Event) -> bytes:
+    """One SSE frame, with an ``id:`` line when ``seq`` is given."""
+    frame = b"data: " + encode_data(event) + b"\n\n"
+    return frame if seq is None else b"id: %d\n" % seq + frame
+
+
+def add_event(batch: list[SeqEvent], item: SeqEvent) -> None:
+    """Append ``item`` to ``batch``, folding it into the previous event when
+    both are single-key deltas of the same kind (the merged frame takes the
+    later seq)."""
+    seq, event = item
+    if batch and isinstance(event, dict) and len(event) == 1:
+        (key, value), = event.items()
+        prev = batch[-1][1]
+        if key in _MERGEABLE and isinstance(prev, dict) and len(prev) == 1 and key in prev:
+            batch[-1] = (seq, {key: prev[key] + value})
+            return
+    batch.append(item)
+
+
+def _encode_batch(batch: list[SeqEvent]) -> bytes:
+    return b"".join(encode_frame(seq, event) for seq, event in batch)
+
+
+async def sse_body(
+    events: AsyncIterator[SeqEvent],
+    flush_interval: float = SSE_FLUSH_INTERVAL,
+) -> AsyncIterator[bytes]:
+    """The response body for a stream of (seq, event) pairs: coalesced
+    frames, with a keepalive comment after 15 s of silence. If ``events``
+    raises, an ``{"error"}`` frame ends the stream.
+
+    ``events`` runs in its own task so a slow client never stalls the SDK
+    iterator, and so keepalives go out while a tool call is running.
+    """
+    queue: asyncio.Queue[SeqEvent | None] = asyncio.Queue()
+    evt_count = 0
+
+    async def _produce():
+        nonlocal evt_count
+        try:
+            async for item in events:
+                evt_count += 1
+                await queue.put(item)
+        except Exception as exc:
+            logger.exception("SSE producer error after %d events: %s", evt_count, exc)
+            await queue.put((None, {"error": str(exc)}))
+        finally:
+            await queue.put(None)
+
+    loop = asyncio.get_running_loop()
+    producer = asyncio.create_task(_produce())
+    last_flush = float("-inf")
+    frames = writes = 0
+    try:
+        finished = False
+        while not finished:
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield _KEEPALIVE
+                continue
+            if item is None:
+                break
+            batch: list[SeqEvent] = []
+            add_event(batch, item)
+            if flush_interval > 0:
+                # Hold the batch open until a window has passed since the
+                # last flush (no wait on the leading edge), then take
+                # whatever else is already queued.
+                deadline = max(last_flush + flush_interval, loop.time())
+                while not finished:
+                    try:
+                        if queue.empty() and deadline > loop.time():
+                            item = await asyncio.wait_for(queue.get(), timeout=deadline - loop.time())
+                        else:
+                            item = queue.get_nowait()
+                    except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                        break
+                    if item is None:
+                        finished = True
+                    else:
+                        add_event(batch, item)
+            yield _encode_batch(batch)
+            frames += len(batch)
+            writes += 1
+            last_flush = loop.time()
+    except GeneratorExit:
+        logger.warning("SSE consumer: GeneratorExit after %d events (client disconnected mid-stream)", evt_count)
+        raise
+    finally:
+        producer.cancel()
+        try:
+            await producer
+        except (asyncio.CancelledError, Exception):
+            pass
+        logger.info("SSE consumer: stream ended, %d events sent as %d frames in %d writes", evt_count, frames, writes)
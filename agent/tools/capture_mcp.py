@@ -1,9 +1,11 @@
 """MCP server for metadata capture tools.
 
-Provides three tools that Claude can call during conversation:
+Provides the tools that Claude can call during conversation:
 - capture_metadata: Save/update a single typed metadata record
 - find_records: Search for existing records to link or reuse
+- get_record: Fetch one record's full data (the prompt only summarises most)
 - link_records: Create explicit links between records
+- render_artifact: Show structured content as a clickable artifact
 """
 
 import asyncio
@@ -19,13 +21,15 @@ from .registry_lookup import lookup_addgene, lookup_mgi, lookup_ncbi_gene
 from .metadata_store import (
     create_artifact,
     create_record,
+    find_record_by_key as store_find_record_by_key,
     find_records as store_find_records,
     get_record,
     link_records as store_link_records,
+    transaction,
     update_record,
     update_record_validation,
 )
-from ..db.models import CATEGORY_MAP, VALID_RECORD_TYPES
+from ..db.models import CATEGORY_MAP, RECORD_KEY_FIELDS, VALID_RECORD_TYPES
 from ..schema_info import SPECIES_REGISTRY
 from ..validation import validate_record
 
@@ -264,34 +268,34 @@ async def capture_metadata_handler(args: dict[str, Any]) -> dict[str, Any]:
     link_to = args.get("link_to")
 
     try:
-        if record_id:
-            # Update existing record
-            existing = await get_record(record_id)
-            if existing is None:
-                return _error(f"Record {record_id} not found")
-            record = await update_record(record_id, data=data, name=name)
-            if record is None:
-                return _error(f"Failed to update record {record_id}")
-            action = "updated"
-        else:
-            # Create new record
-            record = await create_record(session_id, record_type, data, name=name)
-            record_id = record["id"]
-            action = "created"
-
-        # Link if requested
-        if link_to:
-            target = await get_record(link_to)
-            if target is None:
-                logger.warning("Link target %s not found", link_to)
+        # Record write, link and validation commit together — one commit
+        # (one fsync on SQLite) per call instead of one per statement.
+        async with transaction():
+            if record_id:
+                # Update existing record (None means no such record)
+                record = await update_record(record_id, data=data, name=name)
+                if record is None:
+                    return _error(f"Record {record_id} not found")
+                action = "updated"
             else:
-                await store_link_records(record_id, link_to)
-                logger.info("Linked %s -> %s", record_id, link_to)
-
-        # Validate
-        record_data = record.get("data_json") or {}
-        validation_result = validate_record(record_type, record_data)
-        await update_record_validation(record_id, validation_result.to_dict())
+                # Create new record
+                record = await create_record(session_id, record_type, data, name=name)
+                record_id = record["id"]
+                action = "created"
+
+            # Link if requested
+            if link_to:
+                target = await get_record(link_to)
+                if target is None:
+                    logger.warning("Link target %s not found", link_to)
+                else:
+                    await store_link_records(record_id, link_to)
+                    logger.info("Linked %s -> %s", record_id, link_to)
+
+            # Validate
+            record_data = record.get("data_json") or {}
+            validation_result = validate_record(record_type, record_data)
+            await update_record_validation(record_id, validation_result.to_dict())
 
         validation_dict = validation_result.to_dict()
 
@@ -374,16 +378,26 @@ async def find_records_handler(args: dict[str, Any]) -> dict[str, Any]:
     record_type = args.get("record_type")
     query = args.get("query")
     category = args.get("category")
+    key = args.get("key")
 
     if not record_type and not query and not category:
         return _error("At least one of record_type, query, or category is required")
+    if key and record_type not in RECORD_KEY_FIELDS:
+        return _error(
+            f"key lookup needs record_type set to one of: {', '.join(RECORD_KEY_FIELDS)}"
+        )
 
     try:
-        records = await store_find_records(
-            record_type=record_type,
-            query=query,
-            category=category,
-        )
+        if key:
+            # Exact natural-key lookup (indexed) — the dedupe check.
+            match = await store_find_record_by_key(record_type, key)
+            records = [match] if match else []
+        else:
+            records = await store_find_records(
+                record_type=record_type,
+                query=query,
+                category=category,
+            )
 
         summaries = []
         for r in records:
@@ -414,7 +428,13 @@ async def find_records_handler(args: dict[str, Any]) -> dict[str, Any]:
 Use this to find shared records (subjects, instruments, rigs, procedures) that can be
 linked to new data assets. This avoids creating duplicate records.
 
+To check whether a specific shared record already exists, pass its identifier as
+`key` together with record_type (subject → subject_id, instrument → instrument_id,
+rig → rig_id, data_description → project_name). This is an exact match and returns
+at most one record.
+
 Example calls:
+    find_records(record_type="subject", key="4528")
     find_records(record_type="subject", query="4528")
     find_records(category="shared")
     find_records(record_type="instrument")
@@ -423,6 +443,7 @@ Example calls:
         "record_type": str,
         "query": str,
         "category": str,
+        "key": str,
     },
 )
 async def find_records_tool(args: dict[str, Any]) -> dict[str, Any]:
@@ -430,6 +451,56 @@ async def find_records_tool(args: dict[str, Any]) -> dict[str, Any]:
     return await find_records_handler(args)
 
 
+# ---------------------------------------------------------------------------
+# get_record tool
+# ---------------------------------------------------------------------------
+
+async def get_record_handler(args: dict[str, Any]) -> dict[str, Any]:
+    """Return one record's full data and validation."""
+    record_id = args.get("record_id")
+    if not record_id:
+        return _error("record_id is required")
+
+    try:
+        record = await get_record(record_id)
+        if record is None:
+            return _error(f"Record {record_id} not found")
+
+        return _success({
+            "id": record["id"],
+            "record_type": record["record_type"],
+            "category": record["category"],
+            "name": record.get("name"),
+            "status": record["status"],
+            "data": record.get("data_json"),
+            "validation": record.get("validation_json"),
+            "session_id": record["session_id"],
+        })
+
+    except Exception as e:
+        logger.exception("Failed to get record %s", record_id)
+        return _error(str(e))
+
+
+@tool(
+    "get_record",
+    """Fetch the full data of one metadata record by its ID.
+
+The session's records are listed in the prompt, but only records changed since the
+previous turn include their data; the rest show just their filled fields. Call this
+before updating or reasoning about the contents of one of those.
+
+Example: get_record(record_id="<record_id>")
+""",
+    {
+        "record_id": str,
+    },
+)
+async def get_record_tool(args: dict[str, Any]) -> dict[str, Any]:
+    """MCP tool wrapper for get_record_handler."""
+    return await get_record_handler(args)
+
+
 # ---------------------------------------------------------------------------
 # link_records tool
 # ---------------------------------------------------------------------------
@@ -590,5 +661,5 @@ async def render_artifact(args: dict[str, Any]) -> dict[str, Any]:
 capture_server = create_sdk_mcp_server(
     name="capture",
     version="2.0.0",
-    tools=[capture_metadata, find_records_tool, link_records_tool, render_artifact],
+    tools=[capture_metadata, find_records_tool, get_record_tool, link_records_tool, render_artifact],
 )
@@ -1,13 +1,25 @@
 """Tools for persisting and retrieving metadata records."""
 
+import asyncio
 import json
 import logging
+import re
 import uuid
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
+from pathlib import Path
 from typing import Any
 
+from ..blob_store import CHUNK_SIZE, get_blob_store
 from ..db.database import get_db
-from ..db.models import CATEGORY_MAP, VALID_RECORD_TYPES
+from ..db.models import (
+    CATEGORY_MAP,
+    PG_SEARCH_VECTOR,
+    RECORD_KEY_FIELDS,
+    VALID_RECORD_TYPES,
+    record_key_expr,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -71,6 +83,99 @@ def _auto_name(record_type: str, data: dict[str, Any]) -> str | None:
     return None
 
 
+def _json_text(dialect: str, expr: str, *path: str) -> str:
+    """SQL for the text value at ``path`` inside the JSON document ``expr``."""
+    if dialect == "postgres":
+        return f"(({expr}) #>> '{{{','.join(path)}}}')"
+    return f"json_extract({expr}, '$.{'.'.join(path)}')"
+
+
+def _now_sql(dialect: str) -> str:
+    """SQL for the current UTC time in the DB's own text format, the one
+    the created_at column defaults (and so conversations.created_at) use.
+    sessions.created_at / last_active are always written in it so
+    /sessions can order and page by last_active as text."""
+    if dialect == "postgres":
+        return "(NOW() AT TIME ZONE 'UTC')::TEXT"
+    return "datetime('now')"
+
+
+def _auto_name_sql(dialect: str, data_expr: str, data_params: tuple | list = ()) -> tuple[str, list[Any]]:
+    """SQL mirror of _auto_name, so UPDATE can rename in the same statement.
+
+    ``data_expr`` may have placeholders (``data_params``); it's repeated for
+    each field read, so the params come back repeated to match. Evaluates
+    to NULL when no name can be derived; keep in step with _auto_name above.
+    """
+    params: list[Any] = []
+
+    def field(*path: str) -> str:
+        params.extend(data_params)
+        return f"NULLIF({_json_text(dialect, data_expr, *path)}, '')"
+
+    # f-string parts are evaluated left to right, so params follow the
+    # placeholders' order.
+    sql = f"""CASE record_type
+        WHEN 'subject' THEN CASE WHEN {field('subject_id')} IS NOT NULL
+            THEN TRIM(COALESCE({field('species', 'name')}, '') || ' ' || {field('subject_id')}) END
+        WHEN 'instrument' THEN COALESCE({field('instrument_id')}, {field('name')})
+        WHEN 'rig' THEN COALESCE({field('rig_id')}, {field('name')})
+        WHEN 'procedures' THEN {field('procedure_type')}
+        WHEN 'data_description' THEN {field('project_name')}
+        WHEN 'session' THEN 'Session ' || {field('session_start_time')}
+    END"""
+    return sql, params
+
+
+def _data_sql(dialect: str, data: Any, merge: bool) -> tuple[str, list[Any]] | None:
+    """SQL for the row's new data_json, plus its params.
+
+    With merge=True this is a server-side shallow merge — same result as
+    ``{**existing, **data}`` — via ``||`` on Postgres JSONB and json_set on
+    SQLite; a row whose data_json isn't a JSON object is replaced outright.
+    Returns None when a key can't be written as a SQLite JSON path
+    (contains a double quote).
+    """
+    doc = _serialize(data)
+    param = "?::jsonb" if dialect == "postgres" else "?"
+    if not merge or not isinstance(data, dict):
+        return param, [doc]
+    if dialect == "postgres":
+        return (
+            f"CASE WHEN jsonb_typeof(data_json) = 'object' "
+            f"THEN data_json || {param} ELSE {param} END",
+            [doc, doc],
+        )
+    if any('"' in key for key in data):
+        return None
+    if not data:
+        return "CASE WHEN json_type(data_json) = 'object' THEN data_json ELSE ? END", [doc]
+    # json_set rather than json_patch: json_patch is an RFC 7396 deep merge
+    # (and treats null as "delete"), not the shallow merge callers expect.
+    pairs: list[Any] = []
+    for key, value in data.items():
+        pairs.extend([f'$."{key}"', json.dumps(value)])
+    paths = ", ".join(["?, json(?)"] * len(data))
+    return (
+        f"CASE WHEN json_type(data_json) = 'object' "
+        f"THEN json_set(data_json, {paths}) ELSE ? END",
+        pairs + [doc],
+    )
+
+
+@asynccontextmanager
+async def transaction() -> AsyncIterator[None]:
+    """Run the enclosed store calls as one database transaction (one commit).
+
+    Store functions called inside the block join it automatically, so
+    callers like capture_metadata can group a create + link + validation
+    write without touching the Database object directly.
+    """
+    db = await get_db()
+    async with db.transaction():
+        yield
+
+
 # ---------------------------------------------------------------------------
 # Record CRUD
 # ---------------------------------------------------------------------------
@@ -94,15 +199,22 @@ async def create_record(
     category = CATEGORY_MAP[record_type]
     display_name = name or _auto_name(record_type, data)
 
-    await db.execute(
-        """INSERT INTO metadata_records
-           (id, session_id, record_type, category, name, data_json, status, created_at, updated_at)
-           VALUES (?, ?, ?, ?, ?, ?, 'draft', ?, ?)""",
-        (record_id, session_id, record_type, category, display_name, _serialize(data), now, now),
-    )
-    record = await get_record(record_id)
-    assert record is not None, f"Record {record_id} not found after insert"
-    return record
+    async with db.transaction():
+        row = await db.execute_returning(
+            """INSERT INTO metadata_records
+               (id, session_id, record_type, category, name, data_json, status, created_at, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?, 'draft', ?, ?)
+               RETURNING *""",
+            (record_id, session_id, record_type, category, display_name, _serialize(data), now, now),
+        )
+        await db.execute(
+            f"""INSERT INTO sessions (session_id, created_at, last_active, record_count)
+               VALUES (?, {_now_sql(db.dialect)}, {_now_sql(db.dialect)}, 1)
+               ON CONFLICT (session_id) DO UPDATE SET record_count = sessions.record_count + 1""",
+            (session_id,),
+        )
+    assert row is not None, f"Record {record_id} not returned by insert"
+    return _row_to_dict(row)
 
 
 async def get_record(record_id: str) -> dict[str, Any] | None:
@@ -119,97 +231,143 @@ async def update_record(
     merge: bool = True,
 ) -> dict[str, Any] | None:
     """Update a record's data and/or name. Merges data with existing by default;
-    pass merge=False for a full replace (PUT semantics)."""
-    db = await get_db()
-    now = datetime.now(timezone.utc).isoformat()
+    pass merge=False for a full replace (PUT semantics).
 
-    existing = await get_record(record_id)
-    if existing is None:
-        return None
+    The merge and the auto-name happen in the UPDATE itself, against the
+    row as it is when the write lands, so this is one statement (one round
+    trip) that returns the updated row and concurrent merges don't lose
+    each other's keys.
+    """
+    if data is None and name is None:
+        return await get_record(record_id)
 
-    if data is not None:
-        if merge:
-            existing_data = existing.get("data_json") or {}
-            merged_data = {**existing_data, **data} if isinstance(existing_data, dict) and isinstance(data, dict) else data
-        else:
-            merged_data = data
-        await db.execute(
-            "UPDATE metadata_records SET data_json = ?, updated_at = ? WHERE id = ?",
-            (_serialize(merged_data), now, record_id),
-        )
+    db = await get_db()
+    now = datetime.now(timezone.utc).isoformat()
 
-    if name is not None:
-        await db.execute(
-            "UPDATE metadata_records SET name = ?, updated_at = ? WHERE id = ?",
+    if data is None:
+        row = await db.execute_returning(
+            "UPDATE metadata_records SET name = ?, updated_at = ? WHERE id = ? RETURNING *",
             (name, now, record_id),
         )
-    elif data is not None:
-        auto = _auto_name(existing["record_type"], merged_data)
-        if auto:
-            await db.execute(
-                "UPDATE metadata_records SET name = ?, updated_at = ? WHERE id = ?",
-                (auto, now, record_id),
-            )
+        return _row_to_dict(row) if row else None
+
+    merged = _data_sql(db.dialect, data, merge)
+    if merged is None:
+        return await _update_record_in_python(record_id, data, name, now)
+    merged_sql, merged_params = merged
+
+    # Both SET expressions read the row being updated, never a separate
+    # snapshot of it: on Postgres a concurrent UPDATE of the same row makes
+    # this one re-evaluate them against the newly committed version
+    # (READ COMMITTED), so neither write is lost. The auto-name repeats the
+    # merge because SET sees the old data_json, not the new one.
+    name_sql, name_params = _auto_name_sql(db.dialect, merged_sql, merged_params)
+    row = await db.execute_returning(
+        f"""UPDATE metadata_records
+            SET data_json = {merged_sql},
+                name = COALESCE(?, {name_sql}, name),
+                updated_at = ?
+            WHERE id = ?
+            RETURNING *""",
+        [*merged_params, name, *name_params, now, record_id],
+    )
+    return _row_to_dict(row) if row else None
+
 
-    return await get_record(record_id)
+async def _update_record_in_python(
+    record_id: str, data: dict[str, Any], name: str | None, now: str
+) -> dict[str, Any] | None:
+    """Read-merge-write fallback for keys _data_sql can't express."""
+    db = await get_db()
+    async with db.transaction():
+        existing = await get_record(record_id)
+        if existing is None:
+            return None
+        existing_data = existing.get("data_json") or {}
+        merged_data = {**existing_data, **data} if isinstance(existing_data, dict) else data
+        row = await db.execute_returning(
+            "UPDATE metadata_records SET data_json = ?, name = ?, updated_at = ? WHERE id = ? RETURNING *",
+            (_serialize(merged_data), name or _auto_name(existing["record_type"], merged_data) or existing["name"],
+             now, record_id),
+        )
+    return _row_to_dict(row) if row else None
 
 
 async def update_record_field(record_id: str, field: str, value: Any) -> dict[str, Any] | None:
-    """Update a single field within a record's data_json."""
-    existing = await get_record(record_id)
-    if existing is None:
-        return None
-    data = existing.get("data_json") or {}
-    if not isinstance(data, dict):
-        data = {}
-    data[field] = value
-    return await update_record(record_id, data=data)
+    """Update a single field within a record's data_json.
+
+    A one-key merge, applied server-side, so concurrent field updates on
+    the same record don't overwrite each other.
+    """
+    return await update_record(record_id, data={field: value})
 
 
-async def update_record_validation(record_id: str, validation: dict[str, Any]) -> None:
-    """Update a record's validation results."""
+async def update_record_validation(record_id: str, validation: dict[str, Any]) -> dict[str, Any] | None:
+    """Update a record's validation results. Returns the updated record."""
     db = await get_db()
     now = datetime.now(timezone.utc).isoformat()
-    await db.execute(
-        "UPDATE metadata_records SET validation_json = ?, updated_at = ? WHERE id = ?",
+    row = await db.execute_returning(
+        "UPDATE metadata_records SET validation_json = ?, updated_at = ? WHERE id = ? RETURNING *",
         (_serialize(validation), now, record_id),
     )
+    return _row_to_dict(row) if row else None
 
 
 async def confirm_record(record_id: str) -> dict[str, Any] | None:
     """Mark a record as confirmed."""
     db = await get_db()
     now = datetime.now(timezone.utc).isoformat()
-    row = await db.fetchrow("SELECT id FROM metadata_records WHERE id = ?", (record_id,))
-    if row is None:
-        return None
-    await db.execute(
-        "UPDATE metadata_records SET status = 'confirmed', updated_at = ? WHERE id = ?",
+    row = await db.execute_returning(
+        "UPDATE metadata_records SET status = 'confirmed', updated_at = ? WHERE id = ? RETURNING *",
         (now, record_id),
     )
-    return await get_record(record_id)
+    return _row_to_dict(row) if row else None
 
 
 async def delete_record(record_id: str) -> bool:
     """Delete a record and its links."""
     db = await get_db()
-    result = await db.execute("DELETE FROM metadata_records WHERE id = ?", (record_id,))
-    count = int(result.split()[-1]) if result else 0
-    return count > 0
+    async with db.transaction():
+        row = await db.execute_returning(
+            "DELETE FROM metadata_records WHERE id = ? RETURNING session_id", (record_id,))
+        if row is None:
+            return False
+        await db.execute(
+            "UPDATE sessions SET record_count = record_count - 1 WHERE session_id = ?",
+            (row["session_id"],),
+        )
+    return True
 
 
 # ---------------------------------------------------------------------------
 # Record queries
 # ---------------------------------------------------------------------------
 
+# Columns a caller may project with list_records(fields=...).
+RECORD_COLUMNS = (
+    "id", "session_id", "record_type", "category", "name", "data_json",
+    "status", "validation_json", "created_at", "updated_at",
+)
+
+
 async def list_records(
     record_type: str | None = None,
     category: str | None = None,
     session_id: str | None = None,
     status: str | None = None,
     ids: list[str] | None = None,
+    limit: int | None = None,
+    after: tuple[str, str] | None = None,
+    fields: list[str] | None = None,
 ) -> list[dict[str, Any]]:
-    """List records with optional filters."""
+    """List records with optional filters, newest first.
+
+    Pagination is keyset on (created_at, id): pass the last row's
+    ``(created_at, id)`` as ``after`` to get the page that follows it.
+    ``fields`` limits the columns returned (id and created_at are always
+    included so the caller can build the next cursor); leaving out
+    data_json/validation_json skips reading and parsing them entirely.
+    """
     db = await get_db()
     clauses: list[str] = []
     params: list[Any] = []
@@ -230,43 +388,120 @@ async def list_records(
         placeholders = ",".join("?" * len(ids))
         clauses.append(f"id IN ({placeholders})")
         params.extend(ids)
+    if after:
+        clauses.append("(created_at, id) < (?, ?)")
+        params.extend(after)
+
+    columns = "*"
+    if fields:
+        unknown = [f for f in fields if f not in RECORD_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+        wanted = {"id", "created_at", *fields}
+        columns = ", ".join(c for c in RECORD_COLUMNS if c in wanted)
 
     where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    page = ""
+    if limit is not None:
+        page = " LIMIT ?"
+        params.append(limit)
     rows = await db.fetch(
-        f"SELECT * FROM metadata_records{where} ORDER BY created_at DESC",
+        f"SELECT {columns} FROM metadata_records{where} ORDER BY created_at DESC, id DESC{page}",
         params,
     )
     return [_row_to_dict(r) for r in rows]
 
 
+def _search_terms(query: str) -> list[str]:
+    """Split a free-text query into the word tokens both FTS engines index."""
+    return re.findall(r"[^\W_]+", query.lower())
+
+
 async def find_records(
     record_type: str | None = None,
     query: str | None = None,
     category: str | None = None,
 ) -> list[dict[str, Any]]:
-    """Search records by type, category, and/or text query against name and data."""
+    """Search records by type, category, and/or text query against name and data.
+
+    A text query goes through the full-text index (records_fts on SQLite,
+    the GIN tsvector index on Postgres): every word must match the start of
+    an indexed token, and results come back best match first — identifier
+    fields (SEARCH_KEY_FIELDS) and names outrank the rest of the document.
+    Without a query, results are newest first.
+    """
     db = await get_db()
     clauses: list[str] = []
     params: list[Any] = []
 
     if record_type:
-        clauses.append("record_type = ?")
+        clauses.append("m.record_type = ?")
         params.append(record_type)
     if category:
-        clauses.append("category = ?")
+        clauses.append("m.category = ?")
         params.append(category)
-    if query:
-        clauses.append("(name LIKE ? OR data_json LIKE ?)")
+
+    terms = _search_terms(query) if query else []
+    if query and not terms:
+        # Nothing indexable (e.g. only punctuation) — fall back to a scan.
+        clauses.append("(m.name LIKE ? OR CAST(m.data_json AS TEXT) LIKE ?)")
         params.extend([f"%{query}%", f"%{query}%"])
 
-    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
-    rows = await db.fetch(
-        f"SELECT * FROM metadata_records{where} ORDER BY updated_at DESC LIMIT 50",
-        params,
-    )
+    if not terms:
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = await db.fetch(
+            f"SELECT m.* FROM metadata_records AS m{where} ORDER BY m.updated_at DESC LIMIT 50",
+            params,
+        )
+    elif db.dialect == "postgres":
+        tsquery = " & ".join(f"{t}:*" for t in terms)
+        where = "".join(f" AND {c}" for c in clauses)
+        rows = await db.fetch(
+            f"""SELECT m.* FROM metadata_records AS m,
+                       to_tsquery('simple', ?) AS q
+                WHERE {PG_SEARCH_VECTOR} @@ q{where}
+                ORDER BY ts_rank({PG_SEARCH_VECTOR}, q) DESC, m.updated_at DESC
+                LIMIT 50""",
+            [tsquery, *params],
+        )
+    else:
+        match = " ".join(f'"{t}"*' for t in terms)
+        where = "".join(f" AND {c}" for c in clauses)
+        rows = await db.fetch(
+            f"""SELECT m.* FROM records_fts AS f
+                JOIN records_fts_ids AS k ON k.fts_rowid = f.rowid
+                JOIN metadata_records AS m ON m.id = k.record_id
+                WHERE records_fts MATCH ?{where}
+                ORDER BY bm25(records_fts, 10.0, 5.0, 1.0), m.updated_at DESC
+                LIMIT 50""",
+            [match, *params],
+        )
     return [_row_to_dict(r) for r in rows]
 
 
+async def find_record_by_key(record_type: str, key: str) -> dict[str, Any] | None:
+    """Look up a shared record by its natural key (RECORD_KEY_FIELDS).
+
+    E.g. the subject whose subject_id is "4528". An exact match served by
+    the partial expression index on that field, not a scan. If several
+    records share the key, the most recently updated one wins.
+    """
+    field = RECORD_KEY_FIELDS.get(record_type)
+    if field is None:
+        raise ValueError(
+            f"record_type '{record_type}' has no natural key; "
+            f"expected one of: {', '.join(RECORD_KEY_FIELDS)}"
+        )
+    db = await get_db()
+    row = await db.fetchrow(
+        f"""SELECT * FROM metadata_records
+            WHERE record_type = ? AND {record_key_expr(db.dialect, field)} = ?
+            ORDER BY updated_at DESC LIMIT 1""",
+        (record_type, str(key)),
+    )
+    return _row_to_dict(row) if row else None
+
+
 async def get_session_records(session_id: str) -> list[dict[str, Any]]:
     """Get all records created in a session."""
     return await list_records(session_id=session_id)
@@ -280,13 +515,16 @@ async def link_records(source_id: str, target_id: str) -> dict[str, Any]:
     """Create a link between two records. Returns link info."""
     db = await get_db()
     now = datetime.now(timezone.utc).isoformat()
+    # ON CONFLICT rather than catching the UNIQUE violation: inside a
+    # Postgres transaction a failed statement aborts the whole transaction.
     try:
         await db.execute(
-            "INSERT INTO record_links (source_id, target_id, created_at) VALUES (?, ?, ?)",
+            """INSERT INTO record_links (source_id, target_id, created_at) VALUES (?, ?, ?)
+               ON CONFLICT (source_id, target_id) DO NOTHING""",
             (source_id, target_id, now),
         )
     except Exception:
-        pass
+        logger.exception("Failed to link %s -> %s", source_id, target_id)
     return {"source_id": source_id, "target_id": target_id}
 
 
@@ -320,8 +558,15 @@ async def unlink_records(source_id: str, target_id: str) -> bool:
 async def delete_session(session_id: str) -> bool:
     """Delete all data for a session (conversations and records)."""
     db = await get_db()
-    r1 = await db.execute("DELETE FROM conversations WHERE session_id = ?", (session_id,))
-    r2 = await db.execute("DELETE FROM metadata_records WHERE session_id = ?", (session_id,))
+    async with db.transaction():
+        r1 = await db.execute("DELETE FROM conversations WHERE session_id = ?", (session_id,))
+        r2 = await db.execute("DELETE FROM metadata_records WHERE session_id = ?", (session_id,))
+        await db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        await db.execute(
+            "DELETE FROM chat_run_events WHERE run_id IN (SELECT run_id FROM chat_runs WHERE session_id = ?)",
+            (session_id,),
+        )
+        await db.execute("DELETE FROM chat_runs WHERE session_id = ?", (session_id,))
     c1 = int(r1.split()[-1]) if r1 else 0
     c2 = int(r2.split()[-1]) if r2 else 0
     return c1 + c2 > 0
@@ -336,14 +581,38 @@ async def save_conversation_turn(
     role: str,
     content: str,
     attachments: list[dict] | None = None,
-) -> None:
-    """Persist a single conversation turn, optionally with attachment metadata."""
+    model: str | None = None,
+) -> int:
+    """Persist a single conversation turn, optionally with attachment metadata.
+    Returns the turn's id.
+
+    Also bumps the session's row in the sessions summary table (created on
+    the first turn); ``model`` records which model the session last used.
+    """
     db = await get_db()
     attachments_json = json.dumps(attachments) if attachments else None
-    await db.execute(
-        "INSERT INTO conversations (session_id, role, content, attachments_json) VALUES (?, ?, ?, ?)",
-        (session_id, role, content, attachments_json),
-    )
+    async with db.transaction():
+        # The turn's DB-assigned timestamp, so sessions.created_at and
+        # last_active match conversations exactly.
+        row = await db.execute_returning(
+            """INSERT INTO conversations (session_id, role, content, attachments_json, token_estimate)
+               VALUES (?, ?, ?, ?, ?) RETURNING id, created_at""",
+            (session_id, role, content, attachments_json, estimate_tokens(content)),
+        )
+        created_at = row["created_at"]
+        await db.execute(
+            """INSERT INTO sessions (session_id, created_at, last_active, message_count, first_message, model)
+               VALUES (?, ?, ?, 1, ?, ?)
+               ON CONFLICT (session_id) DO UPDATE SET
+                   created_at = CASE WHEN sessions.message_count = 0
+                                     THEN excluded.created_at ELSE sessions.created_at END,
+                   last_active = excluded.last_active,
+                   message_count = sessions.message_count + 1,
+                   first_message = COALESCE(sessions.first_message, excluded.first_message),
+                   model = COALESCE(excluded.model, sessions.model)""",
+            (session_id, created_at, created_at, content if role == "user" else None, model),
+        )
+    return row["id"]
 
 
 async def get_conversation_history(session_id: str) -> list[dict[str, Any]]:
@@ -362,6 +631,136 @@ async def get_conversation_history(session_id: str) -> list[dict[str, Any]]:
     return result
 
 
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token), stored per turn.
+
+    Mirrored in SQL by get_history_turns for turns saved before the
+    token_estimate column existed.
+    """
+    return (len(text) + 3) // 4
+
+
+async def get_history_turns(session_id: str, start_id: int = 0) -> list[dict[str, Any]]:
+    """Conversation turns with id >= start_id, oldest first, with their
+    token estimates. Reads only the part of the history still in the window."""
+    db = await get_db()
+    rows = await db.fetch(
+        """SELECT id, role, content, attachments_json, created_at,
+                  COALESCE(token_estimate, (length(content) + 3) / 4) AS token_estimate
+           FROM conversations WHERE session_id = ? AND id >= ? ORDER BY id""",
+        (session_id, start_id),
+    )
+    result = []
+    for r in rows:
+        d = dict(r)
+        if d.get("attachments_json"):
+            d["attachments_json"] = _parse_json(d["attachments_json"])
+        result.append(d)
+    return result
+
+
+async def get_history_state(session_id: str) -> dict[str, Any]:
+    """The session's history window: {"start_id", "summary"}."""
+    db = await get_db()
+    row = await db.fetchrow(
+        "SELECT history_start_id, history_summary FROM sessions WHERE session_id = ?",
+        (session_id,),
+    )
+    if row is None:
+        return {"start_id": 0, "summary": None}
+    return {"start_id": row["history_start_id"] or 0, "summary": row["history_summary"]}
+
+
+async def advance_history(
+    session_id: str, from_start_id: int, start_id: int, summary: str | None,
+) -> bool:
+    """Move the session's history window to start at ``start_id``.
+
+    Compare-and-set on ``from_start_id``: if a concurrent turn already moved
+    the window, nothing is written and False is returned, so the same turns
+    are never folded into the summary twice.
+    """
+    db = await get_db()
+    row = await db.execute_returning(
+        """UPDATE sessions SET history_start_id = ?, history_summary = ?
+           WHERE session_id = ? AND COALESCE(history_start_id, 0) = ?
+           RETURNING session_id""",
+        (start_id, summary, session_id, from_start_id),
+    )
+    return row is not None
+
+
+# ---------------------------------------------------------------------------
+# Chat runs (resumable SSE streams, agent/chat_runs.py)
+# ---------------------------------------------------------------------------
+
+def _utc_now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+async def create_chat_run(run_id: str, session_id: str) -> None:
+    """Register a new, running chat run."""
+    db = await get_db()
+    now = _utc_now()
+    await db.execute(
+        "INSERT INTO chat_runs (run_id, session_id, status, created_at, updated_at) VALUES (?, ?, 'running', ?, ?)",
+        (run_id, session_id, now, now),
+    )
+
+
+async def append_chat_run_events(
+    run_id: str, events: list[tuple[int, str]], keep: int, status: str | None = None,
+) -> None:
+    """Append (seq, data) events to a run's log, drop all but the last
+    ``keep``, and optionally set the run's status."""
+    db = await get_db()
+    last_seq = events[-1][0] if events else None
+    async with db.transaction():
+        if events:
+            await db.executemany(
+                "INSERT INTO chat_run_events (run_id, seq, data) VALUES (?, ?, ?)",
+                [(run_id, seq, data) for seq, data in events],
+            )
+            await db.execute(
+                "DELETE FROM chat_run_events WHERE run_id = ? AND seq <= ?",
+                (run_id, last_seq - keep),
+            )
+        await db.execute(
+            """UPDATE chat_runs SET last_seq = COALESCE(?, last_seq), status = COALESCE(?, status),
+                   updated_at = ?
+               WHERE run_id = ?""",
+            (last_seq, status, _utc_now(), run_id),
+        )
+
+
+async def get_chat_run(run_id: str) -> dict[str, Any] | None:
+    """A run's row: session_id, status, last_seq, created_at, updated_at."""
+    db = await get_db()
+    return await db.fetchrow("SELECT * FROM chat_runs WHERE run_id = ?", (run_id,))
+
+
+async def get_chat_run_events(run_id: str, after_seq: int = 0) -> list[dict[str, Any]]:
+    """The logged events of a run with seq > after_seq, oldest first."""
+    db = await get_db()
+    return await db.fetch(
+        "SELECT seq, data FROM chat_run_events WHERE run_id = ? AND seq > ? ORDER BY seq",
+        (run_id, after_seq),
+    )
+
+
+async def prune_chat_runs(before: str) -> int:
+    """Delete runs (and their events) last updated before ``before`` (an ISO
+    timestamp). Returns how many were deleted."""
+    db = await get_db()
+    async with db.transaction():
+        await db.execute(
+            "DELETE FROM chat_run_events WHERE run_id IN (SELECT run_id FROM chat_runs WHERE updated_at < ?)",
+            (before,),
+        )
+        result = await db.execute("DELETE FROM chat_runs WHERE updated_at < ?", (before,))
+    return int(result.split()[-1]) if result else 0
+
+
 # ---------------------------------------------------------------------------
 # Upload management
 # ---------------------------------------------------------------------------
@@ -372,7 +771,7 @@ async def save_upload(
     content_type: str,
     file_path: str,
     size_bytes: int,
-    file_data: bytes | None = None,
+    blob_digest: str | None = None,
     session_id: str | None = None,
     initial_status: str = "pending",
 ) -> dict[str, Any]:
@@ -380,14 +779,14 @@ async def save_upload(
 
     initial_status: 'pending' for types that need background extraction,
     'done' for native types (images/PDFs) that are ready immediately.
-    file_data: raw file bytes stored in the DB so the file survives
-    ephemeral filesystems (e.g. autoscale production).
+    blob_digest: SHA-256 of the file in the blob store, so the file
+    survives ephemeral filesystems (e.g. autoscale production).
     """
     db = await get_db()
     await db.execute(
-        """INSERT INTO uploads (id, original_filename, content_type, file_path, size_bytes, file_data, session_id, extraction_status)
+        """INSERT INTO uploads (id, original_filename, content_type, file_path, size_bytes, blob_digest, session_id, extraction_status)
            VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-        (upload_id, original_filename, content_type, file_path, size_bytes, file_data, session_id, initial_status),
+        (upload_id, original_filename, content_type, file_path, size_bytes, blob_digest, session_id, initial_status),
     )
     return {
         "id": upload_id,
@@ -397,13 +796,149 @@ async def save_upload(
     }
 
 
+# Every uploads column except the legacy file_data blob, plus a flag saying
+# whether that blob is set. Metadata reads use this so a lookup never pulls
+# a file's bytes into memory. length() is answered from the record header;
+# "file_data IS NOT NULL" would make SQLite load the whole value.
+UPLOAD_META_COLUMNS = """id, original_filename, content_type, file_path, size_bytes,
+    blob_digest, session_id, extraction_status, extracted_text,
+    extracted_meta_json, extraction_error, created_at,
+    (length(file_data) > 0) AS has_file_data"""
+
+
 async def get_upload(upload_id: str) -> dict[str, Any] | None:
-    """Fetch an upload record by ID."""
+    """Fetch a full upload row by ID, including any legacy file_data bytes.
+
+    Prefer get_upload_meta (metadata) or open_upload_stream (bytes).
+    """
     db = await get_db()
     row = await db.fetchrow("SELECT * FROM uploads WHERE id = ?", (upload_id,))
     return dict(row) if row else None
 
 
+async def get_upload_meta(upload_id: str) -> dict[str, Any] | None:
+    """Fetch an upload's metadata columns by ID — never its bytes."""
+    db = await get_db()
+    row = await db.fetchrow(f"SELECT {UPLOAD_META_COLUMNS} FROM uploads WHERE id = ?", (upload_id,))
+    return dict(row) if row else None
+
+
+class UploadBlob:
+    """Lazy handle on an upload's bytes.
+
+    Built from a get_upload_meta row; nothing is read until stream(),
+    read() or save_to() is called. Sources are tried in order: the local
+    file, the blob store, then the legacy file_data column.
+    """
+
+    def __init__(self, upload: dict[str, Any]) -> None:
+        self.upload_id: str = upload["id"]
+        self.file_path = Path(upload["file_path"])
+        self.size: int = upload["size_bytes"]
+        self.digest: str | None = upload.get("blob_digest")
+        self._has_file_data = bool(upload.get("has_file_data"))
+
+    async def _source(self) -> str | None:
+        if await asyncio.to_thread(self.file_path.is_file):
+            return "file"
+        if self.digest and await get_blob_store().exists(self.digest):
+            return "blob"
+        if self._has_file_data:
+            return "db"
+        return None
+
+    async def exists(self) -> bool:
+        """Whether any copy of the bytes is still reachable."""
+        return await self._source() is not None
+
+    async def stream(self, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+        """Yield the file's bytes in chunks. Raises FileNotFoundError if no
+        copy is left."""
+        source = await self._source()
+        if source == "file":
+            f = await asyncio.to_thread(self.file_path.open, "rb")
+            try:
+                while chunk := await asyncio.to_thread(f.read, chunk_size):
+                    yield chunk
+            finally:
+                f.close()
+        elif source == "blob":
+            async for chunk in get_blob_store().stream(self.digest, chunk_size):
+                yield chunk
+        elif source == "db":
+            # Legacy rows: the column can only be fetched whole.
+            db = await get_db()
+            row = await db.fetchrow("SELECT file_data FROM uploads WHERE id = ?", (self.upload_id,))
+            if row and row["file_data"] is not None:
+                yield bytes(row["file_data"])
+        else:
+            raise FileNotFoundError(f"No stored copy of upload {self.upload_id}")
+
+    async def read(self) -> bytes:
+        """The whole file in memory."""
+        return b"".join([chunk async for chunk in self.stream()])
+
+    async def save_to(self, dest: str | Path) -> None:
+        """Write the file to ``dest`` chunk by chunk.
+
+        Goes through a temp file so ``dest`` is never seen half-written and
+        a hard-linked blob is replaced, not overwritten in place.
+        """
+        dest = Path(dest)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(f".{dest.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            with tmp.open("wb") as out:
+                async for chunk in self.stream():
+                    await asyncio.to_thread(out.write, chunk)
+            tmp.replace(dest)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+
+async def open_upload_stream(upload_id: str) -> UploadBlob | None:
+    """Lazy handle on an upload's bytes, or None if the upload doesn't exist."""
+    meta = await get_upload_meta(upload_id)
+    return UploadBlob(meta) if meta else None
+
+
+class Keyframe:
+    """Lazy handle on one stored keyframe (see get_upload_extraction)."""
+
+    def __init__(self, upload_id: str, row: dict[str, Any]) -> None:
+        self.digest: str | None = row["frame_digest"]
+        self.key = self.digest or f"{upload_id}-frame-{row['frame_idx']}"
+        self._data = row["frame_data"]
+
+    async def read(self) -> bytes | None:
+        """The frame's bytes, or None if its blob is gone (e.g. a local
+        blob store on a disk that didn't survive a restart)."""
+        if self.digest:
+            return await _read_frame_blob(self.digest)
+        return bytes(self._data)
+
+
+async def _read_frame_blob(digest: str) -> bytes | None:
+    try:
+        return await get_blob_store().read(digest)
+    except FileNotFoundError:
+        logger.warning("Keyframe blob %s is missing from the blob store", digest)
+        return None
+
+
+async def _load_frames(rows: list[dict[str, Any]]) -> list[tuple[bytes, str]]:
+    """[(bytes, caption), ...] for keyframe rows, from the blob store or
+    the legacy frame_data column. Frames whose blob is missing are left
+    out."""
+    async def load(row: dict[str, Any]) -> bytes | None:
+        if row["frame_digest"]:
+            return await _read_frame_blob(row["frame_digest"])
+        return bytes(row["frame_data"])
+
+    data = await asyncio.gather(*(load(r) for r in rows))
+    return [(frame, r["caption"]) for frame, r in zip(data, rows) if frame is not None]
+
+
 async def set_upload_extraction(
     upload_id: str,
     text: str,
@@ -413,23 +948,35 @@ async def set_upload_extraction(
 ) -> None:
     """Persist extraction results for an upload.
 
-    Images are stored one row per image in the upload_keyframes table.
+    Image bytes go to the blob store first; the upload_keyframes rows
+    (one per image, holding the digest) are inserted as one batch in the
+    same transaction as the status flip so a poller never sees
+    status='done' with half the frames written.
     """
     db = await get_db()
     meta_json = json.dumps(meta)
     status = "error" if error else "done"
-    # Store each image as a separate row in upload_keyframes.
-    for frame_idx, (frame_bytes, caption) in enumerate(images):
-        await save_keyframe(upload_id, frame_idx, frame_bytes, caption)
-    await db.execute(
-        """UPDATE uploads
-           SET extracted_text = ?,
-               extracted_meta_json = ?,
-               extraction_status = ?,
-               extraction_error = ?
-           WHERE id = ?""",
-        (text, meta_json, status, error, upload_id),
-    )
+    store = get_blob_store()
+    digests = await asyncio.gather(*(store.put_bytes(frame) for frame, _ in images))
+    async with db.transaction():
+        if images:
+            await db.executemany(
+                """INSERT INTO upload_keyframes (upload_id, frame_idx, frame_digest, caption)
+                   VALUES (?, ?, ?, ?)""",
+                [
+                    (upload_id, frame_idx, digest, caption)
+                    for frame_idx, (digest, (_, caption)) in enumerate(zip(digests, images))
+                ],
+            )
+        await db.execute(
+            """UPDATE uploads
+               SET extracted_text = ?,
+                   extracted_meta_json = ?,
+                   extraction_status = ?,
+                   extraction_error = ?
+               WHERE id = ?""",
+            (text, meta_json, status, error, upload_id),
+        )
 
 
 async def append_upload_transcript(
@@ -510,15 +1057,17 @@ async def get_upload_status(upload_id: str) -> dict[str, Any] | None:
     }
 
 
-async def get_upload_extraction(upload_id: str) -> dict[str, Any] | None:
+async def get_upload_extraction(upload_id: str, lazy_images: bool = False) -> dict[str, Any] | None:
     """Fetch extraction results for an upload, including image bytes.
 
     Returns {"status", "text", "images", "meta", "error"} with images
     decoded back to [(bytes, caption), ...], or None if the upload
-    doesn't exist.
+    doesn't exist. With ``lazy_images`` the images are
+    [(Keyframe, caption), ...] instead and nothing is read until
+    Keyframe.read() — the chat path only reads frames the media cache
+    doesn't already have.
 
-    NOTE: This loads all keyframe bytes into memory. Only call when the
-    bytes are actually needed (e.g. _prepare_attachments in service.py).
+    NOTE: Without lazy_images this loads all keyframe bytes into memory.
     For status polls use get_upload_status instead.
     """
     db = await get_db()
@@ -531,11 +1080,17 @@ async def get_upload_extraction(upload_id: str) -> dict[str, Any] | None:
     if row is None:
         return None
 
+    # frame_data is only selected for legacy rows without a digest.
     kf_rows = await db.fetch(
-        "SELECT frame_data, caption FROM upload_keyframes WHERE upload_id = ? ORDER BY frame_idx",
+        """SELECT frame_idx, frame_digest, caption,
+                  CASE WHEN frame_digest IS NULL THEN frame_data END AS frame_data
+           FROM upload_keyframes WHERE upload_id = ? ORDER BY frame_idx""",
         (upload_id,),
     )
-    images: list[tuple[bytes, str]] = [(bytes(r["frame_data"]), r["caption"]) for r in kf_rows]
+    if lazy_images:
+        images: list[tuple[Any, str]] = [(Keyframe(upload_id, r), r["caption"]) for r in kf_rows]
+    else:
+        images = await _load_frames(kf_rows)
 
     meta: dict = {}
     raw_meta = row["extracted_meta_json"]
@@ -564,12 +1119,13 @@ async def save_keyframe(
     frame_data: bytes,
     caption: str,
 ) -> None:
-    """Persist a single video keyframe as a DB row."""
+    """Persist a single video keyframe: bytes to the blob store, digest to a DB row."""
+    digest = await get_blob_store().put_bytes(frame_data)
     db = await get_db()
     await db.execute(
-        """INSERT INTO upload_keyframes (upload_id, frame_idx, frame_data, caption)
+        """INSERT INTO upload_keyframes (upload_id, frame_idx, frame_digest, caption)
            VALUES (?, ?, ?, ?)""",
-        (upload_id, frame_idx, frame_data, caption),
+        (upload_id, frame_idx, digest, caption),
     )
 
 
@@ -587,10 +1143,11 @@ async def get_keyframes(upload_id: str) -> list[tuple[bytes, str]]:
     """Fetch all keyframes for an upload as [(png_bytes, caption), ...]."""
     db = await get_db()
     rows = await db.fetch(
-        "SELECT frame_data, caption FROM upload_keyframes WHERE upload_id = ? ORDER BY frame_idx",
+        """SELECT frame_digest, frame_data, caption FROM upload_keyframes
+           WHERE upload_id = ? ORDER BY frame_idx""",
         (upload_id,),
     )
-    return [(bytes(row["frame_data"]), row["caption"]) for row in rows]
+    return await _load_frames(rows)
 
 
 # ---------------------------------------------------------------------------
@@ -607,25 +1164,27 @@ async def create_artifact(
     """Persist an agent-generated artifact. Returns the created artifact."""
     db = await get_db()
     artifact_id = str(uuid.uuid4())
-    await db.execute(
+    row = await db.execute_returning(
         """INSERT INTO artifacts (id, session_id, artifact_type, title, content_json, language)
-           VALUES (?, ?, ?, ?, ?, ?)""",
+           VALUES (?, ?, ?, ?, ?, ?)
+           RETURNING *""",
         (artifact_id, session_id, artifact_type, title, _serialize(content), language),
     )
-    created = await get_artifact(artifact_id)
-    assert created is not None
-    return created
+    assert row is not None
+    return _artifact_row(row)
+
+
+def _artifact_row(row: dict[str, Any]) -> dict[str, Any]:
+    d = dict(row)
+    d["content"] = _parse_json(d.pop("content_json", None))
+    return d
 
 
 async def get_artifact(artifact_id: str) -> dict[str, Any] | None:
     """Fetch a single artifact by ID, with content parsed from JSON."""
     db = await get_db()
     row = await db.fetchrow("SELECT * FROM artifacts WHERE id = ?", (artifact_id,))
-    if row is None:
-        return None
-    d = dict(row)
-    d["content"] = _parse_json(d.pop("content_json", None))
-    return d
+    return _artifact_row(row) if row else None
 
 
 async def list_artifacts(session_id: str) -> list[dict[str, Any]]:
@@ -635,9 +1194,4 @@ async def list_artifacts(session_id: str) -> list[dict[str, Any]]:
         "SELECT * FROM artifacts WHERE session_id = ? ORDER BY created_at DESC",
         (session_id,),
     )
-    result = []
-    for row in rows:
-        d = dict(row)
-        d["content"] = _parse_json(d.pop("content_json", None))
-        result.append(d)
-    return result
+    return [_artifact_row(r) for r in rows]
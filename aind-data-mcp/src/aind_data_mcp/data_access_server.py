@@ -1,5 +1,6 @@
 """MCP server for AIND data access."""
 
+import argparse
 from pathlib import Path
 
 # Import tool modules — side-effect registers all @mcp.tool() decorators.
@@ -36,8 +37,24 @@ def get_nwbfile_download_script() -> str:
 
 
 def main():
-    """Main entry point for the MCP server."""
-    mcp.run(transport="stdio")
+    """Main entry point for the MCP server.
+
+    Serves over stdio by default. ``--transport streamable-http`` runs it
+    as a local HTTP service that several clients can share.
+    """
+    parser = argparse.ArgumentParser(description="AIND data access MCP server")
+    parser.add_argument(
+        "--transport",
+        choices=["stdio", "streamable-http"],
+        default="stdio",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    if args.transport == "stdio":
+        mcp.run(transport="stdio")
+    else:
+        mcp.run(transport=args.transport, host=args.host, port=args.port)
 
 
 if __name__ == "__main__":
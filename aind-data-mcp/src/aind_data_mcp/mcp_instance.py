@@ -1,16 +1,47 @@
 """Central MCP instance and MongoDB client factory."""
 
-from aind_data_access_api.document_db import MetadataDbClient
+import os
+import threading
+
 from fastmcp import FastMCP
 
 mcp = FastMCP("aind_data_mcp")
 
+# DOCDB_HOST overrides the DocDB API host (e.g. a local stand-in for
+# benchmarks).
+DOCDB_HOST = os.environ.get("DOCDB_HOST", "api.allenneuraldynamics.org")
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _pooled_session():
+    """A requests Session whose keep-alive connections are reused, so
+    tool calls after the first skip the TCP + TLS handshake."""
+    from requests import Session
+    from requests.adapters import HTTPAdapter
+
+    session = Session()
+    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=16))
+    return session
+
 
 def setup_mongodb_client():
-    """Set up and return the MongoDB client"""
+    """Return the MongoDB client shared by all tool calls.
 
-    return MetadataDbClient(
-        host="api.allenneuraldynamics.org",
-        version="v2",
-    )
+    Built on first use (importing aind_data_access_api pulls in boto3,
+    so server startup doesn't pay for it) and reused after that, along
+    with its HTTP session.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from aind_data_access_api.document_db import MetadataDbClient
 
+                _client = MetadataDbClient(
+                    host=DOCDB_HOST,
+                    version="v2",
+                    session=_pooled_session(),
+                )
+    return _client
@@ -2,6 +2,7 @@
 
 import asyncio
 import os
+import sys
 import tempfile
 from pathlib import Path
 from typing import AsyncIterator
@@ -26,6 +27,31 @@ def event_loop():
     loop.close()
 
 
+@pytest.fixture(autouse=True)
+def _isolate_file_stores(tmp_path_factory, monkeypatch):
+    """Keep uploads, blobs and the media cache out of the repo's uploads/.
+
+    The shared blob store and media cache are built on first use from the
+    environment, so they're reset to be rebuilt in a fresh temp directory
+    (not tmp_path, which some tests use as a store root themselves); server.py
+    reads UPLOADS_DIR at import, so its constants are patched if it's
+    already loaded (and the env var covers a first import).
+    """
+    import agent.blob_store as blob_mod
+    import agent.media_cache as media_mod
+
+    uploads_dir = tmp_path_factory.mktemp("uploads")
+    monkeypatch.setenv("UPLOADS_DIR", str(uploads_dir))
+    monkeypatch.setenv("BLOB_DIR", str(uploads_dir / "blobs"))
+    monkeypatch.setenv("MEDIA_CACHE_DIR", str(uploads_dir / "media_cache"))
+    monkeypatch.setattr(blob_mod, "_store", None)
+    monkeypatch.setattr(media_mod, "_cache", None)
+    server_mod = sys.modules.get("agent.server")
+    if server_mod is not None:
+        monkeypatch.setattr(server_mod, "UPLOADS_DIR", uploads_dir)
+        monkeypatch.setattr(server_mod, "CHUNKS_DIR", uploads_dir / "chunks")
+
+
 @pytest_asyncio.fixture()
 async def tmp_db(tmp_path: Path) -> AsyncIterator[aiosqlite.Connection]:
     """Create a temporary SQLite database with the agent schema.
@@ -0,0 +1,133 @@
+"""Tests for agent/aind_mcp.py — the shared HTTP AIND MCP server.
+
+Runs a stand-in MCP server (one tool, streamable HTTP) instead of the
+vendored aind_data_mcp server, which needs fastmcp + MongoDB access.
+
+Run from repo root:
+    python3 -m pytest evals/tasks/end_to_end/test_aind_mcp.py -v
+"""
+
+import asyncio
+import socket
+import sys
+
+from agent import aind_mcp
+from agent.aind_mcp import SharedMcpServer
+
+_loop = asyncio.new_event_loop()
+
+
+def _run(coro):
+    return _loop.run_until_complete(coro)
+
+
+_STANDIN = """
+import sys
+from mcp.server.fastmcp import FastMCP
+
+mcp = FastMCP("standin", host="127.0.0.1", port=int(sys.argv[1]), log_level="WARNING")
+
+
+@mcp.tool()
+def get_records() -> str:
+    return "[]"
+
+
+mcp.run(transport="streamable-http")
+"""
+
+
+def _server(tmp_path) -> SharedMcpServer:
+    script = tmp_path / "standin.py"
+    script.write_text(_STANDIN)
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    return SharedMcpServer(port=port, command=[sys.executable, str(script), str(port)])
+
+
+def test_cli_config_points_every_client_at_the_shared_server(tmp_path, monkeypatch):
+    server = _server(tmp_path)
+    monkeypatch.setattr(aind_mcp, "_server", server)
+    monkeypatch.setattr(aind_mcp, "AIND_MCP_SHARED", True)
+
+    async def scenario():
+        await server.start(timeout=30)
+        shared = aind_mcp.cli_config()
+        await server.stop()
+        return shared
+
+    assert _run(scenario()) == {"type": "http", "url": server.url}
+    monkeypatch.setattr(aind_mcp, "AIND_MCP_SHARED", False)
+    config = aind_mcp.cli_config()
+    assert config["type"] == "stdio" and config["args"] == ["-m", "aind_data_mcp.data_access_server"]
+
+
+def test_cli_config_uses_stdio_until_the_server_is_up(monkeypatch):
+    monkeypatch.setattr(aind_mcp, "AIND_MCP_SHARED", True)
+    monkeypatch.setattr(aind_mcp, "_server", None)
+    assert aind_mcp.cli_config()["type"] == "stdio"
+
+
+def test_cli_config_uses_stdio_when_the_server_failed_to_start(tmp_path, monkeypatch):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = SharedMcpServer(port=port, command=["false"])  # exits at once
+    monkeypatch.setattr(aind_mcp, "AIND_MCP_SHARED", True)
+    monkeypatch.setattr(aind_mcp, "_server", server)
+    assert not _run(server.start(timeout=10))
+    assert aind_mcp.cli_config()["type"] == "stdio"
+
+
+def test_server_starts_once_and_is_shared(tmp_path):
+    async def scenario():
+        server = _server(tmp_path)
+        ready = await server.start(timeout=30)
+        other = SharedMcpServer(port=server.port, command=["false"])  # e.g. another backend worker
+        adopted = await other.start(timeout=5)
+        stats = server.stats()
+        await server.stop()
+        return ready, adopted, other.pid, stats
+
+    ready, adopted, other_pid, stats = _run(scenario())
+    assert ready and adopted
+    assert other_pid is None  # used the running server, spawned nothing
+    assert stats["healthy"] and stats["tools"] == 1 and stats["pid"]
+    assert stats["probe_ms"] > 0
+
+
+def test_check_restarts_a_dead_server(tmp_path):
+    async def scenario():
+        server = _server(tmp_path)
+        await server.start(timeout=30)
+        first_pid = server.pid
+        healthy = await server.check()
+        server._proc.kill()
+        await server._proc.wait()
+        after_crash = await server.check()
+        recovered = await server.check()
+        stats = server.stats()
+        await server.stop()
+        return first_pid, healthy, after_crash, recovered, stats
+
+    first_pid, healthy, after_crash, recovered, stats = _run(scenario())
+    assert healthy
+    assert not after_crash  # connected clients must be replaced
+    assert recovered and stats["restarts"] == 1 and stats["pid"] != first_pid
+
+
+def test_pool_health_check_uses_the_running_server(tmp_path, monkeypatch):
+    from agent.sdk_client_pool import SDKClientPool
+
+    server = _server(tmp_path)
+    monkeypatch.setattr(aind_mcp, "get_mcp_server", lambda: server)
+    pool = SDKClientPool(lambda m: m, "sonnet")
+
+    async def scenario():
+        await server.start(timeout=30)
+        healthy = await pool._check_mcp_health()
+        await server.stop()
+        return healthy
+
+    assert _run(scenario())
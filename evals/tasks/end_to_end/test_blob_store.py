@@ -0,0 +1,181 @@
+"""Tests for agent/blob_store.py.
+
+The local driver runs against a tmp directory; the S3 driver runs against
+an in-memory stand-in with the slice of the boto3 client API it uses; the
+database driver runs against a throwaway SQLite file.
+
+Run from repo root:
+    python3 -m pytest evals/tasks/end_to_end/test_blob_store.py -v
+"""
+
+import asyncio
+import hashlib
+import io
+
+import pytest
+
+from agent.blob_store import DatabaseBlobStore, LocalBlobStore, S3BlobStore, sha256_file
+from agent.db.database import SQLiteDatabase
+
+_loop = asyncio.new_event_loop()
+
+
+def _run(coro):
+    return _loop.run_until_complete(coro)
+
+
+class _NotFound(Exception):
+    def __init__(self):
+        super().__init__("Not Found")
+        self.response = {"Error": {"Code": "404"}}
+
+
+class FakeS3:
+    """Just enough of boto3's S3 client, backed by a dict."""
+
+    def __init__(self):
+        self.objects: dict[tuple[str, str], bytes] = {}
+        self.puts = 0
+
+    def put_object(self, Bucket, Key, Body):
+        self.puts += 1
+        self.objects[(Bucket, Key)] = bytes(Body)
+
+    def upload_file(self, Filename, Bucket, Key):
+        with open(Filename, "rb") as f:
+            self.put_object(Bucket=Bucket, Key=Key, Body=f.read())
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise _NotFound()
+        return {"ContentLength": len(self.objects[(Bucket, Key)])}
+
+    def get_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise _NotFound()
+        return {"Body": io.BytesIO(self.objects[(Bucket, Key)])}
+
+
+@pytest.fixture(params=["local", "s3", "db"])
+def store(request, tmp_path):
+    if request.param == "local":
+        yield LocalBlobStore(tmp_path / "blobs")
+    elif request.param == "s3":
+        yield S3BlobStore("bucket", prefix="blobs/", client=FakeS3())
+    else:
+        db = SQLiteDatabase(tmp_path / "metadata.db", read_pool_size=0)
+        _run(db.init_tables())
+        yield DatabaseBlobStore(db)
+        _run(db.close())
+
+
+def test_put_bytes_round_trip(store):
+    data = b"frame" * 1000
+    digest = _run(store.put_bytes(data))
+    assert digest == hashlib.sha256(data).hexdigest()
+    assert _run(store.exists(digest))
+    assert _run(store.read(digest)) == data
+
+
+def test_put_file_dedupes(store, tmp_path):
+    a, b = tmp_path / "a.bin", tmp_path / "b.bin"
+    a.write_bytes(b"same bytes")
+    b.write_bytes(b"same bytes")
+    d1 = _run(store.put_file(a))
+    d2 = _run(store.put_file(b, sha256_file(b)))
+    assert d1 == d2
+    if isinstance(store, S3BlobStore):
+        assert store.client.puts == 1
+    elif isinstance(store, DatabaseBlobStore):
+        assert _run(store._db.fetchrow("SELECT COUNT(*) AS n FROM blobs"))["n"] == 1
+    else:
+        assert len([p for p in store.root.rglob("*") if p.is_file()]) == 1
+
+
+def test_stream_chunks_and_download(store, tmp_path):
+    data = bytes(range(256)) * 100
+    digest = _run(store.put_bytes(data))
+
+    async def _chunks():
+        return [c async for c in store.stream(digest, chunk_size=1000)]
+
+    chunks = _run(_chunks())
+    assert len(chunks) == 26
+    assert b"".join(chunks) == data
+
+    dest = tmp_path / "restored" / "file.bin"
+    _run(store.download(digest, dest))
+    assert dest.read_bytes() == data
+
+
+def test_missing_blob(store):
+    digest = hashlib.sha256(b"never stored").hexdigest()
+    assert not _run(store.exists(digest))
+    with pytest.raises(FileNotFoundError):
+        _run(store.read(digest))
+
+
+def test_rejects_non_digest_keys(store):
+    with pytest.raises(ValueError):
+        _run(store.exists("../../etc/passwd"))
+
+
+def test_local_put_file_hardlinks(tmp_path):
+    store = LocalBlobStore(tmp_path / "blobs")
+    src = tmp_path / "upload.bin"
+    src.write_bytes(b"x" * 4096)
+    digest = _run(store.put_file(src))
+    assert store.path(digest).stat().st_ino == src.stat().st_ino
+    # The blob outlives the upload's own copy.
+    src.unlink()
+    assert _run(store.read(digest)) == b"x" * 4096
+
+
+@pytest.mark.parametrize("env, driver", [
+    ({}, LocalBlobStore),
+    ({"DATABASE_URL": "postgresql://db/x"}, LocalBlobStore),
+    ({"DATABASE_URL": "postgresql://db/x", "BLOB_S3_BUCKET": "b"}, S3BlobStore),
+    ({"DATABASE_URL": "postgresql://db/x", "BLOB_STORE": "db"}, DatabaseBlobStore),
+])
+def test_driver_selection(env, driver, tmp_path, monkeypatch):
+    """The database driver is opt-in; a bucket picks S3 by default."""
+    from agent.blob_store import _create_store
+
+    for name in ("BLOB_STORE", "BLOB_S3_BUCKET", "DATABASE_URL"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("BLOB_DIR", str(tmp_path / "blobs"))
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    assert type(_create_store()) is driver
+
+
+def test_db_store_refuses_blobs_over_its_limit(tmp_path):
+    db = SQLiteDatabase(tmp_path / "metadata.db", read_pool_size=0)
+    _run(db.init_tables())
+    store = DatabaseBlobStore(db, max_bytes=10)
+    big = tmp_path / "big.bin"
+    big.write_bytes(b"x" * 11)
+    try:
+        with pytest.raises(ValueError):
+            _run(store.put_file(big))
+        with pytest.raises(ValueError):
+            _run(store.put_bytes(b"x" * 11))
+        assert _run(store.read(_run(store.put_bytes(b"x" * 10)))) == b"x" * 10
+        assert _run(db.fetchrow("SELECT COUNT(*) AS n FROM blobs"))["n"] == 1
+    finally:
+        _run(db.close())
+
+
+def test_upload_over_the_store_limit_is_not_copied(tmp_path, monkeypatch):
+    import agent.blob_store as blob_mod
+    import agent.server as server
+
+    class _Store(LocalBlobStore):
+        max_blob_bytes = 10
+
+    monkeypatch.setattr(blob_mod, "_store", _Store(tmp_path / "blobs"))
+    small, big = tmp_path / "small.bin", tmp_path / "big.bin"
+    small.write_bytes(b"x" * 10)
+    big.write_bytes(b"x" * 11)
+    assert _run(server._store_upload_blob(small, sha256_file(small), 10)) == sha256_file(small)
+    assert _run(server._store_upload_blob(big, sha256_file(big), 11)) is None
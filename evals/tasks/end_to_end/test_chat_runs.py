@@ -0,0 +1,157 @@
+"""Tests for agent/chat_runs.py — resumable chat runs.
+
+Run from repo root:
+    python3 -m pytest evals/tasks/end_to_end/test_chat_runs.py -v
+"""
+
+import asyncio
+import json
+
+import pytest
+
+from agent.sse import DONE
+
+_loop = asyncio.new_event_loop()
+
+
+def _run(coro):
+    return _loop.run_until_complete(coro)
+
+
+@pytest.fixture()
+def global_db(tmp_path, monkeypatch):
+    import agent.chat_runs as runs_mod
+    import agent.db.database as db_mod
+
+    monkeypatch.setenv("METADATA_DB_DIR", str(tmp_path))
+    monkeypatch.setattr(runs_mod, "_runs", {})
+    _run(db_mod.close_db())
+    _run(db_mod.init_db())
+    yield _run(db_mod.get_db())
+    _run(db_mod.close_db())
+
+
+async def _agent(n: int, delay: float = 0.0):
+    """Stands in for chat(): n content deltas."""
+    for i in range(n):
+        yield {"content": f"t{i} "}
+        await asyncio.sleep(delay)
+
+
+async def _take(events, limit: int | None = None) -> list:
+    out = []
+    async for item in events:
+        out.append(item)
+        if limit is not None and len(out) == limit:
+            break
+    return out
+
+
+def test_run_keeps_going_after_the_client_leaves(global_db):
+    from agent.chat_runs import start_run
+    from agent.tools.metadata_store import get_chat_run, get_chat_run_events
+
+    async def scenario():
+        run = await start_run("s", _agent(20, delay=0.005))
+        follower = run.follow()
+        seen = await _take(follower, limit=3)  # then the client drops
+        await follower.aclose()
+        await run.task
+        return run, seen
+
+    run, seen = _run(scenario())
+    assert seen[0] == (1, {"run_id": run.run_id})
+    assert run.status == "done"
+    assert run.last_seq == 22  # run_id + 20 deltas + DONE
+    assert _run(get_chat_run(run.run_id))["status"] == "done"
+    rows = _run(get_chat_run_events(run.run_id))
+    assert [r["seq"] for r in rows] == list(range(1, 23))
+    assert rows[-1]["data"] == DONE
+
+
+def test_resume_after_last_event_id_live_and_from_db(global_db, monkeypatch):
+    import agent.chat_runs as runs_mod
+    from agent.chat_runs import follow_run, start_run
+
+    async def scenario():
+        run = await start_run("s", _agent(10, delay=0.005))
+        live = await _take(await follow_run(run.run_id, after=5))
+        monkeypatch.setattr(runs_mod, "_runs", {})  # evicted / restarted
+        replayed = await _take(await follow_run(run.run_id, after=5))
+        return live, replayed
+
+    live, replayed = _run(scenario())
+    assert [seq for seq, _ in live] == list(range(6, 13))
+    assert live[-1][1] == DONE
+    assert replayed == live
+
+
+def test_db_ring_buffer_keeps_the_tail(global_db):
+    from agent.chat_runs import ChatRun
+    from agent.tools.metadata_store import create_chat_run, get_chat_run_events
+
+    async def scenario():
+        run = ChatRun("r1", "s", buffer_size=5)
+        await create_chat_run("r1", "s")
+        for i in range(12):
+            run.append({"content": str(i)})
+            if i % 4 == 3:
+                await run.persist()
+        return run
+
+    run = _run(scenario())
+    assert [seq for seq, _ in run.events] == [8, 9, 10, 11, 12]
+    rows = _run(get_chat_run_events("r1"))
+    assert [r["seq"] for r in rows] == [8, 9, 10, 11, 12]
+    assert json.loads(rows[0]["data"]) == {"content": "7"}
+
+
+def test_run_cut_off_by_restart_replays_then_errors(global_db):
+    from agent.chat_runs import follow_run
+    from agent.tools.metadata_store import append_chat_run_events, create_chat_run
+
+    _run(create_chat_run("r2", "s"))
+    _run(append_chat_run_events("r2", [(1, '{"run_id": "r2"}'), (2, '{"content": "half"}')], keep=100))
+
+    events = _run(_take(_run(follow_run("r2", after=1))))
+    assert events[0] == (2, {"content": "half"})
+    assert "interrupted" in events[1][1]["error"]
+    assert _run(follow_run("nope")) is None
+
+
+def test_cancel_stops_the_agent(global_db):
+    from agent.chat_runs import cancel_run, start_run
+
+    async def scenario():
+        run = await start_run("s", _agent(1000, delay=0.01))
+        await asyncio.sleep(0.05)
+        assert cancel_run(run.run_id)
+        await run.task
+        return run, await _take(run.follow(run.last_seq - 1))
+
+    run, tail = _run(scenario())
+    assert run.status == "cancelled"
+    assert run.last_seq < 100
+    assert tail == [(run.last_seq, DONE)]
+
+
+def test_stream_endpoint_honours_last_event_id(global_db, monkeypatch):
+    from httpx import ASGITransport, AsyncClient
+
+    import agent.server as server
+
+    monkeypatch.setattr(server, "chat", lambda *a, **kw: _agent(3))
+
+    async def scenario():
+        async with AsyncClient(transport=ASGITransport(app=server.app), base_url="http://test") as client:
+            first = await client.post("/chat", json={"message": "hi", "session_id": "s"})
+            run_id = first.headers["x-chat-run-id"]
+            resumed = await client.get(f"/chat/{run_id}/stream", headers={"Last-Event-ID": "3"})
+            missing = await client.get("/chat/nope/stream")
+            return first.text, resumed.text, missing.status_code
+
+    first, resumed, missing = _run(scenario())
+    assert first.startswith("id: 1\ndata: {")
+    assert first.endswith("data: [DONE]\n\n")
+    assert resumed == 'id: 4\ndata: {"content":"t2 "}\n\nid: 5\ndata: [DONE]\n\n'
+    assert missing == 404
@@ -0,0 +1,122 @@
+"""Tests for agent/chat_scheduler.py — chat admission control.
+
+Run from repo root:
+    python3 -m pytest evals/tasks/end_to_end/test_chat_scheduler.py -v
+"""
+
+import asyncio
+
+import pytest
+
+from agent.chat_scheduler import ChatQueueFull, ChatScheduler
+
+_loop = asyncio.new_event_loop()
+
+
+def _run(coro):
+    return _loop.run_until_complete(coro)
+
+
+async def _agent(log: list, name: str, gate: asyncio.Event):
+    """Stands in for chat(): logs start/end around waiting on ``gate``."""
+    log.append(f"{name} start")
+    yield {"content": name}
+    await gate.wait()
+    log.append(f"{name} end")
+
+
+async def _collect(events) -> list:
+    return [e async for e in events]
+
+
+def test_runs_in_one_session_are_serialized():
+    async def scenario():
+        sched = ChatScheduler(max_concurrent=4, max_queue=10)
+        log: list[str] = []
+        gate = asyncio.Event()
+        first = asyncio.create_task(_collect(sched.run(sched.admit("s"), _agent(log, "a", gate))))
+        second = asyncio.create_task(_collect(sched.run(sched.admit("s"), _agent(log, "b", gate))))
+        other = asyncio.create_task(_collect(sched.run(sched.admit("t"), _agent(log, "c", gate))))
+        await asyncio.sleep(0.01)
+        started_early = list(log)
+        gate.set()
+        return started_early, log, await second, await first, await other
+
+    started_early, log, second, first, other = _run(scenario())
+    assert started_early == ["a start", "c start"]  # b waits for a; c isn't held up behind b
+    assert log.index("a end") < log.index("b start")
+    assert second == [{"queue_position": 1}, {"queue_position": 0}, {"content": "b"}]
+    assert first == [{"content": "a"}]
+    assert other == [{"content": "c"}]
+
+
+def test_global_cap_and_queue_positions():
+    async def scenario():
+        sched = ChatScheduler(max_concurrent=1, max_queue=10)
+        log: list[str] = []
+        gates = [asyncio.Event() for _ in range(3)]
+        tasks = [
+            asyncio.create_task(_collect(sched.run(sched.admit(f"s{i}"), _agent(log, f"r{i}", gates[i]))))
+            for i in range(3)
+        ]
+        await asyncio.sleep(0.01)
+        depth = sched.stats()["queue_depth"]
+        for gate in gates:
+            gate.set()
+            await asyncio.sleep(0.01)
+        return depth, [await t for t in tasks], sched.stats()
+
+    depth, results, stats = _run(scenario())
+    assert depth == 2
+    assert results[1] == [{"queue_position": 1}, {"queue_position": 0}, {"content": "r1"}]
+    assert results[2] == [{"queue_position": 2}, {"queue_position": 1}, {"queue_position": 0}, {"content": "r2"}]
+    assert stats["running"] == 0 and stats["queue_depth"] == 0
+    assert stats["admitted"] == 3 and stats["wait_seconds"]["samples"] == 3
+    assert stats["wait_seconds"]["max"] > 0
+
+
+def test_full_queue_is_rejected_with_retry_after():
+    sched = ChatScheduler(max_concurrent=1, max_queue=1)
+    sched.admit("a")  # running
+    sched.admit("b")  # waiting
+    with pytest.raises(ChatQueueFull) as exc:
+        sched.admit("c")
+    assert exc.value.retry_after == 60  # (1 waiting + 1) rounds x 30 s default
+    assert sched.stats()["rejected"] == 1
+
+
+def test_cancelled_waiter_gives_up_its_place():
+    async def scenario():
+        sched = ChatScheduler(max_concurrent=1, max_queue=10)
+        gate = asyncio.Event()
+        running = asyncio.create_task(_collect(sched.run(sched.admit("a"), _agent([], "a", gate))))
+        waiting = asyncio.create_task(_collect(sched.run(sched.admit("b"), _agent([], "b", gate))))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        depth = sched.stats()["queue_depth"]
+        gate.set()
+        await running
+        return depth, sched.stats()
+
+    depth, stats = _run(scenario())
+    assert depth == 0
+    assert stats["running"] == 0
+
+
+def test_chat_endpoint_returns_503_when_queue_full(monkeypatch):
+    from httpx import ASGITransport, AsyncClient
+
+    import agent.server as server
+
+    sched = ChatScheduler(max_concurrent=1, max_queue=0)
+    sched.admit("busy")
+    monkeypatch.setattr(server, "chat_scheduler", sched)
+
+    async def post():
+        async with AsyncClient(transport=ASGITransport(app=server.app), base_url="http://test") as client:
+            return await client.post("/chat", json={"message": "hi", "session_id": "s"})
+
+    resp = _run(post())
+    assert resp.status_code == 503
+    assert resp.headers["retry-after"] == "30"
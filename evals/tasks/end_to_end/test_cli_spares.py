@@ -0,0 +1,132 @@
+"""Tests for agent/cli_spares.py — pre-spawned CLI clients for query().
+
+Uses a stand-in for ClaudeSDKClient, so no `claude` CLI is spawned.
+
+Run from repo root:
+    python3 -m pytest evals/tasks/end_to_end/test_cli_spares.py -v
+"""
+
+import asyncio
+import itertools
+
+from claude_agent_sdk import ResultMessage
+
+from agent.cli_spares import HotSpares
+
+_loop = asyncio.new_event_loop()
+
+
+def _run(coro):
+    return _loop.run_until_complete(coro)
+
+
+class _StubClient:
+    ids = itertools.count(1)
+    prompts: list = []
+
+    def __init__(self, options):
+        self.model = options
+        self.id = next(self.ids)
+        self.disconnected = False
+
+    async def connect(self):
+        await asyncio.sleep(0.01)
+
+    async def query(self, prompt):
+        if not isinstance(prompt, str):
+            prompt = [m async for m in prompt][0]["message"]["content"]
+        self.prompts.append(prompt)
+
+    async def receive_response(self):
+        yield ResultMessage(subtype="success", duration_ms=1, duration_api_ms=1, is_error=False,
+                            num_turns=1, session_id="sdk", result=f"from client {self.id} ({self.model})")
+
+    async def disconnect(self):
+        self.disconnected = True
+
+
+def _spares(**kwargs) -> HotSpares:
+    return HotSpares(lambda model: model, "sonnet", client_factory=_StubClient, **kwargs)
+
+
+async def _ready(spares: HotSpares, model: str, n: int) -> None:
+    while spares.stats()["ready"].get(model, 0) < n:
+        await asyncio.sleep(0.005)
+
+
+def test_spare_is_used_once_and_replaced():
+    async def scenario():
+        spares = _spares(spares=2)
+        spares.start()
+        await _ready(spares, "sonnet", 2)
+        first = [m async for m in spares.take("hi", None)]
+        second = [m async for m in spares.take("hi", None)]
+        await _ready(spares, "sonnet", 2)  # both refilled
+        workers = list(spares._workers["sonnet"])
+        await spares.shutdown()
+        return first, second, workers, spares.stats()
+
+    first, second, workers, stats = _run(scenario())
+    assert first[0].result != second[0].result  # a different client each time
+    assert len(workers) == 2 and all(w.served == 0 for w in workers)
+    assert stats["taken"] == 2 and stats["missed"] == 0
+
+
+def test_unused_spares_are_recycled_by_age():
+    async def scenario():
+        spares = _spares(spares=1, max_age=0.05)
+        spares.start()
+        await _ready(spares, "sonnet", 1)
+        old = spares._workers["sonnet"][0]
+        await asyncio.sleep(0.1)
+        await _ready(spares, "sonnet", 1)
+        new = spares._workers["sonnet"][0]
+        await spares.shutdown()
+        return old, new
+
+    old, new = _run(scenario())
+    assert new is not old and old.retiring and old.served == 0
+
+
+def test_other_models_get_spares_on_demand():
+    async def scenario():
+        spares = _spares(spares=1)
+        spares.start()
+        miss = spares.take("hi", "haiku")
+        await _ready(spares, "haiku", 1)
+        hit = [m async for m in spares.take("hi", "haiku")]
+        await spares.shutdown()
+        return miss, hit, spares.stats()
+
+    miss, hit, stats = _run(scenario())
+    assert miss is None
+    assert "(haiku)" in hit[0].result
+    assert stats["missed"] == 1 and stats["taken"] == 1
+
+
+def test_chat_uses_a_spare_when_there_is_no_pool(tmp_path, monkeypatch):
+    import agent.db.database as db_mod
+    import agent.service as service
+
+    monkeypatch.setenv("METADATA_DB_DIR", str(tmp_path))
+    monkeypatch.setattr(service, "get_pool", lambda: None)
+    monkeypatch.setattr(service, "query", None)  # the spawn path must not run
+    _run(db_mod.close_db())
+    _run(db_mod.init_db())
+    spares = HotSpares(lambda m: m, service.DEFAULT_MODEL, spares=1, client_factory=_StubClient)
+    monkeypatch.setattr(service, "get_spares", lambda: spares)
+
+    async def scenario():
+        spares.start()
+        await _ready(spares, service.DEFAULT_MODEL, 1)
+        events = [e async for e in service.chat("s", "hello")]
+        await spares.shutdown()
+        return events
+
+    try:
+        events = _run(scenario())
+    finally:
+        _run(db_mod.close_db())
+    assert any("from client" in e.get("content", "") for e in events)
+    assert spares.stats()["taken"] == 1
+    assert "USER: hello" in str(_StubClient.prompts[-1])
@@ -0,0 +1,1051 @@
+"""Tests for the SQLite backend in agent/db/database.py.
+
+Covers the writer/reader split (writes go through the single writer
+connection, reads are served by a pool of read-only connections and must
+see every committed write) and the transaction/executemany API the store
+functions build on.
+
+Run from repo root:
+    python3 -m pytest evals/tasks/end_to_end/test_database.py -v
+"""
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+
+import pytest
+
+from agent.db.database import SQLiteDatabase
+
+_loop = asyncio.new_event_loop()
+
+
+def _run(coro):
+    return _loop.run_until_complete(coro)
+
+
+@pytest.fixture()
+def make_db(tmp_path):
+    """Factory for initialised SQLiteDatabase instances; closes them after."""
+    opened: list[SQLiteDatabase] = []
+
+    def _make(read_pool_size: int | None = None) -> SQLiteDatabase:
+        db = SQLiteDatabase(tmp_path / "metadata.db", read_pool_size=read_pool_size)
+        _run(db.init_tables())
+        opened.append(db)
+        return db
+
+    yield _make
+    for db in opened:
+        _run(db.close())
+
+
+def _insert_turn(db: SQLiteDatabase, session_id: str, content: str):
+    return db.execute(
+        "INSERT INTO conversations (session_id, role, content) VALUES (?, ?, ?)",
+        (session_id, "user", content),
+    )
+
+
+# ---------------------------------------------------------------------------
+# Reader pool
+# ---------------------------------------------------------------------------
+
+
+def test_reads_see_committed_writes(make_db):
+    db = make_db(read_pool_size=2)
+    _run(_insert_turn(db, "s1", "hello"))
+    row = _run(db.fetchrow("SELECT content FROM conversations WHERE session_id = ?", ("s1",)))
+    assert row == {"content": "hello"}
+
+
+def test_in_memory_database_reads_through_the_writer():
+    """A read-only reader would open its own, empty in-memory database."""
+    db = SQLiteDatabase(":memory:", read_pool_size=4)
+    _run(db.init_tables())
+    _run(_insert_turn(db, "s1", "hello"))
+    rows = _run(db.fetch("SELECT content FROM conversations"))
+    readers = len(db._readers)
+    _run(db.close())
+    assert rows == [{"content": "hello"}]
+    assert readers == 0
+
+
+def test_reader_connections_are_read_only(make_db):
+    db = make_db(read_pool_size=1)
+    with pytest.raises(sqlite3.OperationalError):
+        _run(db.fetch(
+            "INSERT INTO conversations (session_id, role, content) VALUES ('x', 'user', 'y')"
+        ))
+
+
+def test_concurrent_reads_open_at_most_pool_size_readers(make_db):
+    db = make_db(read_pool_size=3)
+    for i in range(5):
+        _run(_insert_turn(db, "s1", f"m{i}"))
+
+    async def _many_reads():
+        return await asyncio.gather(*(
+            db.fetch("SELECT content FROM conversations WHERE session_id = ?", ("s1",))
+            for _ in range(20)
+        ))
+
+    results = _run(_many_reads())
+    assert all(len(r) == 5 for r in results)
+    assert 1 <= len(db._readers) <= 3
+
+
+def test_reads_interleaved_with_writes(make_db):
+    """A steady writer must not starve or corrupt concurrent readers."""
+    db = make_db(read_pool_size=2)
+
+    async def _writer():
+        for i in range(50):
+            await _insert_turn(db, "w", f"turn {i}")
+
+    async def _reader():
+        counts = []
+        for _ in range(50):
+            row = await db.fetchrow("SELECT COUNT(*) AS n FROM conversations")
+            counts.append(row["n"])
+        return counts
+
+    async def _both():
+        return await asyncio.gather(_writer(), _reader())
+
+    _, counts = _run(_both())
+    # Each read sees a committed snapshot, so the count never goes backwards.
+    assert counts == sorted(counts)
+    final = _run(db.fetchrow("SELECT COUNT(*) AS n FROM conversations"))
+    assert final["n"] == 50
+
+
+def test_pool_size_zero_reads_through_writer(make_db):
+    db = make_db(read_pool_size=0)
+    _run(_insert_turn(db, "s1", "hi"))
+    rows = _run(db.fetch("SELECT content FROM conversations"))
+    assert rows == [{"content": "hi"}]
+    assert db._readers == []
+
+
+def test_pool_size_from_env(tmp_path, monkeypatch):
+    monkeypatch.setenv("SQLITE_READ_POOL_SIZE", "7")
+    assert SQLiteDatabase(tmp_path / "x.db")._read_pool_size == 7
+
+
+# ---------------------------------------------------------------------------
+# Transactions + executemany
+# ---------------------------------------------------------------------------
+
+
+def _count_commits(db: SQLiteDatabase) -> list[int]:
+    """Wrap the writer connection's commit() and return a live counter."""
+    conn = _run(db._get_conn())
+    counter = [0]
+    real_commit = conn.commit
+
+    async def _commit():
+        counter[0] += 1
+        await real_commit()
+
+    conn.commit = _commit
+    return counter
+
+
+def test_transaction_commits_once(make_db):
+    db = make_db()
+    commits = _count_commits(db)
+
+    async def _txn():
+        async with db.transaction():
+            for i in range(5):
+                await _insert_turn(db, "t", f"m{i}")
+
+    _run(_txn())
+    assert commits[0] == 1
+    rows = _run(db.fetch("SELECT content FROM conversations"))
+    assert len(rows) == 5
+
+
+def test_transaction_rolls_back_on_error(make_db):
+    db = make_db()
+
+    async def _txn():
+        async with db.transaction():
+            await _insert_turn(db, "t", "lost")
+            raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        _run(_txn())
+    assert _run(db.fetch("SELECT * FROM conversations")) == []
+
+
+def test_reads_inside_transaction_see_uncommitted_writes(make_db):
+    db = make_db(read_pool_size=2)
+
+    async def _txn():
+        async with db.transaction():
+            await _insert_turn(db, "t", "pending")
+            inside = await db.fetch("SELECT content FROM conversations")
+            # A different task reads through the pool and sees nothing yet.
+            outside = await asyncio.create_task(
+                _isolated_fetch(db, "SELECT content FROM conversations"))
+            return inside, outside
+
+    inside, outside = _run(_txn())
+    assert inside == [{"content": "pending"}]
+    assert outside == []
+
+
+async def _isolated_fetch(db, sql):
+    from agent.db.database import _current_txn
+    _current_txn.set(None)
+    return await db.fetch(sql)
+
+
+def test_nested_transaction_joins_outer(make_db):
+    db = make_db()
+    commits = _count_commits(db)
+
+    async def _txn():
+        async with db.transaction():
+            await _insert_turn(db, "t", "a")
+            async with db.transaction():
+                await _insert_turn(db, "t", "b")
+
+    _run(_txn())
+    assert commits[0] == 1
+    assert len(_run(db.fetch("SELECT * FROM conversations"))) == 2
+
+
+def test_autocommit_write_waits_for_open_transaction(make_db):
+    """Another task's execute() must not land inside (or be rolled back
+    with) a transaction it isn't part of."""
+    db = make_db()
+
+    async def _scenario():
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def _txn():
+            async with db.transaction():
+                await _insert_turn(db, "t", "in-txn")
+                started.set()
+                await release.wait()
+                raise RuntimeError("rollback")
+
+        async def _other():
+            await started.wait()
+            await _insert_turn(db, "o", "outside")
+
+        txn_task = asyncio.create_task(_txn())
+        other_task = asyncio.create_task(_other())
+        await started.wait()
+        await asyncio.sleep(0.01)
+        assert not other_task.done()  # blocked on the write lock
+        release.set()
+        with pytest.raises(RuntimeError):
+            await txn_task
+        await other_task
+
+    _run(_scenario())
+    rows = _run(db.fetch("SELECT content FROM conversations"))
+    assert rows == [{"content": "outside"}]
+
+
+def test_executemany_inserts_batch_with_one_commit(make_db):
+    db = make_db()
+    commits = _count_commits(db)
+    _run(db.executemany(
+        "INSERT INTO upload_keyframes (upload_id, frame_idx, frame_data, caption) VALUES (?, ?, ?, ?)",
+        [("u1", i, b"png", f"Frame {i}") for i in range(10)],
+    ))
+    assert commits[0] == 1
+    row = _run(db.fetchrow("SELECT COUNT(*) AS n FROM upload_keyframes"))
+    assert row["n"] == 10
+
+
+# ---------------------------------------------------------------------------
+# Store functions on top of transactions
+# ---------------------------------------------------------------------------
+
+
+@pytest.fixture()
+def global_db(tmp_path, monkeypatch):
+    """Point agent.db.database's shared instance (and the blob store) at a
+    throwaway directory."""
+    import agent.blob_store as blob_mod
+    import agent.db.database as db_mod
+
+    monkeypatch.setenv("METADATA_DB_DIR", str(tmp_path))
+    monkeypatch.setenv("BLOB_DIR", str(tmp_path / "blobs"))
+    monkeypatch.setattr(blob_mod, "_store", None)
+    _run(db_mod.close_db())
+    _run(db_mod.init_db())
+    yield _run(db_mod.get_db())
+    _run(db_mod.close_db())
+
+
+def test_capture_metadata_commits_once(global_db):
+    from agent.tools.capture_mcp import capture_metadata_handler
+
+    created = _run(capture_metadata_handler({
+        "session_id": "s", "record_type": "subject", "data": {"subject_id": "1"},
+    }))
+    target_id = json.loads(created["content"][0]["text"])["record_id"]
+
+    commits = _count_commits(global_db)
+    _run(capture_metadata_handler({
+        "session_id": "s",
+        "record_type": "session",
+        "data": {"session_start_time": "2025-01-15T09:00:00"},
+        "link_to": target_id,
+    }))
+    assert commits[0] == 1
+
+    commits[0] = 0
+    _run(capture_metadata_handler({
+        "session_id": "s", "record_type": "subject", "record_id": target_id,
+        "data": {"sex": "Male"},
+    }))
+    assert commits[0] == 1
+
+
+def test_set_upload_extraction_batches_keyframes(global_db):
+    from agent.tools.metadata_store import get_upload_extraction, save_upload, set_upload_extraction
+
+    _run(save_upload("u1", "v.mp4", "video/mp4", "/tmp/v.mp4", 10))
+    commits = _count_commits(global_db)
+    frames = [(b"png%d" % i, f"Frame {i}") for i in range(8)]
+    _run(set_upload_extraction("u1", "transcript", frames, {"keyframes": 8}, None))
+    assert commits[0] == 1
+
+    ext = _run(get_upload_extraction("u1"))
+    assert ext["status"] == "done"
+    assert ext["images"] == frames
+
+
+def test_keyframes_store_only_digests(global_db):
+    from agent.blob_store import get_blob_store
+    from agent.tools.metadata_store import get_keyframes, save_keyframe, save_upload, set_upload_extraction
+
+    _run(save_upload("u1", "v.mp4", "video/mp4", "/tmp/v.mp4", 10))
+    _run(set_upload_extraction("u1", "", [(b"same", "Frame 0"), (b"same", "Frame 1")], {}, None))
+    _run(save_keyframe("u1", 2, b"other", "Frame 2"))
+
+    rows = _run(global_db.fetch("SELECT frame_data, frame_digest FROM upload_keyframes ORDER BY frame_idx"))
+    assert all(r["frame_data"] is None for r in rows)
+    assert rows[0]["frame_digest"] == rows[1]["frame_digest"] != rows[2]["frame_digest"]
+    blobs = [p for p in get_blob_store().root.rglob("*") if p.is_file()]
+    assert len(blobs) == 2
+
+    assert _run(get_keyframes("u1")) == [(b"same", "Frame 0"), (b"same", "Frame 1"), (b"other", "Frame 2")]
+
+
+def test_legacy_frame_data_still_reads(global_db):
+    from agent.tools.metadata_store import get_keyframes, open_upload_stream, save_upload
+
+    _run(save_upload("u1", "a.png", "image/png", "/gone/a.png", 3))
+    _run(global_db.execute("UPDATE uploads SET file_data = ? WHERE id = 'u1'", (b"old",)))
+    _run(global_db.execute(
+        "INSERT INTO upload_keyframes (upload_id, frame_idx, frame_data, caption) VALUES ('u1', 0, ?, 'f')",
+        (b"png",),
+    ))
+    assert _run(get_keyframes("u1")) == [(b"png", "f")]
+    assert _run(_run(open_upload_stream("u1")).read()) == b"old"
+
+
+def test_keyframe_with_missing_blob_is_skipped(global_db):
+    from agent.blob_store import get_blob_store
+    from agent.tools.metadata_store import get_keyframes, get_upload_extraction, save_keyframe, save_upload
+
+    _run(save_upload("u1", "v.mp4", "video/mp4", "/tmp/v.mp4", 10))
+    _run(save_keyframe("u1", 0, b"kept", "Frame 0"))
+    _run(save_keyframe("u1", 1, b"lost", "Frame 1"))
+    get_blob_store().path(hashlib.sha256(b"lost").hexdigest()).unlink()
+
+    assert _run(get_keyframes("u1")) == [(b"kept", "Frame 0")]
+    frames = _run(get_upload_extraction("u1", lazy_images=True))["images"]
+    assert [_run(frame.read()) for frame, _ in frames] == [b"kept", None]
+
+
+def test_upload_meta_never_selects_file_data(global_db):
+    from agent.tools.metadata_store import get_upload_meta, open_upload_stream, save_upload
+
+    _run(save_upload("u1", "a.bin", "application/octet-stream", "/gone/a.bin", 3))
+    _run(global_db.execute("UPDATE uploads SET file_data = ? WHERE id = 'u1'", (b"old",)))
+    statements = _count_statements(global_db)
+    reads: list[str] = []
+    original_fetchrow = global_db.fetchrow
+
+    async def _fetchrow(sql, params=()):
+        reads.append(sql)
+        return await original_fetchrow(sql, params)
+
+    global_db.fetchrow = _fetchrow
+    try:
+        meta = _run(get_upload_meta("u1"))
+        blob = _run(open_upload_stream("u1"))
+        assert not any(sql.startswith(("SELECT *", "SELECT file_data")) for sql in reads)
+        assert "file_data" not in meta and meta["has_file_data"]
+        # Bytes are only fetched once the handle is consumed.
+        assert _run(blob.read()) == b"old"
+        assert any(sql.startswith("SELECT file_data FROM") for sql in reads)
+    finally:
+        global_db.fetchrow = original_fetchrow
+    assert statements == []
+
+
+def test_upload_blob_prefers_local_file_then_store(global_db, tmp_path):
+    from agent.blob_store import get_blob_store
+    from agent.tools.metadata_store import open_upload_stream, save_upload
+
+    path = tmp_path / "a.csv"
+    path.write_bytes(b"a,b\n1,2\n")
+    digest = _run(get_blob_store().put_file(path))
+    _run(save_upload("u1", "a.csv", "text/csv", str(path), 8, blob_digest=digest))
+
+    blob = _run(open_upload_stream("u1"))
+    assert _run(blob.read()) == b"a,b\n1,2\n"
+    path.unlink()
+    assert _run(blob.read()) == b"a,b\n1,2\n"
+    _run(blob.save_to(path))
+    assert path.read_bytes() == b"a,b\n1,2\n"
+
+    get_blob_store().path(digest).unlink()
+    path.unlink()
+    assert not _run(blob.exists())
+    with pytest.raises(FileNotFoundError):
+        _run(blob.read())
+    assert _run(open_upload_stream("missing")) is None
+
+
+# ---------------------------------------------------------------------------
+# Single-statement writes (RETURNING)
+# ---------------------------------------------------------------------------
+
+
+def _count_statements(db: SQLiteDatabase) -> list[str]:
+    """Record every SQL statement sent on the writer connection."""
+    conn = _run(db._get_conn())
+    seen: list[str] = []
+    real_execute = conn.execute
+
+    def _execute(sql, *args, **kwargs):
+        seen.append(sql)
+        return real_execute(sql, *args, **kwargs)
+
+    conn.execute = _execute
+    return seen
+
+
+def test_execute_returning_returns_row(make_db):
+    db = make_db()
+    row = _run(db.execute_returning(
+        "INSERT INTO conversations (session_id, role, content) VALUES (?, ?, ?) RETURNING session_id, content",
+        ("s1", "user", "hi"),
+    ))
+    assert row == {"session_id": "s1", "content": "hi"}
+    assert _run(db.execute_returning(
+        "UPDATE conversations SET content = 'x' WHERE session_id = 'nope' RETURNING *"
+    )) is None
+
+
+def test_record_writes_are_single_statements(global_db):
+    from agent.tools.metadata_store import confirm_record, create_record, update_record
+
+    statements = _count_statements(global_db)
+    record = _run(create_record("s", "subject", {"subject_id": "1"}))
+    assert record["name"] == "1"
+    assert record["data_json"] == {"subject_id": "1"}
+
+    updated = _run(update_record(record["id"], {"species": {"name": "Mus musculus"}}))
+    assert updated["data_json"] == {"subject_id": "1", "species": {"name": "Mus musculus"}}
+    assert updated["name"] == "Mus musculus 1"
+
+    confirmed = _run(confirm_record(record["id"]))
+    assert confirmed["status"] == "confirmed"
+    record_writes = [sql for sql in statements if "metadata_records" in sql]
+    assert len(record_writes) == 3
+    assert all("RETURNING" in sql for sql in record_writes)
+
+
+def test_update_record_merge_semantics(global_db):
+    from agent.tools.metadata_store import create_record, get_record, update_record
+
+    rid = _run(create_record("s", "rig", {"rig_id": "R1", "flag": True, "n": 1}))["id"]
+    updated = _run(update_record(rid, {"n": 2, "nested": {"a": [1, None]}, "it's": "ok"}))
+    assert updated["data_json"] == {
+        "rig_id": "R1", "flag": True, "n": 2, "nested": {"a": [1, None]}, "it's": "ok",
+    }
+    assert updated["name"] == "R1"
+
+    # Full replace; with no derivable name the old one is kept.
+    replaced = _run(update_record(rid, {"other": 1}, merge=False))
+    assert replaced["data_json"] == {"other": 1}
+    assert replaced["name"] == "R1"
+
+    # Explicit name wins over the auto-name.
+    renamed = _run(update_record(rid, {"rig_id": "R2"}, name="Custom"))
+    assert renamed["name"] == "Custom"
+
+    # Keys a JSON path can't express still merge (via the fallback).
+    quoted = _run(update_record(rid, {'say "hi"': 1}))
+    assert quoted["data_json"]['say "hi"'] == 1
+    assert quoted["data_json"]["rig_id"] == "R2"
+    assert quoted["name"] == "R2"
+
+    assert _run(update_record("missing", {"x": 1})) is None
+    assert _run(get_record(rid)) == quoted
+
+
+def test_update_record_replaces_non_object_data(global_db):
+    from agent.tools.metadata_store import create_record, update_record
+
+    rid = _run(create_record("s", "session", {}))["id"]
+    _run(global_db.execute("UPDATE metadata_records SET data_json = '[1, 2]' WHERE id = ?", (rid,)))
+    updated = _run(update_record(rid, {"session_start_time": "2025-01-15T09:00:00"}))
+    assert updated["data_json"] == {"session_start_time": "2025-01-15T09:00:00"}
+    assert updated["name"] == "Session 2025-01-15T09:00:00"
+
+
+def test_create_artifact_returns_row(global_db):
+    from agent.tools.metadata_store import create_artifact, get_artifact
+
+    created = _run(create_artifact("s", "table", "Subjects", {"rows": [1]}))
+    assert created["content"] == {"rows": [1]}
+    assert created == _run(get_artifact(created["id"]))
+
+
+# ---------------------------------------------------------------------------
+# Server-side JSON updates + migrations
+# ---------------------------------------------------------------------------
+
+
+def test_concurrent_field_updates_do_not_lose_writes(global_db):
+    from agent.tools.metadata_store import create_record, get_record, update_record_field
+
+    rid = _run(create_record("s", "subject", {"subject_id": "1"}))["id"]
+
+    async def _patch_all():
+        await asyncio.gather(*(
+            update_record_field(rid, f"field_{i}", i) for i in range(20)
+        ))
+
+    _run(_patch_all())
+    data = _run(get_record(rid))["data_json"]
+    assert data == {"subject_id": "1", **{f"field_{i}": i for i in range(20)}}
+
+
+def test_update_merges_into_a_concurrently_committed_row(global_db, tmp_path):
+    """An update that waits on another writer merges into that writer's
+    result, not the row as it was when the update was issued."""
+    from agent.tools.metadata_store import create_record, update_record
+
+    rid = _run(create_record("s", "subject", {"subject_id": "1"}))["id"]
+    other = sqlite3.connect(tmp_path / "metadata.db", isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    other.execute(
+        """UPDATE metadata_records SET data_json = json_set(data_json, '$.species', json('{"name": "Mouse"}'))
+           WHERE id = ?""", (rid,))
+
+    async def _interleave():
+        pending = asyncio.ensure_future(update_record(rid, {"sex": "Male"}))
+        await asyncio.sleep(0.2)
+        assert not pending.done()  # blocked on the other writer
+        other.execute("COMMIT")
+        return await pending
+
+    updated = _run(_interleave())
+    other.close()
+    assert updated["data_json"] == {"subject_id": "1", "species": {"name": "Mouse"}, "sex": "Male"}
+    assert updated["name"] == "Mouse 1"
+
+
+def test_fresh_database_is_stamped_at_latest_version(make_db):
+    from agent.db.models import SQLITE_MIGRATIONS
+
+    db = make_db()
+    row = _run(db.fetchrow("PRAGMA user_version"))
+    assert row["user_version"] == len(SQLITE_MIGRATIONS)
+
+
+def _drop_added_columns(legacy: sqlite3.Connection) -> None:
+    """Undo the ADD COLUMN migrations so an older user_version replays cleanly."""
+    legacy.executescript("""
+        ALTER TABLE uploads DROP COLUMN blob_digest;
+        ALTER TABLE conversations DROP COLUMN token_estimate;
+        ALTER TABLE sessions DROP COLUMN history_start_id;
+        ALTER TABLE sessions DROP COLUMN history_summary;
+    """)
+
+
+def test_migration_normalises_legacy_json(tmp_path):
+    """Rows written before the JSON1 update path are made valid JSON."""
+    path = tmp_path / "metadata.db"
+    db = SQLiteDatabase(path, read_pool_size=0)
+    _run(db.init_tables())
+    _run(db.close())
+
+    legacy = sqlite3.connect(path)
+    # Databases this old had no search trigger or key indexes (which need
+    # valid JSON).
+    legacy.execute("DROP TRIGGER records_fts_insert")
+    legacy.execute("DROP INDEX idx_records_key_subject")
+    _drop_added_columns(legacy)
+    rows = [
+        ("a", "not json at all", None),
+        ("b", json.dumps(json.dumps({"subject_id": "7"})), json.dumps(json.dumps({"status": "valid"}))),
+        ("c", json.dumps({"subject_id": "8"}), "{broken"),
+    ]
+    legacy.executemany(
+        """INSERT INTO metadata_records (id, session_id, record_type, category, data_json, validation_json)
+           VALUES (?, 's', 'subject', 'shared', ?, ?)""",
+        rows,
+    )
+    legacy.execute("PRAGMA user_version = 0")
+    legacy.commit()
+    legacy.close()
+
+    db = SQLiteDatabase(path, read_pool_size=0)
+    _run(db.init_tables())
+    got = {
+        r["id"]: (json.loads(r["data_json"]), r["validation_json"] and json.loads(r["validation_json"]))
+        for r in _run(db.fetch("SELECT id, data_json, validation_json FROM metadata_records"))
+    }
+    _run(db.close())
+    assert got == {
+        "a": ("not json at all", None),
+        "b": ({"subject_id": "7"}, {"status": "valid"}),
+        "c": ({"subject_id": "8"}, "{broken"),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Full-text search (find_records)
+# ---------------------------------------------------------------------------
+
+
+def test_find_records_uses_fts_and_ranks_identifiers_first(global_db):
+    from agent.tools.metadata_store import create_record, find_records
+
+    mention = _run(create_record("s", "session", {"notes": "mouse 4528 was calm"}))
+    subject = _run(create_record("s", "subject", {"subject_id": "4528", "genotype": "Pvalb-IRES-Cre/wt"}))
+    _run(create_record("s", "subject", {"subject_id": "9999"}))
+
+    results = _run(find_records(query="4528"))
+    assert [r["id"] for r in results] == [subject["id"], mention["id"]]
+
+    # Prefix match on every word, any order.
+    assert [r["id"] for r in _run(find_records(query="pvalb cre"))] == [subject["id"]]
+    assert [r["id"] for r in _run(find_records(query="452"))] == [subject["id"], mention["id"]]
+    # Filters still apply.
+    assert [r["id"] for r in _run(find_records(record_type="session", query="4528"))] == [mention["id"]]
+
+
+def test_fts_index_follows_updates_and_deletes(global_db):
+    from agent.tools.metadata_store import create_record, delete_record, find_records, update_record
+
+    rid = _run(create_record("s", "instrument", {"instrument_id": "SmartSPIM-1"}))["id"]
+    assert len(_run(find_records(query="smartspim"))) == 1
+
+    _run(update_record(rid, {"instrument_id": "Mesoscope-2"}))
+    assert _run(find_records(query="smartspim")) == []
+    assert [r["id"] for r in _run(find_records(query="mesoscope"))] == [rid]
+
+    _run(delete_record(rid))
+    assert _run(find_records(query="mesoscope")) == []
+    row = _run(global_db.fetchrow("SELECT COUNT(*) AS n FROM records_fts"))
+    assert row["n"] == 0
+
+
+def test_fts_index_survives_renumbered_rowids(global_db):
+    """VACUUM may renumber metadata_records' implicit rowids; search must not
+    depend on them."""
+    from agent.tools.metadata_store import create_record, delete_record, find_records, update_record
+
+    smartspim = _run(create_record("s", "instrument", {"instrument_id": "SmartSPIM-1"}))["id"]
+    mesoscope = _run(create_record("s", "instrument", {"instrument_id": "Mesoscope-2"}))["id"]
+    # Swap the two rows' rowids, as a table rebuild could.
+    _run(global_db.execute("UPDATE metadata_records SET rowid = -rowid"))
+    _run(global_db.execute("UPDATE metadata_records SET rowid = 3 + rowid"))
+    _run(global_db.execute("VACUUM"))
+
+    assert [r["id"] for r in _run(find_records(query="smartspim"))] == [smartspim]
+    assert [r["id"] for r in _run(find_records(query="mesoscope"))] == [mesoscope]
+    _run(update_record(smartspim, {"instrument_id": "Exaspim-3"}))
+    _run(delete_record(mesoscope))
+    assert [r["id"] for r in _run(find_records(query="exaspim"))] == [smartspim]
+    assert _run(find_records(query="mesoscope")) == []
+    assert _run(find_records(query="smartspim")) == []
+
+
+def test_find_records_punctuation_query_falls_back_to_scan(global_db):
+    from agent.tools.metadata_store import create_record, find_records
+
+    _run(create_record("s", "subject", {"subject_id": "1", "note": "a/b"}))
+    assert len(_run(find_records(query="/"))) == 1
+
+
+def test_migration_backfills_search_index(tmp_path):
+    path = tmp_path / "metadata.db"
+    db = SQLiteDatabase(path, read_pool_size=0)
+    _run(db.init_tables())
+    _run(db.close())
+
+    legacy = sqlite3.connect(path)
+    _drop_added_columns(legacy)
+    legacy.executescript("""
+        DROP TRIGGER records_fts_insert;
+        INSERT INTO metadata_records (id, session_id, record_type, category, data_json)
+            VALUES ('old', 's', 'subject', 'shared', '{"subject_id": "777"}');
+        PRAGMA user_version = 1;
+    """)
+    legacy.close()
+
+    db = SQLiteDatabase(path, read_pool_size=0)
+    _run(db.init_tables())
+    rows = _run(db.fetch("SELECT rowid FROM records_fts WHERE records_fts MATCH '777'"))
+    _run(db.close())
+    assert len(rows) == 1
+
+
+
+def test_migration_rekeys_search_index(tmp_path):
+    """An index keyed on metadata_records' rowid is rebuilt on records_fts_ids."""
+    path = tmp_path / "metadata.db"
+    db = SQLiteDatabase(path, read_pool_size=0)
+    _run(db.init_tables())
+    _run(db.close())
+
+    legacy = sqlite3.connect(path)
+    legacy.executescript("""
+        DROP TRIGGER records_fts_insert;
+        DROP TABLE records_fts_ids;
+        CREATE TRIGGER records_fts_insert AFTER INSERT ON metadata_records BEGIN
+            INSERT INTO records_fts (rowid, name, keys, body)
+                VALUES (new.rowid, new.name, '', new.data_json);
+        END;
+        INSERT INTO metadata_records (id, session_id, record_type, category, data_json)
+            VALUES ('old', 's', 'subject', 'shared', '{"subject_id": "777"}');
+        PRAGMA user_version = 7;
+    """)
+    legacy.close()
+
+    db = SQLiteDatabase(path, read_pool_size=0)
+    _run(db.init_tables())
+    rows = _run(db.fetch(
+        """SELECT k.record_id FROM records_fts AS f
+           JOIN records_fts_ids AS k ON k.fts_rowid = f.rowid
+           WHERE records_fts MATCH '777'"""))
+    trigger = _run(db.fetchrow("SELECT sql FROM sqlite_master WHERE name = 'records_fts_insert'"))
+    _run(db.close())
+    assert [r["record_id"] for r in rows] == ["old"]
+    assert "records_fts_ids" in trigger["sql"]
+
+
+# ---------------------------------------------------------------------------
+# Natural-key lookups
+# ---------------------------------------------------------------------------
+
+
+def test_find_record_by_key_exact_match(global_db):
+    from agent.tools.metadata_store import create_record, find_record_by_key
+
+    numeric = _run(create_record("s", "subject", {"subject_id": 4528}))
+    _run(create_record("s", "subject", {"subject_id": "45280"}))
+    _run(create_record("s", "session", {"subject_id": "4528"}))  # not a subject
+    inst = _run(create_record("s", "instrument", {"instrument_id": "SmartSPIM-1"}))
+
+    assert _run(find_record_by_key("subject", "4528"))["id"] == numeric["id"]
+    assert _run(find_record_by_key("instrument", "SmartSPIM-1"))["id"] == inst["id"]
+    assert _run(find_record_by_key("rig", "nope")) is None
+    with pytest.raises(ValueError):
+        _run(find_record_by_key("session", "x"))
+
+
+def test_find_record_by_key_uses_expression_index(global_db):
+    from agent.db.models import record_key_expr
+
+    plan = _run(global_db.fetch(
+        f"""EXPLAIN QUERY PLAN SELECT * FROM metadata_records
+            WHERE record_type = ? AND {record_key_expr('sqlite', 'subject_id')} = ?""",
+        ("subject", "4528"),
+    ))
+    assert any("idx_records_key_subject" in row["detail"] for row in plan)
+
+
+def test_find_records_tool_key_path(global_db):
+    from agent.tools.capture_mcp import find_records_handler
+    from agent.tools.metadata_store import create_record
+
+    rid = _run(create_record("s", "subject", {"subject_id": "4528"}))["id"]
+    result = json.loads(_run(find_records_handler({"record_type": "subject", "key": "4528"}))["content"][0]["text"])
+    assert [r["id"] for r in result["records"]] == [rid]
+
+    missing = json.loads(_run(find_records_handler({"record_type": "subject", "key": "452"}))["content"][0]["text"])
+    assert missing["count"] == 0
+
+    bad = _run(find_records_handler({"record_type": "session", "key": "x"}))
+    assert json.loads(bad["content"][0]["text"])["status"] == "error"
+
+
+# ---------------------------------------------------------------------------
+# sessions summary table
+# ---------------------------------------------------------------------------
+
+_LEGACY_SESSIONS_SQL = """
+    SELECT session_id, MIN(created_at) AS created_at, MAX(created_at) AS last_active,
+           COUNT(*) AS message_count,
+           (SELECT content FROM conversations c2
+            WHERE c2.session_id = conversations.session_id AND c2.role = 'user'
+            ORDER BY c2.created_at ASC LIMIT 1) AS first_message
+    FROM conversations GROUP BY session_id ORDER BY MAX(created_at) DESC"""
+
+
+def _session_summary(rows):
+    keys = ("session_id", "created_at", "last_active", "message_count", "first_message")
+    return sorted(tuple(r[k] for k in keys) for r in rows)
+
+
+def test_sessions_table_tracks_turns_and_records(global_db):
+    from agent.service import get_sessions
+    from agent.tools.metadata_store import (
+        create_record, delete_record, delete_session, save_conversation_turn,
+    )
+
+    rid = _run(create_record("s1", "subject", {"subject_id": "1"}))["id"]
+    assert _run(get_sessions()) == []  # records alone don't make a chat session
+
+    _run(save_conversation_turn("s1", "assistant", "hi there"))
+    _run(save_conversation_turn("s1", "user", "first question", model="m-1"))
+    _run(save_conversation_turn("s1", "user", "second question"))
+    _run(save_conversation_turn("s2", "user", "other chat"))
+
+    sessions = {s["session_id"]: s for s in _run(get_sessions())}
+    assert sessions["s1"]["message_count"] == 3
+    assert sessions["s1"]["first_message"] == "first question"
+    assert sessions["s1"]["record_count"] == 1
+    assert sessions["s1"]["model"] == "m-1"
+    legacy = _run(global_db.fetch(_LEGACY_SESSIONS_SQL))
+    assert _session_summary(sessions.values()) == _session_summary(legacy)
+
+    _run(delete_record(rid))
+    assert {s["session_id"]: s for s in _run(get_sessions())}["s1"]["record_count"] == 0
+
+    _run(delete_session("s2"))
+    assert [s["session_id"] for s in _run(get_sessions())] == ["s1"]
+
+
+def test_session_timestamps_share_one_format(global_db):
+    """create_record and save_conversation_turn write sessions timestamps
+    the same way, so last_active orders (and pages) as text."""
+    import re
+
+    from agent.tools.metadata_store import create_record, save_conversation_turn
+
+    _run(create_record("records-first", "subject", {"subject_id": "1"}))
+    _run(save_conversation_turn("chat-first", "user", "hi"))
+    _run(create_record("chat-first", "subject", {"subject_id": "2"}))
+
+    rows = _run(global_db.fetch("SELECT created_at, last_active FROM sessions"))
+    turn = _run(global_db.fetchrow("SELECT created_at FROM conversations"))["created_at"]
+    db_format = re.compile(r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$")
+    assert db_format.match(turn)
+    assert all(db_format.match(r["created_at"]) and db_format.match(r["last_active"]) for r in rows)
+
+
+def test_migration_rewrites_iso_session_timestamps(tmp_path):
+    path = tmp_path / "metadata.db"
+    db = SQLiteDatabase(path, read_pool_size=0)
+    _run(db.init_tables())
+    _run(db.close())
+
+    legacy = sqlite3.connect(path)
+    legacy.execute(
+        """INSERT INTO sessions (session_id, created_at, last_active)
+           VALUES ('iso', '2025-01-02T03:04:05.678901+00:00', '2025-01-02T03:04:05.678901+00:00'),
+                  ('db', '2025-01-01 00:00:00', '2025-01-03 00:00:00')""")
+    legacy.execute("PRAGMA user_version = 6")
+    legacy.commit()
+    legacy.close()
+
+    db = SQLiteDatabase(path, read_pool_size=0)
+    _run(db.init_tables())
+    rows = _run(db.fetch("SELECT session_id, created_at, last_active FROM sessions ORDER BY last_active DESC"))
+    _run(db.close())
+    assert rows == [
+        {"session_id": "db", "created_at": "2025-01-01 00:00:00", "last_active": "2025-01-03 00:00:00"},
+        {"session_id": "iso", "created_at": "2025-01-02 03:04:05", "last_active": "2025-01-02 03:04:05"},
+    ]
+
+
+def test_sessions_backfill_matches_group_by(tmp_path):
+    path = tmp_path / "metadata.db"
+    db = SQLiteDatabase(path, read_pool_size=0)
+    _run(db.init_tables())
+    _run(db.close())
+
+    legacy = sqlite3.connect(path)
+    for i in range(30):
+        legacy.execute(
+            "INSERT INTO conversations (session_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+            (f"s{i % 4}", "user" if i % 2 else "assistant", f"msg {i}", f"2025-01-01 00:00:{i:02d}"),
+        )
+    legacy.execute(
+        """INSERT INTO metadata_records (id, session_id, record_type, category, data_json, created_at)
+           VALUES ('r1', 's1', 'subject', 'shared', '{}', '2025-01-01 00:00:00'),
+                  ('r2', 'records-only', 'subject', 'shared', '{}', '2025-01-02 00:00:00')""")
+    _drop_added_columns(legacy)
+    legacy.execute("PRAGMA user_version = 2")
+    legacy.commit()
+    legacy.close()
+
+    db = SQLiteDatabase(path, read_pool_size=0)
+    _run(db.init_tables())
+    sessions = _run(db.fetch("SELECT * FROM sessions"))
+    expected = _run(db.fetch(_LEGACY_SESSIONS_SQL))
+    _run(db.close())
+
+    chats = [s for s in sessions if s["message_count"] > 0]
+    assert _session_summary(chats) == _session_summary(expected)
+    counts = {s["session_id"]: s["record_count"] for s in sessions}
+    assert counts["s1"] == 1 and counts["records-only"] == 1
+
+
+# ---------------------------------------------------------------------------
+# Blob store migration
+# ---------------------------------------------------------------------------
+
+
+def test_migration_moves_uploads_to_digest_columns(tmp_path):
+    """Pre-blob-store databases gain the digest columns and keep their bytes."""
+    path = tmp_path / "metadata.db"
+    db = SQLiteDatabase(path, read_pool_size=0)
+    _run(db.init_tables())
+    _run(db.close())
+
+    legacy = sqlite3.connect(path)
+    _drop_added_columns(legacy)
+    legacy.executescript("""
+        DROP TABLE upload_keyframes;
+        CREATE TABLE upload_keyframes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            upload_id TEXT NOT NULL,
+            frame_idx INTEGER NOT NULL,
+            frame_data BLOB NOT NULL,
+            caption TEXT NOT NULL,
+            created_at TEXT NOT NULL DEFAULT (datetime('now'))
+        );
+        INSERT INTO upload_keyframes (upload_id, frame_idx, frame_data, caption)
+            VALUES ('u1', 0, x'89504e47', 'Frame 0');
+        PRAGMA user_version = 3;
+    """)
+    legacy.close()
+
+    db = SQLiteDatabase(path, read_pool_size=0)
+    _run(db.init_tables())
+    rows = _run(db.fetch("SELECT upload_id, frame_data, frame_digest, caption FROM upload_keyframes"))
+    _run(db.execute(
+        "INSERT INTO upload_keyframes (upload_id, frame_idx, frame_digest, caption) VALUES ('u2', 0, 'd', 'c')"
+    ))
+    _run(db.execute(
+        """INSERT INTO uploads (id, original_filename, content_type, file_path, size_bytes, blob_digest)
+           VALUES ('u2', 'a.png', 'image/png', '/x', 1, 'd')"""
+    ))
+    # Legacy bytes end up after every metadata column.
+    columns = [r["name"] for r in _run(db.fetch("PRAGMA table_info(uploads)"))]
+    _run(db.close())
+    assert columns[-1] == "file_data"
+    assert rows == [{"upload_id": "u1", "frame_data": b"\x89PNG", "frame_digest": None, "caption": "Frame 0"}]
+
+
+# The SQLite schema as of the first release: no sessions table, no
+# user_version.
+_BASELINE_SCHEMA = """
+CREATE TABLE metadata_records (
+    id TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    record_type TEXT NOT NULL,
+    category TEXT NOT NULL,
+    name TEXT,
+    data_json TEXT NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL DEFAULT 'draft',
+    validation_json TEXT,
+    created_at TEXT NOT NULL DEFAULT (datetime('now')),
+    updated_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
+CREATE TABLE record_links (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source_id TEXT NOT NULL REFERENCES metadata_records(id) ON DELETE CASCADE,
+    target_id TEXT NOT NULL REFERENCES metadata_records(id) ON DELETE CASCADE,
+    created_at TEXT NOT NULL DEFAULT (datetime('now')),
+    UNIQUE(source_id, target_id)
+);
+CREATE TABLE conversations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    role TEXT NOT NULL CHECK (role IN ('user', 'assistant')),
+    content TEXT NOT NULL,
+    attachments_json TEXT,
+    created_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
+CREATE TABLE uploads (
+    id TEXT PRIMARY KEY,
+    original_filename TEXT NOT NULL,
+    content_type TEXT NOT NULL,
+    file_path TEXT NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    file_data BLOB,
+    session_id TEXT,
+    extracted_text TEXT,
+    extracted_meta_json TEXT,
+    extraction_status TEXT DEFAULT 'pending',
+    extraction_error TEXT,
+    created_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
+CREATE TABLE artifacts (
+    id TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    artifact_type TEXT NOT NULL,
+    title TEXT NOT NULL,
+    content_json TEXT NOT NULL,
+    language TEXT,
+    created_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
+CREATE TABLE upload_keyframes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    upload_id TEXT NOT NULL,
+    frame_idx INTEGER NOT NULL,
+    frame_data BLOB NOT NULL,
+    caption TEXT NOT NULL,
+    created_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
+"""
+
+
+def test_baseline_database_upgrades_cleanly(tmp_path):
+    """A database from before any migration runs every one of them without
+    tripping over the columns SQLITE_TABLES already created."""
+    from agent.db.models import SQLITE_MIGRATIONS
+
+    path = tmp_path / "metadata.db"
+    legacy = sqlite3.connect(path)
+    legacy.executescript(_BASELINE_SCHEMA)
+    legacy.execute(
+        """INSERT INTO metadata_records (id, session_id, record_type, category, data_json)
+           VALUES ('r1', 's1', 'subject', 'shared', '{"subject_id": "7"}')""")
+    legacy.execute("INSERT INTO conversations (session_id, role, content) VALUES ('s1', 'user', 'hi')")
+    legacy.commit()
+    legacy.close()
+
+    db = SQLiteDatabase(path, read_pool_size=0)
+    _run(db.init_tables())
+    version = _run(db.fetchrow("PRAGMA user_version"))["user_version"]
+    session_columns = {r["name"] for r in _run(db.fetch("PRAGMA table_info(sessions)"))}
+    sessions = _run(db.fetch("SELECT session_id FROM sessions"))
+    _run(db.close())
+    assert version == len(SQLITE_MIGRATIONS)
+    assert {"history_start_id", "history_summary"} <= session_columns
+    assert sessions == [{"session_id": "s1"}]
@@ -0,0 +1,164 @@
+"""Tests for agent/history.py — the token-budgeted chat history window.
+
+Run from repo root:
+    python3 -m pytest evals/tasks/end_to_end/test_history.py -v
+"""
+
+import asyncio
+
+import pytest
+
+from agent.history import fold_summary, load_history_window, summary_line, window_start
+
+_loop = asyncio.new_event_loop()
+
+
+def _run(coro):
+    return _loop.run_until_complete(coro)
+
+
+@pytest.fixture()
+def global_db(tmp_path, monkeypatch):
+    import agent.db.database as db_mod
+
+    monkeypatch.setenv("METADATA_DB_DIR", str(tmp_path))
+    _run(db_mod.close_db())
+    _run(db_mod.init_db())
+    yield _run(db_mod.get_db())
+    _run(db_mod.close_db())
+
+
+def _save(session_id: str, n: int, chars: int = 400, start: int = 0) -> None:
+    from agent.tools.metadata_store import save_conversation_turn
+
+    for i in range(start, start + n):
+        role = "user" if i % 2 == 0 else "assistant"
+        _run(save_conversation_turn(session_id, role, f"turn {i} " + "x" * chars))
+
+
+# ---------------------------------------------------------------------------
+# Pure window / summary logic
+# ---------------------------------------------------------------------------
+
+
+def test_window_start_keeps_everything_under_budget():
+    assert window_start([100] * 10, budget=1000) == 0
+    assert window_start([], budget=1000) == 0
+
+
+def test_window_start_drops_to_low_water_on_overflow():
+    # 1100 > 1000: drop oldest until <= 600.
+    assert window_start([100] * 11, budget=1000, low_water=0.6) == 5
+
+
+def test_window_start_always_keeps_last_turn():
+    assert window_start([10, 10, 5000], budget=1000) == 2
+
+
+def test_fold_summary_caps_and_marks_omissions():
+    turns = [{"role": "user", "content": f"message {i} " + "y" * 100} for i in range(20)]
+    summary = fold_summary(None, turns[:5], max_tokens=10_000)
+    assert summary.splitlines() == [summary_line(t) for t in turns[:5]]
+
+    capped = fold_summary(summary, turns[5:], max_tokens=200)
+    lines = capped.splitlines()
+    assert lines[0] == "- (earlier turns omitted)"
+    assert lines[-1] == summary_line(turns[-1])
+    assert len(capped) // 4 <= 200 + 10
+
+
+def test_summary_line_is_one_clipped_line_with_attachments():
+    line = summary_line({
+        "role": "user",
+        "content": "see\n\nthis   " + "z" * 500,
+        "attachments_json": [{"filename": "rig.png"}],
+    })
+    assert "\n" not in line
+    assert line.startswith("- USER: see this z")
+    assert line.endswith("… [attached: rig.png]")
+
+
+# ---------------------------------------------------------------------------
+# Persisted window
+# ---------------------------------------------------------------------------
+
+
+def test_turns_store_token_estimates(global_db):
+    _save("s", 1, chars=396)
+    row = _run(global_db.fetchrow("SELECT token_estimate FROM conversations"))
+    assert row["token_estimate"] == 101  # "turn 0 " + 396 chars = 403 chars
+
+
+def test_short_session_shows_everything(global_db):
+    _save("s", 6)
+    window = _run(load_history_window("s", budget=10_000))
+    assert len(window.turns) == 5  # newest (the current message) excluded
+    assert window.summary is None
+
+
+def test_long_session_fits_budget_and_persists_summary(global_db):
+    from agent.tools.metadata_store import get_history_state
+
+    _save("s", 30, chars=400)  # ~100 tokens each
+    window = _run(load_history_window("s", budget=1000, summary_tokens=10_000))
+    assert sum(t["token_estimate"] for t in window.turns) <= 600
+    assert window.turns[-1]["content"].startswith("turn 28 ")
+    assert window.summary.splitlines()[0].startswith("- USER: turn 0 ")
+
+    state = _run(get_history_state("s"))
+    assert state["start_id"] == window.turns[0]["id"]
+    assert state["summary"] == window.summary
+
+
+def test_window_is_append_only_until_overflow(global_db):
+    _save("s", 20, chars=400)
+    first = _run(load_history_window("s", budget=1500))
+    _save("s", 4, chars=400, start=20)
+    second = _run(load_history_window("s", budget=1500))
+    # Same start, same summary: the earlier prompt prefix is still valid.
+    assert second.turns[0]["id"] == first.turns[0]["id"]
+    assert second.summary == first.summary
+    assert [t["id"] for t in second.turns[:len(first.turns)]] == [t["id"] for t in first.turns]
+
+
+def test_only_turns_in_window_are_read(global_db, monkeypatch):
+    import agent.history as history
+
+    _save("s", 40, chars=400)
+    _run(load_history_window("s", budget=1000))
+
+    fetched: list[int] = []
+    original = history.get_history_turns
+
+    async def _spy(session_id, start_id=0):
+        rows = await original(session_id, start_id)
+        fetched.append(len(rows))
+        return rows
+
+    monkeypatch.setattr(history, "get_history_turns", _spy)
+    _run(load_history_window("s", budget=1000))
+    assert fetched[0] < 10
+
+
+def test_oversized_turn_is_clipped(global_db):
+    _save("s", 2, chars=50_000)
+    window = _run(load_history_window("s", budget=1000))
+    (turn,) = window.turns
+    assert len(turn["content"]) < 4_100
+    assert turn["content"].endswith("[… truncated to fit the history budget]")
+
+
+def test_turns_without_estimate_fall_back_to_length(global_db):
+    _save("s", 3, chars=396)
+    _run(global_db.execute("UPDATE conversations SET token_estimate = NULL"))
+    window = _run(load_history_window("s", budget=10_000))
+    assert [t["token_estimate"] for t in window.turns] == [101, 101]
+
+
+def test_concurrent_advance_folds_once(global_db):
+    from agent.tools.metadata_store import advance_history, get_history_state
+
+    _save("s", 4)
+    assert _run(advance_history("s", 0, 3, "- USER: a"))
+    assert not _run(advance_history("s", 0, 2, "- USER: b"))
+    assert _run(get_history_state("s")) == {"start_id": 3, "summary": "- USER: a"}
@@ -0,0 +1,153 @@
+"""Tests for agent/media_cache.py and its use in _build_multimodal_content.
+
+Run from repo root:
+    python3 -m pytest evals/tasks/end_to_end/test_media_cache.py -v
+"""
+
+import asyncio
+import base64
+import hashlib
+from unittest.mock import patch
+
+import pytest
+
+from agent.media_cache import MediaCache
+
+_loop = asyncio.new_event_loop()
+
+
+def _run(coro):
+    return _loop.run_until_complete(coro)
+
+
+_TINY_PNG = bytes.fromhex(
+    "89504e470d0a1a0a"
+    "0000000d49484452000000010000000108060000001f15c489"
+    "0000000a49444154789c63000000000200015e9e47f8"
+    "0000000049454e44ae426082"
+)
+
+
+@pytest.fixture()
+def cache(tmp_path, monkeypatch):
+    import agent.media_cache as media_mod
+
+    c = MediaCache(tmp_path / "media", memory_bytes=1024 * 1024, disk_bytes=1024 * 1024)
+    monkeypatch.setattr(media_mod, "_cache", c)
+    return c
+
+
+def test_memory_tier_evicts_least_recently_used(tmp_path):
+    c = MediaCache(None, memory_bytes=250, disk_bytes=0)
+    for key in ("a", "b"):
+        _run(c.put(key, ("image/png", key * 100)))
+    _run(c.get("a"))  # a is now the most recent
+    _run(c.put("c", ("image/png", "c" * 100)))
+    assert _run(c.get("a")) is not None
+    assert _run(c.get("b")) is None
+    assert _run(c.get("c")) is not None
+
+
+def test_disk_tier_survives_restart_and_evicts_by_size(tmp_path):
+    import os
+
+    first = MediaCache(tmp_path, memory_bytes=0, disk_bytes=3200)
+    for i, key in enumerate(("old", "mid", "new")):
+        _run(first.put(key, ("image/jpeg", "x" * 900)))
+        os.utime(tmp_path / key, (1000 + i, 1000 + i))
+
+    restarted = MediaCache(tmp_path, memory_bytes=0, disk_bytes=3200)
+    assert _run(restarted.get("old")) == ("image/jpeg", "x" * 900)  # touches "old"
+
+    _run(restarted.put("newest", ("image/jpeg", "x" * 900)))
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["new", "newest", "old"]
+
+
+def test_rejects_keys_that_are_not_file_names(tmp_path):
+    c = MediaCache(tmp_path, memory_bytes=1024, disk_bytes=1024)
+    with pytest.raises(ValueError):
+        _run(c.get("../escape"))
+
+
+def test_repeat_attachment_is_served_from_cache(cache, tmp_path):
+    from agent.service import _build_multimodal_content
+
+    png = tmp_path / "scope.png"
+    png.write_bytes(_TINY_PNG)
+    digest = hashlib.sha256(_TINY_PNG).hexdigest()
+    att = [{"file_id": "u1", "file_path": str(png), "blob_digest": digest,
+            "content_type": "image/png", "filename": "scope.png"}]
+
+    first = _run(_build_multimodal_content("look", att))
+    png.unlink()  # a hit must not touch the original bytes
+    with patch("agent.service.run_media_prep") as prep:
+        second = _run(_build_multimodal_content("again", att))
+    prep.assert_not_called()
+    assert second[0] == first[0]
+    assert base64.standard_b64decode(second[0]["source"]["data"]) == _TINY_PNG
+    assert cache.stats()["hits"] == 1
+
+
+def test_upload_is_prepared_before_first_chat_turn(cache, tmp_path):
+    from agent.service import _build_multimodal_content, prepare_upload_media
+
+    pdf = tmp_path / "protocol.pdf"
+    pdf.write_bytes(b"%PDF-1.4\n%fake")
+    _run(prepare_upload_media("u2", pdf, "application/pdf", None))  # what /upload schedules
+    pdf.unlink()
+
+    att = [{"file_id": "u2", "file_path": str(pdf), "content_type": "application/pdf", "filename": "protocol.pdf"}]
+    blocks = _run(_build_multimodal_content("summarize", att))
+    assert blocks[0]["type"] == "document"
+    assert base64.standard_b64decode(blocks[0]["source"]["data"]) == b"%PDF-1.4\n%fake"
+
+
+def test_extracted_frames_are_keyed_by_frame_digest(cache, tmp_path, monkeypatch):
+    import agent.blob_store as blob_mod
+    import agent.db.database as db_mod
+    from agent.service import _build_multimodal_content, prepare_frame_media
+    from agent.tools.metadata_store import save_keyframe, save_upload, set_upload_extraction
+
+    monkeypatch.setenv("METADATA_DB_DIR", str(tmp_path))
+    monkeypatch.setenv("BLOB_DIR", str(tmp_path / "blobs"))
+    monkeypatch.setattr(blob_mod, "_store", None)
+    _run(db_mod.close_db())
+    _run(db_mod.init_db())
+    try:
+        _run(save_upload("vid", "clip.mp4", "video/mp4", str(tmp_path / "clip.mp4"), 10))
+        _run(save_keyframe("vid", 0, _TINY_PNG, "Frame at 0.0s"))
+        _run(set_upload_extraction("vid", text="", images=[], meta={}, error=None))
+        _run(prepare_frame_media(_TINY_PNG))  # what the extraction task does
+
+        att = [{"file_id": "vid", "file_path": "", "content_type": "video/mp4", "filename": "clip.mp4"}]
+        with patch("agent.tools.metadata_store.Keyframe.read") as read:
+            blocks = _run(_build_multimodal_content("describe", att))
+        read.assert_not_called()
+        assert blocks[0]["type"] == "image" and blocks[1]["text"] == "[Frame at 0.0s]"
+    finally:
+        _run(db_mod.close_db())
+
+
+def test_missing_frame_blob_is_reported_unavailable(cache, tmp_path, monkeypatch):
+    import agent.blob_store as blob_mod
+    import agent.db.database as db_mod
+    from agent.service import _build_multimodal_content
+    from agent.tools.metadata_store import save_keyframe, save_upload, set_upload_extraction
+
+    monkeypatch.setenv("METADATA_DB_DIR", str(tmp_path))
+    monkeypatch.setenv("BLOB_DIR", str(tmp_path / "blobs"))
+    monkeypatch.setattr(blob_mod, "_store", None)
+    _run(db_mod.close_db())
+    _run(db_mod.init_db())
+    try:
+        _run(save_upload("vid", "clip.mp4", "video/mp4", str(tmp_path / "clip.mp4"), 10))
+        _run(save_keyframe("vid", 0, _TINY_PNG, "Frame at 0.0s"))
+        _run(set_upload_extraction("vid", text="", images=[], meta={}, error=None))
+        # The blob store's disk was lost (e.g. an instance restart).
+        blob_mod.get_blob_store().path(hashlib.sha256(_TINY_PNG).hexdigest()).unlink()
+
+        att = [{"file_id": "vid", "file_path": "", "content_type": "video/mp4", "filename": "clip.mp4"}]
+        blocks = _run(_build_multimodal_content("describe", att))
+        assert blocks[0] == {"type": "text", "text": "[Frame at 0.0s: frame unavailable]"}
+    finally:
+        _run(db_mod.close_db())
@@ -728,3 +728,130 @@ def test_messages_include_attachments(client):
     assert msg["attachments_json"] is not None
     atts = msg["attachments_json"] if isinstance(msg["attachments_json"], list) else json.loads(msg["attachments_json"])
     assert atts[0]["file_id"] == "f1"
+
+
+# ---------------------------------------------------------------------------
+# Test 36: GET /records — keyset pagination
+# ---------------------------------------------------------------------------
+
+
+def test_records_keyset_pagination(client):
+    from agent.tools.metadata_store import create_record
+
+    ids = {_run(create_record("page-session", "subject", {"subject_id": str(i)}))["id"] for i in range(7)}
+
+    seen: list[str] = []
+    cursor = None
+    pages = 0
+    while True:
+        params = {"limit": 3, **({"after": cursor} if cursor else {})}
+        resp = _run(client.get("/records", params=params))
+        assert resp.status_code == 200
+        page = resp.json()
+        assert len(page) <= 3
+        seen.extend(r["id"] for r in page)
+        pages += 1
+        cursor = resp.headers.get("x-next-cursor")
+        if cursor is None:
+            break
+
+    assert pages == 3
+    assert len(seen) == len(set(seen)) == 7
+    assert set(seen) == ids
+
+    # No limit → everything, as before.
+    assert len(_run(client.get("/records")).json()) == 7
+    assert _run(client.get("/records", params={"after": "garbage!"})).status_code == 400
+
+
+# ---------------------------------------------------------------------------
+# Test 37: GET /records — field projection
+# ---------------------------------------------------------------------------
+
+
+def test_records_field_projection(client):
+    from agent.tools.metadata_store import create_record
+
+    _run(create_record("proj-session", "subject", {"subject_id": "1"}))
+    resp = _run(client.get("/records", params={"fields": "name,record_type,status"}))
+    assert resp.status_code == 200
+    (record,) = resp.json()
+    assert set(record) == {"id", "created_at", "name", "record_type", "status"}
+
+    bad = _run(client.get("/records", params={"fields": "name,secret"}))
+    assert bad.status_code == 400
+
+
+# ---------------------------------------------------------------------------
+# Test 38: GET /sessions — keyset pagination
+# ---------------------------------------------------------------------------
+
+
+def test_sessions_keyset_pagination(client):
+    from agent.tools.metadata_store import save_conversation_turn
+
+    for i in range(5):
+        _run(save_conversation_turn(f"paged-{i}", "user", f"hello {i}"))
+
+    first = _run(client.get("/sessions", params={"limit": 2}))
+    assert [s["session_id"] for s in first.json()] == ["paged-4", "paged-3"]
+    cursor = first.headers["x-next-cursor"]
+
+    second = _run(client.get("/sessions", params={"limit": 10, "after": cursor}))
+    assert [s["session_id"] for s in second.json()] == ["paged-2", "paged-1", "paged-0"]
+    assert "x-next-cursor" not in second.headers
+
+
+# ---------------------------------------------------------------------------
+# Test 39: uploads go to the blob store, deduplicated
+# ---------------------------------------------------------------------------
+
+
+def test_uploads_stored_once_in_blob_store(client, tmp_path, monkeypatch):
+    import agent.blob_store as blob_mod
+    from agent.db.database import get_db
+
+    monkeypatch.setenv("BLOB_DIR", str(tmp_path / "blobs"))
+    monkeypatch.setattr(blob_mod, "_store", None)
+
+    png_bytes = b'\x89PNG\r\n\x1a\n' + b'\x01' * 64
+    ids = [
+        _run(client.post("/upload", files={"file": (f"img{i}.png", png_bytes, "image/png")})).json()["id"]
+        for i in range(2)
+    ]
+
+    db = _run(get_db())
+    rows = _run(db.fetch("SELECT file_path, file_data, blob_digest FROM uploads ORDER BY id"))
+    assert all(r["file_data"] is None for r in rows)
+    assert rows[0]["blob_digest"] == rows[1]["blob_digest"]
+    assert len([p for p in (tmp_path / "blobs").rglob("*") if p.is_file()]) == 1
+
+    # Local copy gone (ephemeral filesystem): served from the store.
+    for r in rows:
+        Path(r["file_path"]).unlink()
+    resp = _run(client.get(f"/uploads/{ids[0]}"))
+    assert resp.status_code == 200
+    assert resp.content == png_bytes
+
+
+# ---------------------------------------------------------------------------
+# Test 40: get_record tool returns full data
+# ---------------------------------------------------------------------------
+
+
+def test_get_record_tool(setup_db):
+    from agent.tools.capture_mcp import capture_metadata_handler, get_record_handler
+
+    created = _run(capture_metadata_handler({
+        "session_id": "s1",
+        "record_type": "instrument",
+        "data": {"instrument_id": "scope-1", "components": [{"name": "objective"}]},
+    }))
+    record_id = json.loads(created["content"][0]["text"])["record_id"]
+
+    parsed = json.loads(_run(get_record_handler({"record_id": record_id}))["content"][0]["text"])
+    assert parsed["data"]["components"] == [{"name": "objective"}]
+    assert parsed["validation"]["status"]
+
+    missing = json.loads(_run(get_record_handler({"record_id": "nope"}))["content"][0]["text"])
+    assert missing["status"] == "error"
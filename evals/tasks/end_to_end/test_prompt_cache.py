@@ -0,0 +1,204 @@
+"""Tests for prompt-prefix caching in agent/service.py chat().
+
+The SDK's query() is replaced by a stand-in that replays recorded assistant
+replies and reports usage the way the Messages API's prompt cache would:
+a request reads from cache the longest prefix (system prompt + content
+blocks) that an earlier request wrote at a cache_control breakpoint, and
+writes a new entry at each of its own breakpoints.
+
+Run from repo root:
+    python3 -m pytest evals/tasks/end_to_end/test_prompt_cache.py -v
+"""
+
+import asyncio
+import json
+
+import pytest
+from claude_agent_sdk import ResultMessage
+
+_loop = asyncio.new_event_loop()
+
+
+def _run(coro):
+    return _loop.run_until_complete(coro)
+
+
+RECORDED_REPLIES = [
+    "Got it — I've noted subject 4528.",
+    "Recorded the Pvalb-IRES-Cre/wt genotype.",
+    "The session started at 09:00.",
+    "Linked the session to subject 4528.",
+]
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class PromptCacheStandIn:
+    """Recorded-response stand-in for claude_agent_sdk.query()."""
+
+    def __init__(self, replies: list[str]):
+        self.replies = list(replies)
+        self.cache: set[tuple[str, ...]] = set()
+        self.requests: list = []
+
+    def _usage(self, system: str, content) -> dict:
+        if isinstance(content, str):
+            return {"input_tokens": _tokens(system) + _tokens(content), "output_tokens": 10}
+        # Markers aren't part of the cached content: a breakpoint that moves
+        # between turns doesn't invalidate the prefix before it.
+        texts = [system] + [
+            json.dumps({k: v for k, v in b.items() if k != "cache_control"}, sort_keys=True)
+            for b in content
+        ]
+        cost = [_tokens(t) for t in texts]
+        breakpoints = [i + 2 for i, b in enumerate(content) if "cache_control" in b]
+
+        read_upto = max((n for n in range(1, len(texts) + 1) if tuple(texts[:n]) in self.cache), default=0)
+        write_upto = max(breakpoints, default=0)
+        for n in breakpoints:
+            self.cache.add(tuple(texts[:n]))
+        read = sum(cost[:read_upto])
+        written = sum(cost[read_upto:write_upto]) if write_upto > read_upto else 0
+        return {
+            "input_tokens": sum(cost) - read - written,
+            "cache_read_input_tokens": read,
+            "cache_creation_input_tokens": written,
+            "output_tokens": 10,
+        }
+
+    async def query(self, *, prompt, options):
+        async for message in prompt:
+            content = message["message"]["content"]
+        self.requests.append(content)
+        yield ResultMessage(
+            subtype="success", duration_ms=5, duration_api_ms=5, is_error=False,
+            num_turns=1, session_id="sdk", usage=self._usage(options.system_prompt, content),
+            result=self.replies.pop(0),
+        )
+
+
+@pytest.fixture()
+def stand_in(tmp_path, monkeypatch):
+    import agent.db.database as db_mod
+    import agent.service as service
+    from agent.metrics import usage_metrics
+
+    monkeypatch.setenv("METADATA_DB_DIR", str(tmp_path))
+    monkeypatch.setenv("SKIP_AIND_MCP", "1")
+    _run(db_mod.close_db())
+    _run(db_mod.init_db())
+    fake = PromptCacheStandIn(RECORDED_REPLIES)
+    monkeypatch.setattr(service, "query", fake.query)
+    monkeypatch.setattr(service, "get_pool", lambda: None)
+    usage_metrics.reset()
+    yield fake
+    usage_metrics.reset()
+    _run(db_mod.close_db())
+
+
+def _chat(session_id: str, message: str) -> list[dict]:
+    from agent.service import chat
+
+    async def _collect():
+        return [evt async for evt in chat(session_id, message)]
+
+    return _run(_collect())
+
+
+def test_repeat_turns_read_history_from_cache(stand_in):
+    from agent.metrics import usage_metrics
+    from agent.tools.metadata_store import create_record
+
+    _chat("s1", "Subject 4528")
+    _chat("s1", "Genotype is Pvalb-IRES-Cre/wt")
+    # A record changes between turns: only the records block is re-read.
+    _run(create_record("s1", "subject", {"subject_id": "4528"}))
+    _chat("s1", "Session started 09:00")
+    _chat("s1", "Link them")
+
+    turns = usage_metrics.snapshot()["recent_turns"]
+    assert [t["session_id"] for t in turns] == ["s1"] * 4
+    assert turns[0]["cached_input_tokens"] == 0
+    for prev, turn in zip(turns, turns[1:]):
+        # Everything the previous turn marked is now read from cache...
+        assert turn["cached_input_tokens"] > prev["cached_input_tokens"]
+        # ...so only the new tail is processed fresh.
+        assert turn["uncached_input_tokens"] < turn["cached_input_tokens"]
+
+    last = stand_in.requests[-1]
+    assert last[-1]["text"] == "USER: Link them"
+    assert "cache_control" not in last[-1]
+    records_block = last[-2]
+    assert "Existing metadata records" in records_block["text"] and "cache_control" in records_block
+    assert [b["text"] for b in last if b["text"].startswith("ASSISTANT:")] == [
+        f"ASSISTANT: {r}" for r in RECORDED_REPLIES[:3]
+    ]
+
+
+def test_prompt_cache_kill_switch(stand_in, monkeypatch):
+    import agent.service as service
+
+    monkeypatch.setattr(service, "_PROMPT_CACHE", False)
+    _chat("s2", "hello")
+    _chat("s2", "again")
+    prompt = stand_in.requests[-1]
+    assert isinstance(prompt, str)
+    assert "Previous conversation:" in prompt and prompt.rstrip().endswith('session_id="s2"')
+
+
+def test_metrics_endpoint(stand_in):
+    from httpx import ASGITransport, AsyncClient
+
+    from agent.server import app
+
+    _chat("s3", "hello")
+
+    async def _get():
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://testserver") as c:
+            return await c.get("/metrics")
+
+    body = _run(_get()).json()["usage"]
+    assert body["turns"] == 1
+    assert body["uncached_input_tokens"] > 0
+    assert set(body["recent_turns"][0]) >= {"cached_input_tokens", "uncached_input_tokens", "output_tokens"}
+
+
+def test_records_context_sends_full_data_only_for_changed_records(stand_in):
+    from agent.db.database import get_db
+    from agent.tools.metadata_store import create_record, update_record
+
+    def _records_block() -> str:
+        return next(b["text"] for b in stand_in.requests[-1] if "Existing metadata records" in b["text"])
+
+    _chat("s4", "Subject 4528")
+    subject = _run(create_record("s4", "subject", {"subject_id": "4528", "genotype": "Pvalb-IRES-Cre/wt"}))
+    _chat("s4", "Genotype is Pvalb-IRES-Cre/wt")
+    assert '"genotype": "Pvalb-IRES-Cre/wt"' in _records_block()
+
+    # Captured two turns ago: summarised, with a pointer to get_record.
+    db = _run(get_db())
+    _run(db.execute("UPDATE metadata_records SET updated_at = '2000-01-01T00:00:00+00:00'"))
+    _chat("s4", "Session started 09:00")
+    block = _records_block()
+    assert "Pvalb" not in block and "get_record" in block
+    assert f"id={subject['id']}" in block and "fields: subject_id, genotype" in block
+
+    _run(update_record(subject["id"], data={"sex": "Male"}))
+    _chat("s4", "Link them")
+    assert '"sex": "Male"' in _records_block()
+
+
+def test_records_context_full_mode(stand_in, monkeypatch):
+    import agent.service as service
+    from agent.db.database import get_db
+    from agent.tools.metadata_store import create_record
+
+    monkeypatch.setattr(service, "_COMPACT_RECORDS", False)
+    _run(create_record("s5", "subject", {"subject_id": "4528", "genotype": "Pvalb-IRES-Cre/wt"}))
+    db = _run(get_db())
+    _run(db.execute("UPDATE metadata_records SET updated_at = '2000-01-01T00:00:00+00:00'"))
+    _chat("s5", "hello")
+    _chat("s5", "again")
+    assert '"genotype": "Pvalb-IRES-Cre/wt"' in stand_in.requests[-1][-2]["text"]
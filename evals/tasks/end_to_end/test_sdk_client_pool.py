@@ -0,0 +1,335 @@
+"""Tests for agent/sdk_client_pool.py — per-model warm clients.
+
+Uses a stand-in for ClaudeSDKClient, so no `claude` CLI is spawned.
+
+Run from repo root:
+    python3 -m pytest evals/tasks/end_to_end/test_sdk_client_pool.py -v
+"""
+
+import asyncio
+import itertools
+
+import agent.sdk_client_pool as pool_mod
+from agent.sdk_client_pool import SDKClientPool, parse_pool_models
+
+_loop = asyncio.new_event_loop()
+
+
+def _run(coro):
+    return _loop.run_until_complete(coro)
+
+
+class _StubClient:
+    """Answers every query with one message naming the client and model."""
+
+    ids = itertools.count(1)
+    connect_delay = 0.01
+    reply_delay = 0.05
+    mcp_status = "connected"
+    status_delay = 0.0
+
+    def __init__(self, options):
+        self.model = options  # the tests' options_factory returns the model name
+        self.id = next(self.ids)
+
+    async def connect(self):
+        await asyncio.sleep(self.connect_delay)
+
+    async def query(self, prompt):
+        self.prompt = prompt
+
+    async def receive_response(self):
+        await asyncio.sleep(self.reply_delay)
+        yield {"client": self.id, "model": self.model, "prompt": self.prompt}
+
+    async def get_mcp_status(self):
+        await asyncio.sleep(self.status_delay)
+        return {"mcpServers": [{"name": "aind-data-mcp", "status": self.mcp_status}]}
+
+    async def disconnect(self):
+        pass
+
+
+def _pool(**kwargs) -> SDKClientPool:
+    kwargs.setdefault("models", {"sonnet": 1})
+    return SDKClientPool(lambda model: model, "sonnet", client_factory=_StubClient, **kwargs)
+
+
+async def _ask(pool: SDKClientPool, prompt: str, model: str | None = None) -> dict | None:
+    pooled = pool.dispatch(prompt, model)
+    if pooled is None:
+        return None
+    return [msg async for msg in pooled][0]
+
+
+def test_parse_pool_models():
+    assert parse_pool_models("", "sonnet") == {"sonnet": 1}
+    assert parse_pool_models("sonnet:2, haiku", "sonnet") == {"sonnet": 2, "haiku": 1}
+
+
+def test_each_model_gets_its_own_clients():
+    async def scenario():
+        pool = _pool(warm_spares=0)
+        pool.start()
+        assert await pool.await_warm(1)
+        sonnet = await _ask(pool, "hi")
+        cold = await _ask(pool, "hi", "haiku")  # no haiku client yet: caller falls back
+        await asyncio.sleep(0.05)
+        haiku = await _ask(pool, "hi", "haiku")
+        stats = pool.stats()
+        await pool.shutdown()
+        return sonnet, cold, haiku, stats
+
+    sonnet, cold, haiku, stats = _run(scenario())
+    assert sonnet["model"] == "sonnet"
+    assert cold is None
+    assert haiku["model"] == "haiku" and haiku["client"] != sonnet["client"]
+    assert stats["haiku"]["warm"] == 1
+
+
+def test_concurrent_queries_go_to_the_least_loaded_client():
+    async def scenario():
+        pool = _pool(models={"sonnet": 3}, warm_spares=0)
+        pool.start()
+        while sum(w.is_warm for w in pool._workers["sonnet"]) < 3:
+            await asyncio.sleep(0.01)
+        return await asyncio.gather(*(_ask(pool, f"q{i}") for i in range(3))), pool
+
+    replies, pool = _run(scenario())
+    _run(pool.shutdown())
+    assert len({r["client"] for r in replies}) == 3
+
+
+def test_busy_client_gets_a_warm_spare_up_to_max():
+    async def scenario():
+        pool = _pool(warm_spares=1, max_workers=2)
+        pool.start()
+        await pool.await_warm(1)
+        await asyncio.sleep(0.05)
+        before = len(pool._workers["sonnet"])
+        busy = [asyncio.create_task(_ask(pool, f"q{i}")) for i in range(3)]
+        await asyncio.sleep(0.03)
+        during = len(pool._workers["sonnet"])
+        await asyncio.gather(*busy)
+        await pool.shutdown()
+        return before, during
+
+    before, during = _run(scenario())
+    assert before == 1  # the one idle client is the spare
+    assert during == 2  # busy, so a spare was started, but capped at max_workers
+
+
+def test_stale_client_is_replaced_without_going_cold():
+    async def scenario():
+        pool = _pool(warm_spares=0)
+        pool.start()
+        await pool.await_warm(1)
+        first = await _ask(pool, "before")
+        old = pool._workers["sonnet"][0]
+        old.stale = True
+        pool._rebalance("sonnet")
+        warm_throughout = True
+        while old in pool._workers["sonnet"]:
+            warm_throughout &= pool.is_warm_for("sonnet")
+            await asyncio.sleep(0.002)
+        reply = await _ask(pool, "after")
+        workers = list(pool._workers["sonnet"])
+        await pool.shutdown()
+        return old, warm_throughout, first, reply, workers
+
+    old, warm_throughout, first, reply, workers = _run(scenario())
+    assert warm_throughout
+    assert len(workers) == 1 and workers[0] is not old
+    assert reply["client"] != first["client"]  # served by the replacement
+    assert old.retiring
+
+
+def test_failed_query_replaces_the_client():
+    class _Flaky(_StubClient):
+        async def receive_response(self):
+            raise BrokenPipeError("CLI exited")
+            yield
+
+    async def scenario():
+        pool = SDKClientPool(lambda m: m, "sonnet", models={"sonnet": 1}, warm_spares=0, client_factory=_Flaky)
+        pool.start()
+        await pool.await_warm(1)
+        try:
+            await _ask(pool, "boom")
+        except BrokenPipeError as exc:
+            error = exc
+        await asyncio.sleep(0.01)
+        state = pool.is_warm_for("sonnet"), pool._not_before["sonnet"] > 0
+        await pool.shutdown()
+        return error, state
+
+    error, (warm, backoff) = _run(scenario())
+    assert "CLI exited" in str(error)
+    assert not warm and backoff  # the replacement waits RECONNECT_DELAY_S
+
+
+def test_watchdog_pings_idle_workers_and_replaces_failed_ones(monkeypatch):
+    async def scenario():
+        pool = _pool(warm_spares=0)
+        pool.start()
+        await pool.await_warm(1)
+        old = pool._workers["sonnet"][0]
+        await pool._probe()
+        healthy = old.stale, pool.stats()["sonnet"]["cli_ping_ms"]
+        monkeypatch.setattr(_StubClient, "mcp_status", "failed")
+        await pool._probe()
+        failed = old.stale
+        while old in pool._workers["sonnet"]:
+            await asyncio.sleep(0.005)
+        warm = pool.is_warm_for("sonnet")
+        await pool.shutdown()
+        return healthy, failed, warm
+
+    (stale_when_healthy, ping_ms), stale_when_failed, warm = _run(scenario())
+    assert not stale_when_healthy and ping_ms["count"] == 1
+    assert stale_when_failed and warm
+
+
+def test_hung_ping_takes_the_worker_out_of_rotation(monkeypatch):
+    """A CLI that never answers the ping stops getting chats and exits,
+    rather than leaving the worker stuck behind the request."""
+    monkeypatch.setattr(pool_mod, "PING_TIMEOUT_S", 0.05)
+
+    async def scenario():
+        pool = _pool(warm_spares=0)
+        pool.start()
+        await pool.await_warm(1)
+        old = pool._workers["sonnet"][0]
+        monkeypatch.setattr(_StubClient, "status_delay", 3600)
+        await pool._probe()
+        out_of_rotation = not old.is_warm  # dispatch only picks warm workers
+        await asyncio.wait_for(old._task, 1)
+        failure = old.failure
+        monkeypatch.setattr(_StubClient, "status_delay", 0.0)
+        await pool.await_warm(1)
+        replaced = pool._workers["sonnet"][0] is not old
+        await pool.shutdown()
+        return out_of_rotation, failure, replaced
+
+    out_of_rotation, failure, replaced = _run(scenario())
+    assert out_of_rotation and failure == "ping" and replaced
+
+
+def test_only_a_streak_of_slow_pings_replaces_a_worker(monkeypatch):
+    monkeypatch.setattr(pool_mod, "SDK_POOL_PING_SLOW_MS", 20)
+
+    async def scenario():
+        pool = _pool(warm_spares=0)
+        pool.start()
+        await pool.await_warm(1)
+        worker = pool._workers["sonnet"][0]
+        for _ in range(5):
+            await pool._probe()  # baseline: fast pings
+        monkeypatch.setattr(_StubClient, "status_delay", 0.04)
+        stale = []
+        for _ in range(3):
+            await pool._probe()
+            stale.append(worker.stale)
+        await pool.shutdown()
+        return stale
+
+    assert _run(scenario()) == [False, False, True]
+
+
+# ---------------------------------------------------------------------------
+# Session affinity
+# ---------------------------------------------------------------------------
+
+
+def test_pin_takes_an_unused_client_out_of_rotation():
+    async def scenario():
+        pool = _pool(warm_spares=1, pinned_max=1)
+        pool.start()
+        await pool.await_warm(1)
+        worker = pool.pin("s1", None)
+        await asyncio.sleep(0.05)  # a replacement spare connects
+        [m async for m in pool.dispatch("q", None)]  # served by the spare, not the pinned client
+        again = pool.pinned("s1", None)
+        other_model = pool.pinned("s1", "haiku")  # pinned to sonnet: dropped
+        stats = pool.stats()
+        await pool.shutdown()
+        return worker, again, other_model, stats
+
+    worker, again, other_model, stats = _run(scenario())
+    assert worker is not None and again is worker and worker.served == 0
+    assert other_model is None and worker.retiring
+    assert stats["sonnet"]["workers"] >= 2
+
+
+def test_pinned_sessions_are_evicted_lru():
+    async def scenario():
+        pool = _pool(models={"sonnet": 3}, warm_spares=0, pinned_max=2)
+        pool.start()
+        while sum(w.is_warm for w in pool._workers["sonnet"]) < 3:
+            await asyncio.sleep(0.01)
+        a = pool.pin("a", None)
+        b = pool.pin("b", None)
+        [m async for m in pool.dispatch_to(a, "a again")]  # b is now least recently used
+        while sum(w.is_warm and w.served == 0 and w.session_id is None for w in pool._workers["sonnet"]) < 1:
+            await asyncio.sleep(0.01)
+        c = pool.pin("c", None)
+        result = (pool.pinned("a", None), pool.pinned("b", None), pool.pinned("c", None))
+        await pool.shutdown()
+        return (a, b, c), result
+
+    (a, b, c), (pa, pb, pc) = _run(scenario())
+    assert c is not None
+    assert pa is a and pb is None and pc is c
+    assert b.retiring
+
+
+def test_chat_sends_only_the_new_turn_to_a_pinned_client(tmp_path, monkeypatch):
+    from claude_agent_sdk import ResultMessage
+
+    import agent.db.database as db_mod
+    import agent.service as service
+
+    class _Recording(_StubClient):
+        prompts: list = []
+
+        async def query(self, prompt):
+            if not isinstance(prompt, str):
+                prompt = [m async for m in prompt][0]["message"]["content"]
+            self.prompts.append((self.id, prompt))
+
+        async def receive_response(self):
+            yield ResultMessage(subtype="success", duration_ms=1, duration_api_ms=1, is_error=False,
+                                num_turns=1, session_id="sdk", result=f"reply {len(self.prompts)}")
+
+    monkeypatch.setenv("METADATA_DB_DIR", str(tmp_path))
+    monkeypatch.setenv("USE_SDK_POOL", "1")
+    monkeypatch.setattr(service, "_SESSION_AFFINITY", True)
+    _run(db_mod.close_db())
+    _run(db_mod.init_db())
+    pool = SDKClientPool(lambda m: m, service.DEFAULT_MODEL, models={service.DEFAULT_MODEL: 1},
+                         warm_spares=1, client_factory=_Recording)
+    monkeypatch.setattr(service, "get_pool", lambda: pool)
+
+    async def scenario():
+        pool.start()
+        await pool.await_warm(1)
+        for text in ("first", "second", "third"):
+            [e async for e in service.chat("s", text)]
+        pool.unpin(pool.pinned("s", None))  # evicted: next turn rebuilds from the DB
+        await asyncio.sleep(0.05)
+        [e async for e in service.chat("s", "fourth")]
+        await pool.shutdown()
+
+    try:
+        _run(scenario())
+    finally:
+        _run(db_mod.close_db())
+
+    def flat(prompt) -> str:
+        return prompt if isinstance(prompt, str) else "".join(b.get("text", "") for b in prompt)
+
+    (c1, p1), (c2, p2), (c3, p3), (c4, p4) = _Recording.prompts
+    assert c1 == c2 == c3 and c4 != c1
+    assert 'session_id="s"' in flat(p1)
+    assert p2 == "USER: second" and p3 == "USER: third"
+    assert "USER: third" in flat(p4) and "reply 3" in flat(p4)  # history replayed after eviction
@@ -0,0 +1,101 @@
+"""Tests for agent/sse.py — coalesced SSE framing of the chat stream.
+
+Run from repo root:
+    python3 -m pytest evals/tasks/end_to_end/test_sse.py -v
+"""
+
+import asyncio
+import json
+import time
+
+from agent.sse import DONE, add_event, sse_body
+
+_loop = asyncio.new_event_loop()
+
+
+def _run(coro):
+    return _loop.run_until_complete(coro)
+
+
+async def _numbered(events):
+    """(seq, event) pairs ending in DONE, like a chat run's log."""
+    seq = 0
+    async for event in events:
+        seq += 1
+        yield seq, event
+    yield seq + 1, DONE
+
+
+async def _collect(events, flush_interval):
+    writes = []
+    async for chunk in sse_body(_numbered(events), flush_interval):
+        writes.append((time.perf_counter(), chunk))
+    return writes
+
+
+def _frames(writes, with_ids: bool = False) -> list:
+    body = b"".join(chunk for _, chunk in writes).decode()
+    out = []
+    for frame in body.split("\n\n")[:-1]:
+        lines = dict(line.split(": ", 1) for line in frame.split("\n"))
+        data = lines["data"] if lines["data"] == DONE else json.loads(lines["data"])
+        out.append((int(lines["id"]) if "id" in lines else None, data) if with_ids else data)
+    return out
+
+
+def test_adjacent_deltas_of_one_kind_merge():
+    batch = []
+    for seq, evt in enumerate(({"content": "Hel"}, {"content": "lo"}, {"tool_use_start": {"name": "t", "id": "1"}},
+                               {"tool_use_input": '{"a"'}, {"tool_use_input": ": 1}"}, {"block_stop": True},
+                               {"thinking": "x"}, {"content": "!"}), start=1):
+        add_event(batch, (seq, evt))
+    assert batch == [
+        (2, {"content": "Hello"}), (3, {"tool_use_start": {"name": "t", "id": "1"}}),
+        (5, {"tool_use_input": '{"a": 1}'}), (6, {"block_stop": True}), (7, {"thinking": "x"}), (8, {"content": "!"}),
+    ]
+
+
+def test_burst_is_one_write_and_text_is_unchanged():
+    async def events():
+        for i in range(200):
+            yield {"content": f"tok{i} "}
+            await asyncio.sleep(0)
+
+    writes = _run(_collect(events(), flush_interval=0.05))
+    frames = _frames(writes)
+    assert frames[-1] == "[DONE]"
+    assert "".join(f["content"] for f in frames[:-1]) == "".join(f"tok{i} " for i in range(200))
+    assert len(writes) <= 3
+
+
+def test_first_token_is_not_held_for_the_window():
+    async def events():
+        yield {"content": "first"}
+        await asyncio.sleep(0.3)
+        yield {"content": "second"}
+
+    t0 = time.perf_counter()
+    writes = _run(_collect(events(), flush_interval=0.2))
+    first_at, _ = writes[0]
+    assert _frames(writes[:1]) == [{"content": "first"}]
+    assert first_at - t0 < 0.1
+
+
+def test_zero_window_writes_every_event():
+    async def events():
+        for text in ("a", "b", "c"):
+            yield {"content": text}
+
+    writes = _run(_collect(events(), flush_interval=0))
+    assert _frames(writes, with_ids=True) == [
+        (1, {"content": "a"}), (2, {"content": "b"}), (3, {"content": "c"}), (4, "[DONE]"),
+    ]
+
+
+def test_producer_error_becomes_error_frame():
+    async def events():
+        yield {"content": "partial"}
+        raise RuntimeError("boom")
+
+    frames = _frames(_run(_collect(events(), flush_interval=0.01)), with_ids=True)
+    assert frames == [(1, {"content": "partial"}), (None, {"error": "boom"})]
@@ -13,12 +13,8 @@ import tempfile
 from pathlib import Path
 from unittest.mock import AsyncMock, patch
 
-from agent.service import (
-    _IMAGE_MAX_RAW_BYTES,
-    _build_multimodal_content,
-    _format_conversation_context,
-    _resize_image_for_api,
-)
+from agent.media_prep import _IMAGE_MAX_RAW_BYTES, _resize_image_for_api
+from agent.service import _build_multimodal_content, _format_conversation_context
 
 # Sync tests drive coroutines via run_until_complete — same pattern as
 # test_extractors.py. Keeps us independent of the session-scoped conftest loop.
@@ -215,7 +211,7 @@ def test_multiple_attachments_preserve_order():
         {"file_id": "second", "content_type": "text/plain", "filename": "b.txt", "file_path": ""},
     ]
 
-    async def fake_get(fid):
+    async def fake_get(fid, **_):
         return _ext(text=f"content from {fid}")
 
     blocks = _build("compare", atts, AsyncMock(side_effect=fake_get))
@@ -513,6 +509,57 @@ def test_resize_garbage_bytes_passthrough():
     assert mt == "image/png"
 
 
+def _png_bytes(img, **save_kwargs) -> bytes:
+    import io
+    buf = io.BytesIO()
+    img.save(buf, format="PNG", **save_kwargs)
+    return buf.getvalue()
+
+
+def test_resize_flat_diagram_stays_png():
+    import io
+    from PIL import Image, ImageDraw
+    img = Image.new("RGB", (2400, 1800), (255, 255, 255))
+    draw = ImageDraw.Draw(img)
+    for i in range(60):
+        draw.rectangle((i * 35, i * 25, i * 35 + 300, i * 25 + 200), outline=(i * 4, 90, 200), width=5)
+    raw = _png_bytes(img, compress_level=0)  # e.g. a fast-save export
+    assert len(raw) > _IMAGE_MAX_RAW_BYTES
+    out, mt = _resize_image_for_api(raw, "image/png")
+    assert mt == "image/png"
+    decoded = Image.open(io.BytesIO(out))
+    assert decoded.mode == "P"
+    assert decoded.size == (1568, 1176)
+
+
+def test_resize_screenshot_encoded_as_webp(monkeypatch):
+    from PIL import Image, ImageDraw
+    monkeypatch.setattr("agent.media_prep._IMAGE_MAX_RAW_BYTES", 100_000)
+    img = Image.new("RGB", (2400, 1600), (250, 250, 252))
+    draw = ImageDraw.Draw(img)
+    for y in range(40, 1560, 28):
+        draw.text((40, y), "craniotomy AAV titer bregma lambda depth " * 6, fill=(20, 20, 20))
+    raw = _png_bytes(img)
+    assert len(raw) > 100_000
+    out, mt = _resize_image_for_api(raw, "image/png")
+    assert mt == "image/webp"
+    assert out[:4] == b"RIFF" and out[8:12] == b"WEBP"
+    assert len(out) <= 100_000
+
+
+def test_quality_search_fits_in_three_encodes():
+    import random
+    from PIL import Image
+    from agent import media_prep
+    random.seed(2)
+    img = Image.frombytes("RGB", (1000, 1000), bytes(random.randrange(256) for _ in range(3_000_000)))
+    with patch("agent.media_prep._encode", wraps=media_prep._encode) as enc:
+        out, quality = media_prep._encode_to_fit(img, "JPEG", 400_000)
+    assert enc.call_count <= 3
+    assert len(out) <= 400_000
+    assert media_prep._QUALITY_MIN < quality < media_prep._QUALITY_MAX
+
+
 def test_build_multimodal_resizes_oversized_native_image():
     """End-to-end: oversized PNG on disk → resized JPEG in content block."""
     big = _make_png(1400, 1400, noise=True)
@@ -256,6 +256,8 @@ interface StructuredMessage {
    * then a derived label for the session title, not user-authored text,
    * and shouldn't be rendered in the bubble. */
   attachmentOnly?: boolean;
+  /** While the run waits for a free agent: its place in the queue. */
+  queuePosition?: number;
 }
 
 // ---------------------------------------------------------------------------
@@ -1055,6 +1057,13 @@ export default function ChatPanel({ sessionId, newChatNonce, onSessionChange, ag
         const last = msgs[msgs.length - 1];
         if (!last || last.role !== 'assistant') return;
 
+        if (event.queue_position !== undefined) {
+          const queuePosition = (event.queue_position as number) || undefined;
+          entry.messages = [...msgs.slice(0, -1), { ...last, queuePosition }];
+          notify(false);
+          return;
+        }
+
         const blocks: MessageBlock[] = [...(last.blocks || [])];
         let content = last.content;
 
@@ -1226,6 +1235,13 @@ export default function ChatPanel({ sessionId, newChatNonce, onSessionChange, ag
                         ) : (
                           <p className="whitespace-pre-wrap">{msg.content}</p>
                         )}
+                        {isStreaming &&
+                          i === messages.length - 1 &&
+                          msg.role === 'assistant' && msg.queuePosition && (
+                            <p className="text-xs text-sand-500">
+                              Waiting for a free assistant ({msg.queuePosition === 1 ? 'next up' : `${msg.queuePosition - 1} ahead`})…
+                            </p>
+                          )}
                         {isStreaming &&
                           i === messages.length - 1 &&
                           msg.role === 'assistant' && (
@@ -254,7 +254,7 @@ function handleEvent(parsed: Record<string, unknown>, cb: ChatCallbacks): 'done'
   if (parsed.error) { cb.onError(new Error(parsed.error as string)); return 'error'; }
   if (parsed.content || parsed.thinking_start || parsed.thinking ||
       parsed.tool_use_start || parsed.tool_use_input || parsed.block_stop ||
-      parsed.tool_result || parsed.artifact) {
+      parsed.tool_result || parsed.artifact || parsed.queue_position !== undefined) {
     cb.onChunk(parsed);
   }
   return 'continue';
@@ -302,11 +302,60 @@ function sendViaWebSocket(
   };
 }
 
+const SSE_RESUME_ATTEMPTS = 5;
+
 async function sendViaSSE(
   payload: Record<string, unknown>,
   cb: ChatCallbacks,
   signal?: AbortSignal,
 ) {
+  // The agent run outlives this request: if the stream drops before [DONE],
+  // reattach to the run and pick up after the last event id we saw.
+  let runId: string | null = null;
+  let lastEventId: string | null = null;
+
+  if (signal) {
+    signal.addEventListener('abort', () => {
+      if (runId) fetch(`${API_BASE}/chat/${runId}/cancel`, { method: 'POST' }).catch(() => {});
+    });
+  }
+
+  // Returns true once the stream has ended ([DONE] or an error event).
+  const readStream = async (res: Response): Promise<boolean> => {
+    runId = runId ?? res.headers.get('X-Chat-Run-Id');
+    const reader = res.body?.getReader();
+    if (!reader) throw new Error('No response body');
+
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) return false;
+
+      buffer += decoder.decode(value, { stream: true });
+      const lines = buffer.split('\n');
+      buffer = lines.pop() || '';
+
+      for (const line of lines) {
+        if (line.startsWith('id: ')) {
+          lastEventId = line.slice(4);
+        } else if (line.startsWith('data: ')) {
+          const data = line.slice(6);
+          if (data === '[DONE]') { cb.onDone(); return true; }
+          try {
+            const parsed = JSON.parse(data);
+            if (parsed.run_id) { runId = parsed.run_id as string; continue; }
+            const result = handleEvent(parsed, cb);
+            if (result !== 'continue') return true;
+          } catch {
+            cb.onChunk({ content: data });
+          }
+        }
+      }
+    }
+  };
+
   const res = await fetch(`${API_BASE}/chat`, {
     method: 'POST',
     headers: { 'Content-Type': 'application/json' },
@@ -314,33 +363,33 @@ async function sendViaSSE(
     signal,
   });
 
+  if (res.status === 503) {
+    const retryAfter = res.headers.get('Retry-After');
+    throw new Error(`The assistant is busy; please try again${retryAfter ? ` in ${retryAfter}s` : ' shortly'}`);
+  }
   if (!res.ok) throw new Error(`Chat request failed: ${res.status}`);
 
-  const reader = res.body?.getReader();
-  if (!reader) throw new Error('No response body');
-
-  const decoder = new TextDecoder();
-  let buffer = '';
-
+  let attempt = 0;
+  let current: Response | null = res;
   while (true) {
-    const { done, value } = await reader.read();
-    if (done) break;
-
-    buffer += decoder.decode(value, { stream: true });
-    const lines = buffer.split('\n');
-    buffer = lines.pop() || '';
-
-    for (const line of lines) {
-      if (line.startsWith('data: ')) {
-        const data = line.slice(6);
-        if (data === '[DONE]') { cb.onDone(); return; }
-        try {
-          const result = handleEvent(JSON.parse(data), cb);
-          if (result !== 'continue') return;
-        } catch {
-          cb.onChunk({ content: data });
-        }
-      }
+    const seenBefore = lastEventId;
+    try {
+      if (current && await readStream(current)) return;
+    } catch (err) {
+      if (signal?.aborted || !runId) throw err;
+    }
+    if (lastEventId !== seenBefore) attempt = 0;
+    if (!runId || attempt >= SSE_RESUME_ATTEMPTS) break;
+    await new Promise((resolve) => setTimeout(resolve, 500 * 2 ** attempt));
+    attempt += 1;
+    try {
+      const headers: Record<string, string> = lastEventId ? { 'Last-Event-ID': lastEventId } : {};
+      current = await fetch(`${API_BASE}/chat/${runId}/stream`, { headers, signal });
+      if (current.status === 404) break;
+      if (!current.ok) current = null;
+    } catch (err) {
+      if (signal?.aborted) throw err;
+      current = null;
     }
   }
   cb.onDone();
@@ -0,0 +1,132 @@
+"""Benchmark: time to first token on the query() path, with and without
+hot-spare CLI processes.
+
+A stubbed CLI client (ClaudeSDKClient stand-in) takes as long to connect
+as spawning `claude` with its MCP stdio servers (~4 s) and streams its
+first message ~0.6 s after the query, finishing the turn at ~1.5 s.
+Requests arrive at random (Poisson, --rate per second). All times are
+multiplied by --scale so a run takes seconds; TTFT is reported unscaled.
+
+  - query():        every request spawns its own CLI (pool off or cold)
+  - spares K:       agent.cli_spares.HotSpares with K ready clients;
+                    a request that finds none spawns its own
+  - pool (warm):    agent.sdk_client_pool with warm clients, for reference
+
+Run from repo root:
+    python -m scripts.bench_cli_spares
+    python -m scripts.bench_cli_spares --rate 1.0 --requests 200
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import time
+
+from agent.cli_spares import HotSpares
+from agent.sdk_client_pool import SDKClientPool
+
+_SPAWN_S = 4.0
+_FIRST_TOKEN_S = 0.6
+_TURN_S = 1.5
+
+
+class _StubCLI:
+    scale = 0.05
+
+    def __init__(self, options=None):
+        pass
+
+    async def connect(self):
+        await asyncio.sleep(_SPAWN_S * self.scale)
+
+    async def query(self, prompt):
+        pass
+
+    async def receive_response(self):
+        await asyncio.sleep(_FIRST_TOKEN_S * self.scale)
+        yield {"first": True}
+        await asyncio.sleep((_TURN_S - _FIRST_TOKEN_S) * self.scale)
+        yield {"done": True}
+
+    async def disconnect(self):
+        pass
+
+
+async def _spawned_query():
+    """What query() does: spawn, connect, stream, exit."""
+    client = _StubCLI()
+    await client.connect()
+    await client.query("hi")
+    async for msg in client.receive_response():
+        yield msg
+
+
+async def _request(source, ttfts: list[float]) -> None:
+    t0 = time.perf_counter()
+    stream = source() or _spawned_query()
+    first = True
+    async for _ in stream:
+        if first:
+            ttfts.append(time.perf_counter() - t0)
+            first = False
+
+
+async def _trial(name: str, requests: int, rate: float, spares: int) -> tuple[list[float], int | None]:
+    manager = pool = None
+    if name == "pool":
+        pool = SDKClientPool(lambda m: m, "sonnet", models={"sonnet": 8}, max_workers=8, warm_spares=0,
+                             client_factory=_StubCLI)
+        pool.start()
+        while sum(w.is_warm for w in pool._workers["sonnet"]) < 8:
+            await asyncio.sleep(0.01)
+        source = lambda: pool.dispatch("hi", None)  # noqa: E731
+    elif name == "spares":
+        manager = HotSpares(lambda m: m, "sonnet", spares=spares, client_factory=_StubCLI)
+        manager.start()
+        while manager.stats()["ready"].get("sonnet", 0) < spares:
+            await asyncio.sleep(0.01)
+        source = lambda: manager.take("hi", None)  # noqa: E731
+    else:
+        source = lambda: None  # noqa: E731
+
+    rng = random.Random(0)
+    ttfts: list[float] = []
+    tasks = []
+    for _ in range(requests):
+        tasks.append(asyncio.create_task(_request(source, ttfts)))
+        await asyncio.sleep(rng.expovariate(rate) * _StubCLI.scale)
+    await asyncio.gather(*tasks)
+    missed = None
+    if manager is not None:
+        missed = manager.stats()["missed"]
+        await manager.shutdown()
+    if pool is not None:
+        await pool.shutdown()
+    return sorted(t / _StubCLI.scale for t in ttfts), missed
+
+
+def _pct(values: list[float], p: float) -> float:
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=0.5, help="requests per (unscaled) second")
+    parser.add_argument("--scale", type=float, default=0.05)
+    args = parser.parse_args()
+    _StubCLI.scale = args.scale
+
+    print(f"{args.requests} requests at {args.rate}/s; spawn {_SPAWN_S}s, first token {_FIRST_TOKEN_S}s")
+    print(f"{'path':<14} {'p50 s':>7} {'p90 s':>7} {'p99 s':>7} {'no spare':>9}")
+    rows = [("query()", "query", 0)] + [(f"spares K={k}", "spares", k) for k in (1, 2, 4)] + [("pool (warm)", "pool", 0)]
+    for label, name, k in rows:
+        ttfts, missed = await _trial(name, args.requests, args.rate, k)
+        print(f"{label:<14} {_pct(ttfts, 0.5):7.2f} {_pct(ttfts, 0.9):7.2f} {_pct(ttfts, 0.99):7.2f} "
+              f"{'' if missed is None else missed:>9}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
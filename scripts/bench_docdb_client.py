@@ -0,0 +1,146 @@
+"""Benchmark: back-to-back count_records tool calls, with a new DocDB
+client per call vs the cached one in aind_data_mcp.mcp_instance.
+
+Runs a local HTTPS stand-in for the DocDB API (self-signed cert for
+localhost) that answers count_documents. --rtt adds a simulated network
+round trip per request, and two more per new connection for the TCP +
+TLS handshakes, so the numbers approximate a remote API rather than
+loopback.
+
+  - new client per call:  MetadataDbClient(...) built inside each call,
+                          as setup_mongodb_client() used to
+  - cached client:        the count_records tool itself, using the shared
+                          client and its keep-alive session
+
+Needs the AIND MCP server's dependencies (fastmcp, aind-data-access-api).
+Run from repo root:
+    python -m scripts.bench_docdb_client
+    python -m scripts.bench_docdb_client --calls 50 --rtt 0.03
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime
+import json
+import os
+import ssl
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "aind-data-mcp" / "src"))
+
+
+class _DocDBStandIn(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True
+    rtt = 0.0
+    connections = 0
+
+    def setup(self):
+        type(self).connections += 1
+        time.sleep(2 * self.rtt)
+        super().setup()
+
+    def do_GET(self):
+        time.sleep(self.rtt)
+        body = json.dumps({"total_record_count": 25000, "filtered_record_count": 42}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _self_signed_cert(directory: Path) -> tuple[Path, Path]:
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name).issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now).not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName("localhost")]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path, key_path = directory / "cert.pem", directory / "key.pem"
+    cert_path.write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    key_path.write_bytes(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                           serialization.NoEncryption()))
+    return cert_path, key_path
+
+
+def _serve(cert_path: Path, key_path: Path) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("localhost", 0), _DocDBStandIn)
+    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ctx.load_cert_chain(cert_path, key_path)
+    server.socket = ctx.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _time_calls(call, calls: int) -> list[float]:
+    times = []
+    for _ in range(calls):
+        t0 = time.perf_counter()
+        result = call()
+        times.append((time.perf_counter() - t0) * 1000)
+        assert isinstance(result, dict), result  # the tool returns an error string on failure
+    return times
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--rtt", type=float, default=0.0, help="simulated network round trip, seconds")
+    args = parser.parse_args()
+    _DocDBStandIn.rtt = args.rtt
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cert_path, key_path = _self_signed_cert(Path(tmp))
+        server = _serve(cert_path, key_path)
+        host = f"localhost:{server.server_address[1]}"
+        os.environ["REQUESTS_CA_BUNDLE"] = str(cert_path)
+        os.environ["DOCDB_HOST"] = host
+
+        from aind_data_access_api.document_db import MetadataDbClient
+
+        from aind_data_mcp import query_tools
+
+        count_records = getattr(query_tools.count_records, "fn", query_tools.count_records)
+        filter_query = {"subject.sex": "Male"}
+
+        def per_call():
+            client = MetadataDbClient(host=host, version="v2")
+            return client._count_records(filter_query=filter_query)
+
+        print(f"{args.calls} back-to-back count_records calls; simulated RTT {args.rtt * 1000:.0f} ms")
+        print(f"{'client':<22} {'total ms':>9} {'p50 ms':>7} {'p95 ms':>7} {'connections':>12}")
+        for label, call in [("new client per call", per_call),
+                            ("cached client", lambda: count_records(filter_query))]:
+            _DocDBStandIn.connections = 0
+            times = _time_calls(call, args.calls)
+            ordered = sorted(times)
+            print(f"{label:<22} {sum(times):9.0f} {statistics.median(times):7.1f} "
+                  f"{ordered[int(0.95 * (len(ordered) - 1))]:7.1f} {_DocDBStandIn.connections:>12}")
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Benchmark: find_records text search, FTS index vs the old LIKE scan.
+
+Seeds a throwaway SQLite database with N records shaped like real captures
+(subjects, instruments, sessions with a few KB of JSON each), then times
+find_records(query=...) against the previous
+``name LIKE '%q%' OR data_json LIKE '%q%'`` query for a handful of
+representative searches: a subject_id dedupe check, a genotype word, an
+instrument id, and a miss.
+
+Run from repo root:
+    python -m scripts.bench_find_records
+    python -m scripts.bench_find_records --records 20000 --repeat 50
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+import uuid
+
+QUERIES = ["614172", "Pvalb", "SmartSPIM-42", "nonexistent-thing"]
+
+LEGACY_SQL = """SELECT * FROM metadata_records
+    WHERE (name LIKE ? OR data_json LIKE ?)
+    ORDER BY updated_at DESC LIMIT 50"""
+
+GENOTYPES = ["Pvalb-IRES-Cre/wt", "Sst-IRES-Cre/wt", "Vip-IRES-Cre/wt", "wt/wt", "Ai14/wt"]
+
+
+def _record(i: int, rng: random.Random) -> tuple:
+    kind = i % 3
+    if kind == 0:
+        record_type, category = "subject", "shared"
+        data = {
+            "subject_id": str(600000 + i),
+            "genotype": rng.choice(GENOTYPES),
+            "species": {"name": "Mus musculus", "registry": "NCBI", "registry_identifier": "NCBI:txid10090"},
+            "sex": rng.choice(["Male", "Female"]),
+            "date_of_birth": "2024-03-01",
+        }
+        name = f"Mus musculus {data['subject_id']}"
+    elif kind == 1:
+        record_type, category = "instrument", "shared"
+        data = {
+            "instrument_id": f"SmartSPIM-{i % 500}",
+            "modalities": ["SPIM"],
+            "components": [{"name": f"laser-{j}", "wavelength": 400 + j * 50} for j in range(20)],
+        }
+        name = data["instrument_id"]
+    else:
+        record_type, category = "session", "asset"
+        data = {
+            "session_start_time": "2025-01-15T09:00:00",
+            "subject_id": str(600000 + i - 2),
+            "notes": " ".join(rng.choice(["reward", "lick", "trial", "stim", "probe"]) for _ in range(200)),
+        }
+        name = f"Session {data['session_start_time']}"
+    now = f"2025-01-{1 + i % 28:02d}T00:00:{i % 60:02d}"
+    return (str(uuid.uuid4()), f"seed-{i % 1000}", record_type, category, name,
+            json.dumps(data), now, now)
+
+
+async def _seed(n_records: int) -> None:
+    from agent.db.database import get_db
+
+    db = await get_db()
+    rng = random.Random(0)
+    batch = 5000
+    for start in range(0, n_records, batch):
+        await db.executemany(
+            """INSERT INTO metadata_records
+               (id, session_id, record_type, category, name, data_json, status, created_at, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?, 'draft', ?, ?)""",
+            [_record(i, rng) for i in range(start, min(start + batch, n_records))],
+        )
+
+
+async def _time(fn, repeat: int) -> tuple[float, int]:
+    samples = []
+    hits = 0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        hits = len(await fn())
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples), hits
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    import agent.db.database as db_mod
+    from agent.tools.metadata_store import find_records
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["METADATA_DB_DIR"] = tmp
+        await db_mod.close_db()
+        await db_mod.init_db()
+        t0 = time.perf_counter()
+        await _seed(args.records)
+        print(f"seeded {args.records} records in {time.perf_counter() - t0:.1f}s")
+        db = await db_mod.get_db()
+
+        print(f"{'query':<20} {'LIKE ms':>9} {'FTS ms':>9} {'speedup':>8} {'hits':>6}")
+        for q in QUERIES:
+            like_ms, like_hits = await _time(
+                lambda q=q: db.fetch(LEGACY_SQL, (f"%{q}%", f"%{q}%")), args.repeat)
+            fts_ms, fts_hits = await _time(lambda q=q: find_records(query=q), args.repeat)
+            print(f"{q:<20} {like_ms:9.2f} {fts_ms:9.2f} {like_ms / fts_ms:7.1f}x "
+                  f"{fts_hits:>3}/{like_hits:<3}")
+        await db_mod.close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
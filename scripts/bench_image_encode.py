@@ -0,0 +1,187 @@
+"""Benchmark: encode time and output size of oversized-image re-encoding.
+
+Runs _resize_image_for_api over a corpus of the images users attach:
+
+  - microscopy: fluorescence frames (dark, noisy, blurred cells), grey
+    and pseudo-coloured, at sCMOS sensor resolution; a high-gain colour
+    brightfield frame
+  - screenshot: 5K protocol screenshots (text, UI chrome, an embedded
+    figure)
+  - scan:       300 dpi letter-size scanned sheets (paper noise, ruled
+    table, handwriting-ish strokes)
+  - diagram:    a flat-colour rig schematic, exported uncompressed
+
+The corpus is generated (seeded, Pillow only) rather than checked in so
+the repo doesn't carry ~100 MB of PNGs. Every image is a PNG over the
+3.5 MB limit, so each one takes the resize path. Times include decode and
+downscale, which are the same for both variants.
+
+  - before: JPEG q85 → 75 → 60 → 45 with optimize=True until it fits
+  - after:  format picked from content, quality searched from a first pass
+
+Run from repo root:
+    python -m scripts.bench_image_encode
+    python -m scripts.bench_image_encode --repeat 3
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import random
+import statistics
+import time
+from collections.abc import Callable
+
+from PIL import Image, ImageChops, ImageDraw, ImageFilter, ImageFont
+
+_WORDS = (
+    "anesthesia isoflurane craniotomy injection AAV titer coordinates bregma "
+    "lambda depth perfusion fixative section objective laser power imaging "
+    "session mouse subject genotype headframe window"
+).split()
+
+
+def _png(img: Image.Image, compress_level: int = 6) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, format="PNG", compress_level=compress_level)
+    return buf.getvalue()
+
+
+def _microscopy(seed: int, size=(2560, 2160), pseudo_colour: bool = False) -> Image.Image:
+    # Low background with clipped camera noise, blurred bright cells.
+    rng = random.Random(seed)
+    cells = Image.new("L", size, 0)
+    draw = ImageDraw.Draw(cells)
+    for _ in range(400):
+        x, y, r = rng.randrange(size[0]), rng.randrange(size[1]), rng.randrange(6, 30)
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=rng.randrange(80, 255))
+    cells = cells.filter(ImageFilter.GaussianBlur(8))
+    noise = Image.effect_noise(size, 40).point(lambda v: max(0, v - 110))
+    frame = ImageChops.add(cells, noise)
+    if pseudo_colour:
+        black = Image.new("L", size, 0)
+        return Image.merge("RGB", (black, frame, black))
+    return frame.convert("RGB")
+
+
+def _brightfield(seed: int, size=(2448, 2048)) -> Image.Image:
+    # Colour camera at high gain: independent noise in each channel.
+    tissue = _microscopy(seed, size).convert("L").point(lambda v: 200 - v // 2)
+    channels = [ImageChops.add(tissue, Image.effect_noise(size, 50), offset=-128) for _ in range(3)]
+    return Image.merge("RGB", channels)
+
+
+def _screenshot(seed: int, size=(5120, 2880), figure=(2600, 2200)) -> Image.Image:
+    rng = random.Random(seed)
+    img = Image.new("RGB", size, (250, 250, 252))
+    draw = ImageDraw.Draw(img)
+    font = ImageFont.load_default(size=36)
+    draw.rectangle((0, 0, size[0], 120), fill=(36, 41, 47))
+    draw.rectangle((0, 120, 700, size[1]), fill=(240, 242, 245))
+    for i in range(30):
+        draw.text((60, 180 + i * 80), " ".join(rng.sample(_WORDS, 2)), fill=(60, 60, 70), font=font)
+    y = 200
+    while y < size[1] - 100:
+        line = " ".join(rng.choice(_WORDS) for _ in range(rng.randrange(8, 18)))
+        draw.text((800, y), line, fill=(20, 20, 20), font=font)
+        y += 56
+    for i in range(6):
+        x = 800 + i * 320
+        draw.rounded_rectangle((x, size[1] - 90, x + 280, size[1] - 30), 12, fill=(9, 105, 218))
+    img.paste(_microscopy(seed, figure, pseudo_colour=True), (size[0] - figure[0] - 100, 300))
+    return img
+
+
+def _scan(seed: int, size=(2550, 3300)) -> Image.Image:
+    rng = random.Random(seed)
+    page = Image.new("L", size, 238)
+    draw = ImageDraw.Draw(page)
+    font = ImageFont.load_default(size=40)
+    for row in range(12):
+        y = 500 + row * 180
+        draw.line((150, y, size[0] - 150, y), fill=90, width=3)
+        for col in range(4):
+            x = 200 + col * 560
+            draw.text((x, y + 50), " ".join(rng.sample(_WORDS, 2)), fill=40, font=font)
+            pts = [(x + i * 18, y + 120 + rng.randrange(-12, 12)) for i in range(20)]
+            draw.line(pts, fill=30, width=4)
+    page = page.rotate(0.7, resample=Image.Resampling.BICUBIC, fillcolor=238)
+    page = ImageChops.subtract(page, Image.effect_noise(size, 14).point(lambda v: max(0, v - 128)))
+    return page.convert("RGB")
+
+
+def _diagram(seed: int, size=(4000, 3000)) -> Image.Image:
+    # Rig schematic: flat fills and outlines, no anti-aliasing, few colours.
+    rng = random.Random(seed)
+    img = Image.new("RGB", size, (255, 255, 255))
+    draw = ImageDraw.Draw(img)
+    palette = [(rng.randrange(256), rng.randrange(256), rng.randrange(256)) for _ in range(12)]
+    for _ in range(80):
+        x, y = rng.randrange(size[0] - 400), rng.randrange(size[1] - 300)
+        draw.rectangle((x, y, x + rng.randrange(80, 400), y + rng.randrange(60, 300)),
+                       fill=rng.choice(palette), outline=(0, 0, 0), width=4)
+    return img
+
+
+CORPUS: dict[str, Callable[[], bytes]] = {
+    "microscopy-grey": lambda: _png(_microscopy(1)),
+    "microscopy-gfp": lambda: _png(_microscopy(2, pseudo_colour=True)),
+    "brightfield-noisy": lambda: _png(_brightfield(7)),
+    "screenshot-protocol": lambda: _png(_screenshot(3)),
+    "screenshot-form": lambda: _png(_screenshot(4, size=(3840, 4000), figure=(2400, 2400))),
+    "scan-sheet": lambda: _png(_scan(5)),
+    "scan-sheet-2": lambda: _png(_scan(6)),
+    # Flat images only get this big uncompressed, as fast-save exports are.
+    "diagram-export": lambda: _png(_diagram(8), compress_level=0),
+}
+
+
+def _before(raw: bytes, content_type: str) -> tuple[bytes, str]:
+    """The resize path as it was: JPEG at fixed qualities until it fits."""
+    from agent.media_prep import _IMAGE_MAX_DIMENSION, _IMAGE_MAX_RAW_BYTES
+
+    img = Image.open(io.BytesIO(raw))
+    img.load()
+    img = img.convert("RGB")
+    img.thumbnail((_IMAGE_MAX_DIMENSION, _IMAGE_MAX_DIMENSION), Image.Resampling.LANCZOS)
+    out = b""
+    for quality in (85, 75, 60, 45):
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=quality, optimize=True)
+        out = buf.getvalue()
+        if len(out) <= _IMAGE_MAX_RAW_BYTES:
+            break
+    return out, "image/jpeg"
+
+
+def main() -> None:
+    from agent.media_prep import _IMAGE_MAX_RAW_BYTES, _resize_image_for_api
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=1, help="timed runs per image (median reported)")
+    args = parser.parse_args()
+
+    print(f"{'image':<20} {'input':>8} {'variant':<7} {'format':<10} {'output':>9} {'encode ms':>10}")
+    totals = {"before": [0, 0.0], "after": [0, 0.0]}
+    for name, make in CORPUS.items():
+        raw = make()
+        assert len(raw) > _IMAGE_MAX_RAW_BYTES, f"{name} is only {len(raw)} bytes"
+        for variant, fn in (("before", _before), ("after", _resize_image_for_api)):
+            times = []
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                out, media_type = fn(raw, "image/png")
+                times.append((time.perf_counter() - t0) * 1000)
+            ms = statistics.median(times)
+            totals[variant][0] += len(out)
+            totals[variant][1] += ms
+            print(f"{name:<20} {len(raw) / 2**20:7.1f}M {variant:<7} {media_type:<10} "
+                  f"{len(out) / 1024:8.0f}K {ms:10.0f}")
+
+    for variant, (size, ms) in totals.items():
+        print(f"total {variant:<7} {size / 2**20:6.2f} MB {ms:7.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
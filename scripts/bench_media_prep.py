@@ -0,0 +1,108 @@
+"""Benchmark: event-loop stalls while a chat turn prepares image attachments.
+
+Builds the multimodal content for N oversized images (noise PNGs, so they
+take the resize + JPEG re-encode path) with the media cache disabled,
+while a heartbeat task on the same loop wakes every 5 ms and records how
+late it was. A late heartbeat is time every other request on the
+single-worker server (SSE streams, /health) would have waited.
+
+  - before: prep inline on the event loop, one attachment at a time
+  - after:  prep in the media-prep pool, attachments in parallel
+
+Run from repo root:
+    python -m scripts.bench_media_prep
+    python -m scripts.bench_media_prep --images 8 --size 2000
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import io
+import os
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+_TICK = 0.005
+
+
+def _noise_png(size: int, seed: int) -> bytes:
+    from PIL import Image
+
+    rng = random.Random(seed)
+    img = Image.frombytes("RGB", (size, size), rng.randbytes(size * size * 3))
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+async def _heartbeat(stop: asyncio.Event, lateness: list[float]) -> None:
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(_TICK)
+        lateness.append(time.perf_counter() - t0 - _TICK)
+
+
+async def _turn(variant: str, attachments: list[dict]) -> dict[str, float]:
+    import agent.media_cache as media_mod
+    import agent.service as service
+    from agent.media_cache import MediaCache
+    from agent.media_prep import prepare_media
+
+    media_mod._cache = MediaCache(None, memory_bytes=0, disk_bytes=0)
+    saved = service.run_media_prep, service.MEDIA_PREP_WORKERS
+    if variant == "before":
+        async def inline(raw: bytes, content_type: str):
+            return prepare_media(raw, content_type)
+
+        service.run_media_prep, service.MEDIA_PREP_WORKERS = inline, 1
+
+    stop = asyncio.Event()
+    lateness: list[float] = []
+    beat = asyncio.create_task(_heartbeat(stop, lateness))
+    await asyncio.sleep(0.05)
+    t0 = time.perf_counter()
+    try:
+        blocks = await service._build_multimodal_content("describe these", attachments)
+    finally:
+        elapsed = time.perf_counter() - t0
+        stop.set()
+        await beat
+        service.run_media_prep, service.MEDIA_PREP_WORKERS = saved
+
+    assert len(blocks) == len(attachments) + 1
+    return {
+        "turn_ms": elapsed * 1000,
+        "max_stall_ms": max(lateness) * 1000,
+        "p50_stall_ms": statistics.median(lateness) * 1000,
+        "stalled_ms": sum(x for x in lateness if x > 0.05) * 1000,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", type=int, default=6)
+    parser.add_argument("--size", type=int, default=1400, help="edge length in px")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        attachments = []
+        for i in range(args.images):
+            path = Path(tmp) / f"frame-{i}.png"
+            path.write_bytes(_noise_png(args.size, i))
+            attachments.append({"file_path": str(path), "content_type": "image/png", "filename": path.name})
+        mb = sum(os.path.getsize(a["file_path"]) for a in attachments) / 2**20
+        print(f"{args.images} x {args.size}px noise PNGs ({mb:.0f} MB), media cache off, {os.cpu_count()} CPUs")
+
+        print(f"{'variant':<8} {'turn ms':>9} {'max stall ms':>13} {'p50 stall ms':>13} {'time >50ms late':>16}")
+        for variant in ("before", "after"):
+            r = await _turn(variant, attachments)
+            print(f"{variant:<8} {r['turn_ms']:9.0f} {r['max_stall_ms']:13.1f} "
+                  f"{r['p50_stall_ms']:13.2f} {r['stalled_ms']:16.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+"""Benchmark: prompt tokens spent on the records context, full vs compact.
+
+Replays a capture session over the record fixtures in
+evals/fixtures/session_records.json (the AIND schema examples: subject,
+procedures, instrument, acquisition, data_description, processing). The
+agent captures one record per turn, then spends the remaining turns
+editing one field of one record at a time. Before each turn the records
+block is built both ways:
+
+  - full:    every record's data_json, every turn (RECORDS_CONTEXT=full)
+  - compact: full data only for records written during the previous turn,
+             a one-line summary for the rest
+
+Tokens are estimated as chars / 4, same as the history window.
+
+Run from repo root:
+    python -m scripts.bench_records_context
+    python -m scripts.bench_records_context --edit-turns 20
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+from pathlib import Path
+
+FIXTURES = Path(__file__).resolve().parent.parent / "evals" / "fixtures" / "session_records.json"
+
+
+def main() -> None:
+    from agent.service import _format_records_context
+    from agent.tools.metadata_store import estimate_tokens
+    from agent.validation import validate_record
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--edit-turns", type=int, default=10)
+    args = parser.parse_args()
+
+    fixtures = json.loads(FIXTURES.read_text())
+    records: list[dict] = []
+    changed: set[str] = set()
+    totals = {"full": 0, "compact": 0}
+
+    def _write(record: dict) -> None:
+        record["validation_json"] = validate_record(record["record_type"], record["data_json"]).to_dict()
+        changed.add(record["id"])
+
+    print(f"{'turn':>4} {'records':>7} {'full tokens':>12} {'compact tokens':>15}")
+    n_turns = len(fixtures) + args.edit_turns
+    for turn in range(n_turns + 1):
+        if records:
+            full = estimate_tokens(_format_records_context(records))
+            compact = estimate_tokens(_format_records_context(records, changed))
+            totals["full"] += full
+            totals["compact"] += compact
+            print(f"{turn:>4} {len(records):>7} {full:>12} {compact:>15}")
+        changed = set()
+
+        # What the agent does during this turn.
+        if turn < len(fixtures):
+            fx = fixtures[turn]
+            record = {
+                "id": f"rec-{turn}", "record_type": fx["record_type"], "name": fx["record_type"],
+                "status": "draft", "data_json": fx["data"],
+            }
+            records.append(record)
+            _write(record)
+        else:
+            record = records[turn % len(records)]
+            record["data_json"] = {**record["data_json"], "notes": f"edited on turn {turn}"}
+            _write(record)
+
+    saved = 1 - totals["compact"] / totals["full"]
+    print(f"total records-context tokens over {n_turns} turns: "
+          f"full={totals['full']} compact={totals['compact']} ({saved:.0%} fewer)")
+
+
+if __name__ == "__main__":
+    main()
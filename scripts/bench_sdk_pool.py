@@ -0,0 +1,114 @@
+"""Load test: chat throughput and latency vs SDK client pool size.
+
+Drives agent.sdk_client_pool.SDKClientPool with a stubbed CLI client
+(ClaudeSDKClient stand-in): connect() takes as long as spawning the
+`claude` CLI with its MCP servers (~2.5 s), a turn as long as a short
+agent reply (~1.5 s, jittered). A request the pool can't serve yet (no
+warm client for its model) pays the one-shot query() cost instead:
+spawn + turn. All times are multiplied by --scale so a run takes seconds.
+
+--users concurrent users each send --turns messages back to back, 70%
+Sonnet / 20% Haiku / 10% Opus. Each row is one pool configuration:
+
+  - max 1, no spares: roughly the old single-client pool, except the old
+    one also serialized every model behind one client and set_model()
+  - max N, 1 spare: per-model workers scaled on demand up to N
+
+Run from repo root:
+    python -m scripts.bench_sdk_pool
+    python -m scripts.bench_sdk_pool --users 16 --scale 0.2
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from agent.sdk_client_pool import SDKClientPool
+
+_MODELS = ["sonnet"] * 7 + ["haiku"] * 2 + ["opus"]
+_SPAWN_S = 2.5
+_TURN_S = 1.5
+
+
+class _StubCLI:
+    scale = 0.1
+
+    def __init__(self, options):
+        self.model = options
+        self._rng = random.Random()
+
+    async def connect(self):
+        await asyncio.sleep(_SPAWN_S * self.scale)
+
+    async def query(self, prompt):
+        pass
+
+    async def receive_response(self):
+        await asyncio.sleep(_TURN_S * self.scale * self._rng.uniform(0.5, 1.5))
+        yield {"model": self.model}
+
+    async def disconnect(self):
+        pass
+
+
+async def _user(pool: SDKClientPool, turns: int, seed: int, latencies: list, fallbacks: list) -> None:
+    rng = random.Random(seed)
+    for _ in range(turns):
+        model = rng.choice(_MODELS)
+        t0 = time.perf_counter()
+        pooled = pool.dispatch("hi", model)
+        if pooled is None:
+            fallbacks.append(model)
+            await asyncio.sleep((_SPAWN_S + _TURN_S) * _StubCLI.scale)
+        else:
+            async for _ in pooled:
+                pass
+        latencies.append(time.perf_counter() - t0)
+
+
+async def _trial(max_workers: int, spares: int, users: int, turns: int) -> dict:
+    pool = SDKClientPool(lambda model: model, "sonnet", models={"sonnet": 1},
+                         max_workers=max_workers, warm_spares=spares, client_factory=_StubCLI)
+    pool.start()
+    await pool.await_warm(60)
+    latencies: list[float] = []
+    fallbacks: list[str] = []
+    t0 = time.perf_counter()
+    await asyncio.gather(*(_user(pool, turns, seed, latencies, fallbacks) for seed in range(users)))
+    wall = time.perf_counter() - t0
+    workers = {m: s["workers"] for m, s in pool.stats().items()}
+    await pool.shutdown()
+    latencies.sort()
+    return {
+        "turns/s": len(latencies) / wall,
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(0.95 * (len(latencies) - 1))],
+        "fallbacks": len(fallbacks),
+        "workers": workers,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--turns", type=int, default=6, help="messages per user")
+    parser.add_argument("--scale", type=float, default=0.1, help="multiplier on simulated spawn/turn times")
+    args = parser.parse_args()
+    _StubCLI.scale = args.scale
+
+    print(f"{args.users} users x {args.turns} turns; spawn {_SPAWN_S}s, turn ~{_TURN_S}s (x{args.scale})")
+    print(f"{'pool':<18} {'turns/s':>8} {'p50 s':>7} {'p95 s':>7} {'fallbacks':>10}  workers at end")
+    for max_workers, spares in [(1, 0), (2, 1), (4, 1), (8, 1)]:
+        r = await _trial(max_workers, spares, args.users, args.turns)
+        label = f"max {max_workers}, {spares} spare"
+        print(f"{label:<18} {r['turns/s']:8.2f} {r['p50'] / args.scale:7.2f} {r['p95'] / args.scale:7.2f} "
+              f"{r['fallbacks']:>10}  {r['workers']}")
+    print("(latencies shown unscaled)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,116 @@
+"""Benchmark: GET /sessions from the sessions table vs the old GROUP BY.
+
+Seeds a throwaway SQLite database with N sessions and M conversation turns,
+builds the sessions summary with the same backfill the migration runs,
+then times:
+
+  - the previous query (MIN/MAX/COUNT over every conversation row plus a
+    correlated first-message subquery per session)
+  - get_sessions() — whole list, and the first page (limit=50) the
+    sidebar actually needs
+  - save_conversation_turn(), which now also upserts the summary row
+
+Run from repo root:
+    python -m scripts.bench_sessions
+    python -m scripts.bench_sessions --sessions 1000 --turns 100000
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+LEGACY_SQL = """
+    SELECT
+        session_id,
+        MIN(created_at) as created_at,
+        MAX(created_at) as last_active,
+        COUNT(*) as message_count,
+        (
+            SELECT content FROM conversations c2
+            WHERE c2.session_id = conversations.session_id
+              AND c2.role = 'user'
+            ORDER BY c2.created_at ASC
+            LIMIT 1
+        ) as first_message
+    FROM conversations
+    GROUP BY session_id
+    ORDER BY MAX(created_at) DESC
+"""
+
+
+async def _seed(n_sessions: int, n_turns: int) -> None:
+    from agent.db.database import get_db
+
+    db = await get_db()
+    batch = 50_000
+    for start in range(0, n_turns, batch):
+        rows = []
+        for i in range(start, min(start + batch, n_turns)):
+            # Interleave sessions the way concurrent users would.
+            sid = f"session-{i % n_sessions:05d}"
+            ts = f"2025-{1 + (i // 100_000) % 12:02d}-01 {(i // 3600) % 24:02d}:{(i // 60) % 60:02d}:{i % 60:02d}"
+            rows.append((sid, "user" if i % 2 == 0 else "assistant", f"turn {i} " + "x" * 200, ts))
+        await db.executemany(
+            "INSERT INTO conversations (session_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+            rows,
+        )
+
+
+async def _time(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=10_000)
+    parser.add_argument("--turns", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    import agent.db.database as db_mod
+    from agent.db.models import SQLITE_MIGRATIONS
+    from agent.service import get_sessions
+    from agent.tools.metadata_store import save_conversation_turn
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["METADATA_DB_DIR"] = tmp
+        await db_mod.close_db()
+        await db_mod.init_db()
+        db = await db_mod.get_db()
+
+        t0 = time.perf_counter()
+        await _seed(args.sessions, args.turns)
+        print(f"seeded {args.sessions} sessions / {args.turns} turns in {time.perf_counter() - t0:.1f}s")
+
+        t0 = time.perf_counter()
+        conn = await db._get_conn()
+        await conn.executescript(SQLITE_MIGRATIONS[2])  # sessions backfill
+        print(f"backfill: {time.perf_counter() - t0:.1f}s")
+
+        legacy = await _time(lambda: db.fetch(LEGACY_SQL), args.repeat)
+        full = await _time(get_sessions, args.repeat)
+        page = await _time(lambda: get_sessions(limit=50), args.repeat * 10)
+        print(f"{'query':<28} {'median ms':>10}")
+        print(f"{'GROUP BY (before)':<28} {legacy:10.1f}")
+        print(f"{'sessions table, all rows':<28} {full:10.1f}")
+        print(f"{'sessions table, limit=50':<28} {page:10.2f}")
+
+        t0 = time.perf_counter()
+        for i in range(500):
+            await save_conversation_turn(f"session-{i:05d}", "user", "another turn")
+        print(f"save_conversation_turn: {(time.perf_counter() - t0) * 1000 / 500:.2f} ms/turn")
+        await db_mod.close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
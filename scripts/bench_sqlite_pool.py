@@ -0,0 +1,115 @@
+"""Benchmark: GET /records latency while a chat is writing.
+
+Seeds a throwaway SQLite database, then runs two things concurrently on
+one event loop, the way the single-worker uvicorn does:
+
+  - a writer that keeps appending conversation turns and ~200 KB keyframe
+    rows (what an in-flight chat + video extraction produce)
+  - a client that issues GET /records?type=subject back to back
+
+and reports p50/p99 request latency for each read-pool size.
+
+Run from repo root:
+    python -m scripts.bench_sqlite_pool
+    python -m scripts.bench_sqlite_pool --records 5000 --requests 500 --pool-sizes 0 2 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+import uuid
+
+
+def _percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+async def _seed(n_records: int) -> None:
+    from agent.tools.metadata_store import create_record
+
+    for i in range(n_records):
+        record_type = "subject" if i % 3 == 0 else "session"
+        await create_record(
+            f"seed-{i % 50}",
+            record_type,
+            {"subject_id": str(100000 + i), "genotype": "Pvalb-IRES-Cre/wt", "notes": "x" * 200},
+        )
+
+
+async def _run_one(pool_size: int, n_records: int, n_requests: int, tmp_root: str | None) -> dict[str, float]:
+    from httpx import ASGITransport, AsyncClient
+
+    import agent.db.database as db_mod
+    from agent.server import app
+    from agent.tools.metadata_store import save_conversation_turn, save_keyframe
+
+    with tempfile.TemporaryDirectory(dir=tmp_root) as tmp:
+        os.environ["METADATA_DB_DIR"] = tmp
+        os.environ["SQLITE_READ_POOL_SIZE"] = str(pool_size)
+        await db_mod.close_db()
+        await db_mod.init_db()
+        await _seed(n_records)
+
+        stop = asyncio.Event()
+        writes = 0
+        frame = os.urandom(200_000)
+
+        async def _writer() -> None:
+            nonlocal writes
+            session = f"bench-{uuid.uuid4()}"
+            upload = str(uuid.uuid4())
+            while not stop.is_set():
+                await save_conversation_turn(session, "user", "describe the injection " * 20)
+                await save_keyframe(upload, writes, frame, f"Frame {writes}")
+                writes += 1
+
+        latencies: list[float] = []
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://bench") as client:
+            writer = asyncio.create_task(_writer())
+            t_start = time.perf_counter()
+            for _ in range(n_requests):
+                t0 = time.perf_counter()
+                resp = await client.get("/records", params={"type": "subject"})
+                latencies.append((time.perf_counter() - t0) * 1000)
+                resp.raise_for_status()
+            elapsed = time.perf_counter() - t_start
+            stop.set()
+            await writer
+
+        await db_mod.close_db()
+
+    return {
+        "p50": statistics.median(latencies),
+        "p99": _percentile(latencies, 99),
+        "rps": n_requests / elapsed,
+        "writes": writes,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--pool-sizes", type=int, nargs="+", default=[0, 4])
+    parser.add_argument("--dir", default=None,
+                        help="where to put the DB (tmpfs hides fsync cost; use a real disk)")
+    args = parser.parse_args()
+
+    print(f"{args.records} records, {args.requests} GET /records under concurrent writes")
+    print(f"{'readers':>8} {'p50 ms':>8} {'p99 ms':>8} {'req/s':>8} {'writes':>8}")
+    for size in args.pool_sizes:
+        r = await _run_one(size, args.records, args.requests, args.dir)
+        label = "writer" if size == 0 else str(size)
+        print(f"{label:>8} {r['p50']:8.1f} {r['p99']:8.1f} {r['rps']:8.1f} {r['writes']:8d}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,159 @@
+"""Benchmark: SSE events/sec and CPU per streamed chat response.
+
+Streams a synthetic chat turn from a local uvicorn server to an httpx
+client over loopback, both in this process (so CPU covers the server's
+framing and socket writes and the client's reads): a thinking block, a
+capture_metadata tool call whose input arrives as ~400 input_json_delta
+fragments, then ~1500 text deltas of 1-6 chars, plus the block start/stop
+events around them.
+
+  - before: one json.dumps'd frame per event, one write per frame
+  - after:  agent.sse.sse_body (deltas merged, one write per flush window)
+
+Two runs per variant:
+  - unpaced: chat() yields as fast as it can — events/sec and CPU ms
+  - paced:   deltas arrive in bursts at roughly model speed (~2.5 ms
+             apart on average) — CPU ms, client reads (about one per
+             server write) and time to the first read
+
+Run from repo root:
+    python -m scripts.bench_sse
+    python -m scripts.bench_sse --text-deltas 4000
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import socket
+import time
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+
+def _script(text_deltas: int, seed: int = 0) -> list[dict]:
+    rng = random.Random(seed)
+    words = "the subject was implanted with a headframe before the craniotomy".split()
+    events: list[dict] = [{"thinking_start": True}]
+    events += [{"thinking": rng.choice(words) + " "} for _ in range(200)]
+    events += [{"block_stop": True}, {"tool_use_start": {"name": "mcp__capture__capture_metadata", "id": "tu_1"}}]
+    events += [{"tool_use_input": '"' + rng.choice(words)[: rng.randrange(1, 6)]} for _ in range(400)]
+    events += [{"block_stop": True}, {"tool_result": {"tool_use_id": "tu_1", "validation": {"status": "valid"}}}]
+    events += [{"content": rng.choice(words)[: rng.randrange(1, 7)]} for _ in range(text_deltas)]
+    events.append({"block_stop": True})
+    return events
+
+
+async def _events(script: list[dict], paced: bool):
+    rng = random.Random(1)
+    for event in script:
+        yield event
+        if paced and rng.random() < 0.35:
+            # The SDK delivers deltas in small bursts.
+            await asyncio.sleep(0.007)
+
+
+async def _before_body(events):
+    """The /chat body as it was: a queue of json.dumps'd frames, one yield each."""
+    queue: asyncio.Queue[str | None] = asyncio.Queue()
+
+    async def _produce():
+        try:
+            async for chunk in events:
+                await queue.put(f"data: {json.dumps(chunk)}\n\n")
+            await queue.put("data: [DONE]\n\n")
+        finally:
+            await queue.put(None)
+
+    producer = asyncio.create_task(_produce())
+    try:
+        while True:
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=15)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if item is None:
+                break
+            yield item
+    finally:
+        producer.cancel()
+
+
+def _app(script: list[dict], paced: bool) -> FastAPI:
+    from agent.sse import DONE, sse_body
+
+    app = FastAPI()
+
+    @app.get("/before")
+    async def before():
+        return StreamingResponse(_before_body(_events(script, paced)), media_type="text/event-stream")
+
+    async def _numbered():
+        # As a chat run's log would hand them over.
+        seq = 0
+        async for event in _events(script, paced):
+            seq += 1
+            yield seq, event
+        yield seq + 1, DONE
+
+    @app.get("/after")
+    async def after():
+        return StreamingResponse(sse_body(_numbered()), media_type="text/event-stream")
+
+    return app
+
+
+async def _stream(client: httpx.AsyncClient, variant: str) -> dict[str, float]:
+    wall0, cpu0 = time.perf_counter(), time.process_time()
+    first_token = None
+    reads = 0
+    body = b""
+    async with client.stream("GET", f"/{variant}") as resp:
+        async for chunk in resp.aiter_raw():
+            reads += 1
+            body += chunk
+            if first_token is None:
+                first_token = time.perf_counter() - wall0
+    wall, cpu = time.perf_counter() - wall0, time.process_time() - cpu0
+    assert body.endswith(b"data: [DONE]\n\n")
+    return {"wall": wall, "cpu": cpu, "reads": reads, "first": first_token or 0.0, "bytes": len(body)}
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--text-deltas", type=int, default=1500)
+    parser.add_argument("--repeat", type=int, default=5, help="unpaced runs per variant (median reported)")
+    args = parser.parse_args()
+
+    script = _script(args.text_deltas)
+    n = len(script)
+    print(f"{n} events per response")
+    print(f"{'run':<8} {'variant':<7} {'events/s':>9} {'CPU ms':>7} {'reads':>6} {'KB':>6} {'first read ms':>14}")
+    for paced in (False, True):
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        server = uvicorn.Server(uvicorn.Config(_app(script, paced), log_level="warning"))
+        serving = asyncio.create_task(server.serve(sockets=[sock]))
+        while not server.started:
+            await asyncio.sleep(0.01)
+        base_url = "http://127.0.0.1:%d" % sock.getsockname()[1]
+        try:
+            async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+                for variant in ("before", "after"):
+                    runs = [await _stream(client, variant) for _ in range(1 if paced else args.repeat)]
+                    r = sorted(runs, key=lambda x: x["cpu"])[len(runs) // 2]
+                    print(f"{'paced' if paced else 'unpaced':<8} {variant:<7} {n / r['wall']:9.0f} "
+                          f"{r['cpu'] * 1000:7.0f} {r['reads']:6d} {r['bytes'] / 1024:6.0f} {r['first'] * 1000:14.1f}")
+        finally:
+            server.should_exit = True
+            await serving
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
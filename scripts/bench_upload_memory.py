@@ -0,0 +1,123 @@
+"""Benchmark: peak memory of a chat turn with large attachments.
+
+Seeds a throwaway SQLite database with N uploads of S MB each, stored the
+pre-blob-store way (bytes in uploads.file_data) with extraction already
+done, then runs the context-gathering half of a chat turn — resolve the
+attachments' upload rows concurrently, build the multimodal content — in a
+fresh subprocess per variant:
+
+  - before: rows resolved with get_upload (SELECT *), which drags every
+    file_data blob into memory
+  - after:  rows resolved with get_upload_meta, which never selects it
+
+Reports each subprocess's peak RSS (ru_maxrss) and the tracemalloc peak
+of the turn itself.
+
+Run from repo root:
+    python -m scripts.bench_upload_memory
+    python -m scripts.bench_upload_memory --files 4 --size-mb 20
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+
+async def _seed(n_files: int, size_mb: int) -> None:
+    from agent.db.database import get_db
+
+    db = await get_db()
+    payload = os.urandom(size_mb * 1024 * 1024)
+    for i in range(n_files):
+        await db.execute(
+            """INSERT INTO uploads (id, original_filename, content_type, file_path, size_bytes,
+                                    file_data, extraction_status, extracted_text)
+               VALUES (?, ?, 'text/csv', ?, ?, ?, 'done', ?)""",
+            (f"upload-{i}", f"sheet-{i}.csv", f"/gone/sheet-{i}.csv", len(payload),
+             payload, f"col_a,col_b\n{i},{i * 2}\n"),
+        )
+
+
+async def _turn(variant: str, n_files: int) -> dict[str, float]:
+    import agent.db.database as db_mod
+    from agent.service import _build_multimodal_content
+    from agent.tools.metadata_store import get_upload, get_upload_meta
+
+    await db_mod.init_db()
+    lookup = get_upload if variant == "before" else get_upload_meta
+    attachments = [
+        {"file_id": f"upload-{i}", "filename": f"sheet-{i}.csv", "content_type": "text/csv"}
+        for i in range(n_files)
+    ]
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    # Same shape as chat(): gather upload rows, zip onto the attachments,
+    # and keep the rows alive for the rest of the turn.
+    uploads = await asyncio.gather(*(lookup(a["file_id"]) for a in attachments))
+    resolved = [{**a, "file_path": up["file_path"]} for a, up in zip(attachments, uploads)]
+    content = await _build_multimodal_content("describe these", resolved)
+    elapsed = (time.perf_counter() - t0) * 1000
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert len(content) == n_files + 1
+    await db_mod.close_db()
+    return {
+        "ms": elapsed,
+        "traced_peak_mb": traced_peak / 2**20,
+        "rss_peak_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "rss_start_mb": rss_before / 1024,
+    }
+
+
+def _run_child(variant: str, db_dir: str, n_files: int) -> dict[str, float]:
+    out = subprocess.run(
+        [sys.executable, "-m", "scripts.bench_upload_memory", "--child", variant, "--files", str(n_files)],
+        env={**os.environ, "METADATA_DB_DIR": db_dir},
+        check=True, capture_output=True, text=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=10)
+    parser.add_argument("--size-mb", type=int, default=80)
+    parser.add_argument("--child", choices=["before", "after"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(await _turn(args.child, args.files)))
+        return
+
+    import agent.db.database as db_mod
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["METADATA_DB_DIR"] = tmp
+        await db_mod.close_db()
+        await db_mod.init_db()
+        t0 = time.perf_counter()
+        await _seed(args.files, args.size_mb)
+        await db_mod.close_db()
+        print(f"seeded {args.files} x {args.size_mb} MB uploads in {time.perf_counter() - t0:.1f}s")
+
+        print(f"{'variant':<8} {'peak RSS MB':>12} {'RSS at start':>13} {'traced peak MB':>15} {'turn ms':>9}")
+        for variant in ("before", "after"):
+            r = _run_child(variant, tmp, args.files)
+            print(f"{variant:<8} {r['rss_peak_mb']:12.0f} {r['rss_start_mb']:13.0f} "
+                  f"{r['traced_peak_mb']:15.1f} {r['ms']:9.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())